@@ -26,6 +26,9 @@ class ApiStack(Stack):
             function_name="stock-api-handler",
             timeout=Duration.seconds(30),
             memory_size=512,  # Increased for faster queries
+            environment={
+                "S3_BUCKET": f"stock-scan-data-{self.account}",
+            },
             log_retention=logs.RetentionDays.ONE_WEEK,
         )
 
@@ -44,6 +47,86 @@ class ApiStack(Stack):
             )
         )
 
+        # Historical ranges read archived anomalies from S3
+        api_handler.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["s3:GetObject"],
+                resources=[
+                    f"arn:aws:s3:::stock-scan-data-{self.account}/anomaly-archive/*"
+                ],
+            )
+        )
+        # Lets a missing manifest (nothing archived yet) read as NoSuchKey
+        api_handler.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["s3:ListBucket"],
+                resources=[f"arn:aws:s3:::stock-scan-data-{self.account}"],
+                conditions={"StringLike": {"s3:prefix": ["anomaly-archive/*", "exports/*"]}},
+            )
+        )
+
+        # Exports too large to return inline are written to exports/ and
+        # handed out as presigned GET URLs (signed with this role)
+        api_handler.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["s3:PutObject", "s3:GetObject"],
+                resources=[
+                    f"arn:aws:s3:::stock-scan-data-{self.account}/exports/*"
+                ],
+            )
+        )
+
+        # Export jobs: ranges too long for the 29 s API limit are exported by
+        # this function, invoked asynchronously by the API
+        export_job = _lambda.Function(
+            self, "AnomalyExportJob",
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            handler="anomaly_export.lambda_handler",
+            code=_lambda.Code.from_asset("../lambda"),
+            function_name="stock-anomaly-export",
+            timeout=Duration.minutes(15),
+            memory_size=1024,
+            environment={
+                "S3_BUCKET": f"stock-scan-data-{self.account}",
+            },
+            log_retention=logs.RetentionDays.ONE_WEEK,
+            retry_attempts=0,  # A failed job is reported in its status document
+        )
+        export_job.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["dynamodb:Query"],
+                resources=[
+                    f"arn:aws:dynamodb:{self.region}:{self.account}:table/stock-anomalies",
+                    f"arn:aws:dynamodb:{self.region}:{self.account}:table/stock-anomalies/index/*",
+                ],
+            )
+        )
+        export_job.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["s3:GetObject"],
+                resources=[
+                    f"arn:aws:s3:::stock-scan-data-{self.account}/anomaly-archive/*"
+                ],
+            )
+        )
+        export_job.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["s3:PutObject", "s3:GetObject"],
+                resources=[
+                    f"arn:aws:s3:::stock-scan-data-{self.account}/exports/*"
+                ],
+            )
+        )
+        export_job.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["s3:ListBucket"],
+                resources=[f"arn:aws:s3:::stock-scan-data-{self.account}"],
+                conditions={"StringLike": {"s3:prefix": ["anomaly-archive/*"]}},
+            )
+        )
+        export_job.grant_invoke(api_handler)
+        api_handler.add_environment("EXPORT_FUNCTION_NAME", export_job.function_name)
+
         # REST API Gateway
         api = apigw.RestApi(
             self, "StockAnomalyApi",
@@ -56,6 +139,12 @@ class ApiStack(Stack):
                 caching_enabled=True,
                 cache_ttl=Duration.minutes(5),  # Cache responses for 5 minutes
                 cache_cluster_size="0.5",  # 0.5 GB cache
+                # Job status changes while it is polled
+                method_options={
+                    "/anomalies/export/jobs/{job_id}/GET": apigw.MethodDeploymentOptions(
+                        caching_enabled=False,
+                    ),
+                },
             ),
             default_cors_preflight_options=apigw.CorsOptions(
                 allow_origins=apigw.Cors.ALL_ORIGINS,
@@ -73,10 +162,67 @@ class ApiStack(Stack):
         health = api.root.add_resource("health")
         health.add_method("GET", lambda_integration)
 
-        # Anomalies endpoints: GET /anomalies
+        # Anomalies endpoints: GET /anomalies[?since=<watermark>]
+        # GET /anomalies?tickers=A,B,C[&limit=N][&format=merged]
+        # and GET /anomalies?start=<date>[&end=<date>].
+        # The stage cache must key on every query parameter, or a poll or
+        # watchlist request would get another request's cached response
+        query_parameters = ["since", "tickers", "limit", "format", "start", "end"]
         anomalies = api.root.add_resource("anomalies")
-        anomalies.add_method("GET", lambda_integration)
+        anomalies.add_method(
+            "GET",
+            apigw.LambdaIntegration(
+                api_handler,
+                proxy=True,
+                cache_key_parameters=[
+                    f"method.request.querystring.{name}" for name in query_parameters
+                ],
+            ),
+            request_parameters={
+                f"method.request.querystring.{name}": False for name in query_parameters
+            },
+        )
 
-        # Ticker-specific endpoint: GET /anomalies/{ticker}
+        # Bulk export: GET /anomalies/export[?format=&start=&end=&ticker=&severity=]
+        # (a literal path, so it takes precedence over /anomalies/{ticker})
+        export_parameters = ["format", "start", "end", "ticker", "severity"]
+        export = anomalies.add_resource("export")
+        export.add_method(
+            "GET",
+            apigw.LambdaIntegration(
+                api_handler,
+                proxy=True,
+                cache_key_parameters=[
+                    f"method.request.querystring.{name}" for name in export_parameters
+                ],
+            ),
+            request_parameters={
+                f"method.request.querystring.{name}": False for name in export_parameters
+            },
+        )
+
+        # Export job status: GET /anomalies/export/jobs/{job_id}
+        export_jobs = export.add_resource("jobs").add_resource("{job_id}")
+        export_jobs.add_method(
+            "GET",
+            lambda_integration,
+            request_parameters={"method.request.path.job_id": True},
+        )
+
+        # Ticker-specific endpoint: GET /anomalies/{ticker}[?start=&end=]
+        range_parameters = ["start", "end"]
         ticker = anomalies.add_resource("{ticker}")
-        ticker.add_method("GET", lambda_integration)
+        ticker.add_method(
+            "GET",
+            apigw.LambdaIntegration(
+                api_handler,
+                proxy=True,
+                cache_key_parameters=["method.request.path.ticker"] + [
+                    f"method.request.querystring.{name}" for name in range_parameters
+                ],
+            ),
+            request_parameters={
+                "method.request.path.ticker": True,
+                **{f"method.request.querystring.{name}": False for name in range_parameters},
+            },
+        )
@@ -27,10 +27,12 @@ class DashboardStack(Stack):
         )
 
         # Deploy dashboard files to S3
+        # snapshots/ is written by the scanner and must survive deployments
         s3_deploy.BucketDeployment(
             self, "DeployDashboard",
             sources=[s3_deploy.Source.asset("../dashboard")],
             destination_bucket=dashboard_bucket,
+            exclude=["snapshots/*"],
         )
 
         # CloudFront distribution for HTTPS
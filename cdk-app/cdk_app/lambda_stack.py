@@ -1,3 +1,8 @@
+import json
+import os
+import sys
+from datetime import date, timedelta
+
 from aws_cdk import (
     Stack,
     Duration,
@@ -7,15 +12,26 @@ from aws_cdk import (
     aws_logs as logs,
     aws_iam as iam,
     aws_sqs as sqs,
+    aws_kinesis as kinesis,
+    aws_lambda_event_sources as event_sources,
+    aws_scheduler as scheduler,
 )
 from constructs import Construct
 
+# The scanner schedule is generated from the Lambda's own trading calendar
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../lambda'))
+from market_calendar import EXCHANGE_TIMEZONE, MarketCalendar
+
+# Days of exact (holiday-free) scanner schedules generated per deploy
+SCHEDULE_HORIZON_DAYS = 400
+
 class LambdaStack(Stack):
     """
     CDK Stack for Lambda function and EventBridge scheduling.
     Week 4: Serverless compute and scheduling.
     Week 7: Data collection with anomaly detection.
     Week 8: Error handling with DLQ and retries.
+    Intraday: Kinesis-driven streaming detector.
     """
 
     def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
@@ -28,6 +44,14 @@ class LambdaStack(Stack):
             retention_period=Duration.days(14),  # Keep failed messages for 14 days
         )
 
+        # Queue of ticker shards for coordinator fan-out (SQS executor)
+        shard_queue = sqs.Queue(
+            self, "StockScannerShardQueue",
+            queue_name="stock-scanner-shards",
+            visibility_timeout=Duration.seconds(720),  # 6x the function timeout
+            dead_letter_queue=sqs.DeadLetterQueue(max_receive_count=3, queue=dlq),
+        )
+
         # Lambda function for stock scanning
         stock_scanner = _lambda.Function(
             self, "StockScanner",
@@ -39,6 +63,14 @@ class LambdaStack(Stack):
             memory_size=512,  # Increased from 256 for faster execution
             environment={
                 "S3_BUCKET": f"stock-scan-data-{self.account}",
+                "DASHBOARD_BUCKET": f"stock-dashboard-{self.account}",
+                "SCAN_EXECUTOR": "lambda",
+                "SCAN_MAX_CONCURRENCY": "4",  # Reserved concurrency minus the coordinator
+                "SHARD_BUDGET_MS": "60000",
+                "SHARD_QUEUE_URL": shard_queue.queue_url,
+                "PROFILE_ENABLED": "false",  # Set to "true" to profile sampled runs
+                "PROFILE_SAMPLE_EVERY": "10",
+                "TRACE_EXPORTER": "xray",  # Alert spans to X-Ray; "" keeps only the context
             },
             log_retention=logs.RetentionDays.ONE_WEEK,
             retry_attempts=2,
@@ -66,6 +98,94 @@ class LambdaStack(Stack):
             )
         )
 
+        # Raw-data archive: read manifests, drop a segment lost to a concurrent append
+        stock_scanner.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["s3:GetObject"],
+                resources=[
+                    f"arn:aws:s3:::stock-scan-data-{self.account}/raw-data/*"
+                ],
+            )
+        )
+        stock_scanner.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["s3:DeleteObject"],
+                resources=[
+                    f"arn:aws:s3:::stock-scan-data-{self.account}/raw-data/*/segments/*"
+                ],
+            )
+        )
+
+        # Market model: per-ticker factor statistics carried between scans
+        stock_scanner.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["s3:GetObject"],
+                resources=[
+                    f"arn:aws:s3:::stock-scan-data-{self.account}/market-model/*"
+                ],
+            )
+        )
+        # Scan watermarks: last processed window per ticker (PutObject is granted above)
+        stock_scanner.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["s3:GetObject"],
+                resources=[
+                    f"arn:aws:s3:::stock-scan-data-{self.account}/scan-watermarks/*"
+                ],
+            )
+        )
+        # Without ListBucket a missing manifest or state object is a 403, not a 404
+        stock_scanner.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["s3:ListBucket"],
+                resources=[f"arn:aws:s3:::stock-scan-data-{self.account}"],
+            )
+        )
+
+        # Grant Lambda permission to read the ticker cost table
+        stock_scanner.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["s3:GetObject"],
+                resources=[
+                    f"arn:aws:s3:::stock-scan-data-{self.account}/scan-costs/*"
+                ],
+            )
+        )
+
+        # Grant Lambda permission to publish dashboard snapshots
+        stock_scanner.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["s3:GetObject", "s3:PutObject", "s3:DeleteObject"],
+                resources=[
+                    f"arn:aws:s3:::stock-dashboard-{self.account}/snapshots/*"
+                ],
+            )
+        )
+        # The publisher lists versions to delete superseded ones
+        stock_scanner.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["s3:ListBucket"],
+                resources=[f"arn:aws:s3:::stock-dashboard-{self.account}"],
+                conditions={"StringLike": {"s3:prefix": ["snapshots/v/*"]}},
+            )
+        )
+
+        # Coordinator mode: invoke worker shards of this function or queue them
+        stock_scanner.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["lambda:InvokeFunction"],
+                resources=[
+                    f"arn:aws:lambda:{self.region}:{self.account}:function:stock-scanner"
+                ],
+            )
+        )
+        shard_queue.grant_send_messages(stock_scanner)
+
+        # Queued shards are consumed one at a time by worker invocations
+        stock_scanner.add_event_source(
+            event_sources.SqsEventSource(shard_queue, batch_size=1)
+        )
+
         # Grant Lambda permission to write to DynamoDB
         stock_scanner.add_to_role_policy(
             iam.PolicyStatement(
@@ -76,6 +196,16 @@ class LambdaStack(Stack):
             )
         )
 
+        # Snapshots read recent anomalies through DateIndex
+        stock_scanner.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["dynamodb:Query"],
+                resources=[
+                    f"arn:aws:dynamodb:{self.region}:{self.account}:table/stock-anomalies/index/DateIndex"
+                ],
+            )
+        )
+
         # Grant Lambda permission to publish to SNS
         stock_scanner.add_to_role_policy(
             iam.PolicyStatement(
@@ -86,19 +216,225 @@ class LambdaStack(Stack):
             )
         )
 
-        # EventBridge rule for hourly execution during market hours
-        # Runs every hour from 9:30 AM to 4:00 PM ET, Monday-Friday
-        # Cron format: minute hour day-of-month month day-of-week
-        # Note: EventBridge uses UTC, so adjust for ET (UTC-5 or UTC-4 for DST)
-        schedule_rule = events.Rule(
-            self, "StockScannerSchedule",
-            schedule=events.Schedule.cron(
-                minute="30",  # Run at :30 past the hour
-                hour="14-21",  # 9:30 AM - 4:30 PM ET = 14:30 - 21:30 UTC (EST)
-                week_day="MON-FRI",
-            ),
-            description="Trigger stock scanner hourly during market hours",
+        # EventBridge Scheduler runs the scanner on exchange time (DST-aware).
+        # Schedules are generated from the trading calendar: one per month and
+        # session shape (full or half day), listing only trading days, so
+        # weekends and holidays are never invoked. The scanner re-checks the
+        # calendar (including closures from /stock-tracker/market-hours) and
+        # exits before any I/O when the market is closed.
+        scheduler_role = iam.Role(
+            self, "StockScannerSchedulerRole",
+            assumed_by=iam.ServicePrincipal("scheduler.amazonaws.com"),
+        )
+        stock_scanner.grant_invoke(scheduler_role)
+
+        def scanner_schedule(schedule_id, name, expression, description, start_date=None):
+            return scheduler.CfnSchedule(
+                self, schedule_id,
+                name=name,
+                description=description,
+                schedule_expression=expression,
+                schedule_expression_timezone=EXCHANGE_TIMEZONE,
+                start_date=start_date,
+                flexible_time_window=scheduler.CfnSchedule.FlexibleTimeWindowProperty(mode="OFF"),
+                target=scheduler.CfnSchedule.TargetProperty(
+                    arn=stock_scanner.function_arn,
+                    role_arn=scheduler_role.role_arn,
+                    input=json.dumps({"scheduled": True}),
+                ),
+            )
+
+        calendar = MarketCalendar()
+        first_day = date.today()
+        horizon_end = first_day + timedelta(days=SCHEDULE_HORIZON_DAYS)
+        per_month = {}
+        for expression, start, end in calendar.schedule_expressions(first_day, horizon_end):
+            # Numbered within the month, so names stay stable across deploys
+            month = f"{start:%Y-%m}"
+            per_month[month] = per_month.get(month, 0) + 1
+            scanner_schedule(
+                f"StockScannerSchedule{start:%Y%m}{per_month[month]}",
+                f"stock-scanner-{month}-{per_month[month]}",
+                expression,
+                f"Stock scanner sessions {start} to {end}",
+            )
+
+        # Past the generated horizon (until the next deploy), fall back to
+        # every weekday session; the scanner's calendar check skips holidays
+        scanner_schedule(
+            "StockScannerScheduleFallback",
+            "stock-scanner-fallback",
+            "cron(30 9-16 ? * MON-FRI *)",
+            "Stock scanner weekday sessions after the generated horizon",
+            start_date=f"{horizon_end + timedelta(days=1)}T00:00:00Z",
+        )
+
+        # Kinesis stream for intraday bars (partition key = ticker)
+        bar_stream = kinesis.Stream(
+            self, "IntradayBarStream",
+            stream_name="stock-intraday-bars",
+            shard_count=1,
+            retention_period=Duration.hours(24),
+        )
+
+        # Lambda function for streaming intraday detection
+        stream_detector = _lambda.Function(
+            self, "StreamDetector",
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            handler="stream_detector.lambda_handler",
+            code=_lambda.Code.from_asset("../lambda"),
+            function_name="stock-stream-detector",
+            timeout=Duration.seconds(60),
+            memory_size=256,
+            environment={
+                "S3_BUCKET": f"stock-scan-data-{self.account}",
+                "STREAM_THRESHOLD": "2.0",
+                "STREAM_WINDOW": "20",
+                "STREAM_ALLOWED_LATENESS": "60",
+                "TRACE_EXPORTER": "xray",
+            },
+            log_retention=logs.RetentionDays.ONE_WEEK,
+        )
+
+        # One batch per shard at a time keeps each ticker's bars in order
+        stream_detector.add_event_source(
+            event_sources.KinesisEventSource(
+                bar_stream,
+                starting_position=_lambda.StartingPosition.LATEST,
+                batch_size=100,
+                max_batching_window=Duration.seconds(1),
+                retry_attempts=2,
+            )
+        )
+
+        # Streaming detector stores and alerts like the batch scanner
+        stream_detector.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["dynamodb:PutItem"],
+                resources=[
+                    f"arn:aws:dynamodb:{self.region}:{self.account}:table/stock-anomalies"
+                ],
+            )
+        )
+        # Per-ticker rolling state, restored after a cold start
+        stream_detector.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["s3:GetObject", "s3:PutObject"],
+                resources=[
+                    f"arn:aws:s3:::stock-scan-data-{self.account}/stream-state/*"
+                ],
+            )
+        )
+        # Without ListBucket a ticker with no saved state is a 403, not a 404
+        stream_detector.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["s3:ListBucket"],
+                resources=[f"arn:aws:s3:::stock-scan-data-{self.account}"],
+            )
+        )
+        stream_detector.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["sns:Publish"],
+                resources=[
+                    f"arn:aws:sns:{self.region}:{self.account}:stock-tracker-alerts"
+                ],
+            )
+        )
+
+        # Alert trace spans (lambda/tracing.py); X-Ray does not scope this to resources
+        for traced in (stock_scanner, stream_detector):
+            traced.add_to_role_policy(
+                iam.PolicyStatement(
+                    actions=["xray:PutTraceSegments"],
+                    resources=["*"],
+                )
+            )
+
+        # Lambda function for raw-data archive compaction
+        raw_compactor = _lambda.Function(
+            self, "RawCompactor",
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            handler="raw_archive.lambda_handler",
+            code=_lambda.Code.from_asset("../lambda"),
+            function_name="stock-raw-compactor",
+            timeout=Duration.minutes(5),
+            memory_size=256,
+            environment={
+                "S3_BUCKET": f"stock-scan-data-{self.account}",
+            },
+            log_retention=logs.RetentionDays.ONE_WEEK,
+        )
+
+        raw_compactor.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["s3:GetObject", "s3:PutObject", "s3:DeleteObject"],
+                resources=[
+                    f"arn:aws:s3:::stock-scan-data-{self.account}/raw-data/*"
+                ],
+            )
+        )
+        raw_compactor.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["s3:ListBucket"],
+                resources=[f"arn:aws:s3:::stock-scan-data-{self.account}"],
+                conditions={"StringLike": {"s3:prefix": ["raw-data/*"]}},
+            )
+        )
+
+        # Daily compaction after the last scan (02:00 UTC = 9-10 PM ET)
+        compaction_rule = events.Rule(
+            self, "RawCompactionSchedule",
+            schedule=events.Schedule.cron(minute="0", hour="2"),
+            description="Compact raw-data segments into monthly partitions",
+        )
+        compaction_rule.add_target(targets.LambdaFunction(raw_compactor))
+
+        # Lambda function moving old anomalies from DynamoDB to S3
+        anomaly_archiver = _lambda.Function(
+            self, "AnomalyArchiver",
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            handler="anomaly_archive.lambda_handler",
+            code=_lambda.Code.from_asset("../lambda"),
+            function_name="stock-anomaly-archiver",
+            timeout=Duration.minutes(5),
+            memory_size=256,
+            environment={
+                "S3_BUCKET": f"stock-scan-data-{self.account}",
+                "ARCHIVE_AFTER_DAYS": "30",
+            },
+            log_retention=logs.RetentionDays.ONE_WEEK,
         )
 
-        # Add Lambda as target for EventBridge rule
-        schedule_rule.add_target(targets.LambdaFunction(stock_scanner))
+        anomaly_archiver.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["dynamodb:Query", "dynamodb:UpdateItem"],
+                resources=[
+                    f"arn:aws:dynamodb:{self.region}:{self.account}:table/stock-anomalies",
+                    f"arn:aws:dynamodb:{self.region}:{self.account}:table/stock-anomalies/index/DateIndex",
+                ],
+            )
+        )
+        anomaly_archiver.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["s3:GetObject", "s3:PutObject"],
+                resources=[
+                    f"arn:aws:s3:::stock-scan-data-{self.account}/anomaly-archive/*"
+                ],
+            )
+        )
+        # Without ListBucket a missing partition reads as AccessDenied, not NoSuchKey
+        anomaly_archiver.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["s3:ListBucket"],
+                resources=[f"arn:aws:s3:::stock-scan-data-{self.account}"],
+                conditions={"StringLike": {"s3:prefix": ["anomaly-archive/*"]}},
+            )
+        )
+
+        # Daily archival after compaction (03:00 UTC)
+        archive_rule = events.Rule(
+            self, "AnomalyArchiveSchedule",
+            schedule=events.Schedule.cron(minute="0", hour="3"),
+            description="Archive anomalies older than 30 days to S3",
+        )
+        archive_rule.add_target(targets.LambdaFunction(anomaly_archiver))
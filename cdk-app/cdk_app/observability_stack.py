@@ -4,8 +4,11 @@ from aws_cdk import (
     aws_cloudwatch as cloudwatch,
     aws_sns as sns,
     aws_sns_subscriptions as sns_subs,
+    aws_sqs as sqs,
     aws_lambda as _lambda,
+    aws_lambda_event_sources as event_sources,
     aws_cloudwatch_actions as cw_actions,
+    aws_iam as iam,
     RemovalPolicy,
     Duration,
 )
@@ -33,6 +36,22 @@ class ObservabilityStack(Stack):
             topic_name="stock-tracker-alerts",
         )
 
+        # Notifications are buffered in SQS so a slow or failing Slack webhook
+        # builds a bounded backlog instead of timing out SNS deliveries
+        notification_dlq = sqs.Queue(
+            self, "NotificationDLQ",
+            queue_name="stock-notifications-dlq",
+            retention_period=Duration.days(14),
+        )
+        notification_queue = sqs.Queue(
+            self, "NotificationQueue",
+            queue_name="stock-notifications",
+            visibility_timeout=Duration.seconds(180),  # 6x the function timeout
+            retention_period=Duration.days(4),
+            dead_letter_queue=sqs.DeadLetterQueue(max_receive_count=5, queue=notification_dlq),
+        )
+        self.alert_topic.add_subscription(sns_subs.SqsSubscription(notification_queue))
+
         # Lambda function for Slack notifications
         notification_handler = _lambda.Function(
             self, "NotificationHandler",
@@ -44,13 +63,26 @@ class ObservabilityStack(Stack):
             memory_size=128,
             environment={
                 "SLACK_WEBHOOK_URL": "placeholder",  # Update with real webhook URL
+                "TRACE_EXPORTER": "xray",
             },
             log_retention=logs.RetentionDays.ONE_WEEK,
         )
+        notification_handler.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["xray:PutTraceSegments"],
+                resources=["*"],
+            )
+        )
 
-        # Subscribe Lambda to SNS topic
-        self.alert_topic.add_subscription(
-            sns_subs.LambdaSubscription(notification_handler)
+        # Batches of up to 10, posted concurrently; only failed messages are
+        # retried. Two concurrent batches at most keep Slack's rate limit
+        notification_handler.add_event_source(
+            event_sources.SqsEventSource(
+                notification_queue,
+                batch_size=10,
+                report_batch_item_failures=True,
+                max_concurrency=2,
+            )
         )
 
         # CloudWatch Dashboard
@@ -69,6 +101,106 @@ class ObservabilityStack(Stack):
             )
         )
 
+        # Per-stage latency and throughput from the handlers' EMF metrics
+        stage_groups = {
+            "stock-scanner": ["handler", "fetch", "s3_store", "detect", "dynamodb_write", "sns_publish"],
+            "stock-api": ["handler", "query"],
+            "stock-notifications": ["slack_post"],
+        }
+        for service, stages in stage_groups.items():
+            self.dashboard.add_widgets(
+                cloudwatch.GraphWidget(
+                    title=f"{service} stage latency (p99)",
+                    left=[self.stage_metric(service, stage, "Duration", "p99") for stage in stages],
+                    width=12,
+                    height=6,
+                ),
+                cloudwatch.GraphWidget(
+                    title=f"{service} items processed / retries",
+                    left=[self.stage_metric(service, stage, "ItemsProcessed", "Sum") for stage in stages],
+                    right=[self.stage_metric(service, stage, "Retries", "Sum") for stage in stages],
+                    width=12,
+                    height=6,
+                ),
+            )
+
+        # End-to-end alert latency: scan (or stream arrival) to Slack post
+        self.dashboard.add_widgets(
+            cloudwatch.GraphWidget(
+                title="Alert latency, scan to Slack",
+                left=[
+                    self.stage_metric("stock-notifications", "alert_latency", "Duration", statistic)
+                    for statistic in ("p50", "p90", "p99")
+                ],
+                width=24,
+                height=6,
+            )
+        )
+
+        # Latency alarms on end-to-end handler time
+        latency_alarms = {
+            "stock-scanner": 90000,  # 75% of the 120 s timeout
+            "stock-api": 1000,
+            "stock-notifications": 10000,
+        }
+        for service, threshold_ms in latency_alarms.items():
+            alarm = cloudwatch.Alarm(
+                self,
+                f"{service.title().replace('-', '')}LatencyAlarm",
+                alarm_name=f"{service}-p99-latency",
+                alarm_description=f"p99 {service} handler latency above {threshold_ms} ms",
+                metric=self.stage_metric(
+                    service, "slack_post" if service == "stock-notifications" else "handler",
+                    "Duration", "p99",
+                ),
+                threshold=threshold_ms,
+                evaluation_periods=3,
+                treat_missing_data=cloudwatch.TreatMissingData.NOT_BREACHING,
+            )
+            alarm.add_alarm_action(cw_actions.SnsAction(self.alert_topic))
+
+        # Alerts reaching Slack more than 5 minutes after their scan started
+        alert_latency_alarm = cloudwatch.Alarm(
+            self,
+            "AlertLatencyAlarm",
+            alarm_name="stock-alert-p99-latency",
+            alarm_description="p99 scan-to-Slack alert latency above 300000 ms",
+            metric=self.stage_metric("stock-notifications", "alert_latency", "Duration", "p99"),
+            threshold=300000,
+            evaluation_periods=3,
+            treat_missing_data=cloudwatch.TreatMissingData.NOT_BREACHING,
+        )
+        alert_latency_alarm.add_alarm_action(cw_actions.SnsAction(self.alert_topic))
+
+        # Notification backlog: alerts older than 15 minutes are not reaching
+        # Slack, and anything in the DLQ was never delivered
+        backlog_alarm = cloudwatch.Alarm(
+            self,
+            "NotificationBacklogAlarm",
+            alarm_name="stock-notifications-backlog",
+            alarm_description="Oldest queued notification older than 15 minutes",
+            metric=notification_queue.metric_approximate_age_of_oldest_message(
+                period=Duration.minutes(5),
+            ),
+            threshold=900,
+            evaluation_periods=1,
+            treat_missing_data=cloudwatch.TreatMissingData.NOT_BREACHING,
+        )
+        dead_letter_alarm = cloudwatch.Alarm(
+            self,
+            "NotificationDeadLetterAlarm",
+            alarm_name="stock-notifications-dead-letters",
+            alarm_description="Notifications moved to the DLQ after repeated failures",
+            metric=notification_dlq.metric_approximate_number_of_messages_visible(
+                period=Duration.minutes(5),
+            ),
+            threshold=1,
+            evaluation_periods=1,
+            treat_missing_data=cloudwatch.TreatMissingData.NOT_BREACHING,
+        )
+        for alarm in (backlog_alarm, dead_letter_alarm):
+            alarm.add_alarm_action(cw_actions.SnsAction(self.alert_topic))
+
         # CloudWatch Alarm for Pipeline Failures (placeholder)
         pipeline_alarm = cloudwatch.Alarm(
             self,
@@ -88,3 +220,15 @@ class ObservabilityStack(Stack):
 
         # Add SNS action to alarm
         pipeline_alarm.add_alarm_action(cw_actions.SnsAction(self.alert_topic))
+
+    @staticmethod
+    def stage_metric(service, stage, metric_name, statistic):
+        """EMF metric emitted by lambda/metrics.py for one handler stage."""
+        return cloudwatch.Metric(
+            namespace="StockTracker",
+            metric_name=metric_name,
+            dimensions_map={"Service": service, "Stage": stage},
+            statistic=statistic,
+            period=Duration.minutes(5),
+            label=stage,
+        )
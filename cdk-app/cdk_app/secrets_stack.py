@@ -38,6 +38,14 @@ class SecretsStack(Stack):
             description="Stock ticker to monitor",
         )
 
+        # Parameter Store: Ticker universe for coordinator (sharded) scans
+        self.universe_param = ssm.StringParameter(
+            self, "UniverseParameter",
+            parameter_name="/stock-tracker/universe",
+            string_value="AAPL",
+            description="Comma-separated tickers scanned in coordinator mode",
+        )
+
         # Parameter Store: Anomaly detection thresholds
         self.threshold_param = ssm.StringParameter(
             self, "ThresholdParameter",
@@ -46,6 +54,16 @@ class SecretsStack(Stack):
             description="Z-score threshold for anomaly detection",
         )
 
+        # Parameter Store: Per-ticker anomaly detector selection
+        self.detectors_param = ssm.StringParameter(
+            self, "DetectorsParameter",
+            parameter_name="/stock-tracker/detectors",
+            string_value=json.dumps({
+                "default": ["zscore"]
+            }),
+            description="Anomaly detectors per ticker (zscore, ewma, mad)",
+        )
+
         # Parameter Store: Market hours configuration
         self.market_hours_param = ssm.StringParameter(
             self, "MarketHoursParameter",
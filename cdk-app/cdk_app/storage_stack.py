@@ -30,6 +30,8 @@ class StorageStack(Stack):
             ),
             billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,  # On-demand pricing
             point_in_time_recovery=True,  # Enable backups
+            # Set by the anomaly archiver once an item is copied to S3
+            time_to_live_attribute="expires_at",
             removal_policy=RemovalPolicy.DESTROY,  # For dev/testing
         )
 
@@ -68,11 +70,26 @@ class StorageStack(Stack):
             versioned=True,  # Enable versioning
             encryption=s3.BucketEncryption.S3_MANAGED,  # SSE-S3 encryption
             lifecycle_rules=[
+                # raw-data/ is an append-only archive (no duplicate windows),
+                # so only replaced or deleted versions expire
                 s3.LifecycleRule(
                     id="DeleteOldScans",
                     enabled=True,
-                    expiration=Duration.days(30),  # Delete after 30 days
-                )
+                    noncurrent_version_expiration=Duration.days(30),
+                ),
+                s3.LifecycleRule(
+                    id="DeleteOldProfiles",
+                    enabled=True,
+                    prefix="profiles/",
+                    expiration=Duration.days(30),
+                ),
+                # Large API exports; their presigned URLs expire after 15 minutes
+                s3.LifecycleRule(
+                    id="DeleteOldExports",
+                    enabled=True,
+                    prefix="exports/",
+                    expiration=Duration.days(1),
+                ),
             ],
             removal_policy=RemovalPolicy.DESTROY,  # For dev/testing
             auto_delete_objects=True,  # Clean up on stack deletion
@@ -65,3 +65,21 @@ def test_alarm_created():
             "EvaluationPeriods": 1,
         },
     )
+
+
+def test_latency_alarms_created():
+    """Test that p99 latency alarms exist for each instrumented service."""
+    app = core.App()
+    stack = ObservabilityStack(app, "TestObservabilityStack")
+    template = assertions.Template.from_stack(stack)
+
+    for alarm_name in ["stock-scanner-p99-latency", "stock-api-p99-latency",
+                       "stock-notifications-p99-latency"]:
+        template.has_resource_properties(
+            "AWS::CloudWatch::Alarm",
+            {
+                "AlarmName": alarm_name,
+                "Namespace": "StockTracker",
+                "ExtendedStatistic": "p99",
+            },
+        )
@@ -0,0 +1,333 @@
+"""
+Hot/cold tiering for the anomalies table.
+
+Anomalies whose bar date is older than ARCHIVE_AFTER_DAYS are copied into
+gzip-compressed columnar JSON in S3, one object per bar date, and given a
+DynamoDB TTL so the table (and every GSI projection) stops growing.
+
+Layout under s3://$S3_BUCKET/anomaly-archive/:
+
+    manifest.json                       archived_through, {date: item count}
+    <YYYY>/<MM>/<YYYY-MM-DD>.json.gz    one bar date: {"columns": {...}}
+
+A partition stores each attribute once as a column (ticker, timestamp,
+z_score, ...), so repeated keys are not written per item and a reader
+looking for a few tickers only walks the ticker column before building
+rows. Dates up to manifest['archived_through'] are served from the archive;
+later dates from the table. The partition is written before the manifest
+moves, and items expire TTL_GRACE_DAYS after archiving, so readers never
+see a date that is in neither tier.
+
+The archive job (lambda_handler, daily) walks forward from
+archived_through, saving the manifest after every date, and stops before
+the function deadline; the next run resumes where it stopped. Re-archiving
+a date merges the table's items into the existing partition, so items that
+already expired are kept.
+"""
+import gzip
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import boto3
+from boto3.dynamodb.conditions import Key
+
+from anomaly_record import FIELDS, from_dynamo
+from metrics import MetricsRecorder
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+ARCHIVE_PREFIX = 'anomaly-archive'
+MANIFEST_NAME = 'manifest.json'
+FORMAT_VERSION = 1
+
+# Bar dates older than this many days are archived
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '30'))
+
+# Archived items stay in the table this long before TTL removes them
+TTL_GRACE_DAYS = 7
+TTL_ATTRIBUTE = 'expires_at'
+
+# How far back the first run (no manifest yet) starts
+FIRST_RUN_DAYS = 365
+
+# Dates are not started with less than this left before the function timeout
+DEADLINE_MARGIN_MS = 30000
+
+# Parallel partition GETs for a date range
+READ_WORKERS = 8
+
+# Readers re-fetch the manifest at most this often (warm Lambda containers)
+MANIFEST_CACHE_SECONDS = 300
+
+s3 = boto3.client('s3')
+dynamodb = boto3.resource('dynamodb')
+anomalies_table = dynamodb.Table('stock-anomalies')
+
+metrics = MetricsRecorder('stock-anomaly-archiver')
+
+_manifest_cache = {}
+
+
+def manifest_key(prefix=ARCHIVE_PREFIX):
+    return f"{prefix}/{MANIFEST_NAME}"
+
+
+def partition_key(day, prefix=ARCHIVE_PREFIX):
+    return f"{prefix}/{day[:4]}/{day[5:7]}/{day}.json.gz"
+
+
+def encode_partition(day, items):
+    """
+    Gzip columnar JSON for one bar date. Core anomaly fields come first,
+    then any optional attribute; items without one hold null.
+    """
+    rows = sorted((from_dynamo(item) for item in items),
+                  key=lambda row: (row['ticker'], row['timestamp']))
+    names = [name for name in FIELDS if any(name in row for row in rows)]
+    extra = sorted({name for row in rows for name in row} - set(FIELDS))
+    doc = {
+        'version': FORMAT_VERSION,
+        'date': day,
+        'count': len(rows),
+        'columns': {name: [row.get(name) for row in rows] for name in names + extra}
+    }
+    body = json.dumps(doc, separators=(',', ':')).encode('utf-8')
+    # mtime=0 keeps re-archiving an unchanged date byte-for-byte identical
+    return gzip.compress(body, mtime=0)
+
+
+def decode_partition(body, tickers=None):
+    """Items of one partition, optionally only those of `tickers`."""
+    columns = json.loads(gzip.decompress(body))['columns']
+    ticker_column = columns.get('ticker', [])
+    if tickers is None:
+        indices = range(len(ticker_column))
+    else:
+        wanted = set(tickers)
+        indices = [i for i, ticker in enumerate(ticker_column) if ticker in wanted]
+    items = []
+    for i in indices:
+        item = {}
+        for name, values in columns.items():
+            if values[i] is not None:
+                item[name] = values[i]
+        items.append(item)
+    return items
+
+
+def empty_manifest():
+    return {'archived_through': None, 'dates': {}}
+
+
+def load_manifest(bucket, prefix=ARCHIVE_PREFIX):
+    try:
+        response = s3.get_object(Bucket=bucket, Key=manifest_key(prefix))
+    except s3.exceptions.NoSuchKey:
+        return empty_manifest()
+    return json.loads(response['Body'].read())
+
+
+def save_manifest(manifest, bucket, prefix=ARCHIVE_PREFIX):
+    s3.put_object(
+        Bucket=bucket,
+        Key=manifest_key(prefix),
+        Body=json.dumps(manifest, separators=(',', ':'), sort_keys=True).encode('utf-8'),
+        ContentType='application/json'
+    )
+
+
+def cached_manifest(bucket, prefix=ARCHIVE_PREFIX, max_age=MANIFEST_CACHE_SECONDS):
+    """The manifest, re-read from S3 at most every `max_age` seconds."""
+    now = time.monotonic()
+    cached = _manifest_cache.get((bucket, prefix))
+    if cached is None or now - cached[0] > max_age:
+        cached = _manifest_cache[(bucket, prefix)] = (now, load_manifest(bucket, prefix))
+    return cached[1]
+
+
+def read_partition(day, bucket, prefix=ARCHIVE_PREFIX, tickers=None):
+    try:
+        response = s3.get_object(Bucket=bucket, Key=partition_key(day, prefix))
+    except s3.exceptions.NoSuchKey:
+        return []
+    return decode_partition(response['Body'].read(), tickers)
+
+
+def read_archive(days, bucket, prefix=ARCHIVE_PREFIX, tickers=None):
+    """Items of every archived date in `days`, fetched in parallel."""
+    if not days:
+        return []
+    with ThreadPoolExecutor(max_workers=min(READ_WORKERS, len(days))) as pool:
+        parts = pool.map(lambda day: read_partition(day, bucket, prefix, tickers), days)
+        return [item for part in parts for item in part]
+
+
+def split_dates(days, manifest):
+    """
+    (cold, hot): dates served from the archive and from the table.
+    Archived dates that held no anomalies need no read at all.
+    """
+    through = manifest.get('archived_through')
+    if not through:
+        return [], list(days)
+    cold = [d for d in days if d <= through and manifest['dates'].get(d)]
+    hot = [d for d in days if d > through]
+    return cold, hot
+
+
+def query_date(day, table=None):
+    """Every item in one DateIndex partition."""
+    table = table or anomalies_table
+    items = []
+    kwargs = {
+        'IndexName': 'DateIndex',
+        'KeyConditionExpression': Key('date').eq(day),
+    }
+    while True:
+        result = table.query(**kwargs)
+        items.extend(result.get('Items', []))
+        if 'LastEvaluatedKey' not in result:
+            return items
+        kwargs['ExclusiveStartKey'] = result['LastEvaluatedKey']
+
+
+def expire_items(items, expires_at):
+    """Set the TTL attribute on archived items; returns how many were updated."""
+    updated = 0
+    for item in items:
+        if item.get(TTL_ATTRIBUTE):
+            continue
+        try:
+            anomalies_table.update_item(
+                Key={'ticker': item['ticker'], 'timestamp': item['timestamp']},
+                UpdateExpression='SET #ttl = :expires_at',
+                ConditionExpression='attribute_exists(ticker)',
+                ExpressionAttributeNames={'#ttl': TTL_ATTRIBUTE},
+                ExpressionAttributeValues={':expires_at': expires_at}
+            )
+            updated += 1
+        except anomalies_table.meta.client.exceptions.ConditionalCheckFailedException:
+            # Deleted since the query (an earlier TTL); nothing to expire
+            pass
+    return updated
+
+
+def archive_date(day, bucket, prefix=ARCHIVE_PREFIX, expires_at=None):
+    """
+    Copy one bar date from the table into its partition, then expire the
+    table items. Returns (items archived, items given a TTL).
+    """
+    items = query_date(day)
+    existing = read_partition(day, bucket, prefix)
+    if not items and not existing:
+        return 0, 0
+
+    merged = {(i['ticker'], i['timestamp']): i for i in existing}
+    for item in items:
+        merged[(item['ticker'], item['timestamp'])] = {
+            k: v for k, v in item.items() if k != TTL_ATTRIBUTE
+        }
+    s3.put_object(
+        Bucket=bucket,
+        Key=partition_key(day, prefix),
+        Body=encode_partition(day, merged.values()),
+        ContentType='application/json',
+        ContentEncoding='gzip'
+    )
+    expired = expire_items(items, expires_at) if expires_at else 0
+    return len(merged), expired
+
+
+def dates_between(start, end):
+    """ISO dates from start to end inclusive."""
+    first = date.fromisoformat(start)
+    return [(first + timedelta(days=i)).isoformat()
+            for i in range((date.fromisoformat(end) - first).days + 1)]
+
+
+def run_archive(bucket, prefix=ARCHIVE_PREFIX, start=None, through=None, now=None, deadline=None):
+    """
+    Archive every bar date after the manifest's archived_through (or from
+    `start`) up to `through`, default ARCHIVE_AFTER_DAYS before today.
+    Stops at the first failed date so archived_through stays contiguous,
+    and before starting a date after `deadline` (time.monotonic()). The
+    manifest is saved after each date, so items given a TTL are always
+    behind archived_through.
+    """
+    now = now or datetime.utcnow()
+    manifest = load_manifest(bucket, prefix)
+    through = through or (now.date() - timedelta(days=ARCHIVE_AFTER_DAYS + 1)).isoformat()
+    if manifest['archived_through']:
+        # Never skip past the first unarchived date: that would leave a gap
+        # readers treat as archived
+        next_day = (date.fromisoformat(manifest['archived_through']) + timedelta(days=1)).isoformat()
+        start = min(start or next_day, next_day)
+    elif start is None:
+        start = (now.date() - timedelta(days=FIRST_RUN_DAYS)).isoformat()
+    expires_at = int((now + timedelta(days=TTL_GRACE_DAYS)).timestamp())
+
+    summary = {'dates': 0, 'items_archived': 0, 'items_expired': 0, 'failed_date': None,
+               'complete': True}
+    for day in dates_between(start, through) if start <= through else []:
+        if deadline is not None and time.monotonic() > deadline:
+            logger.warning(f"Stopping before {day}: function deadline near, next run resumes")
+            summary['complete'] = False
+            break
+        try:
+            with metrics.timer('archive_date'):
+                archived, expired = archive_date(day, bucket, prefix, expires_at)
+        except Exception as e:
+            logger.error(f"Archiving {day} failed: {str(e)}")
+            metrics.add('archive_date', 'Failures')
+            summary['failed_date'] = day
+            break
+        metrics.add('archive_date', 'ItemsProcessed', archived)
+        changed = archived and manifest['dates'].get(day) != archived
+        if archived:
+            manifest['dates'][day] = archived
+        if not manifest['archived_through'] or day > manifest['archived_through']:
+            manifest['archived_through'] = day
+            changed = True
+        if changed:
+            save_manifest(manifest, bucket, prefix)
+        summary['dates'] += 1
+        summary['items_archived'] += archived
+        summary['items_expired'] += expired
+
+    summary['archived_through'] = manifest['archived_through']
+    logger.info(f"Archived {summary['items_archived']} anomalies over {summary['dates']} dates "
+                f"(through {summary['archived_through']})")
+    return summary
+
+
+def lambda_handler(event, context):
+    """
+    Scheduled archival of old anomalies.
+    Event options: {"start": "YYYY-MM-DD"} to re-archive from a date (e.g.
+    after a backfill wrote into archived dates), {"through": "YYYY-MM-DD"}
+    to stop earlier than the default cutoff.
+    """
+    try:
+        with metrics.timer('handler'):
+            event = event or {}
+            bucket = os.environ.get('S3_BUCKET', 'stock-scan-data-529088281783')
+            deadline = None
+            if context is not None:
+                deadline = time.monotonic() + (context.get_remaining_time_in_millis() - DEADLINE_MARGIN_MS) / 1000
+            summary = run_archive(bucket, start=event.get('start'), through=event.get('through'),
+                                  deadline=deadline)
+            return {
+                'statusCode': 200,
+                'body': json.dumps(summary)
+            }
+
+    except Exception as e:
+        logger.error(f"Anomaly archival failed: {str(e)}", exc_info=True)
+        raise
+    finally:
+        metrics.flush()
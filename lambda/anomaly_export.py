@@ -0,0 +1,300 @@
+"""
+Bulk export of anomaly history as NDJSON or CSV.
+
+Rows are read one DynamoDB page (or one archived partition) at a time and
+written to a SpooledTemporaryFile, which stays in memory up to
+MAX_INLINE_BYTES and spills to /tmp beyond that, so memory use does not grow
+with the size of the export. An export that fits is returned in the API
+response; a larger one (Lambda and API Gateway cap responses at 6 MB) is
+uploaded to s3://$S3_BUCKET/exports/ and returned as a presigned URL.
+
+Dates the archive job has moved to S3 are read from their partitions (see
+anomaly_archive), later dates from the table. Partitions and per-date
+queries are fetched READ_WORKERS at a time, ahead of the encoder, and rows
+come out oldest bar date first. CSV has one column per core anomaly field
+plus `extra`, a JSON object of any optional attributes (horizon, members,
+...).
+
+Ranges too long for the API's 29 s limit run as export jobs: the API invokes
+the stock-anomaly-export function (lambda_handler here) asynchronously and
+the client polls exports/jobs/<id>.json through the API until the file is
+ready.
+"""
+import csv
+import io
+import json
+import logging
+import os
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from tempfile import SpooledTemporaryFile
+
+import boto3
+from boto3.dynamodb.conditions import Attr, Key
+
+from anomaly_archive import (
+    READ_WORKERS, TTL_ATTRIBUTE, cached_manifest, dates_between, read_partition, split_dates
+)
+from anomaly_record import FIELDS, AnomalyRecord, from_dynamo
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+s3 = boto3.client('s3')
+lambda_client = boto3.client('lambda')
+dynamodb = boto3.resource('dynamodb')
+anomalies_table = dynamodb.Table('stock-anomalies')
+
+# format -> (Content-Type, file extension)
+FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+}
+
+# Largest export returned inline. The body is JSON-escaped into the Lambda
+# response, which grows it, so this stays well under the 6 MB limit.
+MAX_INLINE_BYTES = 4 * 1024 * 1024
+
+EXPORT_PREFIX = 'exports'
+JOB_PREFIX = f'{EXPORT_PREFIX}/jobs'
+URL_EXPIRES_SECONDS = 900
+
+# Function running export jobs (15-minute timeout)
+EXPORT_FUNCTION_NAME = os.environ.get('EXPORT_FUNCTION_NAME', 'stock-anomaly-export')
+
+# Without ?start=, exports begin at the oldest archived anomaly, or this many
+# days back when nothing is archived yet
+DEFAULT_EXPORT_DAYS = 90
+
+_FIELD_SET = frozenset(FIELDS)
+
+
+def default_start(bucket, end):
+    """Oldest archived date holding anomalies, else DEFAULT_EXPORT_DAYS before `end`."""
+    archived = cached_manifest(bucket)['dates']
+    if archived:
+        return min(archived)
+    return (date.fromisoformat(end) - timedelta(days=DEFAULT_EXPORT_DAYS - 1)).isoformat()
+
+
+def prefetched(fetch, days, workers=READ_WORKERS):
+    """fetch(day) for each day, in order, with up to `workers` fetches in flight."""
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for day in days:
+            pending.append(pool.submit(fetch, day))
+            if len(pending) >= workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def paginate(table, **kwargs):
+    """Items of a Query, one page at a time."""
+    while True:
+        result = table.query(**kwargs)
+        yield from result.get('Items', [])
+        if 'LastEvaluatedKey' not in result:
+            return
+        kwargs['ExclusiveStartKey'] = result['LastEvaluatedKey']
+
+
+def item_filter(tickers=None, severities=None):
+    """DynamoDB FilterExpression for the export filters, or None."""
+    conditions = []
+    if tickers:
+        conditions.append(Attr('ticker').is_in(tickers))
+    if severities:
+        conditions.append(Attr('severity').is_in(severities))
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def iter_hot(table, days, tickers=None, severities=None):
+    """
+    Table items for `days` (not yet archived). A single ticker is one
+    Query on its key; otherwise one DateIndex Query per date.
+    """
+    if tickers and len(tickers) == 1:
+        condition = Attr('date').between(days[0], days[-1])
+        severity = item_filter(severities=severities)
+        # A scan never precedes its bar date, so timestamps start at days[0]
+        yield from paginate(
+            table,
+            KeyConditionExpression=Key('ticker').eq(tickers[0]) & Key('timestamp').gte(days[0]),
+            FilterExpression=condition & severity if severity else condition
+        )
+        return
+    expression = item_filter(tickers, severities)
+
+    def query_day(day):
+        kwargs = {'IndexName': 'DateIndex', 'KeyConditionExpression': Key('date').eq(day)}
+        if expression is not None:
+            kwargs['FilterExpression'] = expression
+        return list(paginate(table, **kwargs))
+
+    for items in prefetched(query_day, days):
+        yield from items
+
+
+def iter_anomalies(table, days, bucket, tickers=None, severities=None):
+    """Anomalies for `days` from both tiers, one partition or page in memory at a time."""
+    cold, hot = split_dates(days, cached_manifest(bucket))
+    wanted = set(severities or ())
+    for items in prefetched(lambda day: read_partition(day, bucket, tickers=tickers), cold):
+        for item in items:
+            if not wanted or item.get('severity') in wanted:
+                yield item
+    if hot:
+        yield from iter_hot(table, hot, tickers, severities)
+
+
+def encode_ndjson(items):
+    for item in items:
+        item.pop(TTL_ATTRIBUTE, None)
+        yield AnomalyRecord.from_dict(item).to_json().encode('utf-8') + b'\n'
+
+
+def encode_csv(items):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def take():
+        line = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    writer.writerow(FIELDS + ('extra',))
+    yield take()
+    for item in items:
+        row = from_dynamo(item)
+        extra = {k: v for k, v in row.items() if k not in _FIELD_SET and k != TTL_ATTRIBUTE}
+        writer.writerow([row.get(name, '') for name in FIELDS]
+                        + [json.dumps(extra, separators=(',', ':'), sort_keys=True) if extra else ''])
+        yield take()
+
+
+ENCODERS = {'ndjson': encode_ndjson, 'csv': encode_csv}
+
+
+def export_anomalies(table, days, bucket, fmt='ndjson', tickers=None, severities=None,
+                     inline=True, key=None):
+    """
+    Write the export and return {'count', 'bytes'} plus either 'body' (the
+    export text, when it fits inline and `inline` is set) or 'key' and 'url'
+    (S3 object and its presigned URL).
+    """
+    content_type, extension = FORMATS[fmt]
+    items = iter_anomalies(table, days, bucket, tickers, severities)
+    count = 0
+    size = 0
+    with SpooledTemporaryFile(max_size=MAX_INLINE_BYTES) as spool:
+        for line in ENCODERS[fmt](items):
+            spool.write(line)
+            size += len(line)
+            count += 1
+        # The CSV header is a line but not a row
+        if fmt == 'csv':
+            count -= 1
+        spool.seek(0)
+
+        result = {'count': count, 'bytes': size}
+        if inline and size <= MAX_INLINE_BYTES:
+            result['body'] = spool.read().decode('utf-8')
+            return result
+
+        key = key or f"{EXPORT_PREFIX}/{datetime.utcnow():%Y/%m/%d}/{uuid.uuid4().hex}.{extension}"
+        s3.upload_fileobj(spool, bucket, key, ExtraArgs={
+            'ContentType': content_type,
+            'ContentDisposition': f'attachment; filename="{export_filename(days, extension)}"'
+        })
+    result['key'] = key
+    result['url'] = presigned_url(bucket, key)
+    return result
+
+
+def presigned_url(bucket, key):
+    return s3.generate_presigned_url(
+        'get_object', Params={'Bucket': bucket, 'Key': key}, ExpiresIn=URL_EXPIRES_SECONDS
+    )
+
+
+def export_filename(days, extension):
+    return f"anomalies-{days[0]}-{days[-1]}.{extension}"
+
+
+def job_key(job_id):
+    return f"{JOB_PREFIX}/{job_id}.json"
+
+
+def save_job(bucket, job):
+    s3.put_object(Bucket=bucket, Key=job_key(job['job_id']),
+                  Body=json.dumps(job, separators=(',', ':')).encode('utf-8'),
+                  ContentType='application/json')
+
+
+def load_job(bucket, job_id):
+    """A job's status document, or None if there is no such job."""
+    try:
+        response = s3.get_object(Bucket=bucket, Key=job_key(job_id))
+    except s3.exceptions.NoSuchKey:
+        return None
+    return json.loads(response['Body'].read())
+
+
+def start_export_job(bucket, start, end, fmt='ndjson', tickers=None, severities=None):
+    """Record a running job and invoke the export function for it. Returns the job."""
+    job = {
+        'job_id': uuid.uuid4().hex,
+        'status': 'running',
+        'format': fmt,
+        'start': start,
+        'end': end,
+        'tickers': tickers or [],
+        'severities': severities or [],
+        'created_at': datetime.utcnow().isoformat()
+    }
+    save_job(bucket, job)
+    try:
+        lambda_client.invoke(
+            FunctionName=EXPORT_FUNCTION_NAME,
+            InvocationType='Event',
+            Payload=json.dumps({'export_job': job}).encode('utf-8')
+        )
+    except Exception as e:
+        job.update(status='failed', error='Could not start the export')
+        save_job(bucket, job)
+        logger.error(f"Failed to start export job {job['job_id']}: {str(e)}")
+    return job
+
+
+def run_export_job(job, bucket, table=None):
+    """Write a job's export to S3 and record the outcome in its status document."""
+    days = dates_between(job['start'], job['end'])
+    extension = FORMATS[job['format']][1]
+    try:
+        result = export_anomalies(
+            table or anomalies_table, days, bucket, job['format'],
+            job['tickers'] or None, job['severities'] or None,
+            inline=False, key=f"{EXPORT_PREFIX}/{job['job_id']}.{extension}"
+        )
+        job.update(status='complete', count=result['count'], bytes=result['bytes'], key=result['key'])
+    except Exception as e:
+        logger.error(f"Export job {job['job_id']} failed: {str(e)}", exc_info=True)
+        job.update(status='failed', error='Export failed')
+    job['finished_at'] = datetime.utcnow().isoformat()
+    save_job(bucket, job)
+    return job
+
+
+def lambda_handler(event, context):
+    """Export job worker, invoked asynchronously by the API with {"export_job": {...}}."""
+    bucket = os.environ.get('S3_BUCKET', 'stock-scan-data-529088281783')
+    job = run_export_job(event['export_job'], bucket)
+    logger.info(f"Export job {job['job_id']} {job['status']}")
+    return {'statusCode': 200, 'body': json.dumps(job)}
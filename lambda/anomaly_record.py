@@ -0,0 +1,173 @@
+"""
+Anomaly record shared by the detectors, market model, stream detector and
+backfill, with one serializer per destination:
+
+- to_item(): DynamoDB item, floats converted to Decimal in a single pass
+- to_json(): compact JSON line for NDJSON output
+- alert_text(): the SNS/Slack alert body
+
+Records are slotted (no per-instance __dict__) and keep dict-style access,
+so code that reads anomaly['z_score'] or anomaly.get('members') works on
+records and on plain dicts (e.g. items read back from DynamoDB) alike.
+"""
+import json
+import operator
+from decimal import Decimal
+
+# Attributes every anomaly carries, in stored order
+FIELDS = (
+    'ticker', 'timestamp', 'date', 'anomaly_type', 'detector', 'value',
+    'baseline_mean', 'baseline_std', 'z_score', 'threshold', 'severity'
+)
+
+_FIELD_SET = frozenset(FIELDS)
+
+_get_fields = operator.attrgetter(*FIELDS)
+
+# Built once: json.dumps() with non-default options creates an encoder per call
+_JSON_ENCODER = json.JSONEncoder(separators=(',', ':'))
+
+
+def to_dynamo(value):
+    """Convert floats (also inside lists and dicts) to Decimal for DynamoDB."""
+    if isinstance(value, float):
+        # repr() is the shortest round-tripping form: 150.1 -> Decimal('150.1')
+        return Decimal(repr(value))
+    if isinstance(value, list):
+        return [to_dynamo(v) for v in value]
+    if isinstance(value, dict):
+        return {k: to_dynamo(v) for k, v in value.items()}
+    return value
+
+
+def from_dynamo(value):
+    """Convert Decimals read from DynamoDB back to int or float."""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, list):
+        return [from_dynamo(v) for v in value]
+    if isinstance(value, dict):
+        return {k: from_dynamo(v) for k, v in value.items()}
+    return value
+
+
+class AnomalyRecord:
+    """
+    One detected anomaly. Optional attributes (horizon, members,
+    bar_timestamp, source, ...) live in `extra` and are stored after the
+    core fields. Fields set to None are treated as absent.
+    """
+
+    __slots__ = FIELDS + ('extra',)
+
+    def __init__(self, ticker=None, timestamp=None, date=None, anomaly_type=None,
+                 detector=None, value=None, baseline_mean=None, baseline_std=None,
+                 z_score=None, threshold=None, severity=None, **extra):
+        self.ticker = ticker
+        self.timestamp = timestamp
+        self.date = date
+        self.anomaly_type = anomaly_type
+        self.detector = detector
+        self.value = value
+        self.baseline_mean = baseline_mean
+        self.baseline_std = baseline_std
+        self.z_score = z_score
+        self.threshold = threshold
+        self.severity = severity
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a record from a dict or DynamoDB item (Decimals converted back)."""
+        return cls(**{k: from_dynamo(v) for k, v in data.items()})
+
+    # Dict-style access
+
+    def __getitem__(self, key):
+        if key in _FIELD_SET:
+            value = getattr(self, key)
+            if value is None:
+                raise KeyError(key)
+            return value
+        return self.extra[key]
+
+    def __setitem__(self, key, value):
+        if key in _FIELD_SET:
+            setattr(self, key, value)
+        else:
+            self.extra[key] = value
+
+    def __contains__(self, key):
+        if key in _FIELD_SET:
+            return getattr(self, key) is not None
+        return key in self.extra
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def items(self):
+        return self.to_dict().items()
+
+    def __eq__(self, other):
+        if isinstance(other, (AnomalyRecord, dict)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"AnomalyRecord({self.to_dict()!r})"
+
+    # Serializers
+
+    def to_dict(self):
+        data = {name: value for name, value in zip(FIELDS, _get_fields(self)) if value is not None}
+        data.update(self.extra)
+        return data
+
+    def to_item(self):
+        """DynamoDB item: floats become Decimal, ints and strings pass through."""
+        item = {}
+        for name, value in zip(FIELDS, _get_fields(self)):
+            if value is None:
+                continue
+            item[name] = Decimal(repr(value)) if type(value) is float else value
+        for name, value in self.extra.items():
+            if value is not None:
+                item[name] = to_dynamo(value)
+        return item
+
+    def to_json(self):
+        """Compact JSON object (one NDJSON line, without the newline)."""
+        return _JSON_ENCODER.encode(self.to_dict())
+
+    def alert_text(self):
+        """Human-readable alert body sent through SNS to email and Slack."""
+        direction = "increased" if self.z_score > 0 else "decreased"
+
+        message = f"""
+🚨 Anomaly Detected for {self.ticker}
+
+Type: {self.anomaly_type.upper()}
+Severity: {self.severity.upper()}
+Date: {self.date}
+
+Current Value: {self.value:,.2f}
+Baseline Mean: {self.baseline_mean:,.2f}
+Standard Deviation: {self.baseline_std:,.2f}
+
+Z-Score: {self.z_score} (threshold: {self.threshold})
+
+The {self.anomaly_type} has {direction} significantly beyond normal levels.
+This represents a {abs(self.z_score):.1f} standard deviation move.
+"""
+        members = self.extra.get('members')
+        if members:
+            message += f"\nMoved together ({self.extra['member_count']}): {', '.join(members)}\n"
+        return message.strip()
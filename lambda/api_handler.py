@@ -1,7 +1,18 @@
 import json
 import logging
+import os
 import boto3
+from boto3.dynamodb.conditions import Attr, Key
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from decimal import Decimal
+
+from anomaly_archive import cached_manifest, dates_between, query_date, read_archive, split_dates
+from anomaly_export import (
+    FORMATS, URL_EXPIRES_SECONDS, default_start, export_anomalies, export_filename, load_job,
+    presigned_url, start_export_job
+)
+from metrics import MetricsRecorder
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -9,69 +20,220 @@ logger.setLevel(logging.INFO)
 dynamodb = boto3.resource('dynamodb')
 table = dynamodb.Table('stock-anomalies')
 
+# Default window for GET /anomalies without ?since=
+RECENT_DAYS = 7
+
+# Bar dates (DateIndex partitions) can trail scan timestamps by this many days
+DATE_LOOKBACK_DAYS = 4
+
+# Maximum items in one delta response; the watermark resumes from the last one
+MAX_DELTA_ITEMS = 500
+
+# Watermarks trail the clock so late-arriving index writes are not skipped
+WATERMARK_LAG_SECONDS = 120
+
+# GET /anomalies?tickers=: watchlist size, and items per ticker
+# (?limit=, clamped to MAX_BATCH_LIMIT)
+MAX_BATCH_TICKERS = 100
+DEFAULT_BATCH_LIMIT = 10
+MAX_BATCH_LIMIT = 50
+
+# Per-ticker Queries run concurrently for one batch request
+BATCH_QUERY_WORKERS = 10
+
+# Historical ranges (?start=&end=): widest range and items per response
+MAX_RANGE_DAYS = 366
+MAX_RANGE_ITEMS = 5000
+
+# Exports (/anomalies/export): widest range, and the most days and archived
+# items exported within the request (API Gateway gives up after 29s);
+# anything larger runs as an export job
+MAX_EXPORT_DAYS = 3660
+MAX_SYNC_EXPORT_DAYS = 31
+MAX_SYNC_EXPORT_ITEMS = 20000
+
+# Sent with every response
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type',
+    'Access-Control-Allow-Methods': 'GET,OPTIONS'
+}
+
+# Per-stage EMF metrics, flushed at the end of each request
+metrics = MetricsRecorder('stock-api')
+
 def lambda_handler(event, context):
     """
     API handler for anomaly queries.
     Supports:
     - GET /anomalies - List recent anomalies
+    - GET /anomalies?since=<timestamp> - Anomalies newer than a watermark
+    - GET /anomalies?tickers=A,B,C[&limit=N][&format=merged] - Latest anomalies for a watchlist
+    - GET /anomalies?start=<date>[&end=<date>] - Anomalies for a range of bar dates
     - GET /anomalies/{ticker} - Get ticker-specific anomalies
+    - GET /anomalies/{ticker}?start=<date>[&end=<date>] - Ticker anomalies for a range
+    - GET /anomalies/export[?format=ndjson|csv&start=&end=&ticker=&severity=] - Bulk export
+    - GET /anomalies/export/jobs/{job_id} - Status of an export job
     - GET /health - Health check
     """
     try:
-        http_method = event.get('httpMethod')
-        path = event.get('path', '')
-        path_parameters = event.get('pathParameters') or {}
-        
-        logger.info(f"API request: {http_method} {path}")
-        
-        # Health check endpoint
-        if path == '/health':
-            return response(200, {
-                'status': 'healthy',
-                'timestamp': datetime.utcnow().isoformat(),
-                'service': 'stock-anomaly-api'
-            })
-        
-        # List all recent anomalies
-        if path == '/anomalies' and http_method == 'GET':
-            return list_anomalies()
-        
-        # Get anomalies for specific ticker
-        if path.startswith('/anomalies/') and http_method == 'GET':
-            ticker = path_parameters.get('ticker')
-            if ticker:
-                return get_ticker_anomalies(ticker)
-        
-        # Unknown endpoint
-        return response(404, {'error': 'Endpoint not found'})
+        with metrics.timer('handler'):
+            http_method = event.get('httpMethod')
+            path = event.get('path', '')
+            path_parameters = event.get('pathParameters') or {}
+            query_parameters = event.get('queryStringParameters') or {}
+            
+            logger.info(f"API request: {http_method} {path}")
+            
+            # Health check endpoint
+            if path == '/health':
+                return response(200, {
+                    'status': 'healthy',
+                    'timestamp': datetime.utcnow().isoformat(),
+                    'service': 'stock-anomaly-api'
+                })
+            
+            # List all recent anomalies (or only new ones with ?since=),
+            # or the latest ones for a watchlist with ?tickers=
+            if path == '/anomalies' and http_method == 'GET':
+                if query_parameters.get('tickers'):
+                    return get_batch_anomalies(
+                        query_parameters['tickers'],
+                        query_parameters.get('limit'),
+                        query_parameters.get('format')
+                    )
+                if query_parameters.get('start'):
+                    return get_range_anomalies(query_parameters['start'], query_parameters.get('end'))
+                return list_anomalies(query_parameters.get('since'))
+            
+            # Bulk export (before the ticker route: API Gateway matches the literal path first)
+            if path == '/anomalies/export' and http_method == 'GET':
+                return get_export(query_parameters)
+            if path.startswith('/anomalies/export/jobs/') and http_method == 'GET':
+                return get_export_job(path_parameters.get('job_id') or path.rsplit('/', 1)[-1])
+            
+            # Get anomalies for specific ticker
+            if path.startswith('/anomalies/') and http_method == 'GET':
+                ticker = path_parameters.get('ticker')
+                if ticker and query_parameters.get('start'):
+                    return get_range_anomalies(query_parameters['start'], query_parameters.get('end'),
+                                               ticker=ticker.upper())
+                if ticker:
+                    return get_ticker_anomalies(ticker)
+            
+            # Unknown endpoint
+            return response(404, {'error': 'Endpoint not found'})
         
     except Exception as e:
         logger.error(f"API error: {str(e)}", exc_info=True)
         return response(500, {'error': 'Internal server error'})
+    finally:
+        metrics.flush()
 
-def list_anomalies():
-    """List recent anomalies (last 7 days)."""
+def list_anomalies(since=None):
+    """
+    List recent anomalies (last 7 days), or only those newer than `since`.
+    
+    `since` is the watermark returned by a previous call, so a polling
+    client only receives new items. Items are read from DateIndex, one
+    Query per bar date that can hold items with timestamp > since.
+    """
     try:
-        # For now, return empty list (will populate in Week 7)
-        # In production, would scan table with date filter
+        now = datetime.utcnow()
+        if since:
+            try:
+                since_time = datetime.fromisoformat(since[:26])
+            except ValueError:
+                return response(400, {'error': f'Invalid since timestamp: {since}'})
+        else:
+            since_time = now - timedelta(days=RECENT_DAYS)
+            since = since_time.isoformat()
+        
+        # Bar dates lag scan timestamps over weekends and holidays
+        first_date = (since_time - timedelta(days=DATE_LOOKBACK_DAYS)).date()
+        dates = [
+            (first_date + timedelta(days=i)).isoformat()
+            for i in range((now.date() - first_date).days + 1)
+        ]
+        
+        items = []
+        with metrics.timer('query'):
+            for date in dates:
+                items.extend(query_date_since(date, since))
+        metrics.add('query', 'ItemsProcessed', len(items))
+        
+        items.sort(key=lambda item: item['timestamp'])
+        truncated = len(items) > MAX_DELTA_ITEMS
+        if truncated:
+            items = items[:page_end(items, MAX_DELTA_ITEMS)]
+        
         return response(200, {
-            'anomalies': [],
-            'count': 0,
-            'message': 'No anomalies detected yet'
+            'anomalies': items[::-1],
+            'count': len(items),
+            'since': since,
+            'watermark': next_watermark(items, since, now, truncated),
+            'truncated': truncated
         })
     except Exception as e:
         logger.error(f"Error listing anomalies: {str(e)}")
         return response(500, {'error': 'Failed to list anomalies'})
 
+def query_date_since(date, since):
+    """All items in one DateIndex partition with timestamp > since."""
+    items = []
+    kwargs = {
+        'IndexName': 'DateIndex',
+        'KeyConditionExpression': Key('date').eq(date) & Key('timestamp').gt(since),
+    }
+    while True:
+        result = table.query(**kwargs)
+        items.extend(result.get('Items', []))
+        if 'LastEvaluatedKey' not in result:
+            return items
+        kwargs['ExclusiveStartKey'] = result['LastEvaluatedKey']
+
+def page_end(items, limit):
+    """
+    Length of a truncated page (items sorted by timestamp). The next poll
+    asks for timestamps after the last one returned, so items sharing a
+    timestamp are never split: the page is cut back to the previous
+    timestamp, or runs past `limit` when one timestamp fills it.
+    """
+    boundary = items[limit]['timestamp']
+    end = limit
+    while end > 0 and items[end - 1]['timestamp'] == boundary:
+        end -= 1
+    if end == 0:
+        end = limit
+        while end < len(items) and items[end]['timestamp'] == boundary:
+            end += 1
+    return end
+
+def next_watermark(items, since, now, truncated):
+    """
+    Watermark for the client's next poll.
+    Held back by WATERMARK_LAG_SECONDS so items whose index write lands a
+    little late are still returned; clients de-duplicate the overlap.
+    """
+    if not items:
+        return since
+    newest = items[-1]['timestamp']
+    if truncated:
+        return newest
+    lagged = (now - timedelta(seconds=WATERMARK_LAG_SECONDS)).isoformat()
+    return max(since, min(newest, lagged))
+
 def get_ticker_anomalies(ticker):
     """Get anomalies for specific ticker."""
     try:
         # Query DynamoDB by ticker
-        result = table.query(
-            KeyConditionExpression='ticker = :ticker',
-            ExpressionAttributeValues={':ticker': ticker.upper()},
-            Limit=50
-        )
+        with metrics.timer('query'):
+            result = table.query(
+                KeyConditionExpression='ticker = :ticker',
+                ExpressionAttributeValues={':ticker': ticker.upper()},
+                Limit=50
+            )
+        metrics.add('query', 'ItemsProcessed', len(result.get('Items', [])))
         
         return response(200, {
             'ticker': ticker.upper(),
@@ -82,15 +244,242 @@ def get_ticker_anomalies(ticker):
         logger.error(f"Error getting ticker anomalies: {str(e)}")
         return response(500, {'error': f'Failed to get anomalies for {ticker}'})
 
+def get_range_anomalies(start, end=None, ticker=None):
+    """
+    Anomalies for bar dates start..end (inclusive), newest first, from both
+    tiers: dates the archive job has moved to S3 (see anomaly_archive) are
+    read from their partitions, later dates from the table.
+    """
+    end = end or datetime.utcnow().date().isoformat()
+    try:
+        days = dates_between(start, end)
+    except ValueError:
+        return response(400, {'error': f'Invalid date range: {start}..{end}'})
+    if not days:
+        return response(400, {'error': 'start is after end'})
+    if len(days) > MAX_RANGE_DAYS:
+        return response(400, {'error': f'At most {MAX_RANGE_DAYS} days per request'})
+
+    bucket = os.environ.get('S3_BUCKET', 'stock-scan-data-529088281783')
+    cold, hot = split_dates(days, cached_manifest(bucket))
+    with metrics.timer('archive_read'):
+        cold_items = read_archive(cold, bucket, tickers=[ticker] if ticker else None)
+    metrics.add('archive_read', 'ItemsProcessed', len(cold_items))
+
+    hot_items = []
+    if hot:
+        with metrics.timer('query'):
+            if ticker:
+                hot_items = query_ticker_dates(ticker, hot[0], hot[-1])
+            else:
+                for date in hot:
+                    hot_items.extend(query_date(date, table))
+        metrics.add('query', 'ItemsProcessed', len(hot_items))
+
+    items = cold_items + hot_items
+    items.sort(key=lambda item: (item['timestamp'], item['ticker']), reverse=True)
+    truncated = len(items) > MAX_RANGE_ITEMS
+    items = items[:MAX_RANGE_ITEMS]
+
+    body = {
+        'start': start,
+        'end': end,
+        'anomalies': items,
+        'count': len(items),
+        'truncated': truncated,
+        'archived': len(cold_items)
+    }
+    if ticker:
+        body['ticker'] = ticker
+    return response(200, body)
+
+def query_ticker_dates(ticker, first_date, last_date):
+    """
+    One ticker's items with bar dates in first_date..last_date.
+    A scan never precedes its bar date, so timestamps start at first_date.
+    """
+    items = []
+    kwargs = {
+        'KeyConditionExpression': Key('ticker').eq(ticker) & Key('timestamp').gte(first_date),
+        'FilterExpression': Attr('date').between(first_date, last_date),
+    }
+    while True:
+        result = table.query(**kwargs)
+        items.extend(result.get('Items', []))
+        if 'LastEvaluatedKey' not in result:
+            return items
+        kwargs['ExclusiveStartKey'] = result['LastEvaluatedKey']
+
+def parse_tickers(raw):
+    """'aapl, MSFT,aapl' -> ['AAPL', 'MSFT']: upper-cased, de-duplicated, in order."""
+    return list(dict.fromkeys(t.strip().upper() for t in raw.split(',') if t.strip()))
+
+def query_latest(client, table_name, ticker, limit):
+    """Newest `limit` anomalies for one ticker in a single Query."""
+    result = client.query(
+        TableName=table_name,
+        KeyConditionExpression=Key('ticker').eq(ticker),
+        ScanIndexForward=False,
+        Limit=limit
+    )
+    return result.get('Items', [])
+
+def get_batch_anomalies(raw_tickers, raw_limit=None, layout=None):
+    """
+    Latest anomalies for up to MAX_BATCH_TICKERS tickers in one round trip.
+
+    One Query per ticker, BATCH_QUERY_WORKERS at a time. Workers share the
+    table's low-level client (boto3 clients are thread-safe, resources are
+    not). Grouped by ticker by default; format=merged returns a single list,
+    newest first. A ticker whose Query fails is listed under 'errors'
+    instead of failing the whole request.
+    """
+    tickers = parse_tickers(raw_tickers)
+    if not tickers:
+        return response(400, {'error': 'No tickers given'})
+    if len(tickers) > MAX_BATCH_TICKERS:
+        return response(400, {'error': f'At most {MAX_BATCH_TICKERS} tickers per request'})
+    if layout not in (None, 'grouped', 'merged'):
+        return response(400, {'error': f'Invalid format: {layout}'})
+    try:
+        limit = int(raw_limit) if raw_limit else DEFAULT_BATCH_LIMIT
+    except ValueError:
+        return response(400, {'error': f'Invalid limit: {raw_limit}'})
+    limit = max(1, min(limit, MAX_BATCH_LIMIT))
+
+    client = table.meta.client
+    grouped = {}
+    errors = {}
+    with metrics.timer('batch_query'):
+        with ThreadPoolExecutor(max_workers=min(BATCH_QUERY_WORKERS, len(tickers))) as pool:
+            futures = {
+                ticker: pool.submit(query_latest, client, table.name, ticker, limit)
+                for ticker in tickers
+            }
+            for ticker, future in futures.items():
+                try:
+                    grouped[ticker] = future.result()
+                except Exception as e:
+                    logger.error(f"Error querying anomalies for {ticker}: {str(e)}")
+                    errors[ticker] = 'Query failed'
+    count = sum(len(items) for items in grouped.values())
+    metrics.add('batch_query', 'ItemsProcessed', count)
+    if errors:
+        metrics.add('batch_query', 'Failures', len(errors))
+
+    body = {'tickers': tickers, 'limit': limit, 'count': count}
+    if layout == 'merged':
+        merged = [item for items in grouped.values() for item in items]
+        merged.sort(key=lambda item: item['timestamp'], reverse=True)
+        body['anomalies'] = merged
+    else:
+        body['anomalies'] = grouped
+    if errors:
+        body['errors'] = errors
+    return response(200, body)
+
+def get_export(query_parameters):
+    """
+    Anomaly history as NDJSON (default) or CSV, filtered by bar date range,
+    tickers and severities. Small exports come back as the response body;
+    larger ones as a presigned S3 URL (see anomaly_export).
+    """
+    fmt = (query_parameters.get('format') or 'ndjson').lower()
+    if fmt not in FORMATS:
+        return response(400, {'error': f'Invalid format: {fmt}'})
+    tickers = parse_tickers(query_parameters.get('ticker') or '')
+    if len(tickers) > MAX_BATCH_TICKERS:
+        return response(400, {'error': f'At most {MAX_BATCH_TICKERS} tickers per export'})
+    severities = [s.strip().lower() for s in (query_parameters.get('severity') or '').split(',') if s.strip()]
+
+    bucket = os.environ.get('S3_BUCKET', 'stock-scan-data-529088281783')
+    end = query_parameters.get('end') or datetime.utcnow().date().isoformat()
+    start = query_parameters.get('start') or default_start(bucket, end)
+    try:
+        days = dates_between(start, end)
+    except ValueError:
+        return response(400, {'error': f'Invalid date range: {start}..{end}'})
+    if not days:
+        return response(400, {'error': 'start is after end'})
+    if len(days) > MAX_EXPORT_DAYS:
+        return response(400, {'error': f'At most {MAX_EXPORT_DAYS} days per export'})
+
+    if not fits_request(days, bucket):
+        job = start_export_job(bucket, start, end, fmt, tickers, severities)
+        if job['status'] == 'failed':
+            return response(500, {'error': job['error']})
+        return response(202, {
+            'job_id': job['job_id'],
+            'status': job['status'],
+            'poll': f"/anomalies/export/jobs/{job['job_id']}"
+        })
+
+    with metrics.timer('export'):
+        result = export_anomalies(table, days, bucket, fmt, tickers or None, severities or None)
+    metrics.add('export', 'ItemsProcessed', result['count'])
+    logger.info(f"Exported {result['count']} anomalies ({result['bytes']} bytes) as {fmt}")
+
+    content_type, extension = FORMATS[fmt]
+    if 'body' in result:
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Content-Type': content_type,
+                'Content-Disposition': f'attachment; filename="{export_filename(days, extension)}"',
+                **CORS_HEADERS
+            },
+            'body': result['body']
+        }
+    return response(200, {
+        'format': fmt,
+        'start': start,
+        'end': end,
+        'count': result['count'],
+        'bytes': result['bytes'],
+        'url': result['url'],
+        'expires_in': URL_EXPIRES_SECONDS
+    })
+
+def fits_request(days, bucket):
+    """
+    Whether an export is small enough to run within the API request: at most
+    MAX_SYNC_EXPORT_DAYS days, whose archived anomaly counts (known from the
+    manifest) stay under MAX_SYNC_EXPORT_ITEMS.
+    """
+    if len(days) > MAX_SYNC_EXPORT_DAYS:
+        return False
+    archived = cached_manifest(bucket)['dates']
+    return sum(archived.get(day, 0) for day in days) <= MAX_SYNC_EXPORT_ITEMS
+
+def get_export_job(job_id):
+    """Status of an export job; a finished one includes a presigned URL."""
+    if not job_id or not job_id.isalnum():
+        return response(400, {'error': 'Invalid job id'})
+    bucket = os.environ.get('S3_BUCKET', 'stock-scan-data-529088281783')
+    job = load_job(bucket, job_id)
+    if job is None:
+        return response(404, {'error': f'No export job {job_id}'})
+    body = {k: job[k] for k in ('job_id', 'status', 'format', 'start', 'end') if k in job}
+    if job['status'] == 'complete':
+        body.update(count=job['count'], bytes=job['bytes'],
+                    url=presigned_url(bucket, job['key']), expires_in=URL_EXPIRES_SECONDS)
+    elif job['status'] == 'failed':
+        body['error'] = job.get('error')
+    return response(200 if job['status'] != 'running' else 202, body)
+
 def response(status_code, body):
     """Format API Gateway response with CORS headers."""
     return {
         'statusCode': status_code,
         'headers': {
             'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Headers': 'Content-Type',
-            'Access-Control-Allow-Methods': 'GET,OPTIONS'
+            **CORS_HEADERS
         },
-        'body': json.dumps(body)
+        'body': json.dumps(body, default=json_default)
     }
+
+def json_default(value):
+    """Serialize DynamoDB Decimals as int or float."""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,555 @@
+"""
+Ad-hoc queries over the raw-data archive (S3 or a local mirror).
+
+Usage:
+    # Days where AAPL volume was more than 2x its trailing 20-day mean in 2025
+    python lambda/archive_query.py --source s3://stock-scan-data-529088281783/raw-data \\
+        --tickers AAPL --start 2025-01-01 --end 2025-12-31 \\
+        --where "volume > 2 * volume_mean20" --columns date,volume,volume_mean20
+
+    # Monthly average close and count of 3-sigma price days per ticker
+    python lambda/archive_query.py --source ./raw-data --group-by ticker,month \\
+        --where "abs(close_z20) > 3" --agg "count,mean(close),max(volume)"
+
+Only monthly partitions inside [start, end] (plus enough earlier months to
+warm up rolling columns) are read, via the manifest and byte-range reads.
+Bars are processed one month per ticker at a time as column batches, so
+memory is bounded by a month of bars plus rolling-window state.
+
+Columns: ticker, date, open, high, low, close, volume, and derived
+<field>_mean<N>, <field>_std<N>, <field>_z<N> (trailing N bars, excluding
+the current one, like the detectors) and <field>_chg (change vs previous bar).
+--where accepts comparisons, and/or/not, + - * / and abs().
+"""
+import argparse
+import ast
+import csv
+import json
+import math
+import operator
+import os
+import re
+import sys
+from collections import deque
+from datetime import date, timedelta
+
+# raw_archive creates its S3 client at import time; the stack is deployed to us-east-1
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import boto3
+
+from detectors import PrefixSums
+from raw_archive import (
+    MANIFEST_NAME,
+    partition_range,
+    merge_bars,
+    normalize_bar,
+    parse_raw_object
+)
+
+BASE_COLUMNS = ('ticker', 'date', 'open', 'high', 'low', 'close', 'volume')
+BAR_COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+DEFAULT_COLUMNS = BASE_COLUMNS
+
+DERIVED = re.compile(r'^(open|high|low|close|volume)_(mean|std|z)(\d+)$')
+CHANGE = re.compile(r'^(open|high|low|close|volume)_chg$')
+
+# Trading days per month, used to size the warm-up for rolling columns
+MIN_BARS_PER_MONTH = 15
+
+GROUP_KEYS = {
+    'ticker': lambda ticker, day: ticker,
+    'year': lambda ticker, day: day[:4],
+    'month': lambda ticker, day: day[:7],
+    'date': lambda ticker, day: day,
+}
+
+
+class QueryError(ValueError):
+    """Invalid column, expression or aggregate."""
+
+
+# --- Sources ---------------------------------------------------------------
+
+class LocalSource:
+    """Local mirror of raw-data/ (aws s3 sync s3://.../raw-data ./raw-data)."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def tickers(self):
+        return sorted(n for n in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, n)))
+
+    def keys(self, ticker):
+        base = os.path.join(self.root, ticker)
+        keys = []
+        for root, dirs, files in os.walk(base):
+            dirs.sort()
+            for name in sorted(files):
+                keys.append(os.path.relpath(os.path.join(root, name), self.root).replace(os.sep, '/'))
+        return keys
+
+    def read(self, key, byte_range=None):
+        path = os.path.join(self.root, *key.split('/'))
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            if byte_range is None:
+                return f.read()
+            first, last = (int(x) for x in byte_range[len('bytes='):].split('-'))
+            f.seek(first)
+            return f.read(last - first + 1)
+
+
+class S3Source:
+    """raw-data/ prefix in S3 (s3://bucket/raw-data)."""
+
+    def __init__(self, uri, client=None):
+        self.bucket, _, prefix = uri[len('s3://'):].partition('/')
+        self.prefix = prefix.rstrip('/')
+        self.s3 = client or boto3.client('s3')
+
+    def tickers(self):
+        tickers = []
+        paginator = self.s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=f"{self.prefix}/", Delimiter='/'):
+            for common in page.get('CommonPrefixes', []):
+                tickers.append(common['Prefix'].rstrip('/').rsplit('/', 1)[-1])
+        return sorted(tickers)
+
+    def keys(self, ticker):
+        keys = []
+        paginator = self.s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=f"{self.prefix}/{ticker}/"):
+            keys.extend(obj['Key'][len(self.prefix) + 1:] for obj in page.get('Contents', []))
+        return sorted(keys)
+
+    def read(self, key, byte_range=None):
+        kwargs = {'Bucket': self.bucket, 'Key': f"{self.prefix}/{key}"}
+        if byte_range:
+            kwargs['Range'] = byte_range
+        try:
+            return self.s3.get_object(**kwargs)['Body'].read()
+        except self.s3.exceptions.NoSuchKey:
+            return None
+
+
+def open_source(uri):
+    return S3Source(uri) if uri.startswith('s3://') else LocalSource(uri)
+
+
+def month_batches(source, ticker, start, end):
+    """
+    Yield one sorted list of bars per month in [start, end] for a ticker.
+    With a manifest only the listed partitions (ranged) and segments are
+    read; without one (legacy layout) every object is read and merged.
+    """
+    body = source.read(f"{ticker}/{MANIFEST_NAME}")
+    if body is None:
+        bars = []
+        for key in source.keys(ticker):
+            bars.extend(parse_raw_object(key, source.read(key) or b''))
+        bars = [normalize_bar(b) for b in merge_bars(bars) if start <= b['date'] <= end]
+        by_month = {}
+        for bar in bars:
+            by_month.setdefault(bar['date'][:7], []).append(bar)
+        for month in sorted(by_month):
+            yield by_month[month]
+        return
+
+    manifest = json.loads(body)
+    # Segments are small (pending compaction); later ones win
+    pending = {}
+    for segment in manifest['segments']:
+        if segment['last_date'] >= start and segment['first_date'] <= end:
+            rel = f"{ticker}/{segment['key'].split(f'/{ticker}/', 1)[1]}"
+            for bar in parse_raw_object(rel, source.read(rel) or b''):
+                pending.setdefault(bar['date'][:7], []).append(bar)
+
+    months = sorted(m for m in set(manifest['months']) | set(pending) if start[:7] <= m <= end[:7])
+    for month in months:
+        bars = []
+        if month in manifest['months']:
+            key = f"{ticker}/monthly/{month}.ndjson"
+            bars = parse_raw_object(key, source.read(key, partition_range(month, start, end)) or b'')
+        bars = merge_bars(bars + pending.get(month, []))
+        bars = [bar for bar in bars if start <= bar['date'] <= end]
+        if bars:
+            yield bars
+
+
+# --- Columns ---------------------------------------------------------------
+
+def _value(x):
+    return None if x is None or (isinstance(x, float) and math.isnan(x)) else x
+
+
+class RollingColumn:
+    """
+    Trailing mean/std/z-score over the previous N values of a field.
+    The values carried over from the previous batch and the batch's own
+    share one prefix-sum pass, so each row costs O(1) whatever N is.
+    """
+
+    def __init__(self, field, kind, size):
+        self.field = field
+        self.kind = kind
+        self.size = size
+
+    def compute(self, values, state):
+        window = state.setdefault((self.kind, self.field, self.size), deque(maxlen=self.size))
+        series = list(window) + [x for x in values if x is not None]
+        sums = PrefixSums(series)
+        end = len(window)
+        out = []
+        for x in values:
+            result = None
+            if end >= self.size:
+                mean, std = sums.window(end - self.size, end)
+                if self.kind == 'mean':
+                    result = mean
+                elif self.kind == 'std':
+                    result = std
+                elif x is not None:
+                    result = (x - mean) / std if std > 0 else 0.0
+            out.append(result)
+            if x is not None:
+                end += 1
+        window.extend(series[len(window):])
+        return out
+
+
+class ChangeColumn:
+    """Fractional change against the previous bar."""
+
+    def __init__(self, field):
+        self.field = field
+
+    def compute(self, values, state):
+        previous = state.get(('previous', self.field))
+        out = []
+        for x in values:
+            out.append((x - previous) / previous if x is not None and previous else None)
+            if x is not None:
+                previous = x
+        state[('previous', self.field)] = previous
+        return out
+
+
+def derived_column(name):
+    """Column object for a derived name, or None for a base column."""
+    if name in BASE_COLUMNS:
+        return None
+    match = DERIVED.match(name)
+    if match:
+        field, kind, size = match.group(1), match.group(2), int(match.group(3))
+        if size < 2:
+            raise QueryError(f"Window for {name} must be at least 2")
+        return RollingColumn(field, kind, size)
+    match = CHANGE.match(name)
+    if match:
+        return ChangeColumn(match.group(1))
+    raise QueryError(f"Unknown column: {name}")
+
+
+def warmup_bars(names):
+    """Bars needed before the start date to fill rolling columns."""
+    bars = 0
+    for name in names:
+        column = derived_column(name)
+        if isinstance(column, RollingColumn):
+            bars = max(bars, column.size)
+        elif isinstance(column, ChangeColumn):
+            bars = max(bars, 1)
+    return bars
+
+
+def to_columns(ticker, bars, names, derived, state):
+    """Turn a month of bars into {name: list} for the requested columns."""
+    columns = {'ticker': [ticker] * len(bars), 'date': [bar['date'] for bar in bars]}
+    for field in BAR_COLUMNS:
+        if field in names or any(c.field == field for c in derived.values()):
+            columns[field] = [_value(bar.get(field)) for bar in bars]
+    for name, column in derived.items():
+        columns[name] = column.compute(columns[column.field], state)
+    return columns
+
+
+# --- Expressions -----------------------------------------------------------
+
+BIN_OPS = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv}
+CMP_OPS = {ast.Gt: operator.gt, ast.GtE: operator.ge, ast.Lt: operator.lt, ast.LtE: operator.le,
+           ast.Eq: operator.eq, ast.NotEq: operator.ne}
+
+
+def _apply(fn, left, right, n):
+    """Element-wise fn over two columns or scalars; None propagates."""
+    left_col = isinstance(left, list)
+    right_col = isinstance(right, list)
+    if not left_col and not right_col:
+        return [None if left is None or right is None else fn(left, right)] * n
+    lefts = left if left_col else [left] * n
+    rights = right if right_col else [right] * n
+    out = []
+    for a, b in zip(lefts, rights):
+        if a is None or b is None:
+            out.append(None)
+        else:
+            try:
+                out.append(fn(a, b))
+            except ZeroDivisionError:
+                out.append(None)
+    return out
+
+
+class Expression:
+    """A --where expression compiled from a restricted Python AST."""
+
+    def __init__(self, text):
+        self.text = text
+        try:
+            self.tree = ast.parse(text, mode='eval').body
+        except SyntaxError as e:
+            raise QueryError(f"Invalid expression {text!r}: {e.msg}")
+        self.names = set()
+        self._check(self.tree)
+
+    def _check(self, node):
+        if isinstance(node, ast.Name):
+            derived_column(node.id)
+            self.names.add(node.id)
+        elif isinstance(node, ast.Constant):
+            if not isinstance(node.value, (int, float, str)):
+                raise QueryError(f"Unsupported constant in {self.text!r}")
+        elif isinstance(node, ast.BinOp) and type(node.op) in BIN_OPS:
+            self._check(node.left)
+            self._check(node.right)
+        elif isinstance(node, ast.Compare) and all(type(op) in CMP_OPS for op in node.ops):
+            for child in [node.left] + node.comparators:
+                self._check(child)
+        elif isinstance(node, ast.BoolOp):
+            for child in node.values:
+                self._check(child)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.Not, ast.USub)):
+            self._check(node.operand)
+        elif (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+              and node.func.id == 'abs' and len(node.args) == 1 and not node.keywords):
+            self._check(node.args[0])
+        else:
+            raise QueryError(f"Unsupported syntax in {self.text!r}: {ast.dump(node)[:40]}")
+
+    def evaluate(self, columns, n):
+        """Return a list of n values (None where an input was missing)."""
+        result = self._eval(self.tree, columns, n)
+        return result if isinstance(result, list) else [result] * n
+
+    def _eval(self, node, columns, n):
+        if isinstance(node, ast.Name):
+            return columns[node.id]
+        if isinstance(node, ast.Constant):
+            return node.value
+        if isinstance(node, ast.BinOp):
+            return _apply(BIN_OPS[type(node.op)], self._eval(node.left, columns, n),
+                          self._eval(node.right, columns, n), n)
+        if isinstance(node, ast.Compare):
+            left = self._eval(node.left, columns, n)
+            result = [True] * n
+            for op, comparator in zip(node.ops, node.comparators):
+                right = self._eval(comparator, columns, n)
+                step = _apply(CMP_OPS[type(op)], left, right, n)
+                result = [bool(a) and bool(b) for a, b in zip(result, step)]
+                left = right
+            return result
+        if isinstance(node, ast.BoolOp):
+            values = [self._eval(v, columns, n) for v in node.values]
+            values = [v if isinstance(v, list) else [v] * n for v in values]
+            combine = all if isinstance(node.op, ast.And) else any
+            return [combine(bool(v) for v in row) for row in zip(*values)]
+        if isinstance(node, ast.UnaryOp):
+            operand = self._eval(node.operand, columns, n)
+            operand = operand if isinstance(operand, list) else [operand] * n
+            if isinstance(node.op, ast.Not):
+                return [not v for v in operand]
+            return [None if v is None else -v for v in operand]
+        # abs()
+        operand = self._eval(node.args[0], columns, n)
+        operand = operand if isinstance(operand, list) else [operand] * n
+        return [None if v is None else abs(v) for v in operand]
+
+
+# --- Aggregates ------------------------------------------------------------
+
+AGGREGATE = re.compile(r'^(count|sum|mean|min|max|first|last)(?:\((\*|[a-z0-9_]+)\))?$')
+
+
+class Aggregate:
+    """One streaming aggregate, e.g. mean(close)."""
+
+    def __init__(self, spec):
+        match = AGGREGATE.match(spec.strip())
+        if not match:
+            raise QueryError(f"Unknown aggregate: {spec}")
+        self.fn, column = match.group(1), match.group(2)
+        if self.fn != 'count' and column in (None, '*'):
+            raise QueryError(f"{self.fn} needs a column: {spec}")
+        self.column = None if column in (None, '*') else column
+        if self.column:
+            derived_column(self.column)
+        self.name = spec.strip() if self.column or self.fn != 'count' else 'count'
+
+    def initial(self):
+        return [0, 0.0, None]  # count, sum, current (min/max/first/last)
+
+    def update(self, acc, values):
+        for v in values:
+            if self.column and v is None:
+                continue
+            acc[0] += 1
+            if self.fn in ('sum', 'mean'):
+                acc[1] += v
+            elif self.fn == 'min':
+                acc[2] = v if acc[2] is None else min(acc[2], v)
+            elif self.fn == 'max':
+                acc[2] = v if acc[2] is None else max(acc[2], v)
+            elif self.fn == 'first':
+                if acc[2] is None:
+                    acc[2] = v
+            elif self.fn == 'last':
+                acc[2] = v
+
+    def result(self, acc):
+        if self.fn == 'count':
+            return acc[0]
+        if self.fn == 'sum':
+            return acc[1]
+        if self.fn == 'mean':
+            return acc[1] / acc[0] if acc[0] else None
+        return acc[2]
+
+
+# --- Query -----------------------------------------------------------------
+
+def run_query(source, tickers, start=None, end=None, columns=None, where=None,
+              aggregates=None, group_by=None):
+    """
+    Yield result rows (dicts). Without aggregates, matching bars are yielded
+    as each month is processed; with aggregates, one row per group at the end.
+    """
+    start = start or '0000-01-01'
+    end = end or '9999-12-31'
+    columns = list(columns or DEFAULT_COLUMNS)
+    expression = Expression(where) if where else None
+    aggregates = [Aggregate(spec) for spec in aggregates or []]
+    group_by = list(group_by or [])
+    for key in group_by:
+        if key not in GROUP_KEYS:
+            raise QueryError(f"Unknown group-by key: {key}")
+
+    names = set(columns if not aggregates else [])
+    names |= expression.names if expression else set()
+    names |= {agg.column for agg in aggregates if agg.column}
+    derived = {}
+    for name in sorted(names):
+        column = derived_column(name)
+        if column:
+            derived[name] = column
+
+    # Read earlier months so rolling columns are full on the start date
+    warmup = warmup_bars(names)
+    read_start = start
+    if warmup and start != '0000-01-01':
+        months_back = warmup // MIN_BARS_PER_MONTH + 1
+        first = date.fromisoformat(start).replace(day=1)
+        for _ in range(months_back):
+            first = (first - timedelta(days=1)).replace(day=1)
+        read_start = first.isoformat()
+
+    groups = {}
+    for ticker in tickers:
+        state = {}
+        for bars in month_batches(source, ticker, read_start, end):
+            batch = to_columns(ticker, bars, names, derived, state)
+            n = len(bars)
+            keep = [start <= day for day in batch['date']]
+            if expression:
+                keep = [k and bool(m) for k, m in zip(keep, expression.evaluate(batch, n))]
+            rows = [i for i in range(n) if keep[i]]
+            if not rows:
+                continue
+
+            if not aggregates:
+                for i in rows:
+                    yield {name: batch[name][i] for name in columns}
+                continue
+
+            for i in rows:
+                key = tuple(GROUP_KEYS[g](ticker, batch['date'][i]) for g in group_by)
+                accs = groups.get(key)
+                if accs is None:
+                    accs = groups[key] = [agg.initial() for agg in aggregates]
+                for agg, acc in zip(aggregates, accs):
+                    agg.update(acc, [batch[agg.column][i]] if agg.column else [1])
+
+    for key in sorted(groups):
+        row = dict(zip(group_by, key))
+        for agg, acc in zip(aggregates, groups[key]):
+            row[agg.name] = agg.result(acc)
+        yield row
+
+
+def write_rows(rows, out, fmt='csv'):
+    """Stream rows as CSV (header from the first row) or NDJSON. Returns the row count."""
+    count = 0
+    writer = None
+    for row in rows:
+        if fmt == 'ndjson':
+            out.write(json.dumps(row) + '\n')
+        else:
+            if writer is None:
+                writer = csv.DictWriter(out, fieldnames=list(row))
+                writer.writeheader()
+            writer.writerow(row)
+        count += 1
+    return count
+
+
+def split_list(value):
+    return [v.strip() for v in value.split(',') if v.strip()] if value else []
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the raw-data archive")
+    parser.add_argument('--source', required=True,
+                        help="Local raw-data mirror or s3://bucket/raw-data")
+    parser.add_argument('--tickers', help="Comma-separated tickers (default: all in source)")
+    parser.add_argument('--start', help="First date (YYYY-MM-DD)")
+    parser.add_argument('--end', help="Last date (YYYY-MM-DD)")
+    parser.add_argument('--columns', help="Comma-separated output columns")
+    parser.add_argument('--where', help="Row filter, e.g. \"volume > 2 * volume_mean20\"")
+    parser.add_argument('--agg', help="Comma-separated aggregates, e.g. \"count,mean(close)\"")
+    parser.add_argument('--group-by', help="Comma-separated: ticker, year, month, date")
+    parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+    parser.add_argument('--output', help="Output file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    source = open_source(args.source)
+    tickers = [t.upper() for t in split_list(args.tickers)] or source.tickers()
+    out = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        rows = run_query(
+            source, tickers, start=args.start, end=args.end,
+            columns=split_list(args.columns) or None, where=args.where,
+            aggregates=split_list(args.agg), group_by=split_list(args.group_by)
+        )
+        count = write_rows(rows, out, args.format)
+    except QueryError as e:
+        parser.error(str(e))
+    finally:
+        if args.output:
+            out.close()
+
+    print(f"{count} row(s)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,312 @@
+"""
+Local backfill runner: re-score stored history with the scanner's detectors.
+
+Usage:
+    python lambda/backfill.py --source ./raw-data --tickers AAPL,MSFT \\
+        --start 2026-01-01 --end 2026-03-31 --output anomalies.ndjson
+    python lambda/backfill.py --source s3://stock-scan-data-529088281783/raw-data \\
+        --dynamodb --resume
+
+History is read from a local mirror of the raw-data/ layout
+(<source>/<TICKER>/ with legacy *.json, monthly/ and segments/, or
+<source>/<TICKER>.json) or from S3.
+Completed tickers are recorded in a checkpoint file so an interrupted
+run can be resumed with --resume. With --history-store, bars are parsed
+from the source once and memory-mapped from the store on later runs.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# The scanner creates AWS clients at import time; the stack is deployed to us-east-1
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import boto3
+
+from bar_series import BarSeries
+from detectors import BASELINE_DAYS, HORIZON_DETECTOR, horizon_anomalies, resolve_detectors
+from history_store import HistoryReader, HistoryWriter
+from raw_archive import merge_bars, parse_raw_object
+from stock_scanner import detect_anomalies
+
+logger = logging.getLogger()
+
+DEFAULT_CHECKPOINT = '.backfill-checkpoint'
+
+
+# Anomaly types the backfill can store, in sort-key order. Append only:
+# a type's position is its microsecond in the sort key, so reordering
+# would duplicate items stored by earlier runs instead of overwriting them.
+BACKFILL_TYPES = (
+    'price', 'volume',
+    'price_ewma', 'volume_ewma',
+    'price_mad', 'volume_mad',
+    'price_5d', 'volume_5d',
+    'price_20d', 'volume_20d',
+    'price_60d', 'volume_60d',
+)
+
+_TYPE_SLOTS = {anomaly_type: slot for slot, anomaly_type in enumerate(BACKFILL_TYPES, 1)}
+
+
+def backfill_timestamp(date, anomaly_type):
+    """
+    Deterministic sort key for a re-scored anomaly, so reruns overwrite
+    instead of duplicating. It stays an ISO timestamp (midnight of the bar
+    date); the type's slot in BACKFILL_TYPES, as microseconds, keeps the
+    types of one date apart. Unknown types raise ValueError: add them to
+    BACKFILL_TYPES rather than risk two types sharing a key.
+    """
+    slot = _TYPE_SLOTS.get(anomaly_type)
+    if slot is None:
+        raise ValueError(f"No backfill sort key for anomaly type {anomaly_type!r}; "
+                         f"add it to BACKFILL_TYPES")
+    return f"{date}T00:00:00.{slot:06d}"
+
+
+def split_s3_uri(uri):
+    bucket, _, prefix = uri[len('s3://'):].partition('/')
+    return bucket, prefix.rstrip('/')
+
+
+def load_local_history(source, ticker):
+    """Load bars for a ticker from a local raw-data mirror."""
+    bars = []
+    single = os.path.join(source, f"{ticker}.json")
+    if os.path.isfile(single):
+        with open(single) as f:
+            bars.extend(json.load(f))
+
+    # Legacy objects, then monthly/ partitions, then segments/: oldest writes first
+    ticker_dir = os.path.join(source, ticker)
+    for root, dirs, files in os.walk(ticker_dir):
+        dirs.sort()
+        for name in sorted(files):
+            with open(os.path.join(root, name), 'rb') as f:
+                bars.extend(parse_raw_object(name, f.read()))
+    return merge_bars(bars)
+
+
+def load_s3_history(source, ticker):
+    """Load bars for a ticker from the S3 raw-data prefix."""
+    bucket, prefix = split_s3_uri(source)
+    s3 = boto3.client('s3')
+    bars = []
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=f"{prefix}/{ticker}/"):
+        for obj in page.get('Contents', []):
+            if obj['Key'].endswith(('.json', '.ndjson')):
+                body = s3.get_object(Bucket=bucket, Key=obj['Key'])['Body'].read()
+                bars.extend(parse_raw_object(obj['Key'], body))
+    return merge_bars(bars)
+
+
+def list_tickers(source):
+    """Discover tickers available in the source."""
+    if source.startswith('s3://'):
+        bucket, prefix = split_s3_uri(source)
+        s3 = boto3.client('s3')
+        tickers = []
+        paginator = s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket, Prefix=f"{prefix}/", Delimiter='/'):
+            for common in page.get('CommonPrefixes', []):
+                tickers.append(common['Prefix'].rstrip('/').rsplit('/', 1)[-1])
+        return sorted(tickers)
+
+    tickers = set()
+    for name in os.listdir(source):
+        path = os.path.join(source, name)
+        if os.path.isdir(path):
+            tickers.add(name)
+        elif name.endswith('.json'):
+            tickers.add(name[:-len('.json')])
+    return sorted(tickers)
+
+
+def rescore_ticker(task):
+    """
+    Re-score every day of a ticker's history in [start, end].
+    Runs in a worker process; returns (ticker, anomalies, bars_scored).
+    """
+    ticker, source, start, end, threshold, detectors, store_root, refresh_store = task
+    logging.getLogger().setLevel(logging.WARNING)
+
+    series = None
+    if store_root and not refresh_store:
+        series = HistoryReader(store_root).series(ticker)
+
+    if series is None:
+        if source.startswith('s3://'):
+            bars = load_s3_history(source, ticker)
+        else:
+            bars = load_local_history(source, ticker)
+
+        if store_root:
+            # Later runs map the store instead of re-parsing JSON
+            HistoryWriter(store_root).append(ticker, bars)
+            series = HistoryReader(store_root).series(ticker)
+        else:
+            series = BarSeries.from_records(bars)
+
+    if series is None:
+        return ticker, [], 0
+    names = resolve_detectors(detectors)
+    window_names = [name for name in names if name != HORIZON_DETECTOR]
+    found = []
+    scored = 0
+    for i in range(BASELINE_DAYS, len(series)):
+        date = series.date(i)
+        if (start and date < start) or (end and date > end):
+            continue
+        scored += 1
+        if window_names:
+            window = series[i - BASELINE_DAYS:i + 1]
+            found.extend(detect_anomalies(ticker, window, threshold, window_names))
+
+    if HORIZON_DETECTOR in names:
+        # One prefix-sum pass scores every day against every horizon
+        found.extend(
+            a for a in horizon_anomalies(ticker, series, threshold, first=0)
+            if not (start and a['date'] < start) and not (end and a['date'] > end)
+        )
+
+    anomalies = []
+    for anomaly in found:
+        anomaly['timestamp'] = backfill_timestamp(anomaly['date'], anomaly['anomaly_type'])
+        anomaly['source'] = 'backfill'
+        anomalies.append(anomaly)
+
+    return ticker, anomalies, scored
+
+
+class NdjsonWriter:
+    """Appends anomalies to a newline-delimited JSON file."""
+
+    def __init__(self, path):
+        self.file = open(path, 'a')
+
+    def write(self, anomalies):
+        self.file.write(''.join(a.to_json() + '\n' for a in anomalies))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class DynamoDBWriter:
+    """Writes anomalies to the anomalies table with batched PutItem calls."""
+
+    def __init__(self, table_name='stock-anomalies'):
+        self.table = boto3.resource('dynamodb').Table(table_name)
+
+    def write(self, anomalies):
+        with self.table.batch_writer(overwrite_by_pkeys=['ticker', 'timestamp']) as batch:
+            for anomaly in anomalies:
+                batch.put_item(Item=anomaly.to_item())
+
+    def close(self):
+        pass
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def run_backfill(tickers, source, writer, start=None, end=None, threshold=2.0,
+                 detectors=None, workers=None, checkpoint=DEFAULT_CHECKPOINT,
+                 resume=False, progress=sys.stderr, store_root=None, refresh_store=False):
+    """
+    Re-score tickers across a process pool and write anomalies in bulk.
+    Returns a summary with totals and throughput.
+    """
+    done = load_checkpoint(checkpoint) if resume else set()
+    if not resume and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    pending = [t for t in tickers if t not in done]
+
+    totals = {'tickers': 0, 'skipped': len(tickers) - len(pending), 'bars': 0, 'anomalies': 0}
+    started = time.perf_counter()
+
+    tasks = [(t, source, start, end, threshold, detectors, store_root, refresh_store)
+             for t in pending]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool, \
+            open(checkpoint, 'a') as checkpoint_file:
+        futures = [pool.submit(rescore_ticker, task) for task in tasks]
+        for future in as_completed(futures):
+            ticker, anomalies, scored = future.result()
+            if anomalies:
+                writer.write(anomalies)
+            checkpoint_file.write(ticker + '\n')
+            checkpoint_file.flush()
+
+            totals['tickers'] += 1
+            totals['bars'] += scored
+            totals['anomalies'] += len(anomalies)
+
+            if progress:
+                elapsed = time.perf_counter() - started
+                progress.write(
+                    f"[{totals['tickers']}/{len(pending)}] {ticker}: {len(anomalies)} anomalies | "
+                    f"{totals['bars'] / elapsed:,.0f} bars/s | "
+                    f"{totals['tickers'] / elapsed:,.1f} tickers/s\n"
+                )
+
+    elapsed = time.perf_counter() - started
+    totals['elapsed_s'] = round(elapsed, 2)
+    totals['bars_per_s'] = round(totals['bars'] / elapsed, 1) if elapsed else 0.0
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-score stored bar history")
+    parser.add_argument('--source', required=True,
+                        help="Local raw-data mirror or s3://bucket/raw-data")
+    parser.add_argument('--tickers', help="Comma-separated tickers (default: all in source)")
+    parser.add_argument('--start', help="First date to score (YYYY-MM-DD)")
+    parser.add_argument('--end', help="Last date to score (YYYY-MM-DD)")
+    parser.add_argument('--threshold', type=float, default=2.0)
+    parser.add_argument('--detectors', default='zscore',
+                        help="Comma-separated detectors (zscore, ewma, mad, horizons)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--output', help="Write anomalies to this NDJSON file")
+    parser.add_argument('--dynamodb', action='store_true',
+                        help="Write anomalies to the stock-anomalies table")
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT)
+    parser.add_argument('--resume', action='store_true',
+                        help="Skip tickers completed in the checkpoint file")
+    parser.add_argument('--history-store',
+                        help="Memory-mapped history store directory (filled from --source on first use)")
+    parser.add_argument('--refresh-store', action='store_true',
+                        help="Append newer bars from --source to the history store before scoring")
+    args = parser.parse_args(argv)
+
+    if not args.output and not args.dynamodb:
+        parser.error("one of --output or --dynamodb is required")
+
+    tickers = ([t.strip().upper() for t in args.tickers.split(',') if t.strip()]
+               if args.tickers else list_tickers(args.source))
+    writer = DynamoDBWriter() if args.dynamodb else NdjsonWriter(args.output)
+
+    try:
+        totals = run_backfill(
+            tickers, args.source, writer,
+            start=args.start, end=args.end, threshold=args.threshold,
+            detectors=args.detectors.split(','), workers=args.workers,
+            checkpoint=args.checkpoint, resume=args.resume,
+            store_root=args.history_store, refresh_store=args.refresh_store
+        )
+    finally:
+        writer.close()
+
+    print(json.dumps(totals))
+
+
+if __name__ == '__main__':
+    main()
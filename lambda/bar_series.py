@@ -0,0 +1,87 @@
+from array import array
+from datetime import date
+
+# Numeric bar columns in storage order
+COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+
+_NAN = float('nan')
+
+
+class BarSeries:
+    """
+    Columnar OHLCV series for one ticker.
+
+    Each column is a memoryview over a typed array, so column access and
+    slicing (e.g. a 20-day baseline window) share the underlying buffer
+    instead of copying. Dates are stored as proleptic ordinals. Columns may
+    also be strided views into a memory-mapped file (see history_store).
+    Convert to and from the list-of-dicts format with from_records() and
+    to_records() at the provider and storage edges.
+    """
+    __slots__ = ('dates', 'open', 'high', 'low', 'close', 'volume')
+
+    def __init__(self, dates, open, high, low, close, volume):
+        self.dates = memoryview(dates)
+        self.open = memoryview(open)
+        self.high = memoryview(high)
+        self.low = memoryview(low)
+        self.close = memoryview(close)
+        self.volume = memoryview(volume)
+
+    @classmethod
+    def from_records(cls, records):
+        """Build a series from a list of {'date', 'open', ..., 'volume'} dicts."""
+        dates = array('i')
+        columns = {name: array('d') for name in COLUMNS}
+        for record in records:
+            dates.append(date.fromisoformat(record['date']).toordinal())
+            for name in COLUMNS:
+                columns[name].append(record.get(name, _NAN))
+        return cls(dates, **columns)
+
+    def to_records(self):
+        """Convert back to the list-of-dicts format (missing fields omitted)."""
+        return [self.record(i) for i in range(len(self))]
+
+    def record(self, index):
+        """One bar as a dict."""
+        bar = {'date': date.fromordinal(int(self.dates[index])).isoformat()}
+        for name in COLUMNS:
+            value = getattr(self, name)[index]
+            if value == value:  # skip NaN (field not present in the source)
+                bar[name] = int(value) if name == 'volume' else value
+        return bar
+
+    def column(self, name):
+        """Zero-copy view of a column ('close', 'volume', ...)."""
+        return getattr(self, name)
+
+    def date(self, index):
+        """ISO date string of a bar."""
+        return date.fromordinal(int(self.dates[index])).isoformat()
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return BarSeries(self.dates[key], self.open[key], self.high[key],
+                             self.low[key], self.close[key], self.volume[key])
+        return self.record(key)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.record(i)
+
+    @property
+    def nbytes(self):
+        """Bytes held by the column buffers."""
+        return sum(view.nbytes for view in (self.dates, self.open, self.high,
+                                            self.low, self.close, self.volume))
+
+
+def as_records(data):
+    """Return bars as a list of dicts, whatever representation was passed in."""
+    if isinstance(data, BarSeries):
+        return data.to_records()
+    return data
@@ -0,0 +1,361 @@
+import logging
+import math
+import time
+from datetime import datetime, timedelta
+
+from anomaly_record import AnomalyRecord
+from bar_series import BarSeries
+
+logger = logging.getLogger()
+
+# Baseline window used by every detector (days before the current bar)
+BASELINE_DAYS = 20
+
+# EWMA span in days (alpha = 2 / (span + 1))
+EWMA_SPAN = 20
+
+# Scale factor that makes MAD comparable to a standard deviation
+MAD_SCALE = 1.4826
+
+# Detectors used when a ticker has no explicit configuration
+DEFAULT_DETECTORS = ['zscore']
+
+# Baseline lengths (bars) scored together by the 'horizons' detector
+HORIZONS = (5, 20, 60)
+
+# Detector name that enables multi-horizon scoring ('price_5d', 'volume_60d', ...)
+HORIZON_DETECTOR = 'horizons'
+
+# Calendar days of history fetched per scan, and with horizons enabled when
+# no market calendar is at hand (60 trading days plus the current bar, over
+# weekends and holidays)
+HISTORY_DAYS = 30
+HORIZON_HISTORY_DAYS = 100
+
+# Extra sessions fetched for horizons, for halts and bars the provider skipped
+HORIZON_SLACK_SESSIONS = 5
+
+# Bar fields scored by the detectors: anomaly_type prefix -> bar key
+FIELDS = {
+    'price': 'close',
+    'volume': 'volume',
+}
+
+# Detector registry: name -> scoring function
+DETECTORS = {}
+
+
+def register_detector(name, needs_sorted=False):
+    """
+    Register a detector function under a name.
+
+    A detector takes the precomputed SeriesStats for one field and returns
+    (z_score, baseline_center, baseline_spread).
+    """
+    def decorator(func):
+        func.needs_sorted = needs_sorted
+        DETECTORS[name] = func
+        return func
+    return decorator
+
+
+class SeriesStats:
+    """
+    Baseline statistics for one field of one ticker.
+    Built in a single pass over the baseline window and shared by all detectors.
+    """
+    __slots__ = ('current', 'count', 'shift', 'total', 'total_sq',
+                 'ewma_mean', 'ewma_var', 'sorted_values')
+
+    def __init__(self, baseline, current, with_sorted=False):
+        self.current = current
+        self.count = len(baseline)
+        # Shift by the first value so sums of squares of large volumes
+        # do not lose precision
+        self.shift = baseline[0]
+        self.total = 0.0
+        self.total_sq = 0.0
+
+        alpha = 2.0 / (EWMA_SPAN + 1)
+        ewma_mean = float(baseline[0])
+        ewma_var = 0.0
+
+        for value in baseline:
+            shifted = value - self.shift
+            self.total += shifted
+            self.total_sq += shifted * shifted
+
+            delta = value - ewma_mean
+            ewma_mean += alpha * delta
+            ewma_var = (1 - alpha) * (ewma_var + alpha * delta * delta)
+
+        self.ewma_mean = ewma_mean
+        self.ewma_var = ewma_var
+        self.sorted_values = sorted(baseline) if with_sorted else None
+
+    @property
+    def mean(self):
+        return self.shift + self.total / self.count
+
+    @property
+    def std(self):
+        """Sample standard deviation (matches statistics.stdev)."""
+        if self.count < 2:
+            return 0.0
+        variance = (self.total_sq - self.total * self.total / self.count) / (self.count - 1)
+        return math.sqrt(variance) if variance > 0 else 0.0
+
+
+class PrefixSums:
+    """
+    Cumulative sums and sums of squares of a whole series, built in one pass.
+    The mean and sample std of any window values[start:end] are then O(1),
+    so every horizon and every day share the same pass.
+    """
+    __slots__ = ('shift', 'sums', 'sums_sq')
+
+    def __init__(self, values):
+        # Shifted like SeriesStats so large volumes keep their precision
+        self.shift = float(values[0]) if len(values) else 0.0
+        sums = [0.0]
+        sums_sq = [0.0]
+        total = 0.0
+        total_sq = 0.0
+        for value in values:
+            shifted = value - self.shift
+            total += shifted
+            total_sq += shifted * shifted
+            sums.append(total)
+            sums_sq.append(total_sq)
+        self.sums = sums
+        self.sums_sq = sums_sq
+
+    def window(self, start, end):
+        """(mean, sample std) of values[start:end]."""
+        n = end - start
+        total = self.sums[end] - self.sums[start]
+        total_sq = self.sums_sq[end] - self.sums_sq[start]
+        mean = self.shift + total / n
+        if n < 2:
+            return mean, 0.0
+        variance = (total_sq - total * total / n) / (n - 1)
+        return mean, math.sqrt(variance) if variance > 0 else 0.0
+
+
+def horizon_scores(values, horizons=HORIZONS, first=0):
+    """
+    Score days first..end of a series against each trailing horizon.
+    Returns {horizon: [(score, mean, std) or None]} indexed like values;
+    None where a day has fewer than `horizon` earlier values.
+    """
+    sums = PrefixSums(values)
+    scores = {}
+    for horizon in horizons:
+        day_scores = [None] * len(values)
+        for i in range(max(first, horizon), len(values)):
+            mean, std = sums.window(i - horizon, i)
+            day_scores[i] = ((values[i] - mean) / std if std > 0 else 0, mean, std)
+        scores[horizon] = day_scores
+    return scores
+
+
+def horizon_anomalies(ticker, data, threshold, horizons=HORIZONS, first=None):
+    """
+    Multi-horizon anomalies for days first..end of data (default: the last day).
+    Each horizon is reported as its own anomaly type, e.g. 'price_5d', with
+    detector 'horizons' and the horizon in bars as `horizon`.
+    """
+    count = len(data)
+    first = count - 1 if first is None else first
+    short = [horizon for horizon in horizons if count <= horizon]
+    if short:
+        logger.warning(f"Only {count} bars for {ticker}, skipping horizons: "
+                       f"{', '.join(f'{h}d' for h in short)}")
+    anomalies = []
+    for prefix, key in FIELDS.items():
+        if isinstance(data, BarSeries):
+            values = data.column(key)
+        else:
+            values = [d[key] for d in data]
+        for horizon, day_scores in horizon_scores(values, horizons, first).items():
+            for i in range(first, count):
+                if day_scores[i] is None:
+                    continue
+                score, center, spread = day_scores[i]
+                if abs(score) > threshold:
+                    anomaly = build_anomaly(
+                        ticker, prefix, HORIZON_DETECTOR, data[i], score, center, spread,
+                        threshold, variant=f"{horizon}d"
+                    )
+                    anomaly['horizon'] = horizon
+                    anomalies.append(anomaly)
+    return anomalies
+
+
+def history_days(detectors, calendar=None, today=None):
+    """
+    Calendar days of history a scan needs for the given detectors. With a
+    market calendar, the horizons window reaches back the longest horizon
+    plus one bar (and HORIZON_SLACK_SESSIONS) in trading sessions before today.
+    """
+    if HORIZON_DETECTOR not in (detectors or []):
+        return HISTORY_DAYS
+    if calendar is None:
+        return HORIZON_HISTORY_DAYS
+    today = today or datetime.utcnow().date()
+    sessions = max(HORIZONS) + 1 + HORIZON_SLACK_SESSIONS
+    days = 0
+    while sessions:
+        days += 1
+        if calendar.is_trading_day(today - timedelta(days=days)):
+            sessions -= 1
+    return days
+
+
+def _median(sorted_values):
+    n = len(sorted_values)
+    mid = n // 2
+    if n % 2:
+        return sorted_values[mid]
+    return (sorted_values[mid - 1] + sorted_values[mid]) / 2
+
+
+@register_detector('zscore')
+def zscore_detector(stats):
+    """Classic z-score against the baseline mean and sample standard deviation."""
+    center = stats.mean
+    spread = stats.std
+    score = (stats.current - center) / spread if spread > 0 else 0
+    return score, center, spread
+
+
+@register_detector('ewma')
+def ewma_detector(stats):
+    """Deviation from an exponentially weighted mean, scaled by the EWMA volatility."""
+    center = stats.ewma_mean
+    spread = math.sqrt(stats.ewma_var) if stats.ewma_var > 0 else 0.0
+    score = (stats.current - center) / spread if spread > 0 else 0
+    return score, center, spread
+
+
+@register_detector('mad', needs_sorted=True)
+def mad_detector(stats):
+    """Robust z-score using the baseline median and median absolute deviation."""
+    center = _median(stats.sorted_values)
+    deviations = sorted(abs(v - center) for v in stats.sorted_values)
+    spread = MAD_SCALE * _median(deviations)
+    score = (stats.current - center) / spread if spread > 0 else 0
+    return score, center, spread
+
+
+def resolve_detectors(names):
+    """Filter a list of detector names down to registered detectors."""
+    resolved = []
+    for name in names or DEFAULT_DETECTORS:
+        if name in DETECTORS or name == HORIZON_DETECTOR:
+            if name not in resolved:
+                resolved.append(name)
+        else:
+            logger.warning(f"Unknown detector '{name}', skipping")
+    return resolved or list(DEFAULT_DETECTORS)
+
+
+def detectors_for_ticker(config, ticker):
+    """
+    Pick detectors for a ticker from the detector config.
+    Config format: {"default": ["zscore"], "TSLA": ["zscore", "mad"]}
+    """
+    config = config or {}
+    names = config.get(ticker.upper(), config.get('default', DEFAULT_DETECTORS))
+    return resolve_detectors(names)
+
+
+def prepare_series(data, with_sorted=False):
+    """
+    Extract each scored field once and build its baseline statistics.
+    Accepts a BarSeries or a list of bar dicts.
+    Returns (current_bar, {field_prefix: SeriesStats}).
+    """
+    current_data = data[-1]
+
+    series = {}
+    for prefix, key in FIELDS.items():
+        if isinstance(data, BarSeries):
+            # Zero-copy view of the baseline window
+            baseline = data.column(key)[-(BASELINE_DAYS + 1):-1]
+        else:
+            baseline = [d[key] for d in data[-(BASELINE_DAYS + 1):-1]]
+        series[prefix] = SeriesStats(baseline, current_data[key], with_sorted=with_sorted)
+    return current_data, series
+
+
+def build_anomaly(ticker, prefix, detector, current_data, score, center, spread, threshold,
+                  variant=None):
+    """
+    Build an anomaly record in the format stored in DynamoDB.
+    variant names the anomaly type when it is not the detector, e.g. '5d'.
+    """
+    # z-score keeps the original anomaly types ('price', 'volume')
+    anomaly_type = prefix if detector == 'zscore' else f"{prefix}_{variant or detector}"
+
+    if prefix == 'volume':
+        baseline_mean = int(center)
+        baseline_std = int(spread)
+    else:
+        baseline_mean = round(center, 2)
+        baseline_std = round(spread, 2)
+
+    return AnomalyRecord(
+        ticker=ticker,
+        timestamp=datetime.utcnow().isoformat(),
+        date=current_data['date'],
+        anomaly_type=anomaly_type,
+        detector=detector,
+        value=current_data[FIELDS[prefix]],
+        baseline_mean=baseline_mean,
+        baseline_std=baseline_std,
+        z_score=round(score, 2),
+        threshold=threshold,
+        severity='high' if abs(score) > threshold * 1.5 else 'medium'
+    )
+
+
+def run_detectors(ticker, data, threshold, detectors=None):
+    """
+    Run the selected detectors over shared per-ticker arrays.
+    Returns (anomalies, timings_ms) where timings_ms has one entry per
+    detector plus 'prepare' for the shared baseline pass of the
+    fixed-window detectors.
+    """
+    names = resolve_detectors(detectors)
+    window_names = [name for name in names if name != HORIZON_DETECTOR]
+    anomalies = []
+    timings = {}
+
+    if HORIZON_DETECTOR in names:
+        start = time.perf_counter()
+        anomalies.extend(horizon_anomalies(ticker, data, threshold))
+        timings[HORIZON_DETECTOR] = round((time.perf_counter() - start) * 1000, 3)
+
+    if not window_names:
+        return anomalies, timings
+
+    with_sorted = any(DETECTORS[name].needs_sorted for name in window_names)
+
+    start = time.perf_counter()
+    current_data, series = prepare_series(data, with_sorted=with_sorted)
+    timings['prepare'] = round((time.perf_counter() - start) * 1000, 3)
+
+    for name in window_names:
+        detector = DETECTORS[name]
+        start = time.perf_counter()
+        for prefix, stats in series.items():
+            score, center, spread = detector(stats)
+            logger.info(f"{name} {prefix} score for {ticker}: {score:.2f}")
+            if abs(score) > threshold:
+                anomalies.append(build_anomaly(
+                    ticker, prefix, name, current_data, score, center, spread, threshold
+                ))
+        timings[name] = round((time.perf_counter() - start) * 1000, 3)
+
+    return anomalies, timings
@@ -0,0 +1,164 @@
+import bisect
+import fcntl
+import mmap
+import os
+import struct
+import sys
+from datetime import date
+
+from bar_series import COLUMNS, BarSeries
+
+# One bar: date ordinal, open, high, low, close, volume as little-endian doubles
+RECORD = struct.Struct('<6d')
+FIELDS_PER_RECORD = 6
+
+# One index entry: date ordinal, byte offset of the record in the data file
+INDEX_ENTRY = struct.Struct('<qq')
+
+if sys.byteorder != 'little':
+    raise ImportError("history_store maps little-endian records and needs a little-endian host")
+
+
+def _paths(root, ticker):
+    base = os.path.join(root, ticker.upper())
+    return base + '.bars', base + '.idx', base + '.lock'
+
+
+def _committed_count(index_path):
+    """Number of records visible to readers (whole index entries only)."""
+    try:
+        return os.path.getsize(index_path) // INDEX_ENTRY.size
+    except FileNotFoundError:
+        return 0
+
+
+class HistoryWriter:
+    """
+    Single appending writer for the on-disk history store.
+
+    Each ticker has an append-only data file of fixed-width records and an
+    index file of (date, offset) entries. Records are written and synced
+    before their index entries, so the index length is the commit point:
+    readers never see a partially written bar. An exclusive lock file
+    keeps a second writer out.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def append(self, ticker, records):
+        """
+        Append bars newer than the last stored date.
+        Returns the number of bars appended.
+        """
+        data_path, index_path, lock_path = _paths(self.root, ticker)
+
+        with open(lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                count = _committed_count(index_path)
+                last_date = self._last_date(index_path, count)
+
+                rows = []
+                for record in sorted(records, key=lambda r: r['date']):
+                    ordinal = date.fromisoformat(record['date']).toordinal()
+                    if last_date is not None and ordinal <= last_date:
+                        continue
+                    rows.append((ordinal, *(float(record.get(name, 'nan')) for name in COLUMNS)))
+                    last_date = ordinal
+
+                if not rows:
+                    return 0
+
+                with open(data_path, 'ab') as data_file:
+                    # Drop any tail left by a writer that died before committing
+                    data_file.truncate(count * RECORD.size)
+                    data_file.write(b''.join(RECORD.pack(*row) for row in rows))
+                    data_file.flush()
+                    os.fsync(data_file.fileno())
+
+                with open(index_path, 'ab') as index_file:
+                    index_file.truncate(count * INDEX_ENTRY.size)
+                    index_file.write(b''.join(
+                        INDEX_ENTRY.pack(row[0], (count + i) * RECORD.size)
+                        for i, row in enumerate(rows)
+                    ))
+                    index_file.flush()
+                    os.fsync(index_file.fileno())
+
+                return len(rows)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _last_date(index_path, count):
+        if count == 0:
+            return None
+        with open(index_path, 'rb') as index_file:
+            index_file.seek((count - 1) * INDEX_ENTRY.size)
+            return INDEX_ENTRY.unpack(index_file.read(INDEX_ENTRY.size))[0]
+
+
+class HistoryReader:
+    """
+    Memory-mapped reader for the history store.
+
+    series() returns a BarSeries whose columns are strided views straight
+    into the mapped data file, so windows are sliced without parsing or
+    copying. Any number of processes can read while one writer appends;
+    each call maps only the records committed at that moment.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._maps = {}
+
+    def _map(self, path, length):
+        cached = self._maps.get(path)
+        if cached is not None and len(cached) >= length:
+            return cached
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ)
+        # Older, shorter maps stay alive as long as views into them do
+        self._maps[path] = mapped
+        return mapped
+
+    def series(self, ticker):
+        """All committed bars for a ticker as a zero-copy BarSeries (None if absent)."""
+        data_path, index_path, _ = _paths(self.root, ticker)
+        count = _committed_count(index_path)
+        if count == 0:
+            return None
+
+        mapped = self._map(data_path, count * RECORD.size)
+        flat = memoryview(mapped)[:count * RECORD.size].cast('d')
+        return BarSeries(*(flat[i::FIELDS_PER_RECORD] for i in range(FIELDS_PER_RECORD)))
+
+    def dates(self, ticker):
+        """Zero-copy view of the indexed date ordinals for a ticker."""
+        _, index_path, _ = _paths(self.root, ticker)
+        count = _committed_count(index_path)
+        if count == 0:
+            return memoryview(b'').cast('q')
+        mapped = self._map(index_path, count * INDEX_ENTRY.size)
+        return memoryview(mapped)[:count * INDEX_ENTRY.size].cast('q')[0::2]
+
+    def window(self, ticker, start=None, end=None):
+        """
+        Bars with start <= date <= end (ISO dates) as a zero-copy BarSeries.
+        The index is binary-searched, so cost does not grow with history length.
+        """
+        series = self.series(ticker)
+        if series is None:
+            return None
+
+        dates = self.dates(ticker)[:len(series)]
+        lo = bisect.bisect_left(dates, date.fromisoformat(start).toordinal()) if start else 0
+        hi = bisect.bisect_right(dates, date.fromisoformat(end).toordinal()) if end else len(dates)
+        return series[lo:hi]
+
+    def tail(self, ticker, days):
+        """Last `days` bars, e.g. a detector baseline plus the current bar."""
+        series = self.series(ticker)
+        return series[-days:] if series is not None else None
@@ -0,0 +1,223 @@
+"""
+US equity trading calendar: exchange holidays, early closes and session
+times in exchange time, so scheduling stays correct across DST.
+
+Holidays are computed from the exchange's rules rather than listed per
+year: a fixed-date holiday on a Sunday is observed on Monday and one on a
+Saturday on Friday (except New Year's Day, which is then not observed),
+and the floating Mondays, Thanksgiving and Good Friday are derived for
+each year. Unscheduled closures (e.g. national days of mourning) live in
+CLOSURES or in the /stock-tracker/market-hours parameter:
+
+    {"open": "09:30", "close": "16:00", "timezone": "America/New_York",
+     "closed": ["2026-01-09"], "early_close": {"2026-12-31": "13:00"}}
+
+The scanner runs at the open minute past each hour of a session, plus one
+run within CLOSE_GRACE after the close to pick up the closing bar.
+"""
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+EXCHANGE_TIMEZONE = 'America/New_York'
+REGULAR_OPEN = time(9, 30)
+REGULAR_CLOSE = time(16, 0)
+EARLY_CLOSE = time(13, 0)
+
+# The last scan of a session runs up to this long after the close
+CLOSE_GRACE = timedelta(minutes=30)
+
+# Scheduled invocations start a little late; still in the window if within this
+SCHEDULE_TOLERANCE = timedelta(minutes=5)
+
+# Closures the rules cannot predict
+CLOSURES = {
+    date(2025, 1, 9): 'National Day of Mourning',
+}
+
+# Juneteenth became an exchange holiday in 2022
+JUNETEENTH_FROM = 2022
+
+MONDAY, THURSDAY, FRIDAY, SATURDAY, SUNDAY = 0, 3, 4, 5, 6
+
+
+def easter(year):
+    """Easter Sunday (Gregorian), by the anonymous computus."""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def nth_weekday(year, month, weekday, n):
+    """The n-th `weekday` of a month; n=-1 is the last one."""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def observed(day):
+    """Weekend holidays move to the nearest weekday."""
+    if day.weekday() == SATURDAY:
+        return day - timedelta(days=1)
+    if day.weekday() == SUNDAY:
+        return day + timedelta(days=1)
+    return day
+
+
+def exchange_holidays(year):
+    """{date: name} of full-day closures in `year`."""
+    holidays = {}
+    new_year = date(year, 1, 1)
+    # A Saturday New Year's Day is not moved back into the previous year
+    if new_year.weekday() != SATURDAY:
+        holidays[observed(new_year)] = "New Year's Day"
+    holidays[nth_weekday(year, 1, MONDAY, 3)] = 'Martin Luther King Jr. Day'
+    holidays[nth_weekday(year, 2, MONDAY, 3)] = "Washington's Birthday"
+    holidays[easter(year) - timedelta(days=2)] = 'Good Friday'
+    holidays[nth_weekday(year, 5, MONDAY, -1)] = 'Memorial Day'
+    if year >= JUNETEENTH_FROM:
+        holidays[observed(date(year, 6, 19))] = 'Juneteenth'
+    holidays[observed(date(year, 7, 4))] = 'Independence Day'
+    holidays[nth_weekday(year, 9, MONDAY, 1)] = 'Labor Day'
+    holidays[nth_weekday(year, 11, THURSDAY, 4)] = 'Thanksgiving Day'
+    holidays[observed(date(year, 12, 25))] = 'Christmas Day'
+    holidays.update({day: name for day, name in CLOSURES.items() if day.year == year})
+    return holidays
+
+
+def exchange_early_closes(year, holidays):
+    """
+    Dates the exchange closes at EARLY_CLOSE: the day before Independence
+    Day, the day after Thanksgiving and Christmas Eve, when those are
+    otherwise trading days.
+    """
+    candidates = [
+        date(year, 7, 3),
+        nth_weekday(year, 11, THURSDAY, 4) + timedelta(days=1),
+        date(year, 12, 24),
+    ]
+    return {day: EARLY_CLOSE for day in candidates
+            if day.weekday() < SATURDAY and day not in holidays}
+
+
+def parse_time(value):
+    hour, minute = value.split(':')
+    return time(int(hour), int(minute))
+
+
+class MarketCalendar:
+    """Trading days and sessions of one exchange, in its own timezone."""
+
+    def __init__(self, open_time=REGULAR_OPEN, close_time=REGULAR_CLOSE,
+                 timezone_name=EXCHANGE_TIMEZONE, closed=(), early_closes=None):
+        self.open_time = open_time
+        self.close_time = close_time
+        self.tz = ZoneInfo(timezone_name)
+        self.closed = set(closed)
+        self.early_closes = dict(early_closes or {})
+        self._years = {}
+
+    @classmethod
+    def from_config(cls, config):
+        """Calendar from the /stock-tracker/market-hours JSON (a dict)."""
+        return cls(
+            open_time=parse_time(config.get('open', '09:30')),
+            close_time=parse_time(config.get('close', '16:00')),
+            timezone_name=config.get('timezone', EXCHANGE_TIMEZONE),
+            closed=[date.fromisoformat(d) for d in config.get('closed', [])],
+            early_closes={date.fromisoformat(d): parse_time(t)
+                          for d, t in config.get('early_close', {}).items()}
+        )
+
+    def _year(self, year):
+        if year not in self._years:
+            holidays = exchange_holidays(year)
+            self._years[year] = (holidays, exchange_early_closes(year, holidays))
+        return self._years[year]
+
+    def holidays(self, year):
+        """{date: name} of closures in `year`, configured ones included."""
+        holidays = dict(self._year(year)[0])
+        holidays.update({day: 'Closed' for day in self.closed if day.year == year})
+        return holidays
+
+    def is_trading_day(self, day):
+        if day.weekday() >= SATURDAY or day in self.closed:
+            return False
+        return day not in self._year(day.year)[0]
+
+    def session(self, day):
+        """(open, close) as aware datetimes in exchange time, or None if closed."""
+        if not self.is_trading_day(day):
+            return None
+        close_time = self.early_closes.get(day) or self._year(day.year)[1].get(day, self.close_time)
+        return (datetime.combine(day, self.open_time, self.tz),
+                datetime.combine(day, min(close_time, self.close_time), self.tz))
+
+    def is_scan_window(self, moment):
+        """
+        True if a scan at `moment` (aware, or naive UTC) falls in a session:
+        from the open through the post-close run.
+        """
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        local = moment.astimezone(self.tz)
+        session = self.session(local.date())
+        if session is None:
+            return False
+        opens, closes = session
+        return opens <= local <= closes + CLOSE_GRACE + SCHEDULE_TOLERANCE
+
+    def scan_times(self, day):
+        """Scheduled scans of one day (aware, exchange time): hourly from the open."""
+        session = self.session(day)
+        if session is None:
+            return []
+        opens, closes = session
+        times = []
+        moment = opens
+        while moment <= closes + CLOSE_GRACE:
+            times.append(moment)
+            moment += timedelta(hours=1)
+        return times
+
+    def next_session(self, moment):
+        """The first session opening after `moment` (aware), as (open, close)."""
+        day = moment.astimezone(self.tz).date()
+        for offset in range(0, 15):
+            session = self.session(day + timedelta(days=offset))
+            if session and session[0] > moment:
+                return session
+        return None
+
+    def schedule_expressions(self, start, end):
+        """
+        Cron expressions in exchange time covering every scan from `start`
+        to `end` (dates, inclusive): one per month and distinct day shape,
+        so holidays and weekends are never invoked. Each entry is
+        (expression, first day, last day).
+        """
+        groups = {}
+        day = start
+        while day <= end:
+            times = self.scan_times(day)
+            if times:
+                hours = ','.join(str(t.hour) for t in times)
+                key = (day.year, day.month, times[0].minute, hours)
+                groups.setdefault(key, []).append(day)
+            day += timedelta(days=1)
+
+        expressions = []
+        for (year, month, minute, hours), days in sorted(groups.items()):
+            day_list = ','.join(str(d.day) for d in days)
+            expressions.append((f"cron({minute} {hours} {day_list} {month} ? {year})", days[0], days[-1]))
+        return expressions
@@ -0,0 +1,359 @@
+"""
+Cross-sectional market model: separates market- and sector-wide moves
+from ticker-specific ones after per-ticker scoring.
+
+Each ticker keeps exponentially weighted means, variances and the
+covariance of its daily return against factor returns: the equal-weight
+mean return of the other tickers, across the universe ('market') and
+within its sector. The statistics are updated incrementally, one
+observation per factor per new trading day, and kept in S3 between scans
+at market-model/<TICKER>.json.
+
+Peers span the universe, not just the batch: every shard of a coordinated
+scan reports its tickers' daily returns, and the coordinator folds them
+into market-model/_universe.json (fold_universe). A batch scores against
+those stored returns with its own tickers' fresh ones in their place, so a
+ticker's peers do not depend on the shard it lands in. Other tickers'
+returns are as of the previous coordinated scan.
+
+A price anomaly is explained by a factor when the factor itself moved
+beyond the threshold and the ticker's residual return (after beta times
+the factor) did not. Explained anomalies of one batch are collapsed into
+a single event per factor; every shard of a scan gives that event the
+scan's timestamp, so it is stored and alerted once.
+"""
+import json
+import logging
+import math
+import os
+import boto3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from anomaly_record import AnomalyRecord
+
+logger = logging.getLogger()
+
+s3 = boto3.client('s3')
+
+# S3 prefix for per-ticker factor statistics
+STATE_PREFIX = 'market-model'
+
+# EWMA span in trading days; alpha = 2 / (span + 1)
+EWMA_SPAN = 60
+ALPHA = 2.0 / (EWMA_SPAN + 1)
+
+# Observations a ticker needs before its anomalies can be explained away
+MIN_OBSERVATIONS = 15
+
+# Tickers (including the scored one) a factor needs on a given day
+MIN_GROUP_TICKERS = 10
+
+# Factor spanning every ticker in the batch
+MARKET_FACTOR = 'market'
+
+# Parallel state reads/writes per batch
+STATE_WORKERS = 8
+
+# Calendar days of daily returns kept per ticker in the universe state;
+# enough peers for a new ticker's statistics to warm up on its first scan
+UNIVERSE_DAYS = 60
+
+
+def state_key(ticker, prefix=STATE_PREFIX):
+    return f"{prefix}/{ticker}.json"
+
+
+def universe_key(prefix=STATE_PREFIX):
+    return f"{prefix}/_universe.json"
+
+
+def sector_factor(sector):
+    return f"sector:{sector.lower()}"
+
+
+def factor_label(factor):
+    """Ticker value for a factor's collapsed event, e.g. 'MARKET' or 'SECTOR:TECH'."""
+    return factor.upper()
+
+
+def daily_returns(dates, closes):
+    """{date: close-to-close return} for consecutive bars."""
+    returns = {}
+    for i in range(1, len(closes)):
+        if closes[i - 1]:
+            returns[dates[i]] = closes[i] / closes[i - 1] - 1
+    return returns
+
+
+def ticker_factors(ticker, sectors):
+    """Factors a ticker is scored against: the market, then its sector if known."""
+    factors = [MARKET_FACTOR]
+    if sectors.get(ticker):
+        factors.append(sector_factor(sectors[ticker]))
+    return factors
+
+
+def factor_totals(returns_by_ticker, factors_by_ticker):
+    """{factor: {date: [sum, count]}} over every ticker in each factor."""
+    totals = {}
+    for ticker, returns in returns_by_ticker.items():
+        for factor in factors_by_ticker[ticker]:
+            by_date = totals.setdefault(factor, {})
+            for date, value in returns.items():
+                entry = by_date.setdefault(date, [0.0, 0])
+                entry[0] += value
+                entry[1] += 1
+    return totals
+
+
+def scan_returns(scans):
+    """{ticker: {date: return}} of a batch's scans, as shards report them."""
+    return {s['ticker']: daily_returns(s['dates'], s['closes']) for s in scans}
+
+
+def peer_return(totals, date, own):
+    """Mean return of the other tickers in a factor, or None if too few."""
+    entry = totals.get(date)
+    if not entry or entry[1] < MIN_GROUP_TICKERS:
+        return None
+    return (entry[0] - own) / (entry[1] - 1)
+
+
+def new_stats():
+    return {'n': 0, 'mean_f': 0.0, 'mean_r': 0.0, 'var_f': 0.0, 'var_r': 0.0, 'cov': 0.0}
+
+
+def update_stats(stats, f, r, alpha=ALPHA):
+    """Fold one (factor, ticker) return pair into the EWMA statistics in place."""
+    if stats['n'] == 0:
+        stats.update(new_stats(), mean_f=f, mean_r=r)
+    else:
+        df = f - stats['mean_f']
+        dr = r - stats['mean_r']
+        stats['mean_f'] += alpha * df
+        stats['mean_r'] += alpha * dr
+        stats['var_f'] = (1 - alpha) * (stats['var_f'] + alpha * df * df)
+        stats['var_r'] = (1 - alpha) * (stats['var_r'] + alpha * dr * dr)
+        stats['cov'] = (1 - alpha) * (stats['cov'] + alpha * df * dr)
+    stats['n'] += 1
+    return stats
+
+
+def score_stats(stats, f, r):
+    """
+    (factor_z, residual_z, beta) of a new observation against the statistics,
+    or None while the statistics are still warming up.
+    """
+    if stats['n'] < MIN_OBSERVATIONS or stats['var_f'] <= 0:
+        return None
+    beta = stats['cov'] / stats['var_f']
+    factor_z = (f - stats['mean_f']) / math.sqrt(stats['var_f'])
+    residual = (r - stats['mean_r']) - beta * (f - stats['mean_f'])
+    # Prediction error: beta is an estimate, so large factor moves widen
+    # the residual band (OLS prediction interval over the EWMA's effective n)
+    effective_n = min(stats['n'], (2 - ALPHA) / ALPHA)
+    residual_var = (stats['var_r'] - beta * stats['cov']) * (1 + factor_z * factor_z / effective_n)
+    residual_z = residual / math.sqrt(residual_var) if residual_var > 0 else 0.0
+    return factor_z, residual_z, beta
+
+
+def load_state(ticker, bucket, prefix=STATE_PREFIX):
+    try:
+        response = s3.get_object(Bucket=bucket, Key=state_key(ticker, prefix))
+    except s3.exceptions.NoSuchKey:
+        return {'ticker': ticker, 'as_of': None, 'factors': {}}
+    return json.loads(response['Body'].read())
+
+
+def save_state(state, bucket, prefix=STATE_PREFIX):
+    s3.put_object(
+        Bucket=bucket,
+        Key=state_key(state['ticker'], prefix),
+        Body=json.dumps(state, separators=(',', ':')).encode('utf-8'),
+        ContentType='application/json'
+    )
+
+
+def load_universe(bucket, prefix=STATE_PREFIX):
+    """Universe state: {'as_of', 'returns': {ticker: {date: return}}}."""
+    try:
+        response = s3.get_object(Bucket=bucket, Key=universe_key(prefix))
+    except s3.exceptions.NoSuchKey:
+        return {'as_of': None, 'returns': {}}
+    return json.loads(response['Body'].read())
+
+
+def fold_universe(returns_by_ticker, bucket, as_of=None, prefix=STATE_PREFIX, days=UNIVERSE_DAYS):
+    """
+    Fold the returns a coordinated scan's shards reported into the universe
+    state: reported tickers' returns are replaced, and dates more than
+    `days` before the newest one are dropped (with tickers left without any).
+    Returns the saved state.
+    """
+    universe = load_universe(bucket, prefix)
+    returns = {**universe['returns'], **returns_by_ticker}
+    newest = max((d for by_date in returns.values() for d in by_date), default=None)
+    if newest:
+        cutoff = (datetime.strptime(newest, '%Y-%m-%d') - timedelta(days=days)).strftime('%Y-%m-%d')
+        returns = {t: {d: r for d, r in by_date.items() if d >= cutoff} for t, by_date in returns.items()}
+    universe = {
+        'as_of': as_of or datetime.utcnow().isoformat(),
+        'returns': {t: by_date for t, by_date in returns.items() if by_date}
+    }
+    s3.put_object(
+        Bucket=bucket,
+        Key=universe_key(prefix),
+        Body=json.dumps(universe, separators=(',', ':')).encode('utf-8'),
+        ContentType='application/json'
+    )
+    return universe
+
+
+def advance_state(state, returns, totals_by_factor, factors, latest):
+    """
+    Fold every completed day after state['as_of'] into the statistics.
+    The latest day is scored but not folded in: hourly scans revise it,
+    and it is folded in by the first scan of the next trading day.
+    Returns True if the state changed.
+    """
+    as_of = state.get('as_of')
+    days = [d for d in sorted(returns) if d < latest and (as_of is None or d > as_of)]
+    for date in days:
+        for factor in factors:
+            f = peer_return(totals_by_factor.get(factor, {}), date, returns[date])
+            if f is not None:
+                update_stats(state['factors'].setdefault(factor, new_stats()), f, returns[date])
+    if days:
+        state['as_of'] = days[-1]
+    return bool(days)
+
+
+def explain(state, returns, totals_by_factor, factors, latest, threshold):
+    """
+    The first factor (market before sector) that explains the latest day's
+    return, as {'factor', 'factor_z', 'residual_z', 'beta', ...}, or None.
+    Only the factor's newest day is explained: a ticker whose data stops
+    earlier keeps its anomalies.
+    """
+    if latest not in returns:
+        return None
+    r = returns[latest]
+    for factor in factors:
+        stats = state['factors'].get(factor)
+        by_date = totals_by_factor.get(factor, {})
+        if not by_date or latest != max(by_date):
+            continue
+        f = peer_return(by_date, latest, r)
+        if stats is None or f is None:
+            continue
+        scored = score_stats(stats, f, r)
+        if scored is None:
+            continue
+        factor_z, residual_z, beta = scored
+        if abs(factor_z) > threshold and abs(residual_z) <= threshold:
+            return {
+                'factor': factor,
+                'factor_z': factor_z,
+                'residual_z': residual_z,
+                'beta': beta,
+                'mean_f': stats['mean_f'],
+                'std_f': math.sqrt(stats['var_f'])
+            }
+    return None
+
+
+def _median(values):
+    ordered = sorted(values)
+    mid = len(ordered) // 2
+    return ordered[mid] if len(ordered) % 2 else (ordered[mid - 1] + ordered[mid]) / 2
+
+
+def build_event(factor, explained, totals, date, threshold, timestamp=None):
+    """One anomaly record standing in for every anomaly a factor explained."""
+    total, count = totals[date]
+    score = _median([e['factor_z'] for e in explained.values()])
+    members = sorted(explained)
+    return AnomalyRecord(
+        ticker=factor_label(factor),
+        timestamp=timestamp or datetime.utcnow().isoformat(),
+        date=date,
+        anomaly_type='market_move' if factor == MARKET_FACTOR else 'sector_move',
+        detector='market_model',
+        # Returns in percent so the alert reads naturally
+        value=round(total / count * 100, 2),
+        baseline_mean=round(_median([e['mean_f'] for e in explained.values()]) * 100, 2),
+        baseline_std=round(_median([e['std_f'] for e in explained.values()]) * 100, 2),
+        z_score=round(score, 2),
+        threshold=threshold,
+        severity='high' if abs(score) > threshold * 1.5 else 'medium',
+        members=members,
+        member_count=len(members)
+    )
+
+
+def apply_market_model(scans, threshold, sectors=None, bucket=None, prefix=STATE_PREFIX,
+                       universe=None, event_time=None):
+    """
+    Update each ticker's factor statistics and collapse price anomalies
+    explained by a market or sector move.
+
+    scans: [{'ticker', 'anomalies', 'dates', 'closes'}] from one batch.
+    universe: {ticker: {date: return}} from the universe state; the batch's
+    own returns replace its tickers' entries. Without it the factor returns
+    are summed over this batch alone.
+    event_time: timestamp of the scan's events (shared by its shards).
+    Returns (anomalies, events): the anomalies still to publish per ticker,
+    and one event per factor that explained at least one of them.
+    """
+    bucket = bucket or os.environ.get('S3_BUCKET', 'stock-scan-data-529088281783')
+    sectors = sectors or {}
+
+    returns_by_ticker = scan_returns(scans)
+    peers = {**(universe or {}), **returns_by_ticker}
+    factors_by_ticker = {t: ticker_factors(t, sectors) for t in peers}
+    totals = factor_totals(peers, factors_by_ticker)
+
+    tickers = list(returns_by_ticker)
+    with ThreadPoolExecutor(max_workers=STATE_WORKERS) as pool:
+        states = dict(zip(tickers, pool.map(lambda t: load_state(t, bucket, prefix), tickers)))
+
+    changed = []
+    explanations = {}
+    for scan in scans:
+        ticker = scan['ticker']
+        if not scan['dates']:
+            continue
+        latest = scan['dates'][-1]
+        state = states[ticker]
+        if advance_state(state, returns_by_ticker[ticker], totals, factors_by_ticker[ticker], latest):
+            changed.append(state)
+        explanation = explain(state, returns_by_ticker[ticker], totals,
+                              factors_by_ticker[ticker], latest, threshold)
+        if explanation:
+            explanations[ticker] = (latest, explanation)
+
+    if changed:
+        with ThreadPoolExecutor(max_workers=STATE_WORKERS) as pool:
+            list(pool.map(lambda s: save_state(s, bucket, prefix), changed))
+
+    kept = []
+    collapsed = {}
+    for scan in scans:
+        ticker = scan['ticker']
+        for anomaly in scan['anomalies']:
+            latest, explanation = explanations.get(ticker, (None, None))
+            if (explanation and anomaly['anomaly_type'].startswith('price')
+                    and anomaly['date'] == latest):
+                collapsed.setdefault((explanation['factor'], latest), {})[ticker] = explanation
+            else:
+                kept.append(anomaly)
+
+    events = [
+        build_event(factor, explained, totals[factor], date, threshold, event_time)
+        for (factor, date), explained in sorted(collapsed.items())
+    ]
+    if events:
+        logger.info(f"Collapsed {sum(e['member_count'] for e in events)} tickers' anomalies "
+                    f"into {len(events)} market events")
+    return kept, events
@@ -0,0 +1,119 @@
+import json
+import time
+from contextlib import contextmanager
+
+# CloudWatch namespace for all Embedded Metric Format (EMF) metrics
+NAMESPACE = 'StockTracker'
+
+# EMF allows at most 100 values per metric in one document
+MAX_VALUES_PER_DOCUMENT = 100
+
+UNITS = {
+    'Duration': 'Milliseconds',
+    'ItemsProcessed': 'Count',
+    'Retries': 'Count',
+    'CacheHits': 'Count',
+    'Failures': 'Count',
+    'Collapsed': 'Count',
+    'Deferred': 'Count',
+    'Duplicates': 'Count',
+    'Skipped': 'Count',
+    'Gaps': 'Count',
+    'Rewarming': 'Count',
+}
+
+
+class MetricsRecorder:
+    """
+    Collects per-stage timings and counters for one invocation and writes
+    them as CloudWatch Embedded Metric Format log lines on flush().
+
+    Timing is a perf_counter pair and a list append, so it is cheap enough
+    to wrap every stage on the hot path.
+    """
+
+    def __init__(self, service, output=print):
+        self.service = service
+        self.output = output
+        self.stages = {}
+        self.active = []
+
+    def _stage(self, stage):
+        data = self.stages.get(stage)
+        if data is None:
+            data = self.stages[stage] = {'Duration': []}
+        return data
+
+    @contextmanager
+    def timer(self, stage, items=None):
+        """Time a block as one occurrence of a stage."""
+        self.active.append(stage)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.active.pop()
+            self.record(stage, elapsed_ms, items)
+
+    def record(self, stage, elapsed_ms, items=None):
+        """
+        Record one occurrence of a stage timed elsewhere, e.g. in a worker
+        thread (timers share the active stack, so they are not thread-safe).
+        """
+        self._stage(stage)['Duration'].append(round(elapsed_ms, 3))
+        if items is not None:
+            self.add(stage, 'ItemsProcessed', items)
+
+    def add(self, stage, metric, value=1):
+        """Add to a counter for a stage."""
+        data = self._stage(stage)
+        data[metric] = data.get(metric, 0) + value
+
+    def add_to_active(self, metric, value=1):
+        """Add to a counter of the innermost running stage (e.g. retries)."""
+        if self.active:
+            self.add(self.active[-1], metric, value)
+
+    def documents(self):
+        """Build the EMF documents for everything recorded so far."""
+        timestamp = int(time.time() * 1000)
+        documents = []
+        for stage, data in self.stages.items():
+            durations = data['Duration'] or [0.0]
+            counters = {k: v for k, v in data.items() if k != 'Duration'}
+
+            for start in range(0, len(durations), MAX_VALUES_PER_DOCUMENT):
+                chunk = durations[start:start + MAX_VALUES_PER_DOCUMENT]
+                values = {'Duration': chunk if len(chunk) > 1 else chunk[0]}
+                # Counters are reported once per stage, with the first chunk
+                if start == 0:
+                    values.update(counters)
+
+                documents.append({
+                    '_aws': {
+                        'Timestamp': timestamp,
+                        'CloudWatchMetrics': [{
+                            'Namespace': NAMESPACE,
+                            'Dimensions': [['Service', 'Stage']],
+                            'Metrics': [
+                                {'Name': name, 'Unit': UNITS.get(name, 'None')}
+                                for name in values
+                            ]
+                        }]
+                    },
+                    'Service': self.service,
+                    'Stage': stage,
+                    **values
+                })
+        return documents
+
+    def flush(self):
+        """
+        Write recorded metrics as EMF log lines and reset.
+        Running timers are kept: an in-process worker invocation flushes
+        while its caller's timers are still open.
+        """
+        for document in self.documents():
+            self.output(json.dumps(document))
+        self.stages = {}
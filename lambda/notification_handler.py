@@ -1,79 +1,205 @@
 import json
 import logging
 import os
+import time
 import urllib3
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import MetricsRecorder
+from tracing import Tracer, context_from_notification, exporter_from_env
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-http = urllib3.PoolManager()
+# Concurrent Slack posts within one batch (also the connection pool size)
+DELIVERY_WORKERS = 5
+
+# Per-post timeouts, well inside the 30 s function timeout
+SLACK_TIMEOUT = urllib3.Timeout(connect=2.0, read=5.0)
+
+# Posts not started this close to the function timeout go back to the queue,
+# so the handler always returns and delivered messages are never retried
+DEADLINE_MARGIN_MS = 8000
+
+# SNS message ids this container has delivered; SNS can deliver a message
+# to the queue twice, and a warm container drops the repeat
+DELIVERED_MEMORY = 1000
+
+http = urllib3.PoolManager(maxsize=DELIVERY_WORKERS)
+
+# Per-stage EMF metrics, flushed at the end of each invocation
+metrics = MetricsRecorder('stock-notifications')
+
+# Closes the traces started by the scanner and stream detector
+tracer = Tracer('stock-notifications', exporter_from_env())
+
+_delivered = OrderedDict()
 
 def lambda_handler(event, context):
     """
-    SNS to Slack notification handler.
-    Receives SNS messages and forwards to Slack webhook.
+    SQS to Slack notification handler.
+    Receives batches of SNS notifications from the notifications queue,
+    posts them to the Slack webhook concurrently and reports the ones that
+    failed as batchItemFailures, so only those are retried (and land in the
+    DLQ after repeated failures). Direct SNS events are still accepted.
+    Traced alerts record their queue and Slack spans, and the time from the
+    start of their trace to the Slack post as alert_latency.
     """
+    records = event.get('Records', [])
+    received = time.time()
     try:
         # Get Slack webhook URL from environment variable
         slack_webhook_url = os.environ.get('SLACK_WEBHOOK_URL', '')
-        
+
         if not slack_webhook_url:
             logger.warning("SLACK_WEBHOOK_URL not configured, skipping notification")
-            return {'statusCode': 200, 'body': 'Webhook not configured'}
-        
-        # Parse SNS message
-        for record in event.get('Records', []):
-            sns_message = record.get('Sns', {})
-            subject = sns_message.get('Subject', 'Stock Tracker Alert')
-            message = sns_message.get('Message', '')
-            
-            logger.info(f"Processing SNS message: {subject}")
-            
-            # Format Slack message
-            slack_message = {
-                'text': f"*{subject}*",
-                'blocks': [
-                    {
-                        'type': 'header',
-                        'text': {
-                            'type': 'plain_text',
-                            'text': subject
-                        }
-                    },
-                    {
-                        'type': 'section',
-                        'text': {
-                            'type': 'mrkdwn',
-                            'text': message
-                        }
-                    },
+            return {'batchItemFailures': []}
+
+        deadline = None
+        if context is not None:
+            deadline = time.monotonic() + (context.get_remaining_time_in_millis() - DEADLINE_MARGIN_MS) / 1000
+
+        failures = []
+        pending = []
+        for record in records:
+            try:
+                record_id, notification = parse_record(record)
+            except (ValueError, KeyError) as e:
+                logger.error(f"Malformed notification record: {str(e)}")
+                failures.append(record.get('messageId'))
+                continue
+            if notification.get('MessageId') in _delivered:
+                logger.info(f"Skipping duplicate notification {notification['MessageId']}")
+                metrics.add('slack_post', 'Duplicates')
+                continue
+            pending.append((record_id, notification))
+
+        def attempt(item):
+            if deadline is not None and time.monotonic() > deadline:
+                return None
+            started = time.time()
+            ok, elapsed_ms = deliver(slack_webhook_url, item[1])
+            return ok, elapsed_ms, started
+
+        results = []
+        if pending:
+            with ThreadPoolExecutor(max_workers=min(DELIVERY_WORKERS, len(pending))) as pool:
+                results = list(pool.map(attempt, pending))
+
+        for (record_id, notification), result in zip(pending, results):
+            if result is None:
+                metrics.add('slack_post', 'Deferred')
+                failures.append(record_id)
+                continue
+            ok, elapsed_ms, started = result
+            metrics.record('slack_post', elapsed_ms, items=1)
+            trace_delivery(notification, received, started, elapsed_ms, ok)
+            if ok:
+                remember(notification.get('MessageId'))
+            else:
+                metrics.add('slack_post', 'Failures')
+                failures.append(record_id)
+
+        logger.info(f"Delivered {len(pending) - len(failures)} of {len(records)} notifications")
+        return batch_response(failures)
+
+    except Exception as e:
+        logger.error(f"Notification handler error: {str(e)}", exc_info=True)
+        # Hand the whole batch back to the queue
+        return batch_response(record.get('messageId') for record in records)
+    finally:
+        metrics.flush()
+        tracer.flush()
+
+def trace_delivery(notification, received, started, elapsed_ms, ok):
+    """Spans for the queue wait and the Slack post of a traced notification."""
+    trace = context_from_notification(notification)
+    if trace is None:
+        return
+    ended = started + elapsed_ms / 1000
+    if trace['sent_ms']:
+        tracer.record('queue', trace['trace_id'], trace['sent_ms'] / 1000, received,
+                      parent_id=trace['parent_id'])
+    tracer.record('slack_post', trace['trace_id'], started, ended,
+                  parent_id=trace['parent_id'], ok=ok)
+    if ok and trace['started_ms']:
+        metrics.record('alert_latency', ended * 1000 - trace['started_ms'], items=1)
+
+def parse_record(record):
+    """
+    (record id, SNS notification) for an SQS record carrying an SNS
+    envelope, or for a record of a direct SNS invocation.
+    """
+    if record.get('eventSource') == 'aws:sqs':
+        return record['messageId'], json.loads(record['body'])
+    sns_message = record['Sns']
+    return sns_message.get('MessageId'), sns_message
+
+def batch_response(record_ids):
+    """SQS partial batch response; ids of direct SNS records are None and dropped."""
+    return {'batchItemFailures': [{'itemIdentifier': i} for i in record_ids if i]}
+
+def remember(message_id):
+    if not message_id:
+        return
+    _delivered[message_id] = True
+    while len(_delivered) > DELIVERED_MEMORY:
+        _delivered.popitem(last=False)
+
+def deliver(slack_webhook_url, notification):
+    """Post one notification to Slack; returns (ok, elapsed_ms)."""
+    subject = notification.get('Subject') or 'Stock Tracker Alert'
+    logger.info(f"Processing SNS message: {subject}")
+
+    started = time.perf_counter()
+    try:
+        response = http.request(
+            'POST',
+            slack_webhook_url,
+            body=json.dumps(format_slack_message(notification)).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            timeout=SLACK_TIMEOUT,
+            retries=False
+        )
+        ok = response.status == 200
+        if ok:
+            logger.info("Slack notification sent successfully")
+        else:
+            logger.error(f"Slack notification failed: {response.status}")
+    except Exception as e:
+        logger.error(f"Slack notification failed: {str(e)}")
+        ok = False
+    return ok, (time.perf_counter() - started) * 1000
+
+def format_slack_message(notification):
+    """Slack blocks for one SNS notification."""
+    subject = notification.get('Subject') or 'Stock Tracker Alert'
+    return {
+        'text': f"*{subject}*",
+        'blocks': [
+            {
+                'type': 'header',
+                'text': {
+                    'type': 'plain_text',
+                    'text': subject
+                }
+            },
+            {
+                'type': 'section',
+                'text': {
+                    'type': 'mrkdwn',
+                    'text': notification.get('Message', '')
+                }
+            },
+            {
+                'type': 'context',
+                'elements': [
                     {
-                        'type': 'context',
-                        'elements': [
-                            {
-                                'type': 'mrkdwn',
-                                'text': f"Timestamp: {sns_message.get('Timestamp', 'N/A')}"
-                            }
-                        ]
+                        'type': 'mrkdwn',
+                        'text': f"Timestamp: {notification.get('Timestamp', 'N/A')}"
                     }
                 ]
             }
-            
-            # Send to Slack
-            response = http.request(
-                'POST',
-                slack_webhook_url,
-                body=json.dumps(slack_message).encode('utf-8'),
-                headers={'Content-Type': 'application/json'}
-            )
-            
-            if response.status == 200:
-                logger.info("Slack notification sent successfully")
-            else:
-                logger.error(f"Slack notification failed: {response.status}")
-        
-        return {'statusCode': 200, 'body': 'Notifications processed'}
-        
-    except Exception as e:
-        logger.error(f"Notification handler error: {str(e)}", exc_info=True)
-        return {'statusCode': 500, 'body': 'Error processing notifications'}
+        ]
+    }
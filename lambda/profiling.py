@@ -0,0 +1,198 @@
+"""
+Opt-in cProfile + tracemalloc profiling for Lambda handlers.
+
+Enable with PROFILE_ENABLED=true (every PROFILE_SAMPLE_EVERY-th invocation
+per container is profiled) or per invocation with {"profile": true} in the
+event. Profiles are written to s3://$S3_BUCKET/profiles/<service>/<date>/.
+Handlers called while a profile is running (e.g. in-process shard workers
+under LocalExecutor) are not profiled separately: they run inside the
+outer profile.
+
+Summarize locally:
+    python lambda/profiling.py s3://stock-scan-data-529088281783/profiles/stock-scanner/2026-10-18/
+    python lambda/profiling.py ./run.prof --sort tottime --top 30
+"""
+import argparse
+import cProfile
+import functools
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import tempfile
+import tracemalloc
+from datetime import datetime
+
+import boto3
+
+logger = logging.getLogger()
+
+PROFILE_PREFIX = 'profiles'
+
+# Frames kept per allocation traceback; deeper costs more while tracing
+TRACEMALLOC_FRAMES = 10
+
+# Allocation sites written next to each profile
+TOP_ALLOCATIONS = 25
+
+s3 = boto3.client('s3')
+
+_invocations = 0
+
+# Set while a profiled handler runs; tracemalloc is process-wide, so a
+# nested profile would stop the outer one's tracing
+_active = False
+
+
+def should_profile(event):
+    """Decide whether this invocation pays the profiling overhead."""
+    global _invocations
+    if isinstance(event, dict) and event.get('profile'):
+        return True
+    if os.environ.get('PROFILE_ENABLED', 'false').lower() != 'true':
+        return False
+
+    _invocations += 1
+    sample_every = max(1, int(os.environ.get('PROFILE_SAMPLE_EVERY', '10')))
+    return _invocations % sample_every == 0
+
+
+def top_allocations(snapshot, limit=TOP_ALLOCATIONS):
+    """Largest allocation sites (by line) from a tracemalloc snapshot."""
+    sites = []
+    for stat in snapshot.statistics('lineno')[:limit]:
+        frame = stat.traceback[0]
+        sites.append({
+            'file': frame.filename,
+            'line': frame.lineno,
+            'size_kb': round(stat.size / 1024, 1),
+            'count': stat.count,
+        })
+    return sites
+
+
+def upload_profile(service, request_id, profiler, allocations, peak_bytes, bucket=None):
+    """Write the pstats dump and allocation report to S3. Returns the .prof key."""
+    bucket = bucket or os.environ.get('S3_BUCKET', 'stock-scan-data-529088281783')
+    now = datetime.utcnow()
+    base = f"{PROFILE_PREFIX}/{service}/{now.strftime('%Y-%m-%d')}/{now.strftime('%H%M%S')}-{request_id}"
+
+    with tempfile.NamedTemporaryFile(suffix='.prof') as f:
+        profiler.dump_stats(f.name)
+        f.seek(0)
+        s3.put_object(Bucket=bucket, Key=f"{base}.prof", Body=f.read(),
+                      ContentType='application/octet-stream')
+
+    s3.put_object(
+        Bucket=bucket,
+        Key=f"{base}.alloc.json",
+        Body=json.dumps({'peak_kb': round(peak_bytes / 1024, 1), 'top': allocations}),
+        ContentType='application/json'
+    )
+    logger.info(f"Stored profile in S3: s3://{bucket}/{base}.prof")
+    return f"{base}.prof"
+
+
+def profiled(service):
+    """Wrap a Lambda handler so sampled invocations are profiled."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            global _active
+            if _active or tracemalloc.is_tracing() or not should_profile(event):
+                return handler(event, context)
+
+            request_id = getattr(context, 'aws_request_id', None) or 'local'
+            _active = True
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                return handler(event, context)
+            finally:
+                profiler.disable()
+                snapshot = tracemalloc.take_snapshot()
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                _active = False
+                try:
+                    upload_profile(service, request_id, profiler, top_allocations(snapshot), peak)
+                except Exception as e:
+                    logger.error(f"Failed to store profile: {str(e)}")
+        return wrapper
+    return decorator
+
+
+def _fetch_profiles(target, workdir):
+    """Download (or locate) .prof files for a local path or s3:// key/prefix."""
+    if not target.startswith('s3://'):
+        if os.path.isdir(target):
+            return sorted(os.path.join(target, n) for n in os.listdir(target) if n.endswith('.prof'))
+        return [target]
+
+    bucket, _, key = target[len('s3://'):].partition('/')
+    if key.endswith('.prof'):
+        keys = [key]
+    else:
+        keys = []
+        paginator = s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket, Prefix=key):
+            keys.extend(o['Key'] for o in page.get('Contents', []) if o['Key'].endswith('.prof'))
+
+    paths = []
+    for key in keys:
+        path = os.path.join(workdir, key.replace('/', '_'))
+        s3.download_file(bucket, key, path)
+        paths.append(path)
+        alloc_key = key[:-len('.prof')] + '.alloc.json'
+        try:
+            s3.download_file(bucket, alloc_key, path[:-len('.prof')] + '.alloc.json')
+        except Exception:
+            pass
+    return paths
+
+
+def summarize(paths, sort='cumulative', top=25, out=sys.stdout):
+    """Print merged pstats and the allocation reports found next to the profiles."""
+    if not paths:
+        out.write("No profiles found\n")
+        return
+
+    stream = io.StringIO()
+    stats = pstats.Stats(paths[0], stream=stream)
+    for path in paths[1:]:
+        stats.add(path)
+    stats.sort_stats(sort).print_stats(top)
+    out.write(f"Merged {len(paths)} profile(s)\n")
+    out.write(stream.getvalue())
+
+    for path in paths:
+        alloc_path = path[:-len('.prof')] + '.alloc.json'
+        if not os.path.exists(alloc_path):
+            continue
+        with open(alloc_path) as f:
+            report = json.load(f)
+        out.write(f"\nTop allocations for {os.path.basename(path)} (peak {report['peak_kb']:,} KB)\n")
+        for site in report['top'][:top]:
+            out.write(f"  {site['size_kb']:>10,.1f} KB {site['count']:>8} blocks  "
+                      f"{site['file']}:{site['line']}\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize scanner profiles")
+    parser.add_argument('targets', nargs='+', help=".prof files, directories or s3:// keys/prefixes")
+    parser.add_argument('--sort', default='cumulative', help="pstats sort key")
+    parser.add_argument('--top', type=int, default=25)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        paths = []
+        for target in args.targets:
+            paths.extend(_fetch_profiles(target, workdir))
+        summarize(paths, sort=args.sort, top=args.top)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,389 @@
+"""
+Append-only raw-data archive.
+
+Layout per ticker under s3://$S3_BUCKET/raw-data/<TICKER>/:
+
+    manifest.json             months with a partition, pending segments, last bar
+    segments/<ts>.ndjson      bars that were new (or revised) at one scan
+    monthly/<YYYY-MM>.ndjson  compacted month, one fixed-width slot per day
+
+Scans append a segment only for bars newer than the manifest's last bar
+(or a revision of it), so an hourly run writes a few hundred bytes instead
+of the full 30-day window. The compaction job (lambda_handler, daily)
+folds segments into monthly partitions and drops them from the manifest.
+
+Monthly partitions hold 31 slots of SLOT_BYTES each (blank when there is no
+bar), so day d of a month is at byte range [(d-1)*SLOT_BYTES, d*SLOT_BYTES)
+and readers can fetch a date range without an index (see load_window).
+"""
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import boto3
+from botocore.exceptions import ClientError
+
+from metrics import MetricsRecorder
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+RAW_PREFIX = 'raw-data'
+MANIFEST_NAME = 'manifest.json'
+
+# Fixed width of one day's line in a monthly partition (newline included)
+SLOT_BYTES = 160
+SLOTS_PER_MONTH = 31
+
+BAR_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+# Optimistic manifest updates retried on a concurrent write
+MANIFEST_ATTEMPTS = 3
+
+# Parallel GETs when loading a window of history
+READ_WORKERS = 8
+
+s3 = boto3.client('s3')
+
+metrics = MetricsRecorder('stock-raw-compactor')
+
+
+class ManifestConflict(Exception):
+    """The manifest changed between read and conditional write."""
+
+
+def manifest_key(ticker, prefix=RAW_PREFIX):
+    return f"{prefix}/{ticker}/{MANIFEST_NAME}"
+
+
+def partition_key(ticker, month, prefix=RAW_PREFIX):
+    return f"{prefix}/{ticker}/monthly/{month}.ndjson"
+
+
+def segment_key(ticker, now, prefix=RAW_PREFIX):
+    return f"{prefix}/{ticker}/segments/{now.strftime('%Y%m%d-%H%M%S-%f')}.ndjson"
+
+
+def normalize_bar(bar):
+    """Keep the archived fields; prices at 4 decimals, volume as int."""
+    normalized = {'date': bar['date']}
+    for field in BAR_FIELDS:
+        value = bar.get(field)
+        if value is None:
+            continue
+        normalized[field] = int(value) if field == 'volume' else round(float(value), 4)
+    return normalized
+
+
+def encode_line(bar):
+    return json.dumps(bar, separators=(',', ':'), sort_keys=True)
+
+
+def encode_segment(bars):
+    return ''.join(encode_line(bar) + '\n' for bar in bars).encode('utf-8')
+
+
+def encode_partition(bars):
+    """Encode one month's bars into fixed-width day slots."""
+    slots = [' ' * (SLOT_BYTES - 1)] * SLOTS_PER_MONTH
+    for bar in bars:
+        line = encode_line(bar)
+        if len(line) > SLOT_BYTES - 1:
+            raise ValueError(f"Bar for {bar['date']} does not fit in {SLOT_BYTES} bytes")
+        slots[int(bar['date'][8:10]) - 1] = line.ljust(SLOT_BYTES - 1)
+    return ''.join(slot + '\n' for slot in slots).encode('utf-8')
+
+
+def decode_lines(body):
+    """Bars from an NDJSON segment or partition (blank slots skipped)."""
+    if isinstance(body, bytes):
+        body = body.decode('utf-8')
+    return [json.loads(line) for line in body.splitlines() if line.strip()]
+
+
+def parse_raw_object(name, body):
+    """
+    Bars from any object under raw-data/<TICKER>/: legacy full-window JSON
+    arrays, segments or partitions. The manifest itself yields no bars.
+    """
+    if name.endswith('.ndjson'):
+        return decode_lines(body)
+    if name.endswith('.json') and os.path.basename(name) != MANIFEST_NAME:
+        return json.loads(body)
+    return []
+
+
+def merge_bars(bars):
+    """Deduplicate bars by date (last write wins) and sort them."""
+    by_date = {}
+    for bar in bars:
+        by_date[bar['date']] = bar
+    return [by_date[d] for d in sorted(by_date)]
+
+
+def empty_manifest(ticker):
+    return {'ticker': ticker, 'last_date': None, 'last_bar': None, 'months': [], 'segments': []}
+
+
+def load_manifest(ticker, bucket=None, prefix=RAW_PREFIX):
+    """Return (manifest, etag); etag is None when the ticker has no manifest yet."""
+    bucket = bucket or os.environ.get('S3_BUCKET', 'stock-scan-data-529088281783')
+    try:
+        response = s3.get_object(Bucket=bucket, Key=manifest_key(ticker, prefix))
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return empty_manifest(ticker), None
+        raise
+    return json.loads(response['Body'].read()), response['ETag']
+
+
+def save_manifest(ticker, manifest, etag, bucket=None, prefix=RAW_PREFIX):
+    """Write the manifest only if it is unchanged since it was read."""
+    bucket = bucket or os.environ.get('S3_BUCKET', 'stock-scan-data-529088281783')
+    condition = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+    try:
+        s3.put_object(
+            Bucket=bucket,
+            Key=manifest_key(ticker, prefix),
+            Body=json.dumps(manifest, separators=(',', ':')),
+            ContentType='application/json',
+            **condition
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('PreconditionFailed', 'ConditionalRequestConflict'):
+            raise ManifestConflict(ticker)
+        raise
+
+
+def new_bars(manifest, records):
+    """Bars after the manifest's last bar, plus a revision of the last bar itself."""
+    last_date = manifest.get('last_date')
+    last_bar = manifest.get('last_bar')
+    bars = []
+    for bar in merge_bars(normalize_bar(r) for r in records):
+        if last_date is None or bar['date'] > last_date:
+            bars.append(bar)
+        elif bar['date'] == last_date and bar != last_bar:
+            bars.append(bar)
+    return bars
+
+
+def append_bars(ticker, records, bucket=None, prefix=RAW_PREFIX, now=None):
+    """
+    Store the bars not yet in the archive as one segment.
+    Returns the segment key, or None when nothing was new.
+    """
+    bucket = bucket or os.environ.get('S3_BUCKET', 'stock-scan-data-529088281783')
+    for attempt in range(MANIFEST_ATTEMPTS):
+        manifest, etag = load_manifest(ticker, bucket, prefix)
+        bars = new_bars(manifest, records)
+        if not bars:
+            logger.info(f"No new bars for {ticker}")
+            return None
+
+        key = segment_key(ticker, now or datetime.utcnow(), prefix)
+        s3.put_object(Bucket=bucket, Key=key, Body=encode_segment(bars),
+                      ContentType='application/x-ndjson')
+
+        manifest['segments'].append({
+            'key': key,
+            'first_date': bars[0]['date'],
+            'last_date': bars[-1]['date'],
+            'bars': len(bars)
+        })
+        manifest['last_date'] = bars[-1]['date']
+        manifest['last_bar'] = bars[-1]
+        try:
+            save_manifest(ticker, manifest, etag, bucket, prefix)
+        except ManifestConflict:
+            logger.warning(f"Manifest for {ticker} changed, retrying append ({attempt + 1})")
+            s3.delete_object(Bucket=bucket, Key=key)
+            continue
+
+        logger.info(f"Appended {len(bars)} bars for {ticker}: s3://{bucket}/{key}")
+        return key
+
+    raise ManifestConflict(ticker)
+
+
+def _get_bars(bucket, key, byte_range=None):
+    """Bars in one archive object (or a byte range of it); None if it does not exist."""
+    kwargs = {'Bucket': bucket, 'Key': key}
+    if byte_range:
+        kwargs['Range'] = byte_range
+    try:
+        body = s3.get_object(**kwargs)['Body'].read()
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return None
+        raise
+    return parse_raw_object(key, body)
+
+
+def read_bars(bucket, key):
+    """All bars in one archive object ([] if it was removed by compaction)."""
+    return _get_bars(bucket, key) or []
+
+
+def partition_range(month, start, end):
+    """HTTP Range covering the day slots of `month` within [start, end]."""
+    first = int(start[8:10]) if start[:7] == month else 1
+    last = int(end[8:10]) if end[:7] == month else SLOTS_PER_MONTH
+    return f"bytes={(first - 1) * SLOT_BYTES}-{last * SLOT_BYTES - 1}"
+
+
+def load_window(ticker, start, end, bucket=None, prefix=RAW_PREFIX):
+    """
+    Archived bars with start <= date <= end (ISO dates), oldest first.
+    
+    Only the objects the manifest lists for the window are read, in
+    parallel: a ranged GET per monthly partition and a GET per segment.
+    Returns (bars, manifest).
+    """
+    bucket = bucket or os.environ.get('S3_BUCKET', 'stock-scan-data-529088281783')
+    for attempt in range(MANIFEST_ATTEMPTS):
+        manifest, _ = load_manifest(ticker, bucket, prefix)
+        partitions = [
+            (partition_key(ticker, month, prefix), partition_range(month, start, end))
+            for month in manifest['months'] if start[:7] <= month <= end[:7]
+        ]
+        segments = [
+            (segment['key'], None)
+            for segment in manifest['segments']
+            if segment['last_date'] >= start and segment['first_date'] <= end
+        ]
+        if not partitions and not segments:
+            return [], manifest
+
+        with ThreadPoolExecutor(max_workers=READ_WORKERS) as pool:
+            results = list(pool.map(lambda request: _get_bars(bucket, *request),
+                                    partitions + segments))
+
+        # A segment compacted away since the manifest was read: its bars
+        # may be in a partition version we did not see, so start over
+        if any(result is None for result in results[len(partitions):]):
+            logger.info(f"Archive for {ticker} compacted during read, reloading manifest")
+            continue
+
+        bars = merge_bars(bar for result in results for bar in (result or []))
+        return [bar for bar in bars if start <= bar['date'] <= end], manifest
+
+    raise ManifestConflict(ticker)
+
+
+def list_legacy_keys(ticker, bucket, prefix=RAW_PREFIX):
+    """Full-window JSON objects written before the append-only layout."""
+    keys = []
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=f"{prefix}/{ticker}/", Delimiter='/'):
+        for obj in page.get('Contents', []):
+            name = obj['Key'].rsplit('/', 1)[-1]
+            if name.endswith('.json') and name != MANIFEST_NAME:
+                keys.append(obj['Key'])
+    return sorted(keys)
+
+
+def compact_ticker(ticker, bucket=None, prefix=RAW_PREFIX, include_legacy=False):
+    """
+    Fold a ticker's segments (and optionally legacy objects) into monthly
+    partitions, then delete what was folded. Returns the number of bars compacted.
+    """
+    bucket = bucket or os.environ.get('S3_BUCKET', 'stock-scan-data-529088281783')
+    manifest, etag = load_manifest(ticker, bucket, prefix)
+    segments = list(manifest['segments'])
+    legacy_keys = list_legacy_keys(ticker, bucket, prefix) if include_legacy else []
+    if not segments and not legacy_keys:
+        return 0
+
+    # Oldest first so later writes win in merge_bars
+    incoming = []
+    for key in legacy_keys + [segment['key'] for segment in segments]:
+        incoming.extend(read_bars(bucket, key))
+
+    by_month = {}
+    for bar in incoming:
+        by_month.setdefault(bar['date'][:7], []).append(normalize_bar(bar))
+
+    for month, bars in sorted(by_month.items()):
+        key = partition_key(ticker, month, prefix)
+        existing = read_bars(bucket, key) if month in manifest['months'] else []
+        s3.put_object(Bucket=bucket, Key=key, Body=encode_partition(merge_bars(existing + bars)),
+                      ContentType='application/x-ndjson')
+
+    compacted = {segment['key'] for segment in segments}
+    for attempt in range(MANIFEST_ATTEMPTS):
+        manifest['segments'] = [s for s in manifest['segments'] if s['key'] not in compacted]
+        manifest['months'] = sorted(set(manifest['months']) | set(by_month))
+        if include_legacy and manifest['last_date'] is None and incoming:
+            latest = max(incoming, key=lambda bar: bar['date'])
+            manifest['last_date'] = latest['date']
+            manifest['last_bar'] = normalize_bar(latest)
+        try:
+            save_manifest(ticker, manifest, etag, bucket, prefix)
+            break
+        except ManifestConflict:
+            # A scan appended meanwhile; keep its segment and retry
+            manifest, etag = load_manifest(ticker, bucket, prefix)
+    else:
+        raise ManifestConflict(ticker)
+
+    # Readers holding the old manifest treat missing segments as empty;
+    # folded legacy objects stay recoverable as noncurrent versions
+    keys = sorted(compacted) + legacy_keys
+    for start in range(0, len(keys), 1000):
+        s3.delete_objects(Bucket=bucket, Delete={
+            'Objects': [{'Key': key} for key in keys[start:start + 1000]],
+            'Quiet': True
+        })
+
+    logger.info(f"Compacted {len(incoming)} bars for {ticker} into {len(by_month)} month(s)")
+    return len(incoming)
+
+
+def list_archived_tickers(bucket, prefix=RAW_PREFIX):
+    tickers = []
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=f"{prefix}/", Delimiter='/'):
+        for common in page.get('CommonPrefixes', []):
+            tickers.append(common['Prefix'].rstrip('/').rsplit('/', 1)[-1])
+    return sorted(tickers)
+
+
+def lambda_handler(event, context):
+    """
+    Scheduled compaction of the raw-data archive.
+    Event options: {"tickers": [...]} to limit the run, {"include_legacy": true}
+    to also fold pre-manifest full-window objects into partitions.
+    """
+    try:
+        with metrics.timer('handler'):
+            event = event or {}
+            bucket = os.environ.get('S3_BUCKET', 'stock-scan-data-529088281783')
+            tickers = event.get('tickers') or list_archived_tickers(bucket)
+            include_legacy = bool(event.get('include_legacy'))
+
+            summary = {'tickers': len(tickers), 'bars_compacted': 0, 'failed_tickers': []}
+            for ticker in tickers:
+                try:
+                    with metrics.timer('compact'):
+                        bars = compact_ticker(ticker, bucket, include_legacy=include_legacy)
+                    metrics.add('compact', 'ItemsProcessed', bars)
+                    summary['bars_compacted'] += bars
+                except Exception as e:
+                    logger.error(f"Compaction failed for {ticker}: {str(e)}")
+                    metrics.add('compact', 'Failures')
+                    summary['failed_tickers'].append(ticker)
+
+            logger.info(f"Compacted {summary['bars_compacted']} bars across {len(tickers)} tickers")
+            return {
+                'statusCode': 200,
+                'body': json.dumps(summary)
+            }
+
+    except Exception as e:
+        logger.error(f"Raw-data compaction failed: {str(e)}", exc_info=True)
+        raise
+    finally:
+        metrics.flush()
@@ -0,0 +1,282 @@
+import heapq
+import json
+import logging
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import boto3
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Cost assumed for tickers that have never been measured
+DEFAULT_TICKER_COST_MS = 500.0
+
+# Work budget per shard: half the 120 s worker timeout leaves headroom for retries
+SHARD_BUDGET_MS = float(os.environ.get('SHARD_BUDGET_MS', '60000'))
+
+# Worker invocations in flight; reserved concurrency (5) minus the coordinator itself
+MAX_CONCURRENCY = int(os.environ.get('SCAN_MAX_CONCURRENCY', '4'))
+
+# Time kept free at the end of the coordinator's own invocation
+COORDINATOR_MARGIN_MS = 10000
+
+# Smoothing for measured per-ticker costs
+COST_SMOOTHING = 0.3
+
+# S3 key holding measured per-ticker costs
+COST_KEY = 'scan-costs/ticker-costs.json'
+
+s3 = boto3.client('s3')
+
+
+def load_ticker_costs(bucket):
+    """Load measured per-ticker costs (ms) from S3."""
+    try:
+        response = s3.get_object(Bucket=bucket, Key=COST_KEY)
+        return json.loads(response['Body'].read())
+    except Exception as e:
+        logger.warning(f"No ticker cost table, using defaults: {str(e)}")
+        return {}
+
+
+def save_ticker_costs(bucket, costs):
+    """Persist per-ticker costs (ms) to S3."""
+    try:
+        s3.put_object(
+            Bucket=bucket,
+            Key=COST_KEY,
+            Body=json.dumps(costs),
+            ContentType='application/json'
+        )
+    except Exception as e:
+        logger.error(f"Failed to save ticker costs: {str(e)}")
+
+
+def merge_ticker_costs(costs, measured):
+    """Blend newly measured costs into the cost table."""
+    merged = dict(costs)
+    for ticker, cost in measured.items():
+        previous = merged.get(ticker)
+        if previous is None:
+            merged[ticker] = round(cost, 1)
+        else:
+            merged[ticker] = round(previous + COST_SMOOTHING * (cost - previous), 1)
+    return merged
+
+
+def plan_shards(tickers, costs=None, budget_ms=SHARD_BUDGET_MS):
+    """
+    Split tickers into shards whose estimated cost fits the budget.
+    Uses longest-processing-time-first so shards finish at about the same time.
+    """
+    costs = costs or {}
+    tickers = list(dict.fromkeys(t.upper() for t in tickers))
+    if not tickers:
+        return []
+
+    weighted = sorted(
+        ((costs.get(t, DEFAULT_TICKER_COST_MS), t) for t in tickers),
+        reverse=True
+    )
+    total = sum(cost for cost, _ in weighted)
+    shard_count = min(len(tickers), max(1, math.ceil(total / budget_ms)))
+
+    # Min-heap of (load, shard_index)
+    loads = [(0.0, i) for i in range(shard_count)]
+    shards = [[] for _ in range(shard_count)]
+    for cost, ticker in weighted:
+        load, index = heapq.heappop(loads)
+        shards[index].append(ticker)
+        heapq.heappush(loads, (load + cost, index))
+
+    return [shard for shard in shards if shard]
+
+
+def shard_event(shard, shared=None, **fields):
+    """Worker event for one shard; `shared` fields go to every shard of the scan."""
+    return {'tickers': shard, **(shared or {}), **fields}
+
+
+class LocalExecutor:
+    """Runs shards in-process; used for tests and local runs."""
+
+    def __init__(self, worker=None, max_workers=1):
+        self.worker = worker
+        self.max_workers = max_workers
+
+    def _run_shard(self, shard, shared=None):
+        worker = self.worker
+        if worker is None:
+            from stock_scanner import lambda_handler as worker
+        response = worker(shard_event(shard, shared), None)
+        return json.loads(response['body'])
+
+    def run(self, shards, shared=None):
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return list(pool.map(lambda shard: self._run_shard(shard, shared), shards))
+
+
+class LambdaExecutor:
+    """
+    Invokes one worker Lambda per shard, at most max_concurrency at a time.
+
+    Shards run synchronously while one more shard budget still fits before
+    the coordinator's deadline (remaining_ms, from the Lambda context). Shards
+    that would not finish in time are invoked asynchronously instead and
+    reported as queued: they scan and alert on their own, so a large universe
+    never times out the coordinator and has finished shards rescanned on
+    retry. Queued shards report neither costs nor factor returns back.
+    """
+
+    def __init__(self, function_name, max_concurrency=MAX_CONCURRENCY, client=None,
+                 remaining_ms=None, budget_ms=SHARD_BUDGET_MS):
+        self.function_name = function_name
+        self.max_concurrency = max_concurrency
+        self.lambda_client = client or boto3.client('lambda')
+        self.latest_start = None
+        if remaining_ms is not None:
+            self.latest_start = time.monotonic() + (remaining_ms - COORDINATOR_MARGIN_MS - budget_ms) / 1000
+
+    def _invoke(self, shard, shared=None):
+        if self.latest_start is not None and time.monotonic() > self.latest_start:
+            return self._invoke_async(shard, shared)
+        try:
+            response = self.lambda_client.invoke(
+                FunctionName=self.function_name,
+                InvocationType='RequestResponse',
+                Payload=json.dumps(shard_event(shard, shared)).encode('utf-8')
+            )
+            payload = json.loads(response['Payload'].read())
+            if response.get('FunctionError'):
+                return {'status': 'error', 'tickers': len(shard), 'failed_tickers': shard,
+                        'error': payload.get('errorMessage', 'worker failed')}
+            return json.loads(payload['body'])
+        except Exception as e:
+            logger.error(f"Shard invocation failed: {str(e)}")
+            return {'status': 'error', 'tickers': len(shard), 'failed_tickers': shard,
+                    'error': str(e)}
+
+    def _invoke_async(self, shard, shared=None):
+        try:
+            self.lambda_client.invoke(
+                FunctionName=self.function_name,
+                InvocationType='Event',
+                Payload=json.dumps(shard_event(shard, shared, queued=True)).encode('utf-8')
+            )
+            return {'status': 'queued', 'tickers': len(shard)}
+        except Exception as e:
+            logger.error(f"Async shard invocation failed: {str(e)}")
+            return {'status': 'error', 'tickers': len(shard), 'failed_tickers': shard,
+                    'error': str(e)}
+
+    def run(self, shards, shared=None):
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            return list(pool.map(lambda shard: self._invoke(shard, shared), shards))
+
+
+class SqsExecutor:
+    """Queues one message per shard; workers consume them under their own concurrency limit."""
+
+    def __init__(self, queue_url, client=None):
+        self.queue_url = queue_url
+        self.sqs = client or boto3.client('sqs')
+
+    def run(self, shards, shared=None):
+        results = []
+        for start in range(0, len(shards), 10):
+            batch = shards[start:start + 10]
+            try:
+                response = self.sqs.send_message_batch(
+                    QueueUrl=self.queue_url,
+                    Entries=[
+                        {'Id': str(start + i), 'MessageBody': json.dumps(shard_event(shard, shared))}
+                        for i, shard in enumerate(batch)
+                    ]
+                )
+                failed = {int(f['Id']): f.get('Message', f.get('Code', 'send failed'))
+                          for f in response.get('Failed', [])}
+            except Exception as e:
+                logger.error(f"Failed to queue shards: {str(e)}")
+                failed = {start + i: str(e) for i in range(len(batch))}
+
+            for i, shard in enumerate(batch):
+                error = failed.get(start + i)
+                if error is None:
+                    results.append({'status': 'queued', 'tickers': len(shard)})
+                else:
+                    results.append({'status': 'error', 'tickers': len(shard),
+                                    'failed_tickers': shard, 'error': error})
+        return results
+
+
+def aggregate_shard_results(shard_results):
+    """Combine per-shard worker results into one scan summary."""
+    summary = {
+        'status': 'success',
+        'timestamp': datetime.utcnow().isoformat(),
+        'shards': len(shard_results),
+        'shards_failed': 0,
+        'shards_queued': 0,
+        'tickers': 0,
+        'tickers_failed': 0,
+        'tickers_processed': 0,
+        'tickers_skipped': 0,
+        'anomalies_detected': 0,
+        'market_events': 0,
+        'failed_tickers': [],
+        'ticker_costs_ms': {},
+        'factor_returns': {},
+    }
+
+    for result in shard_results:
+        summary['tickers'] += result.get('tickers', 0)
+        if result.get('status') == 'queued':
+            summary['shards_queued'] += 1
+            continue
+        if result.get('status') == 'error':
+            summary['shards_failed'] += 1
+        summary['tickers_processed'] += result.get('tickers_processed', 0)
+        summary['tickers_skipped'] += result.get('tickers_skipped', 0)
+        summary['anomalies_detected'] += result.get('anomalies_detected', 0)
+        summary['market_events'] += result.get('market_events', 0)
+        summary['failed_tickers'].extend(result.get('failed_tickers', []))
+        summary['ticker_costs_ms'].update(result.get('ticker_costs_ms', {}))
+        summary['factor_returns'].update(result.get('factor_returns', {}))
+
+    summary['tickers_failed'] = len(summary['failed_tickers'])
+    if summary['shards_failed'] or summary['tickers_failed']:
+        summary['status'] = 'partial_failure'
+    return summary
+
+
+def make_executor(name, function_name=None, queue_url=None, remaining_ms=None):
+    """Build the executor named in the event or SCAN_EXECUTOR."""
+    if name == 'local':
+        return LocalExecutor()
+    if name == 'sqs':
+        return SqsExecutor(queue_url or os.environ['SHARD_QUEUE_URL'])
+    return LambdaExecutor(function_name or os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'stock-scanner'),
+                          remaining_ms=remaining_ms)
+
+
+def run_coordinator(tickers, executor, bucket=None, budget_ms=SHARD_BUDGET_MS, shared=None):
+    """
+    Plan shards from measured costs, dispatch them and aggregate the results.
+    `shared` fields (e.g. the scan's start time) are sent with every shard.
+    Measured per-ticker costs are fed back into the cost table for the next run.
+    """
+    costs = load_ticker_costs(bucket) if bucket else {}
+    shards = plan_shards(tickers, costs, budget_ms)
+
+    logger.info(f"Dispatching {len(tickers)} tickers in {len(shards)} shards")
+    summary = aggregate_shard_results(executor.run(shards, shared))
+
+    measured = summary.pop('ticker_costs_ms')
+    if bucket and measured:
+        save_ticker_costs(bucket, merge_ticker_costs(costs, measured))
+
+    return summary
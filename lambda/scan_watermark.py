@@ -0,0 +1,84 @@
+"""
+Per-ticker scan watermarks: the last processed bar date plus a hash of
+everything detection depends on (the history window, the threshold and the
+ticker's detectors).
+
+With daily bars, most intraday runs see exactly the window the previous run
+scored. A ticker whose watermark is unchanged is skipped right after the
+fetch: no raw-data upload, detection or anomaly writes. A new bar, a revised
+bar, or a threshold or detector change alters the hash and the ticker is
+scored again.
+
+Watermarks are stored at scan-watermarks/<TICKER>.json in the scan bucket and
+cached per container, so a warm container checks an unchanged ticker without
+any I/O. A watermark is written only after the ticker's anomalies were
+published; a run that fails before that scores the ticker again next time.
+"""
+import hashlib
+import json
+import logging
+import os
+import boto3
+from datetime import datetime
+
+logger = logging.getLogger()
+
+s3 = boto3.client('s3')
+
+# S3 prefix for per-ticker watermarks
+WATERMARK_PREFIX = 'scan-watermarks'
+
+# ticker -> last watermark this container read or wrote
+_cache = {}
+
+
+def watermark_key(ticker, prefix=WATERMARK_PREFIX):
+    return f"{prefix}/{ticker}.json"
+
+
+def compute_watermark(records, threshold, detectors):
+    """{'last_date', 'hash'} for a history window as it would be scored."""
+    payload = json.dumps([threshold, detectors, records], sort_keys=True,
+                         separators=(',', ':'), default=str)
+    return {
+        'last_date': records[-1]['date'] if records else None,
+        'hash': hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    }
+
+
+def same_watermark(stored, current):
+    return (stored is not None
+            and stored.get('last_date') == current['last_date']
+            and stored.get('hash') == current['hash'])
+
+
+def load_watermark(ticker, bucket, prefix=WATERMARK_PREFIX):
+    try:
+        response = s3.get_object(Bucket=bucket, Key=watermark_key(ticker, prefix))
+    except s3.exceptions.NoSuchKey:
+        return None
+    return json.loads(response['Body'].read())
+
+
+def is_unchanged(ticker, watermark, bucket=None, prefix=WATERMARK_PREFIX):
+    """True if `watermark` matches the last processed one (cache first, then S3)."""
+    if same_watermark(_cache.get(ticker), watermark):
+        return True
+    bucket = bucket or os.environ.get('S3_BUCKET', 'stock-scan-data-529088281783')
+    stored = load_watermark(ticker, bucket, prefix)
+    if stored is not None:
+        _cache[ticker] = stored
+    return same_watermark(stored, watermark)
+
+
+def save_watermark(ticker, watermark, bucket=None, prefix=WATERMARK_PREFIX):
+    """Record `watermark` as processed for `ticker`."""
+    bucket = bucket or os.environ.get('S3_BUCKET', 'stock-scan-data-529088281783')
+    body = dict(watermark, ticker=ticker, scanned_at=datetime.utcnow().isoformat())
+    s3.put_object(
+        Bucket=bucket,
+        Key=watermark_key(ticker, prefix),
+        Body=json.dumps(body, separators=(',', ':')).encode('utf-8'),
+        ContentType='application/json'
+    )
+    _cache[ticker] = body
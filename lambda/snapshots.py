@@ -0,0 +1,188 @@
+"""
+Precomputed dashboard snapshots.
+
+After each scan the recent anomalies are rendered into static JSON in the
+dashboard bucket, served by its CloudFront distribution:
+
+    snapshots/latest.json                  pointer, short cache (60s)
+    snapshots/v/<version>/recent.json      last 7 days, newest first
+    snapshots/v/<version>/tickers.json     latest anomaly per ticker
+    snapshots/v/<version>/summary.json     counts by severity, type, ticker, date
+
+Versioned objects never change, so CloudFront and browsers cache them for a
+year; only the small pointer is re-fetched. Viewers never reach Lambda.
+
+The publisher deletes old versions itself: each new version keeps the one it
+replaced (viewers may still hold the old pointer for up to a minute) and
+removes the rest. The live version is never deleted, however long the
+content stays unchanged.
+"""
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import boto3
+from boto3.dynamodb.conditions import Key
+
+logger = logging.getLogger()
+
+SNAPSHOT_PREFIX = 'snapshots'
+LATEST_KEY = f'{SNAPSHOT_PREFIX}/latest.json'
+VERSIONS_PREFIX = f'{SNAPSHOT_PREFIX}/v/'
+
+# Days of anomalies in recent.json (matches the API's default window)
+RECENT_DAYS = 7
+
+# Bar dates (DateIndex partitions) can trail scan timestamps by this many days
+DATE_LOOKBACK_DAYS = 4
+
+# recent.json is capped so the first dashboard load stays small
+MAX_RECENT = 500
+
+LATEST_CACHE_CONTROL = 'public, max-age=60'
+VERSIONED_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+s3 = boto3.client('s3')
+dynamodb = boto3.resource('dynamodb')
+anomalies_table = dynamodb.Table('stock-anomalies')
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _dumps(obj):
+    """Compact JSON; CloudFront gzips it on the way out."""
+    return json.dumps(obj, separators=(',', ':'), default=_json_default)
+
+
+def load_recent_anomalies(now=None, days=RECENT_DAYS):
+    """Anomalies scanned in the last `days` days, oldest first, via DateIndex."""
+    now = now or datetime.utcnow()
+    since = (now - timedelta(days=days)).isoformat()
+    first_date = (now - timedelta(days=days + DATE_LOOKBACK_DAYS)).date()
+
+    items = []
+    for offset in range((now.date() - first_date).days + 1):
+        kwargs = {
+            'IndexName': 'DateIndex',
+            'KeyConditionExpression': (
+                Key('date').eq((first_date + timedelta(days=offset)).isoformat())
+                & Key('timestamp').gt(since)
+            ),
+        }
+        while True:
+            result = anomalies_table.query(**kwargs)
+            items.extend(result.get('Items', []))
+            if 'LastEvaluatedKey' not in result:
+                break
+            kwargs['ExclusiveStartKey'] = result['LastEvaluatedKey']
+
+    items.sort(key=lambda item: item['timestamp'])
+    return items
+
+
+def build_snapshots(anomalies, generated_at):
+    """Render recent / tickers / summary documents from anomalies sorted oldest first."""
+    latest_by_ticker = {}
+    by_severity = {}
+    by_type = {}
+    by_ticker = {}
+    by_date = {}
+    for anomaly in anomalies:
+        latest_by_ticker[anomaly['ticker']] = anomaly
+        for counts, key in ((by_severity, anomaly.get('severity')),
+                            (by_type, anomaly.get('anomaly_type')),
+                            (by_ticker, anomaly['ticker']),
+                            (by_date, anomaly.get('date'))):
+            counts[key] = counts.get(key, 0) + 1
+
+    recent = anomalies[::-1][:MAX_RECENT]
+    return {
+        'recent': {
+            'generated_at': generated_at,
+            'count': len(recent),
+            'truncated': len(anomalies) > MAX_RECENT,
+            'anomalies': recent,
+        },
+        'tickers': {
+            'generated_at': generated_at,
+            'tickers': dict(sorted(latest_by_ticker.items())),
+        },
+        'summary': {
+            'generated_at': generated_at,
+            'days': RECENT_DAYS,
+            'total': len(anomalies),
+            'last_anomaly': anomalies[-1]['timestamp'] if anomalies else None,
+            'by_severity': by_severity,
+            'by_type': by_type,
+            'by_ticker': by_ticker,
+            'by_date': dict(sorted(by_date.items())),
+        },
+    }
+
+
+def publish_snapshots(bucket=None, now=None):
+    """
+    Rebuild the snapshots and move the latest pointer to them.
+    Skips the upload when the content is unchanged. Returns the pointer.
+    """
+    bucket = bucket or os.environ.get('DASHBOARD_BUCKET', 'stock-dashboard-529088281783')
+    now = now or datetime.utcnow()
+    anomalies = load_recent_anomalies(now)
+
+    # Version on content (not generation time) so unchanged scans are no-ops
+    bodies = {name: _dumps(doc) for name, doc in build_snapshots(anomalies, None).items()}
+    digest = hashlib.sha256(''.join(bodies[name] for name in sorted(bodies)).encode('utf-8'))
+    version = digest.hexdigest()[:16]
+
+    previous = None
+    try:
+        current = json.loads(s3.get_object(Bucket=bucket, Key=LATEST_KEY)['Body'].read())
+        if current.get('version') == version:
+            logger.info(f"Dashboard snapshot {version} unchanged")
+            return current
+        previous = current.get('version')
+    except Exception:
+        pass  # First publish, or an unreadable pointer that is about to be replaced
+
+    generated_at = now.isoformat()
+    pointer = {'version': version, 'generated_at': generated_at}
+    for name, doc in build_snapshots(anomalies, generated_at).items():
+        key = f'{SNAPSHOT_PREFIX}/v/{version}/{name}.json'
+        s3.put_object(Bucket=bucket, Key=key, Body=_dumps(doc),
+                      ContentType='application/json', CacheControl=VERSIONED_CACHE_CONTROL)
+        pointer[name] = key
+
+    # Pointer last, so viewers never see a version with missing documents
+    s3.put_object(Bucket=bucket, Key=LATEST_KEY, Body=_dumps(pointer),
+                  ContentType='application/json', CacheControl=LATEST_CACHE_CONTROL)
+    logger.info(f"Published dashboard snapshot {version} ({len(anomalies)} anomalies)")
+
+    # Without the replaced version we cannot tell what viewers still read
+    if previous:
+        try:
+            prune_versions(bucket, keep={version, previous})
+        except Exception as e:
+            logger.warning(f"Failed to prune old dashboard snapshots: {str(e)}")
+    return pointer
+
+
+def prune_versions(bucket, keep):
+    """Delete every snapshot version not in `keep`. Returns the number of objects deleted."""
+    stale = []
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=VERSIONS_PREFIX):
+        for obj in page.get('Contents', []):
+            version = obj['Key'][len(VERSIONS_PREFIX):].split('/', 1)[0]
+            if version not in keep:
+                stale.append({'Key': obj['Key']})
+    # DeleteObjects takes at most 1000 keys
+    for start in range(0, len(stale), 1000):
+        s3.delete_objects(Bucket=bucket, Delete={'Objects': stale[start:start + 1000], 'Quiet': True})
+    return len(stale)
@@ -2,11 +2,23 @@ import json
 import logging
 import os
 import boto3
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import urllib3
-from statistics import mean, stdev
 import time
 
+from anomaly_record import AnomalyRecord
+from bar_series import BarSeries, as_records
+from detectors import BASELINE_DAYS, detectors_for_ticker, history_days, run_detectors
+from market_calendar import MarketCalendar
+from market_model import apply_market_model, fold_universe, load_universe, scan_returns
+from metrics import MetricsRecorder
+from profiling import profiled
+from raw_archive import append_bars, load_window, merge_bars, normalize_bar
+from scan_coordinator import make_executor, run_coordinator
+from scan_watermark import compute_watermark, is_unchanged, save_watermark
+from snapshots import publish_snapshots
+from tracing import Tracer, exporter_from_env, message_attributes
+
 # Configure structured logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -21,6 +33,19 @@ anomalies_table = dynamodb.Table('stock-anomalies')
 # HTTP client
 http = urllib3.PoolManager()
 
+# Per-stage EMF metrics, flushed at the end of each invocation
+metrics = MetricsRecorder('stock-scanner')
+
+# Trace context carried with each alert to the notification handler
+tracer = Tracer('stock-scanner', exporter_from_env())
+
+
+# Scheduled runs outside a session exit before any I/O. The calendar from
+# /stock-tracker/market-hours is re-read at most this often per container.
+MARKET_HOURS_CACHE_SECONDS = 3600
+
+_market_calendar = {'calendar': MarketCalendar(), 'loaded_at': None}
+
 # Circuit breaker state
 circuit_breaker = {
     'failures': 0,
@@ -28,70 +53,414 @@ circuit_breaker = {
     'state': 'closed'  # closed, open, half_open
 }
 
+@profiled('stock-scanner')
 def lambda_handler(event, context):
     """
     Stock scanner Lambda function with error handling.
     Fetches stock data, detects anomalies, and stores results.
+    
+    Modes:
+    - default: scan the ticker from Parameter Store
+    - {"tickers": [...]}: worker mode, scan one shard of tickers
+      ({"queued": true} when invoked asynchronously by the coordinator,
+      {"scan_time": ...} with the coordinated scan's start, shared by its shards)
+    - {"mode": "coordinator"}: split the universe into shards and fan out
+    - SQS records with {"tickers": [...]} bodies: queued shards
+    
+    Every mode except synchronous worker shards refreshes the dashboard snapshots.
+    
+    Scheduled invocations ({"scheduled": true}, or an EventBridge rule event)
+    return immediately when the market is closed; add {"force": true} to
+    scan anyway.
+    
+    Add {"profile": true} (or set PROFILE_ENABLED) to profile the run.
+    Each invocation starts a trace ({"trace_id": ...} continues one); its id
+    is stored on the anomalies and sent with their alerts.
     """
     try:
-        logger.info("Stock scanner started", extra={
-            "timestamp": datetime.utcnow().isoformat(),
-            "event": event
-        })
-        
-        # Get configuration from Parameter Store with retry
-        ticker = get_parameter_with_retry('/stock-tracker/ticker', 'AAPL')
-        threshold = float(get_parameter_with_retry('/stock-tracker/anomaly-threshold', '2.0'))
-        
-        logger.info(f"Configuration: ticker={ticker}, threshold={threshold}")
-        
-        # Fetch stock data with circuit breaker
-        stock_data = fetch_with_circuit_breaker(ticker, days=30)
-        
-        if not stock_data or len(stock_data) < 20:
-            logger.warning(f"Insufficient data for {ticker}")
+        # An in-process shard worker stays in its coordinator's trace
+        if not tracer.active:
+            tracer.start_trace((event or {}).get('trace_id'))
+        with metrics.timer('handler'), tracer.span('scan'):
+            event = event or {}
+            logger.info("Stock scanner started", extra={
+                "timestamp": datetime.utcnow().isoformat(),
+                "event": event
+            })
+            
+            if is_scheduled(event) and not event.get('force'):
+                now = datetime.now(timezone.utc)
+                if not market_is_open(now):
+                    logger.info(f"Market closed at {now.isoformat()}, skipping scheduled scan")
+                    return {
+                        'statusCode': 200,
+                        'body': json.dumps({'status': 'market_closed', 'checked_at': now.isoformat()})
+                    }
+            
+            if event.get('mode') == 'coordinator':
+                return run_coordinator_mode(event, context)
+            
+            # Get configuration from Parameter Store with retry
+            threshold = float(get_parameter_with_retry('/stock-tracker/anomaly-threshold', '2.0'))
+            detector_config = get_detector_config()
+            
+            if event.get('tickers'):
+                summary = scan_tickers(event['tickers'], threshold, detector_config, get_sector_config(),
+                                       event.get('scan_time'))
+                # Shards the coordinator queued finish after it returned
+                if event.get('queued'):
+                    publish_dashboard_snapshots()
+                return {
+                    'statusCode': 200,
+                    'body': json.dumps(summary)
+                }
+            
+            if event.get('Records'):
+                sectors = get_sector_config()
+                shards = [json.loads(record['body']) for record in event['Records']]
+                summaries = [
+                    scan_tickers(shard['tickers'], threshold, detector_config, sectors,
+                                 shard.get('scan_time'))
+                    for shard in shards
+                ]
+                # Queued shards finish after the coordinator returns
+                publish_dashboard_snapshots()
+                return {
+                    'statusCode': 200,
+                    'body': json.dumps({'shards': summaries})
+                }
+            
+            ticker = get_parameter_with_retry('/stock-tracker/ticker', 'AAPL')
+            scan_result = scan_ticker(ticker, threshold, detectors_for_ticker(detector_config, ticker))
+            publish_dashboard_snapshots()
+            
             return {
                 'statusCode': 200,
-                'body': json.dumps({'status': 'insufficient_data', 'ticker': ticker})
+                'body': json.dumps(scan_result)
             }
         
-        # Store raw data in S3 with retry
-        s3_key = store_raw_data_with_retry(ticker, stock_data)
-        
-        # Detect anomalies
-        anomalies = detect_anomalies(ticker, stock_data, threshold)
-        
-        # Store anomalies and send alerts with error handling
-        if anomalies:
-            store_anomalies_with_retry(anomalies)
-            send_alert_with_retry(anomalies)
-        
-        # Prepare scan result
-        scan_result = {
-            "status": "success",
-            "result_message": "Stock data collected successfully",
-            "timestamp": datetime.utcnow().isoformat(),
-            "ticker": ticker,
-            "threshold": threshold,
-            "data_points": len(stock_data),
-            "s3_key": s3_key,
-            "anomalies_detected": len(anomalies),
-            "latest_price": stock_data[-1]['close'] if stock_data else None,
-            "latest_volume": stock_data[-1]['volume'] if stock_data else None
-        }
-        
-        logger.info("Stock scanner completed successfully")
-        logger.info(f"Collected {len(stock_data)} data points, detected {len(anomalies)} anomalies")
-        
-        return {
-            'statusCode': 200,
-            'body': json.dumps(scan_result)
-        }
-        
     except Exception as e:
         logger.error(f"Stock scanner failed: {str(e)}", exc_info=True)
         # Re-raise to trigger DLQ
         raise
+    finally:
+        metrics.flush()
+        tracer.flush()
+
+def is_scheduled(event):
+    """Scheduler invocations and events from a legacy EventBridge rule."""
+    return bool(event.get('scheduled')) or event.get('source') == 'aws.events'
+
+def market_is_open(now):
+    """
+    Whether `now` falls in a scan window. The cached calendar answers
+    first, so closed sessions cost no I/O; an open one refreshes the
+    market-hours parameter (when stale) and checks again.
+    """
+    if not _market_calendar['calendar'].is_scan_window(now):
+        return False
+    loaded_at = _market_calendar['loaded_at']
+    if loaded_at is None or time.time() - loaded_at > MARKET_HOURS_CACHE_SECONDS:
+        _market_calendar['calendar'] = get_market_calendar()
+        _market_calendar['loaded_at'] = time.time()
+        return _market_calendar['calendar'].is_scan_window(now)
+    return True
+
+def get_market_calendar():
+    """Trading calendar with the hours and closures from Parameter Store."""
+    raw = get_parameter_with_retry('/stock-tracker/market-hours', '')
+    if not raw:
+        return MarketCalendar()
+    try:
+        return MarketCalendar.from_config(json.loads(raw))
+    except (ValueError, KeyError) as e:
+        logger.warning(f"Invalid market hours config, using exchange defaults: {str(e)}")
+        return MarketCalendar()
+
+def scan_ticker(ticker, threshold, detectors, deferred=None):
+    """
+    Fetch, store and score one ticker; store anomalies and send alerts.
+    With a `deferred` list, anomalies and closes are appended to it instead
+    so the batch can be checked for market-wide moves before publishing.
+    A ticker whose window is unchanged since its last scan (same watermark)
+    returns status 'unchanged' right after the fetch.
+    Returns the scan result for the ticker.
+    """
+    logger.info(f"Configuration: ticker={ticker}, threshold={threshold}, detectors={detectors}")
+    
+    # Load history from the archive; the provider fills in only the recent days
+    with metrics.timer('fetch'):
+        records, fetched = fetch_history(ticker, days=history_days(detectors, _market_calendar['calendar']))
+    metrics.add('fetch', 'ItemsProcessed', len(records))
+    
+    if len(records) < 20:
+        logger.warning(f"Insufficient data for {ticker}")
+        return {'status': 'insufficient_data', 'ticker': ticker}
+    
+    # Skip the upload, detection and writes if nothing changed since the last scan
+    watermark = compute_watermark(records, threshold, detectors)
+    if watermark_unchanged(ticker, watermark):
+        metrics.add('watermark', 'Skipped')
+        if deferred is not None:
+            # Still a peer for the market model's factor returns
+            deferred.append({
+                'ticker': ticker,
+                'anomalies': [],
+                'dates': [r['date'] for r in records],
+                'closes': [r['close'] for r in records],
+                'unchanged': True
+            })
+        logger.info(f"No new data for {ticker} since {watermark['last_date']}, skipping")
+        return {'status': 'unchanged', 'ticker': ticker, 'last_date': watermark['last_date']}
+    
+    # Archive the provider's bars in S3 with retry
+    s3_key = None
+    if fetched:
+        with metrics.timer('s3_store', items=len(fetched)):
+            s3_key = store_raw_data_with_retry(ticker, fetched)
+    
+    # Columnar view for detection (zero-copy baseline windows)
+    stock_data = BarSeries.from_records(records)
+    
+    # Detect anomalies
+    with metrics.timer('detect', items=len(stock_data)):
+        anomalies, detector_timings = detect_anomalies_with_timings(
+            ticker, stock_data, threshold, detectors
+        )
+    
+    if deferred is not None:
+        deferred.append({
+            'ticker': ticker,
+            'anomalies': anomalies,
+            'dates': [stock_data.date(i) for i in range(len(stock_data))],
+            'closes': list(stock_data.close),
+            'watermark': watermark
+        })
+    else:
+        publish_anomalies(anomalies)
+        record_watermark(ticker, watermark)
+    
+    # Prepare scan result
+    scan_result = {
+        "status": "success",
+        "result_message": "Stock data collected successfully",
+        "timestamp": datetime.utcnow().isoformat(),
+        "ticker": ticker,
+        "threshold": threshold,
+        "data_points": len(stock_data),
+        "s3_key": s3_key,
+        "anomalies_detected": len(anomalies),
+        "detectors": detectors,
+        "detector_timings_ms": detector_timings,
+        "latest_price": stock_data.close[-1],
+        "latest_volume": int(stock_data.volume[-1])
+    }
+    
+    logger.info("Stock scanner completed successfully")
+    logger.info(f"Collected {len(stock_data)} data points, detected {len(anomalies)} anomalies")
+    
+    return scan_result
+
+def publish_anomalies(anomalies, events=()):
+    """
+    Store anomalies and market events and send alerts with error handling.
+    A market event another shard of the scan already stored is not alerted again.
+    """
+    if anomalies or events:
+        trace = tracer.context()
+        if trace:
+            for anomaly in list(anomalies) + list(events):
+                anomaly['trace_id'] = trace['trace_id']
+        with metrics.timer('dynamodb_write', items=len(anomalies) + len(events)), \
+                tracer.span('dynamodb_write'):
+            store_anomalies_with_retry(anomalies)
+            alerts = list(anomalies) + store_market_events(events)
+        if alerts:
+            with metrics.timer('sns_publish', items=len(alerts)), tracer.span('sns_publish'):
+                send_alert_with_retry(alerts)
+
+def watermark_unchanged(ticker, watermark):
+    """Watermark check; a failed read counts as changed so the ticker is scored."""
+    try:
+        with metrics.timer('watermark'):
+            return is_unchanged(ticker, watermark)
+    except Exception as e:
+        logger.warning(f"Watermark read failed for {ticker}, scanning: {str(e)}")
+        return False
+
+def record_watermark(ticker, watermark):
+    """Mark a ticker's window as processed. Failures only cost a re-scan."""
+    try:
+        save_watermark(ticker, watermark)
+    except Exception as e:
+        metrics.add('watermark', 'Failures')
+        logger.warning(f"Failed to save watermark for {ticker}: {str(e)}")
+
+def scan_tickers(tickers, threshold, detector_config, sectors=None, scan_time=None):
+    """
+    Scan one shard of tickers and summarise the results.
+    Per-ticker wall time is reported so the coordinator can size future
+    shards; unchanged (skipped) tickers are left out of it. The tickers'
+    daily returns are reported too, for the coordinator's universe state.
+    Price anomalies explained by a market or sector move are published as
+    one market event per factor instead of one alert per ticker.
+    """
+    summary = {
+        'status': 'success',
+        'tickers': len(tickers),
+        'tickers_processed': 0,
+        'tickers_skipped': 0,
+        'anomalies_detected': 0,
+        'market_events': 0,
+        'insufficient_data': 0,
+        'failed_tickers': [],
+        'ticker_costs_ms': {},
+        'factor_returns': {},
+    }
+    
+    deferred = []
+    for ticker in tickers:
+        ticker = ticker.upper()
+        start = time.perf_counter()
+        try:
+            result = scan_ticker(ticker, threshold, detectors_for_ticker(detector_config, ticker),
+                                 deferred=deferred)
+            if result['status'] == 'unchanged':
+                summary['tickers_skipped'] += 1
+                continue
+            if result['status'] == 'insufficient_data':
+                summary['insufficient_data'] += 1
+            else:
+                summary['tickers_processed'] += 1
+                summary['anomalies_detected'] += result['anomalies_detected']
+        except Exception as e:
+            logger.error(f"Scan failed for {ticker}: {str(e)}")
+            summary['failed_tickers'].append(ticker)
+        summary['ticker_costs_ms'][ticker] = round((time.perf_counter() - start) * 1000, 1)
+    
+    # Unchanged tickers only matter as peers of changed ones
+    if any(not scan.get('unchanged') for scan in deferred):
+        anomalies, events = collapse_market_moves(deferred, threshold, sectors, scan_time)
+        publish_anomalies(anomalies, events)
+        summary['market_events'] = len(events)
+        for scan in deferred:
+            if scan.get('watermark'):
+                record_watermark(scan['ticker'], scan['watermark'])
+    summary['factor_returns'] = scan_returns(deferred)
+    
+    logger.info(f"Shard processed {summary['tickers_processed']} tickers, "
+                f"skipped {summary['tickers_skipped']} unchanged")
+    
+    if summary['failed_tickers']:
+        summary['status'] = 'partial_failure'
+    return summary
+
+def run_coordinator_mode(event, context=None):
+    """Fan the ticker universe out to workers and return the aggregated summary."""
+    tickers = event.get('universe')
+    if not tickers:
+        universe = get_parameter_with_retry('/stock-tracker/universe', '')
+        tickers = [t.strip() for t in universe.split(',') if t.strip()]
+    if not tickers:
+        tickers = [get_parameter_with_retry('/stock-tracker/ticker', 'AAPL')]
+    
+    remaining_ms = context.get_remaining_time_in_millis() if context is not None else None
+    executor = make_executor(event.get('executor', os.environ.get('SCAN_EXECUTOR', 'lambda')),
+                             remaining_ms=remaining_ms)
+    bucket_name = os.environ.get('S3_BUCKET', 'stock-scan-data-529088281783')
+    scan_time = datetime.utcnow().isoformat()
+    summary = run_coordinator(tickers, executor, bucket=bucket_name, shared={'scan_time': scan_time})
+    record_universe_returns(summary.pop('factor_returns'), bucket_name, scan_time)
+    publish_dashboard_snapshots()
+    
+    logger.info(f"Coordinator scanned {summary['tickers']} tickers in {summary['shards']} shards, "
+                f"detected {summary['anomalies_detected']} anomalies")
+    return {
+        'statusCode': 200,
+        'body': json.dumps(summary)
+    }
+
+def record_universe_returns(returns_by_ticker, bucket, scan_time):
+    """
+    Fold the returns the shards reported into the market model's universe
+    state, for the next scan's peers. Queued shards report none; their
+    tickers keep their previous returns. Failures are logged only.
+    """
+    if not returns_by_ticker:
+        return
+    try:
+        with metrics.timer('universe', items=len(returns_by_ticker)):
+            fold_universe(returns_by_ticker, bucket, scan_time)
+    except Exception as e:
+        metrics.add('universe', 'Failures')
+        logger.error(f"Failed to update market model universe: {str(e)}")
+
+def store_market_events(events):
+    """
+    Store market events; returns the ones to alert on. Every shard of a
+    coordinated scan builds a factor's event under the same key: the first
+    shard stores it and alerts, later shards add their members to it.
+    """
+    claimed = []
+    for event in events:
+        item = event.to_item()
+        
+        def store():
+            try:
+                anomalies_table.put_item(Item=item, ConditionExpression='attribute_not_exists(ticker)')
+                claimed.append(event)
+            except anomalies_table.meta.client.exceptions.ConditionalCheckFailedException:
+                anomalies_table.update_item(
+                    Key={'ticker': item['ticker'], 'timestamp': item['timestamp']},
+                    UpdateExpression='SET members = list_append(members, :members), '
+                                     'member_count = member_count + :count',
+                    ExpressionAttributeValues={':members': item['members'],
+                                               ':count': item['member_count']}
+                )
+                logger.info(f"Added {item['member_count']} members to {item['ticker']} event")
+        
+        try:
+            retry_with_backoff(store, max_retries=3)
+        except Exception as e:
+            # Better a duplicate alert than a lost one
+            logger.error(f"Failed to store market event after retries: {str(e)}")
+            claimed.append(event)
+    return claimed
+
+def collapse_market_moves(scans, threshold, sectors=None, scan_time=None):
+    """
+    Run the cross-sectional market model over a shard's scans, with the
+    universe state's returns as peers. Events are stamped with the
+    coordinated scan's start so its shards share them.
+    Returns (anomalies, events); on failure every anomaly is kept as-is.
+    """
+    anomalies = [a for scan in scans for a in scan['anomalies']]
+    if not scans:
+        return anomalies, []
+    try:
+        with metrics.timer('market_model', items=len(scans)):
+            bucket_name = os.environ.get('S3_BUCKET', 'stock-scan-data-529088281783')
+            universe = load_universe(bucket_name)['returns']
+            kept, events = apply_market_model(scans, threshold, sectors=sectors, bucket=bucket_name,
+                                              universe=universe, event_time=scan_time)
+        metrics.add('market_model', 'Collapsed', len(anomalies) - len(kept))
+        return kept, events
+    except Exception as e:
+        metrics.add('market_model', 'Failures')
+        logger.error(f"Market model failed, publishing per-ticker anomalies: {str(e)}")
+        return anomalies, []
+
+def publish_dashboard_snapshots():
+    """
+    Refresh the static dashboard snapshots.
+    Failures are logged only: a stale dashboard must not fail the scan.
+    """
+    try:
+        with metrics.timer('snapshot'):
+            publish_snapshots()
+    except Exception as e:
+        metrics.add('snapshot', 'Failures')
+        logger.error(f"Failed to publish dashboard snapshots: {str(e)}")
 
 def retry_with_backoff(func, max_retries=3, initial_delay=1):
     """
@@ -106,9 +475,66 @@ def retry_with_backoff(func, max_retries=3, initial_delay=1):
                 raise
             
             delay = initial_delay * (2 ** attempt)
+            metrics.add_to_active('Retries')
             logger.warning(f"Retry {attempt + 1}/{max_retries} after {delay}s: {str(e)}")
             time.sleep(delay)
 
+def first_missing_day(records, start, calendar):
+    """
+    The first trading day from `start` up to the last record that has no
+    bar (a missed scan or a failed archive append), or None.
+    """
+    have = {r['date'] for r in records}
+    day = start
+    last = datetime.strptime(records[-1]['date'], '%Y-%m-%d').date()
+    while day < last:
+        if calendar.is_trading_day(day) and day.isoformat() not in have:
+            return day
+        day += timedelta(days=1)
+    return None
+
+def fetch_history(ticker, days=30):
+    """
+    Bars for the last `days` days: archived bars from S3, plus provider bars
+    from the newest archived day on (it may be a partial day). Trading days
+    the archive is missing (checked against the market calendar) are
+    fetched again, from the first gap on; an archive that misses the start
+    of the window means the whole window comes from the provider.
+    Returns (records, fetched) where fetched are the provider's bars.
+    """
+    end = datetime.utcnow().date()
+    start = end - timedelta(days=days)
+    bucket_name = os.environ.get('S3_BUCKET', 'stock-scan-data-529088281783')
+    
+    try:
+        with metrics.timer('archive_read'):
+            archived, _ = load_window(ticker, start.isoformat(), end.isoformat(), bucket=bucket_name)
+    except Exception as e:
+        logger.warning(f"Archive read failed for {ticker}, using provider: {str(e)}")
+        archived = []
+    metrics.add('fetch', 'CacheHits', len(archived))
+    
+    if archived:
+        refetch_from = datetime.strptime(archived[-1]['date'], '%Y-%m-%d').date()
+        missing = first_missing_day(archived, start, _market_calendar['calendar'])
+        if missing is not None and missing.isoformat() < archived[0]['date']:
+            refetch_from = start
+        elif missing is not None:
+            logger.info(f"Archive for {ticker} is missing {missing.isoformat()}, refetching from there")
+            metrics.add('fetch', 'Gaps')
+            refetch_from = min(refetch_from, missing)
+        provider_days = min(days, (end - refetch_from).days + 1)
+    else:
+        provider_days = days
+    
+    # An open circuit leaves the archived window, which may still be enough
+    fetched = fetch_with_circuit_breaker(ticker, days=provider_days) or []
+    logger.info(f"History for {ticker}: {len(archived)} archived bars, "
+                f"{len(fetched)} from provider ({provider_days} days)")
+    
+    records = merge_bars(archived + [normalize_bar(bar) for bar in fetched])
+    return [r for r in records if r['date'] >= start.isoformat()], fetched
+
 def fetch_with_circuit_breaker(ticker, days=30):
     """
     Fetch data with circuit breaker pattern.
@@ -166,21 +592,13 @@ def get_parameter_with_retry(name, default):
         return default
 
 def store_raw_data_with_retry(ticker, data):
-    """Store raw stock data in S3 with retry logic."""
+    """
+    Append new bars to the raw-data archive in S3 with retry logic.
+    Returns the segment key, or None if every bar was already archived.
+    """
     def store():
         bucket_name = os.environ.get('S3_BUCKET', 'stock-scan-data-529088281783')
-        timestamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
-        s3_key = f"raw-data/{ticker}/{timestamp}.json"
-        
-        s3.put_object(
-            Bucket=bucket_name,
-            Key=s3_key,
-            Body=json.dumps(data, indent=2),
-            ContentType='application/json'
-        )
-        
-        logger.info(f"Stored raw data in S3: s3://{bucket_name}/{s3_key}")
-        return s3_key
+        return append_bars(ticker, as_records(data), bucket=bucket_name)
     
     return retry_with_backoff(store, max_retries=3)
 
@@ -188,7 +606,7 @@ def store_anomalies_with_retry(anomalies):
     """Store detected anomalies in DynamoDB with retry logic."""
     for anomaly in anomalies:
         def store():
-            anomalies_table.put_item(Item=anomaly)
+            anomalies_table.put_item(Item=anomaly.to_item())
             logger.info(f"Stored {anomaly['anomaly_type']} anomaly for {anomaly['ticker']}")
         
         try:
@@ -201,13 +619,15 @@ def send_alert_with_retry(anomalies):
     sns_topic_arn = os.environ.get('SNS_TOPIC_ARN', 
         'arn:aws:sns:us-east-1:529088281783:stock-tracker-alerts')
     
+    trace = tracer.context()
     for anomaly in anomalies:
         def send():
             message = format_alert_message(anomaly)
             sns.publish(
                 TopicArn=sns_topic_arn,
                 Subject=f"Stock Anomaly Detected: {anomaly['ticker']}",
-                Message=message
+                Message=message,
+                MessageAttributes=message_attributes(trace) if trace else {}
             )
             logger.info(f"Sent alert for {anomaly['ticker']} {anomaly['anomaly_type']} anomaly")
         
@@ -216,83 +636,65 @@ def send_alert_with_retry(anomalies):
         except Exception as e:
             logger.error(f"Failed to send alert after retries: {str(e)}")
 
-def detect_anomalies(ticker, data, threshold):
+def detect_anomalies(ticker, data, threshold, detectors=None):
+    """
+    Detect anomalies using the configured detectors.
+    Uses 20-day baseline for comparison; defaults to Z-score analysis.
     """
-    Detect anomalies using Z-score analysis.
-    Uses 20-day baseline for comparison.
+    anomalies, _ = detect_anomalies_with_timings(ticker, data, threshold, detectors)
+    return anomalies
+
+def detect_anomalies_with_timings(ticker, data, threshold, detectors=None):
+    """
+    Detect anomalies and report how long each detector took.
+    Returns (anomalies, timings_ms).
     """
     try:
-        if len(data) < 21:
+        if not data or len(data) < BASELINE_DAYS + 1:
             logger.warning("Not enough data for anomaly detection (need 21+ days)")
-            return []
-        
-        # Use last 20 days as baseline, current day for detection
-        baseline_data = data[-21:-1]  # Days -21 to -2
-        current_data = data[-1]  # Most recent day
-        
-        # Calculate baseline statistics
-        baseline_prices = [d['close'] for d in baseline_data]
-        baseline_volumes = [d['volume'] for d in baseline_data]
-        
-        price_mean = mean(baseline_prices)
-        price_std = stdev(baseline_prices)
-        volume_mean = mean(baseline_volumes)
-        volume_std = stdev(baseline_volumes)
+            return [], {}
         
-        # Calculate Z-scores for current day
-        price_zscore = (current_data['close'] - price_mean) / price_std if price_std > 0 else 0
-        volume_zscore = (current_data['volume'] - volume_mean) / volume_std if volume_std > 0 else 0
-        
-        logger.info(f"Z-scores - Price: {price_zscore:.2f}, Volume: {volume_zscore:.2f}")
-        
-        anomalies = []
-        
-        # Check for price anomaly
-        if abs(price_zscore) > threshold:
-            anomalies.append({
-                'ticker': ticker,
-                'timestamp': datetime.utcnow().isoformat(),
-                'date': current_data['date'],
-                'anomaly_type': 'price',
-                'value': current_data['close'],
-                'baseline_mean': round(price_mean, 2),
-                'baseline_std': round(price_std, 2),
-                'z_score': round(price_zscore, 2),
-                'threshold': threshold,
-                'severity': 'high' if abs(price_zscore) > threshold * 1.5 else 'medium'
-            })
-        
-        # Check for volume anomaly
-        if abs(volume_zscore) > threshold:
-            anomalies.append({
-                'ticker': ticker,
-                'timestamp': datetime.utcnow().isoformat(),
-                'date': current_data['date'],
-                'anomaly_type': 'volume',
-                'value': current_data['volume'],
-                'baseline_mean': int(volume_mean),
-                'baseline_std': int(volume_std),
-                'z_score': round(volume_zscore, 2),
-                'threshold': threshold,
-                'severity': 'high' if abs(volume_zscore) > threshold * 1.5 else 'medium'
-            })
+        anomalies, timings = run_detectors(ticker, data, threshold, detectors)
         
+        logger.info(f"Detector timings for {ticker} (ms): {timings}")
         if anomalies:
             logger.info(f"Detected {len(anomalies)} anomalies for {ticker}")
         else:
             logger.info(f"No anomalies detected for {ticker}")
         
-        return anomalies
+        return anomalies, timings
         
     except Exception as e:
         logger.error(f"Error detecting anomalies: {str(e)}")
-        return []
+        return [], {}
+
+def get_detector_config():
+    """Load per-ticker detector selection from Parameter Store."""
+    raw = get_parameter_with_retry('/stock-tracker/detectors', '')
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except ValueError:
+        logger.warning(f"Invalid detector config, using defaults: {raw}")
+        return {}
+
+def get_sector_config():
+    """Load the ticker -> sector map used for sector co-movement."""
+    raw = get_parameter_with_retry('/stock-tracker/sectors', '')
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except ValueError:
+        logger.warning(f"Invalid sector config, ignoring: {raw}")
+        return {}
 
 def store_anomalies(anomalies):
     """Store detected anomalies in DynamoDB."""
     try:
         for anomaly in anomalies:
-            anomalies_table.put_item(Item=anomaly)
+            anomalies_table.put_item(Item=anomaly.to_item())
             logger.info(f"Stored {anomaly['anomaly_type']} anomaly for {anomaly['ticker']}")
     except Exception as e:
         logger.error(f"Error storing anomalies: {str(e)}")
@@ -303,13 +705,15 @@ def send_alert(anomalies):
         sns_topic_arn = os.environ.get('SNS_TOPIC_ARN', 
             'arn:aws:sns:us-east-1:529088281783:stock-tracker-alerts')
         
+        trace = tracer.context()
         for anomaly in anomalies:
             message = format_alert_message(anomaly)
             
             sns.publish(
                 TopicArn=sns_topic_arn,
                 Subject=f"Stock Anomaly Detected: {anomaly['ticker']}",
-                Message=message
+                Message=message,
+                MessageAttributes=message_attributes(trace) if trace else {}
             )
             
             logger.info(f"Sent alert for {anomaly['ticker']} {anomaly['anomaly_type']} anomaly")
@@ -319,25 +723,9 @@ def send_alert(anomalies):
 
 def format_alert_message(anomaly):
     """Format anomaly data into readable alert message."""
-    direction = "increased" if anomaly['z_score'] > 0 else "decreased"
-    
-    message = f"""
-🚨 Anomaly Detected for {anomaly['ticker']}
-
-Type: {anomaly['anomaly_type'].upper()}
-Severity: {anomaly['severity'].upper()}
-Date: {anomaly['date']}
-
-Current Value: {anomaly['value']:,.2f}
-Baseline Mean: {anomaly['baseline_mean']:,.2f}
-Standard Deviation: {anomaly['baseline_std']:,.2f}
-
-Z-Score: {anomaly['z_score']} (threshold: {anomaly['threshold']})
-
-The {anomaly['anomaly_type']} has {direction} significantly beyond normal levels.
-This represents a {abs(anomaly['z_score']):.1f} standard deviation move.
-"""
-    return message.strip()
+    if not isinstance(anomaly, AnomalyRecord):
+        anomaly = AnomalyRecord.from_dict(anomaly)
+    return anomaly.alert_text()
 
 def fetch_stock_data_simple(ticker, days=30):
     """
@@ -374,21 +762,10 @@ def fetch_stock_data_simple(ticker, days=30):
         return None
 
 def store_raw_data(ticker, data):
-    """Store raw stock data in S3."""
+    """Append new bars to the raw-data archive in S3."""
     try:
         bucket_name = os.environ.get('S3_BUCKET', 'stock-scan-data-529088281783')
-        timestamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
-        s3_key = f"raw-data/{ticker}/{timestamp}.json"
-        
-        s3.put_object(
-            Bucket=bucket_name,
-            Key=s3_key,
-            Body=json.dumps(data, indent=2),
-            ContentType='application/json'
-        )
-        
-        logger.info(f"Stored raw data in S3: s3://{bucket_name}/{s3_key}")
-        return s3_key
+        return append_bars(ticker, as_records(data), bucket=bucket_name)
         
     except Exception as e:
         logger.error(f"Error storing data in S3: {str(e)}")
@@ -402,131 +779,3 @@ def get_parameter(name, default):
     except Exception as e:
         logger.warning(f"Failed to get parameter {name}: {str(e)}, using default: {default}")
         return default
-
-
-def detect_anomalies(ticker, data, threshold):
-    """
-    Detect anomalies using Z-score analysis.
-    Uses 20-day baseline for comparison.
-    """
-    try:
-        if len(data) < 21:
-            logger.warning("Not enough data for anomaly detection (need 21+ days)")
-            return []
-        
-        # Use last 20 days as baseline, current day for detection
-        baseline_data = data[-21:-1]
-        current_data = data[-1]
-        
-        # Calculate baseline statistics
-        baseline_prices = [d['close'] for d in baseline_data]
-        baseline_volumes = [d['volume'] for d in baseline_data]
-        
-        price_mean = mean(baseline_prices)
-        price_std = stdev(baseline_prices)
-        volume_mean = mean(baseline_volumes)
-        volume_std = stdev(baseline_volumes)
-        
-        # Calculate Z-scores
-        price_zscore = (current_data['close'] - price_mean) / price_std if price_std > 0 else 0
-        volume_zscore = (current_data['volume'] - volume_mean) / volume_std if volume_std > 0 else 0
-        
-        logger.info(f"Z-scores - Price: {price_zscore:.2f}, Volume: {volume_zscore:.2f}")
-        
-        anomalies = []
-        
-        # Check for price anomaly
-        if abs(price_zscore) > threshold:
-            anomalies.append({
-                'ticker': ticker,
-                'timestamp': datetime.utcnow().isoformat(),
-                'date': current_data['date'],
-                'anomaly_type': 'price',
-                'value': current_data['close'],
-                'baseline_mean': round(price_mean, 2),
-                'baseline_std': round(price_std, 2),
-                'z_score': round(price_zscore, 2),
-                'threshold': threshold,
-                'severity': 'high' if abs(price_zscore) > threshold * 1.5 else 'medium'
-            })
-        
-        # Check for volume anomaly
-        if abs(volume_zscore) > threshold:
-            anomalies.append({
-                'ticker': ticker,
-                'timestamp': datetime.utcnow().isoformat(),
-                'date': current_data['date'],
-                'anomaly_type': 'volume',
-                'value': current_data['volume'],
-                'baseline_mean': int(volume_mean),
-                'baseline_std': int(volume_std),
-                'z_score': round(volume_zscore, 2),
-                'threshold': threshold,
-                'severity': 'high' if abs(volume_zscore) > threshold * 1.5 else 'medium'
-            })
-        
-        if anomalies:
-            logger.info(f"Detected {len(anomalies)} anomalies for {ticker}")
-        else:
-            logger.info(f"No anomalies detected for {ticker}")
-        
-        return anomalies
-        
-    except Exception as e:
-        logger.error(f"Error detecting anomalies: {str(e)}")
-        return []
-
-def format_alert_message(anomaly):
-    """Format anomaly data into readable alert message."""
-    direction = "increased" if anomaly['z_score'] > 0 else "decreased"
-    
-    message = f"""
-🚨 Anomaly Detected for {anomaly['ticker']}
-
-Type: {anomaly['anomaly_type'].upper()}
-Severity: {anomaly['severity'].upper()}
-Date: {anomaly['date']}
-
-Current Value: {anomaly['value']:,.2f}
-Baseline Mean: {anomaly['baseline_mean']:,.2f}
-Standard Deviation: {anomaly['baseline_std']:,.2f}
-
-Z-Score: {anomaly['z_score']} (threshold: {anomaly['threshold']})
-
-The {anomaly['anomaly_type']} has {direction} significantly beyond normal levels.
-This represents a {abs(anomaly['z_score']):.1f} standard deviation move.
-"""
-    return message.strip()
-
-def fetch_stock_data_simple(ticker, days=30):
-    """
-    Fetch stock data using a simple approach.
-    For now, generates mock data. In production, integrate with real API.
-    """
-    try:
-        logger.info(f"Generating mock data for {ticker}")
-        
-        # Generate mock data for last 30 days
-        data = []
-        base_price = 150.0
-        
-        for i in range(days):
-            date = datetime.now() - timedelta(days=days-i)
-            price_change = (hash(f"{ticker}{date.date()}") % 10 - 5) * 0.5
-            price = base_price + price_change
-            
-            data.append({
-                'date': date.strftime('%Y-%m-%d'),
-                'open': round(price - 0.5, 2),
-                'high': round(price + 1.0, 2),
-                'low': round(price - 1.0, 2),
-                'close': round(price, 2),
-                'volume': (hash(f"{ticker}{date.date()}volume") % 1000000) + 50000000
-            })
-        
-        logger.info(f"Generated {len(data)} mock data points for {ticker}")
-        return data
-        
-    except Exception as e:
-        logger.error(f"Error generating data for {ticker}: {str(e)}")
-        return None
@@ -0,0 +1,496 @@
+import base64
+import heapq
+import json
+import logging
+import math
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import boto3
+from botocore.exceptions import ClientError
+
+from detectors import BASELINE_DAYS, FIELDS, build_anomaly
+from metrics import MetricsRecorder
+from stock_scanner import store_anomalies_with_retry, send_alert_with_retry, tracer
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+s3 = boto3.client('s3')
+
+# Per-stage EMF metrics, flushed at the end of each invocation
+metrics = MetricsRecorder('stock-stream-detector')
+
+# Detector name used for intraday anomaly records ('price_intraday', ...)
+STREAM_DETECTOR = 'intraday'
+
+# S3 prefix for per-ticker detector state carried across containers
+STATE_PREFIX = 'stream-state'
+
+# Parallel state reads/writes per batch
+STATE_WORKERS = 8
+
+
+class RollingWindow:
+    """
+    Fixed-size rolling window with O(1) push, mean and sample stdev.
+    Values are shifted by the first observation to keep the running
+    sum of squares precise for large volumes.
+    """
+    __slots__ = ('size', 'values', 'shift', 'total', 'total_sq')
+
+    def __init__(self, size):
+        self.size = size
+        self.values = deque()
+        self.shift = None
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def __len__(self):
+        return len(self.values)
+
+    def push(self, value):
+        if self.shift is None:
+            self.shift = value
+        shifted = value - self.shift
+        self.values.append(shifted)
+        self.total += shifted
+        self.total_sq += shifted * shifted
+
+        if len(self.values) > self.size:
+            old = self.values.popleft()
+            self.total -= old
+            self.total_sq -= old * old
+
+    @property
+    def mean(self):
+        return self.shift + self.total / len(self.values)
+
+    @property
+    def std(self):
+        n = len(self.values)
+        if n < 2:
+            return 0.0
+        variance = (self.total_sq - self.total * self.total / n) / (n - 1)
+        return math.sqrt(variance) if variance > 0 else 0.0
+
+    def to_dict(self):
+        return {'shift': self.shift, 'values': list(self.values)}
+
+    @classmethod
+    def from_dict(cls, size, data):
+        """Window restored from to_dict(); the sums are rebuilt from the values."""
+        window = cls(size)
+        window.shift = data['shift']
+        for shifted in data['values'][-size:]:
+            window.values.append(shifted)
+            window.total += shifted
+            window.total_sq += shifted * shifted
+        return window
+
+
+class TickerState:
+    """Rolling statistics and reorder buffer for one ticker."""
+    __slots__ = ('windows', 'pending', 'pending_ts', 'max_seen', 'last_emitted')
+
+    def __init__(self, window):
+        self.windows = {prefix: RollingWindow(window) for prefix in FIELDS}
+        self.pending = []          # heap of (epoch, seq, bar)
+        self.pending_ts = set()
+        self.max_seen = None
+        self.last_emitted = None
+
+    def to_dict(self):
+        return {
+            'windows': {prefix: window.to_dict() for prefix, window in self.windows.items()},
+            'pending': [bar for _, _, bar in sorted(self.pending)],
+            'max_seen': self.max_seen,
+            'last_emitted': self.last_emitted
+        }
+
+
+def bar_epoch(bar):
+    """Bar timestamp (ISO 8601) as epoch seconds."""
+    return datetime.fromisoformat(bar['timestamp'].replace('Z', '+00:00')).timestamp()
+
+
+class StreamDetector:
+    """
+    Per-ticker intraday z-score detector with constant-time updates.
+
+    Bars are buffered per ticker until the event-time watermark
+    (latest bar seen minus allowed_lateness) passes them, so bars that
+    arrive slightly out of order are still scored in timestamp order.
+    Bars older than the last scored bar are dropped as late.
+    """
+
+    def __init__(self, threshold=2.0, window=BASELINE_DAYS, allowed_lateness=60):
+        self.threshold = threshold
+        self.window = window
+        self.allowed_lateness = allowed_lateness
+        self.tickers = {}
+        # ETag of each ticker's state in S3, as last loaded or saved
+        self.versions = {}
+        self.stats = {'received': 0, 'scored': 0, 'late_dropped': 0, 'duplicates': 0}
+        self._seq = 0
+
+    def process(self, bar):
+        """Accept one bar and return anomalies for any bars released by the watermark."""
+        self.stats['received'] += 1
+        ticker = bar['ticker'].upper()
+        state = self.tickers.get(ticker)
+        if state is None:
+            state = self.tickers[ticker] = TickerState(self.window)
+
+        epoch = bar_epoch(bar)
+
+        if state.last_emitted is not None and epoch <= state.last_emitted:
+            self.stats['late_dropped'] += 1
+            logger.warning(f"Dropping late bar for {ticker} at {bar['timestamp']}")
+            return []
+        if epoch in state.pending_ts:
+            self.stats['duplicates'] += 1
+            return []
+
+        self._seq += 1
+        heapq.heappush(state.pending, (epoch, self._seq, bar))
+        state.pending_ts.add(epoch)
+        if state.max_seen is None or epoch > state.max_seen:
+            state.max_seen = epoch
+
+        return self._release(ticker, state, state.max_seen - self.allowed_lateness)
+
+    def export_state(self, ticker):
+        """JSON-safe state of one ticker (windows and buffered bars), or None if unseen."""
+        state = self.tickers.get(ticker.upper())
+        return state.to_dict() if state is not None else None
+
+    def restore_state(self, ticker, data):
+        """Replace a ticker's state with one from export_state()."""
+        state = TickerState(self.window)
+        for prefix, window in data['windows'].items():
+            if prefix in state.windows:
+                state.windows[prefix] = RollingWindow.from_dict(self.window, window)
+        for bar in data['pending']:
+            self._seq += 1
+            epoch = bar_epoch(bar)
+            heapq.heappush(state.pending, (epoch, self._seq, bar))
+            state.pending_ts.add(epoch)
+        state.max_seen = data['max_seen']
+        state.last_emitted = data['last_emitted']
+        self.tickers[ticker.upper()] = state
+
+    def drop_state(self, ticker):
+        """Forget a ticker; its next bar starts from saved (or empty) state."""
+        self.tickers.pop(ticker.upper(), None)
+        self.versions.pop(ticker.upper(), None)
+
+    def flush(self):
+        """Score every buffered bar regardless of the watermark."""
+        anomalies = []
+        for ticker, state in self.tickers.items():
+            anomalies.extend(self._release(ticker, state, math.inf))
+        return anomalies
+
+    def _release(self, ticker, state, watermark):
+        anomalies = []
+        while state.pending and state.pending[0][0] <= watermark:
+            epoch, _, bar = heapq.heappop(state.pending)
+            state.pending_ts.discard(epoch)
+            state.last_emitted = epoch
+            anomalies.extend(self._score(ticker, state, bar))
+        return anomalies
+
+    def _score(self, ticker, state, bar):
+        """Score a bar against the rolling window, then add it to the window."""
+        self.stats['scored'] += 1
+        # DateIndex partitions on the calendar date; the bar time is kept separately
+        current = {'date': bar['timestamp'][:10], 'close': bar['close'], 'volume': bar['volume']}
+        anomalies = []
+
+        for prefix, key in FIELDS.items():
+            window = state.windows[prefix]
+            value = bar[key]
+            if len(window) >= self.window:
+                center = window.mean
+                spread = window.std
+                score = (value - center) / spread if spread > 0 else 0
+                if abs(score) > self.threshold:
+                    anomaly = build_anomaly(
+                        ticker, prefix, STREAM_DETECTOR, current,
+                        score, center, spread, self.threshold
+                    )
+                    anomaly['bar_timestamp'] = bar['timestamp']
+                    anomalies.append(anomaly)
+            window.push(value)
+
+        return anomalies
+
+
+class StreamSource(ABC):
+    """Source of intraday bars. read() returns a (possibly empty) list of bar dicts."""
+
+    @abstractmethod
+    def read(self, max_records=100):
+        """Up to max_records bars that arrived since the last read."""
+
+
+class InMemoryStreamSource(StreamSource):
+    """In-memory bar source for tests and local replays."""
+
+    def __init__(self, bars=None):
+        self.queue = deque(bars or [])
+
+    def put(self, bar):
+        self.queue.append(bar)
+
+    def read(self, max_records=100):
+        batch = []
+        while self.queue and len(batch) < max_records:
+            batch.append(self.queue.popleft())
+        return batch
+
+
+class FileStreamSource(StreamSource):
+    """Reads newline-delimited JSON bars from a file, following appends."""
+
+    def __init__(self, path):
+        self.path = path
+        self.position = 0
+
+    def read(self, max_records=100):
+        batch = []
+        with open(self.path, 'r') as f:
+            f.seek(self.position)
+            while len(batch) < max_records:
+                line = f.readline()
+                if not line or not line.endswith('\n'):
+                    break  # partial line: wait for the writer to finish it
+                self.position = f.tell()
+                if line.strip():
+                    batch.append(json.loads(line))
+        return batch
+
+
+class KinesisStreamSource(StreamSource):
+    """Polls every shard of a Kinesis stream for JSON-encoded bars."""
+
+    def __init__(self, stream_name, iterator_type='LATEST', client=None):
+        self.stream_name = stream_name
+        self.kinesis = client or boto3.client('kinesis')
+        self.iterators = {}
+
+        shards = self.kinesis.list_shards(StreamName=stream_name)['Shards']
+        for shard in shards:
+            response = self.kinesis.get_shard_iterator(
+                StreamName=stream_name,
+                ShardId=shard['ShardId'],
+                ShardIteratorType=iterator_type
+            )
+            self.iterators[shard['ShardId']] = response['ShardIterator']
+
+    def read(self, max_records=100):
+        batch = []
+        for shard_id, iterator in list(self.iterators.items()):
+            if not iterator:
+                continue
+            response = self.kinesis.get_records(ShardIterator=iterator, Limit=max_records)
+            self.iterators[shard_id] = response.get('NextShardIterator')
+            batch.extend(json.loads(record['Data']) for record in response['Records'])
+        return batch
+
+
+def emit_anomalies(anomalies):
+    """Store and alert on anomalies using the scanner's storage and alert functions."""
+    if anomalies:
+        trace = tracer.context()
+        if trace:
+            for anomaly in anomalies:
+                anomaly['trace_id'] = trace['trace_id']
+        store_anomalies_with_retry(anomalies)
+        send_alert_with_retry(anomalies)
+
+
+def run_stream(source, detector, max_batches=None, idle_sleep=1.0, emit=emit_anomalies):
+    """
+    Consume bars from a source until it is exhausted (max_batches) or forever.
+    Returns the detector counters.
+    """
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        bars = source.read()
+        batches += 1
+        if not bars:
+            if max_batches is None:
+                time.sleep(idle_sleep)
+            continue
+
+        anomalies = []
+        for bar in bars:
+            anomalies.extend(detector.process(bar))
+        emit(anomalies)
+
+    return dict(detector.stats)
+
+
+def state_key(ticker, prefix=STATE_PREFIX):
+    return f"{prefix}/{ticker}.json"
+
+
+def load_ticker_state(ticker, bucket, prefix=STATE_PREFIX, version=None):
+    """
+    (state, version): a ticker's saved detector state and its ETag, or
+    (None, None) if it has none. A state still at `version` is not
+    downloaded again and comes back as (None, version).
+    """
+    kwargs = {'Bucket': bucket, 'Key': state_key(ticker, prefix)}
+    if version:
+        kwargs['IfNoneMatch'] = version
+    try:
+        response = s3.get_object(**kwargs)
+    except s3.exceptions.NoSuchKey:
+        return None, None
+    except ClientError as e:
+        if e.response['Error']['Code'] == '304':
+            return None, version
+        raise
+    return json.loads(response['Body'].read()), response['ETag']
+
+
+def save_ticker_state(ticker, data, bucket, prefix=STATE_PREFIX):
+    """Save a ticker's detector state; returns its new ETag."""
+    response = s3.put_object(
+        Bucket=bucket,
+        Key=state_key(ticker, prefix),
+        Body=json.dumps(data, separators=(',', ':')).encode('utf-8'),
+        ContentType='application/json'
+    )
+    return response['ETag']
+
+
+def restore_tickers(detector, tickers, bucket, prefix=STATE_PREFIX):
+    """
+    Bring the batch's tickers up to their saved state. Tickers this
+    container has not seen yet (a cold start, or a ticker new to the shard)
+    are loaded; seen ones are reloaded only if another container saved a
+    newer state since (the ETag changed). A ticker without saved state
+    starts from an empty window and is not scored until it has filled
+    again; those are counted as Rewarming on the state_load stage.
+    """
+    if not tickers:
+        return
+    with metrics.timer('state_load', items=len(tickers)):
+        with ThreadPoolExecutor(max_workers=STATE_WORKERS) as pool:
+            states = list(pool.map(
+                lambda t: load_ticker_state(t, bucket, prefix, detector.versions.get(t)), tickers
+            ))
+    rewarming = []
+    for ticker, (data, version) in zip(tickers, states):
+        seen = ticker in detector.tickers
+        if data is not None:
+            if seen:
+                logger.info(f"Stream state for {ticker} was advanced by another container, reloading")
+            detector.restore_state(ticker, data)
+            detector.versions[ticker] = version
+        elif not seen:
+            rewarming.append(ticker)
+    if rewarming:
+        metrics.add('state_load', 'Rewarming', len(rewarming))
+        logger.warning(f"No saved stream state for {len(rewarming)} tickers, re-warming: "
+                       f"{', '.join(sorted(rewarming))}")
+
+
+def persist_tickers(detector, tickers, bucket, prefix=STATE_PREFIX):
+    """
+    Save the state of the batch's tickers, including the last bar scored
+    for each. A ticker whose write fails is dropped from the container so
+    a retried batch scores its bars again from the saved state.
+    Returns the tickers that were not saved.
+    """
+    def save(ticker):
+        try:
+            return save_ticker_state(ticker, detector.export_state(ticker), bucket, prefix)
+        except Exception as e:
+            logger.error(f"Failed to save stream state for {ticker}: {str(e)}")
+            return None
+
+    with metrics.timer('state_save', items=len(tickers)):
+        with ThreadPoolExecutor(max_workers=STATE_WORKERS) as pool:
+            versions = list(pool.map(save, tickers))
+    failed = []
+    for ticker, version in zip(tickers, versions):
+        if version is None:
+            failed.append(ticker)
+            detector.drop_state(ticker)
+        else:
+            detector.versions[ticker] = version
+    if failed:
+        metrics.add('state_save', 'Failures', len(failed))
+    return failed
+
+
+# Detector state survives across warm invocations of the same container;
+# cold starts restore it from S3 (restore_tickers)
+stream_detector = StreamDetector(
+    threshold=float(os.environ.get('STREAM_THRESHOLD', '2.0')),
+    window=int(os.environ.get('STREAM_WINDOW', str(BASELINE_DAYS))),
+    allowed_lateness=int(os.environ.get('STREAM_ALLOWED_LATENESS', '60')),
+)
+
+
+def lambda_handler(event, context):
+    """
+    Kinesis event source handler for intraday bars.
+    Records are JSON bars partitioned by ticker, so one container sees
+    each ticker's bars in shard order. The batch's alerts are traced from
+    the arrival of its first bar in the stream.
+
+    Each ticker's rolling windows and reorder buffer are saved to S3
+    (stream-state/<TICKER>.json) after every batch and restored the first
+    time a container sees the ticker, so a cold start does not re-warm.
+    State is saved before alerting: a retried batch finds its bars at or
+    below the saved last-scored bar and drops them instead of alerting
+    twice. Tickers whose state could not be saved are not alerted on, and
+    the batch fails so Kinesis retries it.
+    """
+    records = event.get('Records', [])
+    bucket = os.environ.get('S3_BUCKET', 'stock-scan-data-529088281783')
+    try:
+        arrivals = [r['kinesis']['approximateArrivalTimestamp'] for r in records
+                    if r['kinesis'].get('approximateArrivalTimestamp')]
+        tracer.start_trace(started_ms=int(min(arrivals) * 1000) if arrivals else None)
+
+        with tracer.span('stream', bars=len(records)):
+            bars = [json.loads(base64.b64decode(record['kinesis']['data'])) for record in records]
+            tickers = sorted({bar['ticker'].upper() for bar in bars})
+            restore_tickers(stream_detector, tickers, bucket)
+
+            anomalies = []
+            for bar in bars:
+                anomalies.extend(stream_detector.process(bar))
+
+            failed = persist_tickers(stream_detector, tickers, bucket) if tickers else []
+            emit_anomalies([a for a in anomalies if a['ticker'] not in failed])
+            if failed:
+                raise RuntimeError(f"Stream state not saved for {', '.join(failed)}")
+
+        logger.info(f"Processed {len(records)} bars, "
+                    f"detected {len(anomalies)} anomalies")
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                'anomalies_detected': len(anomalies),
+                'stats': stream_detector.stats
+            })
+        }
+
+    except Exception as e:
+        logger.error(f"Stream detector failed: {str(e)}", exc_info=True)
+        raise
+    finally:
+        metrics.flush()
+        tracer.flush()
@@ -0,0 +1,225 @@
+"""
+Cross-hop trace context and span timings, from scan to Slack.
+
+A trace starts in the scanner's lambda_handler (or the stream detector's,
+for intraday bars). Its id uses the X-Ray format, so the X-Ray exporter can
+use it unchanged. The id travels with every alert:
+
+    scanner -> DynamoDB item (trace_id attribute)
+            -> SNS message attributes (trace_id, parent_span_id, trace_started_ms,
+               trace_sent_ms)
+            -> SQS (inside the SNS envelope) -> notification_handler
+
+Each hop records spans (name, start, end, parent) for its part of the
+trace. notification_handler ends the trace when the Slack post succeeds,
+and the time since trace_started_ms is the end-to-end alert latency.
+
+Finished spans go to an exporter on flush(). TRACE_EXPORTER selects it:
+'xray' (PutTraceSegments), 'memory' (kept in process, for tests and the
+emulator) or unset (spans are dropped and only the context propagates).
+"""
+import json
+import logging
+import os
+import secrets
+import time
+from contextlib import contextmanager
+
+import boto3
+
+logger = logging.getLogger()
+
+# SNS message attribute names carrying the trace context
+TRACE_ID_ATTRIBUTE = 'trace_id'
+PARENT_ID_ATTRIBUTE = 'parent_span_id'
+STARTED_ATTRIBUTE = 'trace_started_ms'
+SENT_ATTRIBUTE = 'trace_sent_ms'
+
+# PutTraceSegments documents per call
+XRAY_BATCH_SIZE = 50
+
+
+def new_trace_id(now=None):
+    """X-Ray trace id: version, epoch seconds in hex, 96 random bits."""
+    return f"1-{int(now or time.time()):08x}-{secrets.token_hex(12)}"
+
+
+def new_span_id():
+    return secrets.token_hex(8)
+
+
+class Span:
+    """One timed step of a trace; times are epoch seconds."""
+
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'start', 'end', 'annotations')
+
+    def __init__(self, name, trace_id, parent_id=None, start=None, end=None, annotations=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = new_span_id()
+        self.parent_id = parent_id
+        self.start = time.time() if start is None else start
+        self.end = end
+        self.annotations = annotations or {}
+
+    @property
+    def duration_ms(self):
+        return (self.end - self.start) * 1000
+
+    def to_segment(self, service):
+        """X-Ray segment document; the span name is kept as an annotation."""
+        segment = {
+            'name': service,
+            'id': self.span_id,
+            'trace_id': self.trace_id,
+            'start_time': self.start,
+            'end_time': self.end,
+            'annotations': dict(self.annotations, span=self.name)
+        }
+        if self.parent_id:
+            segment['parent_id'] = self.parent_id
+        return segment
+
+
+class InMemoryExporter:
+    """Keeps exported spans in a list (tests, local emulation)."""
+
+    def __init__(self):
+        self.spans = []
+
+    def export(self, service, spans):
+        self.spans.extend((service, span) for span in spans)
+
+    def named(self, name):
+        return [span for _, span in self.spans if span.name == name]
+
+
+class XRayExporter:
+    """Sends spans to X-Ray as segments. Failures are logged, never raised."""
+
+    def __init__(self, client=None):
+        self.client = client or boto3.client('xray')
+
+    def export(self, service, spans):
+        documents = [json.dumps(span.to_segment(service)) for span in spans]
+        for start in range(0, len(documents), XRAY_BATCH_SIZE):
+            try:
+                result = self.client.put_trace_segments(
+                    TraceSegmentDocuments=documents[start:start + XRAY_BATCH_SIZE]
+                )
+                if result.get('UnprocessedTraceSegments'):
+                    logger.warning(f"X-Ray rejected {len(result['UnprocessedTraceSegments'])} segments")
+            except Exception as e:
+                logger.warning(f"Failed to export trace segments: {str(e)}")
+
+
+def exporter_from_env():
+    name = os.environ.get('TRACE_EXPORTER', '')
+    if name == 'xray':
+        return XRayExporter()
+    if name == 'memory':
+        return InMemoryExporter()
+    return None
+
+
+def message_attributes(context):
+    """SNS MessageAttributes for a trace context dict, stamped with the send time."""
+    attributes = {
+        TRACE_ID_ATTRIBUTE: {'DataType': 'String', 'StringValue': context['trace_id']},
+        STARTED_ATTRIBUTE: {'DataType': 'Number', 'StringValue': str(context['started_ms'])},
+        SENT_ATTRIBUTE: {'DataType': 'Number', 'StringValue': str(int(time.time() * 1000))},
+    }
+    # SNS rejects empty attribute values
+    if context.get('parent_id'):
+        attributes[PARENT_ID_ATTRIBUTE] = {'DataType': 'String', 'StringValue': context['parent_id']}
+    return attributes
+
+
+def _number(attributes, name):
+    try:
+        return int(attributes[name]['Value'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def context_from_notification(notification):
+    """
+    Trace context from an SNS notification (a direct SNS record or the
+    envelope in an SQS body), or None if the message carries none.
+    """
+    attributes = notification.get('MessageAttributes') or {}
+    trace_id = (attributes.get(TRACE_ID_ATTRIBUTE) or {}).get('Value')
+    if not trace_id:
+        return None
+    return {
+        'trace_id': trace_id,
+        'parent_id': (attributes.get(PARENT_ID_ATTRIBUTE) or {}).get('Value'),
+        'started_ms': _number(attributes, STARTED_ATTRIBUTE),
+        'sent_ms': _number(attributes, SENT_ATTRIBUTE)
+    }
+
+
+class Tracer:
+    """
+    Trace context and spans for one invocation, exported on flush().
+    Nested span() blocks parent to the innermost running span, so like
+    MetricsRecorder timers they are not thread-safe; spans timed in worker
+    threads are added with record().
+    """
+
+    def __init__(self, service, exporter=None):
+        self.service = service
+        self.exporter = exporter
+        self.trace_id = None
+        self.started_ms = None
+        self.parent_id = None
+        self.active = []
+        self.finished = []
+
+    def start_trace(self, trace_id=None, started_ms=None, parent_id=None):
+        """Begin a trace, or continue one received from another hop."""
+        self.trace_id = trace_id or new_trace_id()
+        self.started_ms = started_ms or int(time.time() * 1000)
+        self.parent_id = parent_id
+        return self.trace_id
+
+    @contextmanager
+    def span(self, name, **annotations):
+        """Time a block as a span of the current trace."""
+        if self.trace_id is None:
+            self.start_trace()
+        parent = self.active[-1].span_id if self.active else self.parent_id
+        span = Span(name, self.trace_id, parent, annotations=annotations)
+        self.active.append(span)
+        try:
+            yield span
+        finally:
+            span.end = time.time()
+            self.active.pop()
+            self.finished.append(span)
+
+    def record(self, name, trace_id, start, end, parent_id=None, **annotations):
+        """Add a span timed elsewhere, possibly of another trace."""
+        span = Span(name, trace_id, parent_id, start, end, annotations)
+        self.finished.append(span)
+        return span
+
+    def context(self):
+        """Context to hand to the next hop: the innermost running span is its parent."""
+        if self.trace_id is None:
+            return None
+        return {
+            'trace_id': self.trace_id,
+            'parent_id': self.active[-1].span_id if self.active else (self.parent_id or ''),
+            'started_ms': self.started_ms
+        }
+
+    def flush(self):
+        """Export finished spans and reset. Running spans are kept."""
+        spans, self.finished = self.finished, []
+        if spans and self.exporter is not None:
+            self.exporter.export(self.service, spans)
+        if not self.active:
+            self.trace_id = None
+            self.started_ms = None
+            self.parent_id = None
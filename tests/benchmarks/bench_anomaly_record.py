@@ -0,0 +1,92 @@
+"""
+Throughput benchmark: anomaly serialization per destination, records/s.
+
+Compares the AnomalyRecord serializers with the dict-based paths they
+replaced (JSON round trip with parse_float=Decimal for DynamoDB, default
+json.dumps for NDJSON, the old alert template).
+
+Usage:
+    python tests/benchmarks/bench_anomaly_record.py --records 200000
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../lambda'))
+
+import argparse
+import json
+import time
+from decimal import Decimal
+
+from anomaly_record import AnomalyRecord
+
+
+def make_fields(i):
+    return {
+        'ticker': f'T{i % 5000:04d}',
+        'timestamp': f'2026-01-21T15:30:{i % 60:02d}.{i:06d}',
+        'date': '2026-01-21',
+        'anomaly_type': 'price' if i % 2 else 'volume',
+        'detector': 'zscore',
+        'value': 150.0 + (i % 997) / 100,
+        'baseline_mean': 148.37,
+        'baseline_std': 1.92,
+        'z_score': round(2.0 + (i % 400) / 100, 2),
+        'threshold': 2.0,
+        'severity': 'high' if i % 3 else 'medium'
+    }
+
+
+def dict_alert(anomaly):
+    direction = "increased" if anomaly['z_score'] > 0 else "decreased"
+    return f"""
+🚨 Anomaly Detected for {anomaly['ticker']}
+
+Type: {anomaly['anomaly_type'].upper()}
+Severity: {anomaly['severity'].upper()}
+Date: {anomaly['date']}
+
+Current Value: {anomaly['value']:,.2f}
+Baseline Mean: {anomaly['baseline_mean']:,.2f}
+Standard Deviation: {anomaly['baseline_std']:,.2f}
+
+Z-Score: {anomaly['z_score']} (threshold: {anomaly['threshold']})
+
+The {anomaly['anomaly_type']} has {direction} significantly beyond normal levels.
+This represents a {abs(anomaly['z_score']):.1f} standard deviation move.
+""".strip()
+
+
+def rate(serialize, items):
+    """Records per second for serialize() over every item."""
+    started = time.perf_counter()
+    for item in items:
+        serialize(item)
+    return len(items) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--records', type=int, default=200000)
+    args = parser.parse_args()
+
+    dicts = [make_fields(i) for i in range(args.records)]
+    records = [AnomalyRecord(**d) for d in dicts]
+
+    paths = [
+        ('dynamodb',
+         lambda d: json.loads(json.dumps(d), parse_float=Decimal),
+         AnomalyRecord.to_item),
+        ('json', json.dumps, AnomalyRecord.to_json),
+        ('alert', dict_alert, AnomalyRecord.alert_text),
+    ]
+
+    print(f"{args.records:,} anomalies")
+    print(f"{'path':<10}{'dict rec/s':>14}{'record rec/s':>14}{'speedup':>10}")
+    for name, old, new in paths:
+        old_rate = rate(old, dicts)
+        new_rate = rate(new, records)
+        print(f"{name:<10}{old_rate:>14,.0f}{new_rate:>14,.0f}{new_rate / old_rate:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Memory benchmark: list-of-dicts bars vs columnar BarSeries.
+
+Usage:
+    python tests/benchmarks/bench_bar_series.py --tickers 10000 --days 252
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../lambda'))
+
+import argparse
+import gc
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from bar_series import BarSeries
+
+
+def make_records(ticker_index, days):
+    start = date(2025, 1, 1)
+    return [
+        {
+            'date': (start + timedelta(days=i)).isoformat(),
+            'open': 150.0 + (ticker_index + i) % 7 - 0.5,
+            'high': 150.0 + (ticker_index + i) % 7 + 1.0,
+            'low': 150.0 + (ticker_index + i) % 7 - 1.0,
+            'close': 150.0 + (ticker_index + i) % 7,
+            'volume': 50000000 + (ticker_index * 7919 + i) % 1000000
+        }
+        for i in range(days)
+    ]
+
+
+def measure(build):
+    """Return (bytes still allocated, seconds) for the object built by build()."""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - started
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    gc.collect()
+    return current, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--tickers', type=int, default=10000)
+    parser.add_argument('--days', type=int, default=252)
+    args = parser.parse_args()
+
+    bars = args.tickers * args.days
+    dict_bytes, dict_s = measure(
+        lambda: [make_records(t, args.days) for t in range(args.tickers)]
+    )
+    series_bytes, series_s = measure(
+        lambda: [BarSeries.from_records(make_records(t, args.days)) for t in range(args.tickers)]
+    )
+
+    print(f"Universe: {args.tickers:,} tickers x {args.days} days = {bars:,} bars")
+    print(f"{'format':<14}{'total MB':>12}{'bytes/bar':>12}{'build s':>10}")
+    print(f"{'list of dicts':<14}{dict_bytes / 1e6:>12,.1f}{dict_bytes / bars:>12,.1f}{dict_s:>10.2f}")
+    print(f"{'BarSeries':<14}{series_bytes / 1e6:>12,.1f}{series_bytes / bars:>12,.1f}{series_s:>10.2f}")
+    print(f"Reduction: {dict_bytes / series_bytes:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -13,6 +13,7 @@ import json
 from datetime import datetime
 
 # Import functions from Lambda
+from anomaly_record import AnomalyRecord
 from stock_scanner import store_raw_data_with_retry
 
 
@@ -37,15 +38,20 @@ class TestS3Integration:
         s3_key = store_raw_data_with_retry('AAPL', data)
         
         # Verify key format
-        assert s3_key.startswith('raw-data/AAPL/')
-        assert s3_key.endswith('.json')
+        assert s3_key.startswith('raw-data/AAPL/segments/')
+        assert s3_key.endswith('.ndjson')
         
         # Verify data was stored
         response = self.s3.get_object(Bucket=self.bucket_name, Key=s3_key)
-        stored_data = json.loads(response['Body'].read())
+        stored_data = [json.loads(line) for line in response['Body'].read().splitlines()]
         
         assert len(stored_data) == 2
         assert stored_data[0]['close'] == 150.0
+        
+        # Verify the manifest points at the segment
+        response = self.s3.get_object(Bucket=self.bucket_name, Key='raw-data/AAPL/manifest.json')
+        manifest = json.loads(response['Body'].read())
+        assert manifest['segments'][0]['key'] == s3_key
     
     def test_store_raw_data_with_large_dataset(self):
         """Test storage of large dataset."""
@@ -58,9 +64,12 @@ class TestS3Integration:
         
         # Verify data was stored
         response = self.s3.get_object(Bucket=self.bucket_name, Key=s3_key)
-        stored_data = json.loads(response['Body'].read())
+        stored_data = response['Body'].read().splitlines()
         
         assert len(stored_data) == 30
+        
+        # A repeat scan of the same window stores nothing
+        assert store_raw_data_with_retry('AAPL', data) is None
 
 
 @mock_aws
@@ -101,7 +110,7 @@ class TestDynamoDBIntegration:
         }
         
         # Store anomaly
-        self.table.put_item(Item=anomaly)
+        self.table.put_item(Item=AnomalyRecord.from_dict(anomaly).to_item())
         
         # Retrieve and verify
         response = self.table.get_item(
@@ -127,7 +136,7 @@ class TestDynamoDBIntegration:
                 'value': 160.0 + i,
                 'z_score': 5.0
             }
-            self.table.put_item(Item=anomaly)
+            self.table.put_item(Item=AnomalyRecord.from_dict(anomaly).to_item())
         
         # Query by ticker
         response = self.table.query(
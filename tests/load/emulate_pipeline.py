@@ -0,0 +1,551 @@
+"""
+In-process pipeline emulator: replays trading days through the scanner,
+notification and API handlers and reports where the time goes.
+
+    scanner (coordinator + local shards) -> S3 raw archive, DynamoDB, SNS
+    SNS -> SQS batches -> notification_handler -> fake Slack webhook (local HTTP server)
+    DynamoDB -> api_handler (dashboard polls after every scan)
+
+S3, DynamoDB, SNS and SSM are moto-backed. A simulated clock stands in for
+datetime.now()/utcnow() and retry sleeps, so a day's hourly schedule runs
+back to back. Market data comes from a deterministic synthetic market with
+configurable spikes instead of the scanner's mock provider.
+
+Usage:
+    python tests/load/emulate_pipeline.py --tickers 200 --days 1
+    python tests/load/emulate_pipeline.py --tickers 2000 --days 5 --spike-rate 0.01 \\
+        --slack-latency-ms 80 --api-polls 20 --json week.json
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../lambda'))
+
+# The handlers build their boto3 clients at import time
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+import types
+import uuid
+import zlib
+from collections import Counter
+from contextlib import ExitStack
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import boto3
+from moto import mock_aws
+
+from market_calendar import MarketCalendar
+from tracing import InMemoryExporter
+
+SCAN_BUCKET = 'stock-scan-data-emulator'
+DASHBOARD_BUCKET = 'stock-dashboard-emulator'
+TABLE_NAME = 'stock-anomalies'
+
+# Modules whose `datetime` name is replaced by the simulated clock
+CLOCKED_MODULES = ('stock_scanner', 'detectors', 'raw_archive', 'snapshots', 'api_handler',
+                   'market_model', 'scan_coordinator', 'scan_watermark')
+
+PERCENTILES = (50, 99)
+
+
+class SimulatedClock:
+    """Naive-UTC simulated time; sleep() advances it instead of blocking."""
+
+    def __init__(self, start):
+        self.current = start
+        self.slept = 0.0
+
+    def advance(self, seconds):
+        self.current += timedelta(seconds=seconds)
+
+    def sleep(self, seconds):
+        self.slept += seconds
+        self.advance(seconds)
+
+    def datetime_class(self):
+        clock = self
+
+        class SimulatedDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                if tz is None:
+                    return clock.current
+                return clock.current.replace(tzinfo=timezone.utc).astimezone(tz)
+
+            @classmethod
+            def utcnow(cls):
+                return clock.current
+
+        return SimulatedDatetime
+
+    def install(self, stack, modules):
+        """Point each module's datetime (and the scanner's sleep) at this clock."""
+        simulated = self.datetime_class()
+        for module in modules:
+            stack.enter_context(patch.object(module, 'datetime', simulated))
+        stack.enter_context(patch.object(sys.modules['stock_scanner'], 'time', types.SimpleNamespace(
+            sleep=self.sleep, perf_counter=time.perf_counter, time=time.time
+        )))
+
+
+class SyntheticMarket:
+    """
+    Deterministic daily bars: each ticker moves with a common market factor
+    plus its own noise, and on a `spike_rate` fraction of days jumps in
+    price and volume. Every (ticker, date) is generated independently, so
+    repeated fetches of a window agree.
+    """
+
+    def __init__(self, clock, seed=7, spike_rate=0.005, gap_dates=()):
+        self.clock = clock
+        self.seed = seed
+        self.spike_rate = spike_rate
+        self.gap_dates = set(gap_dates)
+
+    def rng(self, *parts):
+        return random.Random(zlib.crc32(':'.join(map(str, (self.seed,) + parts)).encode()))
+
+    def bar(self, ticker, day):
+        base = 20 + self.rng(ticker).random() * 480
+        market = self.rng('market', day).gauss(0, 0.01)
+        if day in self.gap_dates:
+            market -= 0.06
+        rng = self.rng(ticker, day)
+        move = market + rng.gauss(0, 0.01)
+        volume = 1000000 * (1 + rng.random())
+        if rng.random() < self.spike_rate:
+            move += rng.choice((-1, 1)) * 0.15
+            volume *= 4
+        close = base * (1 + move)
+        return {
+            'date': day,
+            'open': round(close * (1 - rng.uniform(-0.005, 0.005)), 2),
+            'high': round(close * 1.01, 2),
+            'low': round(close * 0.99, 2),
+            'close': round(close, 2),
+            'volume': int(volume)
+        }
+
+    def fetch(self, ticker, days=30):
+        """Drop-in for stock_scanner.fetch_stock_data_simple."""
+        today = self.clock.current.date()
+        return [self.bar(ticker, (today - timedelta(days=days - i)).isoformat())
+                for i in range(days)]
+
+
+class FakeSlack:
+    """Local webhook endpoint that counts posts, with optional latency and errors."""
+
+    def __init__(self, latency_ms=0.0, failure_rate=0.0):
+        self.posts = 0
+        self.failures = 0
+        self.lock = threading.Lock()
+        slack = self
+        rng = random.Random(1)
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if latency_ms:
+                    time.sleep(latency_ms / 1000)
+                with slack.lock:
+                    failed = rng.random() < failure_rate
+                    slack.posts += 1
+                    slack.failures += failed
+                self.send_response(500 if failed else 200)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/webhook"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class SnsFanout:
+    """
+    Wraps the scanner's SNS client: messages are published to moto and also
+    queued as SQS records carrying the SNS envelope, as the notifications
+    queue delivers them to notification_handler. Messages a batch reports in
+    batchItemFailures become visible again at the next receive (the next
+    scan), and move to the DLQ after MAX_RECEIVES attempts.
+    """
+
+    BATCH_SIZE = 10
+    MAX_RECEIVES = 5
+
+    def __init__(self, client, clock):
+        self.client = client
+        self.clock = clock
+        self.pending = []
+        self.published = 0
+        self.redelivered = 0
+        self.dead_letters = 0
+
+    def publish(self, **kwargs):
+        response = self.client.publish(**kwargs)
+        self.published += 1
+        envelope = {
+            'Type': 'Notification',
+            'MessageId': response.get('MessageId', str(uuid.uuid4())),
+            'TopicArn': kwargs.get('TopicArn'),
+            'Subject': kwargs.get('Subject'),
+            'Message': kwargs.get('Message'),
+            'Timestamp': self.clock.current.isoformat() + 'Z',
+            # SNS passes attributes to the raw-disabled queue as Type/Value
+            'MessageAttributes': {
+                name: {'Type': value['DataType'], 'Value': value['StringValue']}
+                for name, value in (kwargs.get('MessageAttributes') or {}).items()
+            }
+        }
+        self.pending.append({
+            'eventSource': 'aws:sqs',
+            'messageId': str(uuid.uuid4()),
+            'body': json.dumps(envelope),
+            'attributes': {'ApproximateReceiveCount': '0'}
+        })
+        return response
+
+    def receive(self):
+        """Batches of the messages visible now, each receive counted."""
+        records, self.pending = self.pending, []
+        for record in records:
+            attributes = record['attributes']
+            attributes['ApproximateReceiveCount'] = str(int(attributes['ApproximateReceiveCount']) + 1)
+        return [records[i:i + self.BATCH_SIZE] for i in range(0, len(records), self.BATCH_SIZE)]
+
+    def settle(self, batch, response):
+        """Delete delivered messages; requeue or dead-letter the reported failures."""
+        failed = {f['itemIdentifier'] for f in (response or {}).get('batchItemFailures', [])}
+        for record in batch:
+            if record['messageId'] not in failed:
+                continue
+            if int(record['attributes']['ApproximateReceiveCount']) >= self.MAX_RECEIVES:
+                self.dead_letters += 1
+            else:
+                self.redelivered += 1
+                self.pending.append(record)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+class LogCounter(logging.Handler):
+    """Counts warnings and errors by message instead of printing them."""
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.messages = Counter()
+
+    def emit(self, record):
+        self.messages[f"{record.levelname}: {record.getMessage()[:120]}"] += 1
+
+
+class StageTimes:
+    """Collects the handlers' EMF output and the emulator's own timings."""
+
+    def __init__(self):
+        self.durations = {}
+        self.counters = {}
+
+    def record(self, service, stage, ms):
+        self.durations.setdefault((service, stage), []).append(ms)
+
+    def emf_output(self, line):
+        document = json.loads(line)
+        key = (document['Service'], document['Stage'])
+        durations = document.get('Duration', [])
+        for ms in durations if isinstance(durations, list) else [durations]:
+            self.record(key[0], key[1], ms)
+        for name, value in document.items():
+            if name not in ('_aws', 'Service', 'Stage', 'Duration'):
+                counters = self.counters.setdefault(key, {})
+                counters[name] = counters.get(name, 0) + value
+
+    def timed(self, service, stage, func, *args):
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.record(service, stage, (time.perf_counter() - started) * 1000)
+
+    def summary(self):
+        rows = {}
+        for (service, stage), values in sorted(self.durations.items()):
+            ordered = sorted(values)
+            row = {'count': len(ordered), 'total_ms': round(sum(ordered), 1)}
+            for pct in PERCENTILES:
+                index = max(0, -(-len(ordered) * pct // 100) - 1)
+                row[f'p{pct}_ms'] = round(ordered[int(index)], 2)
+            row.update(self.counters.get((service, stage), {}))
+            rows[f'{service}/{stage}'] = row
+        return rows
+
+
+def wire(stack, table, sns, market, stages, spans):
+    """
+    Point the handlers' module-level clients at moto, SNS at the fan-out,
+    the provider at the synthetic market and the tracers at `spans` (an
+    InMemoryExporter). Everything is restored on exit.
+    """
+    import api_handler
+    import market_model
+    import notification_handler
+    import raw_archive
+    import scan_coordinator
+    import scan_watermark
+    import snapshots
+    import stock_scanner
+
+    s3 = boto3.client('s3')
+    replacements = [
+        (stock_scanner, 's3', s3), (stock_scanner, 'ssm', boto3.client('ssm')),
+        (stock_scanner, 'sns', sns), (stock_scanner, 'anomalies_table', table),
+        (stock_scanner, 'fetch_stock_data_simple', market.fetch),
+        (raw_archive, 's3', s3), (market_model, 's3', s3), (scan_coordinator, 's3', s3),
+        (scan_watermark, 's3', s3), (scan_watermark, '_cache', {}),
+        (snapshots, 's3', s3), (snapshots, 'anomalies_table', table),
+        (api_handler, 'table', table),
+    ]
+    for module, name, value in replacements:
+        stack.enter_context(patch.object(module, name, value))
+    for module in (stock_scanner, notification_handler, api_handler):
+        stack.enter_context(patch.object(module.metrics, 'output', stages.emf_output))
+    for module in (stock_scanner, notification_handler):
+        stack.enter_context(patch.object(module.tracer, 'exporter', spans))
+
+
+def create_resources(tickers, threshold):
+    """Buckets, table, topic and parameters the handlers expect."""
+    s3 = boto3.client('s3')
+    for bucket in (SCAN_BUCKET, DASHBOARD_BUCKET):
+        s3.create_bucket(Bucket=bucket)
+
+    dynamodb = boto3.resource('dynamodb')
+    table = dynamodb.create_table(
+        TableName=TABLE_NAME,
+        KeySchema=[
+            {'AttributeName': 'ticker', 'KeyType': 'HASH'},
+            {'AttributeName': 'timestamp', 'KeyType': 'RANGE'}
+        ],
+        AttributeDefinitions=[
+            {'AttributeName': 'ticker', 'AttributeType': 'S'},
+            {'AttributeName': 'timestamp', 'AttributeType': 'S'},
+            {'AttributeName': 'date', 'AttributeType': 'S'}
+        ],
+        GlobalSecondaryIndexes=[{
+            'IndexName': 'DateIndex',
+            'KeySchema': [
+                {'AttributeName': 'date', 'KeyType': 'HASH'},
+                {'AttributeName': 'timestamp', 'KeyType': 'RANGE'}
+            ],
+            'Projection': {'ProjectionType': 'ALL'}
+        }],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+    topic_arn = boto3.client('sns').create_topic(Name='stock-tracker-alerts')['TopicArn']
+
+    ssm = boto3.client('ssm')
+    parameters = {
+        '/stock-tracker/universe': ','.join(tickers),
+        '/stock-tracker/ticker': tickers[0],
+        '/stock-tracker/anomaly-threshold': str(threshold),
+        '/stock-tracker/detectors': json.dumps({'default': ['zscore']}),
+        '/stock-tracker/sectors': '{}',
+        '/stock-tracker/market-hours': json.dumps({'open': '09:30', 'close': '16:00',
+                                                   'timezone': 'America/New_York'})
+    }
+    for name, value in parameters.items():
+        ssm.put_parameter(Name=name, Value=value, Type='String', Overwrite=True)
+
+    return table, topic_arn
+
+
+def trading_days(start, count, calendar):
+    """The next `count` trading days from start."""
+    days = []
+    day = start
+    while len(days) < count:
+        if calendar.is_trading_day(day):
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def poll_dashboard(api_handler, stages, watermark, tickers, rng, polls):
+    """`polls` dashboards refreshing: a ?since= poll and one ticker drill-down each."""
+    for _ in range(polls):
+        query = {'since': watermark} if watermark else None
+        response = stages.timed('emulator', 'api_poll', api_handler.lambda_handler,
+                                {'httpMethod': 'GET', 'path': '/anomalies',
+                                 'queryStringParameters': query}, None)
+        if response['statusCode'] == 200:
+            watermark = json.loads(response['body'])['watermark']
+        ticker = rng.choice(tickers)
+        stages.timed('emulator', 'api_ticker', api_handler.lambda_handler,
+                     {'httpMethod': 'GET', 'path': f'/anomalies/{ticker}',
+                      'pathParameters': {'ticker': ticker}}, None)
+    return watermark
+
+
+def emulate(tickers, days=1, start=None, threshold=2.0, spike_rate=0.005, gap_dates=(),
+            slack_latency_ms=0.0, slack_failure_rate=0.0, api_polls=5, seed=7):
+    """Replay `days` trading days of hourly scans; returns the report."""
+    start = start or datetime(2026, 3, 2)
+    clock = SimulatedClock(start)
+    stages = StageTimes()
+
+    log = LogCounter()
+    root = logging.getLogger()
+    with ExitStack() as stack:
+        stack.enter_context(mock_aws())
+        slack = stack.enter_context(FakeSlack(slack_latency_ms, slack_failure_rate))
+        table, topic_arn = create_resources(tickers, threshold)
+        stack.enter_context(patch.dict(os.environ, {
+            'S3_BUCKET': SCAN_BUCKET,
+            'DASHBOARD_BUCKET': DASHBOARD_BUCKET,
+            'SNS_TOPIC_ARN': topic_arn,
+            'SLACK_WEBHOOK_URL': slack.url,
+            'SCAN_EXECUTOR': 'local'
+        }))
+        stack.enter_context(patch.object(root, 'handlers', [log]))
+        stack.enter_context(patch.object(root, 'level', logging.WARNING))
+
+        import api_handler
+        import notification_handler
+        import stock_scanner
+        sns = SnsFanout(boto3.client('sns'), clock)
+        spans = InMemoryExporter()
+        wire(stack, table, sns, SyntheticMarket(clock, seed, spike_rate, gap_dates), stages, spans)
+        clock.install(stack, [sys.modules[name] for name in CLOCKED_MODULES])
+
+        rng = random.Random(seed)
+        watermark = None
+        wall_started = time.perf_counter()
+        simulated_started = clock.current
+        runs = 0
+        scanned = Counter()
+        calendar = MarketCalendar()
+        for day in trading_days(start.date(), days, calendar):
+            # The generated schedule: the day's sessions in exchange time
+            for scan_time in calendar.scan_times(day):
+                clock.current = scan_time.astimezone(timezone.utc).replace(tzinfo=None)
+                result = stages.timed('emulator', 'scan_run', stock_scanner.lambda_handler,
+                                      {'mode': 'coordinator', 'executor': 'local', 'scheduled': True}, None)
+                body = json.loads(result['body'])
+                scanned.update(processed=body.get('tickers_processed', 0),
+                               skipped=body.get('tickers_skipped', 0))
+                runs += 1
+                for batch in sns.receive():
+                    response = stages.timed('emulator', 'notify', notification_handler.lambda_handler,
+                                            {'Records': batch}, None)
+                    sns.settle(batch, response)
+                watermark = poll_dashboard(api_handler, stages, watermark, tickers, rng, api_polls)
+        wall = time.perf_counter() - wall_started
+
+        stored = table.scan(Select='COUNT')['Count']
+        simulated = (clock.current - simulated_started).total_seconds()
+
+    return {
+        'config': {
+            'tickers': len(tickers), 'days': days, 'threshold': threshold,
+            'spike_rate': spike_rate, 'api_polls': api_polls,
+            'slack_latency_ms': slack_latency_ms
+        },
+        'scan_runs': runs,
+        'wall_s': round(wall, 2),
+        'simulated_s': round(simulated, 1),
+        'simulated_sleep_s': round(clock.slept, 1),
+        'ticker_scans_per_s': round(runs * len(tickers) / wall, 1) if wall else 0.0,
+        'tickers_processed': scanned['processed'],
+        'tickers_skipped': scanned['skipped'],
+        'anomalies_stored': stored,
+        'slack_posts': slack.posts,
+        'slack_failures': slack.failures,
+        'sns_published': sns.published,
+        'notifications_redelivered': sns.redelivered,
+        'notifications_dead_lettered': sns.dead_letters,
+        'notifications_queued': len(sns.pending),
+        'traced_alerts': sum(1 for span in spans.named('slack_post') if span.annotations.get('ok')),
+        'trace_spans': len(spans.spans),
+        'log_messages': dict(log.messages.most_common(10)),
+        'stages': stages.summary()
+    }
+
+
+def print_report(report, out=sys.stdout):
+    config = report['config']
+    print(f"\n{config['tickers']} tickers x {report['scan_runs']} scans "
+          f"({config['days']} trading days) in {report['wall_s']}s wall "
+          f"= {report['ticker_scans_per_s']:,} ticker scans/s", file=out)
+    print(f"Tickers processed: {report['tickers_processed']}, "
+          f"skipped unchanged: {report['tickers_skipped']}", file=out)
+    print(f"Anomalies stored: {report['anomalies_stored']}, SNS messages: {report['sns_published']}, "
+          f"Slack posts: {report['slack_posts']} ({report['slack_failures']} failed), "
+          f"simulated retry sleep: {report['simulated_sleep_s']}s", file=out)
+    print(f"Notifications redelivered: {report['notifications_redelivered']}, "
+          f"dead-lettered: {report['notifications_dead_lettered']}, "
+          f"still queued: {report['notifications_queued']}", file=out)
+    print(f"Traced alerts delivered: {report['traced_alerts']} "
+          f"({report['trace_spans']} spans exported)", file=out)
+    for message, count in report['log_messages'].items():
+        print(f"  {count:>6} x {message}", file=out)
+    columns = ['count', 'total_ms'] + [f'p{p}_ms' for p in PERCENTILES]
+    print(f"\n{'stage':<40}" + ''.join(f"{c:>12}" for c in columns) + "  counters", file=out)
+    for name, row in report['stages'].items():
+        counters = {k: v for k, v in row.items() if k not in columns}
+        print(f"{name:<40}" + ''.join(f"{row[c]:>12}" for c in columns)
+              + (f"  {counters}" if counters else ''), file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--tickers', type=int, default=200, help="Universe size")
+    parser.add_argument('--days', type=int, default=1, help="Trading days to replay")
+    parser.add_argument('--start', default='2026-03-02', help="First day (YYYY-MM-DD)")
+    parser.add_argument('--threshold', type=float, default=2.0)
+    parser.add_argument('--spike-rate', type=float, default=0.005,
+                        help="Fraction of ticker-days with a price/volume spike")
+    parser.add_argument('--gap-date', action='append', default=[],
+                        help="Day on which the whole market gaps down (repeatable)")
+    parser.add_argument('--slack-latency-ms', type=float, default=0.0)
+    parser.add_argument('--slack-failure-rate', type=float, default=0.0)
+    parser.add_argument('--api-polls', type=int, default=5, help="Dashboard polls after each scan")
+    parser.add_argument('--json', help="Also write the report to this file")
+    args = parser.parse_args(argv)
+
+    tickers = [f'T{i:04d}' for i in range(args.tickers)]
+    report = emulate(
+        tickers, days=args.days, start=datetime.strptime(args.start, '%Y-%m-%d'),
+        threshold=args.threshold, spike_rate=args.spike_rate, gap_dates=args.gap_date,
+        slack_latency_ms=args.slack_latency_ms, slack_failure_rate=args.slack_failure_rate,
+        api_polls=args.api_polls
+    )
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == '__main__':
+    main()
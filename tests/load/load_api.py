@@ -0,0 +1,316 @@
+"""
+Load generator for the anomaly API: drives api_handler.lambda_handler with a
+dashboard-like request mix and reports throughput and latency percentiles.
+
+The table is moto-backed by default, which is enough to compare changes to
+the handler but not for absolute numbers: moto's per-call cost grows with
+the table and all clients share one Python process. For realistic latency
+at millions of anomalies point it at DynamoDB Local (seed once, then reuse
+the table with --no-seed).
+
+Usage:
+    python tests/load/load_api.py --anomalies 20000 --clients 8 --duration 30
+    python tests/load/load_api.py --endpoint-url http://localhost:8000 \\
+        --anomalies 2000000 --seed-workers 16 --clients 32 --duration 60
+    python tests/load/load_api.py --endpoint-url http://localhost:8000 --no-seed \\
+        --mix health=0,list=1,since=4,ticker=5 --json results.json
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../lambda'))
+
+# api_handler builds its boto3 resources at import time
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import boto3
+
+import api_handler
+from metrics import MetricsRecorder
+
+TABLE_NAME = 'stock-anomalies'
+
+# Relative weights of each request type, roughly what open dashboards send:
+# mostly ?since= polls and ticker drill-downs, the odd full reload and
+# watchlist refresh
+DEFAULT_MIX = {'health': 1, 'list': 1, 'since': 6, 'ticker': 4, 'batch': 1}
+
+# Tickers in one ?tickers= watchlist request
+WATCHLIST_SIZE = 50
+
+PERCENTILES = (50, 90, 99)
+
+
+def create_table(dynamodb):
+    """The anomalies table with DateIndex, as deployed by the storage stack."""
+    return dynamodb.create_table(
+        TableName=TABLE_NAME,
+        KeySchema=[
+            {'AttributeName': 'ticker', 'KeyType': 'HASH'},
+            {'AttributeName': 'timestamp', 'KeyType': 'RANGE'}
+        ],
+        AttributeDefinitions=[
+            {'AttributeName': 'ticker', 'AttributeType': 'S'},
+            {'AttributeName': 'timestamp', 'AttributeType': 'S'},
+            {'AttributeName': 'date', 'AttributeType': 'S'}
+        ],
+        GlobalSecondaryIndexes=[{
+            'IndexName': 'DateIndex',
+            'KeySchema': [
+                {'AttributeName': 'date', 'KeyType': 'HASH'},
+                {'AttributeName': 'timestamp', 'KeyType': 'RANGE'}
+            ],
+            'Projection': {'ProjectionType': 'ALL'}
+        }],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+
+def ticker_names(count):
+    return [f'T{i:04d}' for i in range(count)]
+
+
+def make_anomaly(rng, ticker, scanned):
+    """One stored anomaly in the scanner's format."""
+    anomaly_type = rng.choice(('price', 'volume'))
+    z_score = rng.choice((-1, 1)) * rng.uniform(2.0, 6.0)
+    return {
+        'ticker': ticker,
+        'timestamp': scanned.isoformat(),
+        'date': scanned.strftime('%Y-%m-%d'),
+        'anomaly_type': anomaly_type,
+        'detector': 'zscore',
+        'value': Decimal(str(round(rng.uniform(20, 500), 2))),
+        'baseline_mean': Decimal(str(round(rng.uniform(20, 500), 2))),
+        'baseline_std': Decimal(str(round(rng.uniform(0.5, 10), 2))),
+        'z_score': Decimal(str(round(z_score, 2))),
+        'threshold': Decimal('2.0'),
+        'severity': 'high' if abs(z_score) > 3.0 else 'medium'
+    }
+
+
+def seed_slice(table, count, names, span, now, seed_value):
+    rng = random.Random(seed_value)
+    with table.batch_writer(overwrite_by_pkeys=['ticker', 'timestamp']) as batch:
+        for i in range(count):
+            scanned = now - timedelta(seconds=rng.uniform(0, span), microseconds=i % 1000)
+            batch.put_item(Item=make_anomaly(rng, rng.choice(names), scanned))
+    return count
+
+
+def seed(table, anomalies, tickers, days, now, workers=1, seed_value=42):
+    """Write `anomalies` items spread evenly over the last `days` days."""
+    names = ticker_names(tickers)
+    span = days * 86400
+    per_worker = -(-anomalies // workers)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(seed_slice, table, min(per_worker, anomalies - w * per_worker),
+                        names, span, now, seed_value + w)
+            for w in range(workers) if w * per_worker < anomalies
+        ]
+        for future in futures:
+            future.result()
+    return time.perf_counter() - started
+
+
+def parse_mix(text):
+    """'health=1,list=1,since=6,ticker=4,batch=1' -> weights; unknown names rejected."""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"Unknown request type: {name}")
+        mix[name] = float(weight)
+    if not any(mix.values()):
+        raise ValueError("Request mix has no positive weights")
+    return mix
+
+
+def make_request(rng, kind, names, now):
+    """API Gateway proxy event for one request type."""
+    if kind == 'health':
+        return {'httpMethod': 'GET', 'path': '/health'}
+    if kind == 'list':
+        return {'httpMethod': 'GET', 'path': '/anomalies'}
+    if kind == 'since':
+        # A dashboard polling every minute or so resumes from a recent watermark
+        since = now - timedelta(seconds=rng.uniform(30, 900))
+        return {'httpMethod': 'GET', 'path': '/anomalies',
+                'queryStringParameters': {'since': since.isoformat()}}
+    if kind == 'batch':
+        watchlist = rng.sample(names, min(WATCHLIST_SIZE, len(names)))
+        return {'httpMethod': 'GET', 'path': '/anomalies',
+                'queryStringParameters': {'tickers': ','.join(watchlist)}}
+    ticker = rng.choice(names)
+    return {'httpMethod': 'GET', 'path': f'/anomalies/{ticker}',
+            'pathParameters': {'ticker': ticker}}
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+class ThreadLocalMetrics:
+    """
+    Stands in for api_handler.metrics: one MetricsRecorder per client thread,
+    so concurrent requests do not share timer state. EMF output is dropped.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def __getattr__(self, name):
+        recorder = getattr(self.local, 'recorder', None)
+        if recorder is None:
+            recorder = self.local.recorder = MetricsRecorder('stock-api', output=lambda line: None)
+        return getattr(recorder, name)
+
+
+def client(client_id, mix, names, deadline, max_requests, counter, lock, now):
+    """One simulated dashboard client; returns [(kind, status, latency_ms)]."""
+    rng = random.Random(client_id)
+    kinds = list(mix)
+    weights = [mix[k] for k in kinds]
+    samples = []
+    while time.perf_counter() < deadline:
+        with lock:
+            if max_requests and counter[0] >= max_requests:
+                break
+            counter[0] += 1
+        kind = rng.choices(kinds, weights)[0]
+        event = make_request(rng, kind, names, now)
+        started = time.perf_counter()
+        result = api_handler.lambda_handler(event, None)
+        samples.append((kind, result['statusCode'], (time.perf_counter() - started) * 1000))
+    return samples
+
+
+def run_load(mix, clients, duration, names, max_requests=None, now=None):
+    """Run `clients` concurrent clients; returns (samples, wall seconds)."""
+    now = now or datetime.utcnow()
+    counter = [0]
+    lock = threading.Lock()
+    started = time.perf_counter()
+    deadline = started + duration
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        futures = [
+            pool.submit(client, i, mix, names, deadline, max_requests, counter, lock, now)
+            for i in range(clients)
+        ]
+        samples = [sample for future in futures for sample in future.result()]
+    return samples, time.perf_counter() - started
+
+
+def summarize(samples, elapsed):
+    """Throughput and latency percentiles overall and per request type."""
+    def stats(group):
+        latencies = sorted(latency for _, _, latency in group)
+        row = {
+            'requests': len(group),
+            'errors': sum(1 for _, status, _ in group if status >= 500),
+            'statuses': dict(Counter(status for _, status, _ in group)),
+            'mean_ms': round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+            'max_ms': round(latencies[-1], 2) if latencies else 0.0,
+        }
+        for pct in PERCENTILES:
+            row[f'p{pct}_ms'] = round(percentile(latencies, pct), 2)
+        return row
+
+    kinds = sorted({kind for kind, _, _ in samples})
+    return {
+        'elapsed_s': round(elapsed, 2),
+        'throughput_rps': round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        'overall': stats(samples),
+        'by_type': {kind: stats([s for s in samples if s[0] == kind]) for kind in kinds}
+    }
+
+
+def print_report(report, out=sys.stdout):
+    columns = ['requests', 'errors', 'mean_ms'] + [f'p{p}_ms' for p in PERCENTILES] + ['max_ms']
+    print(f"\n{report['overall']['requests']:,} requests in {report['elapsed_s']}s "
+          f"= {report['throughput_rps']:,} req/s", file=out)
+    print(f"{'type':<10}" + ''.join(f"{c:>11}" for c in columns), file=out)
+    rows = list(report['by_type'].items()) + [('all', report['overall'])]
+    for kind, row in rows:
+        print(f"{kind:<10}" + ''.join(f"{row[c]:>11}" for c in columns), file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--endpoint-url', help="DynamoDB Local endpoint (default: moto in-process)")
+    parser.add_argument('--anomalies', type=int, default=20000, help="Items to seed")
+    parser.add_argument('--tickers', type=int, default=500, help="Distinct tickers in the seed")
+    parser.add_argument('--days', type=int, default=90, help="Days of history the seed spans")
+    parser.add_argument('--no-seed', action='store_true', help="Reuse an already seeded table")
+    parser.add_argument('--seed-workers', type=int, default=1,
+                        help="Parallel batch writers (DynamoDB Local; moto gains nothing)")
+    parser.add_argument('--clients', type=int, default=8, help="Concurrent clients")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds to run")
+    parser.add_argument('--requests', type=int, help="Stop after this many requests")
+    parser.add_argument('--mix', default=','.join(f'{k}={v}' for k, v in DEFAULT_MIX.items()),
+                        help="Request weights, e.g. health=1,list=1,since=6,ticker=4,batch=1")
+    parser.add_argument('--json', help="Also write the report to this file")
+    args = parser.parse_args(argv)
+
+    mix = parse_mix(args.mix)
+    logging.getLogger().setLevel(logging.WARNING)
+    api_handler.logger.setLevel(logging.WARNING)
+    api_handler.metrics = ThreadLocalMetrics()
+
+    if args.endpoint_url:
+        context = nullcontext()
+    else:
+        from moto import mock_aws
+        context = mock_aws()
+
+    with context:
+        dynamodb = boto3.resource('dynamodb', endpoint_url=args.endpoint_url)
+        if args.no_seed:
+            table = dynamodb.Table(TABLE_NAME)
+        else:
+            table = create_table(dynamodb)
+            print(f"Seeding {args.anomalies:,} anomalies over {args.days} days...", file=sys.stderr)
+            seconds = seed(table, args.anomalies, args.tickers, args.days, datetime.utcnow(),
+                           workers=args.seed_workers)
+            print(f"Seeded in {seconds:.1f}s", file=sys.stderr)
+        api_handler.table = table
+
+        samples, elapsed = run_load(mix, args.clients, args.duration,
+                                    ticker_names(args.tickers), args.requests)
+
+    report = summarize(samples, elapsed)
+    report['config'] = {
+        'backend': args.endpoint_url or 'moto',
+        'anomalies': args.anomalies,
+        'tickers': args.tickers,
+        'clients': args.clients,
+        'mix': mix
+    }
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""
+Unit tests for hot/cold tiering of anomalies.
+Tests the columnar partition format, the archive job and TTLs.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../lambda'))
+
+import pytest
+import boto3
+import json
+from datetime import datetime
+from decimal import Decimal
+from moto import mock_aws
+
+import anomaly_archive
+from anomaly_archive import decode_partition, encode_partition, run_archive, split_dates
+
+BUCKET = 'stock-scan-data-test'
+NOW = datetime(2026, 3, 15, 12, 0)
+
+
+def create_table():
+    """Create the anomalies table with its DateIndex."""
+    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+    return dynamodb.create_table(
+        TableName='stock-anomalies',
+        KeySchema=[
+            {'AttributeName': 'ticker', 'KeyType': 'HASH'},
+            {'AttributeName': 'timestamp', 'KeyType': 'RANGE'}
+        ],
+        AttributeDefinitions=[
+            {'AttributeName': 'ticker', 'AttributeType': 'S'},
+            {'AttributeName': 'timestamp', 'AttributeType': 'S'},
+            {'AttributeName': 'date', 'AttributeType': 'S'}
+        ],
+        GlobalSecondaryIndexes=[{
+            'IndexName': 'DateIndex',
+            'KeySchema': [
+                {'AttributeName': 'date', 'KeyType': 'HASH'},
+                {'AttributeName': 'timestamp', 'KeyType': 'RANGE'}
+            ],
+            'Projection': {'ProjectionType': 'ALL'}
+        }],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+
+def make_item(ticker, day, hour=15, **extra):
+    return dict({
+        'ticker': ticker,
+        'timestamp': f'{day}T{hour:02d}:30:00',
+        'date': day,
+        'anomaly_type': 'price',
+        'value': Decimal('160.1'),
+        'z_score': Decimal('3.5'),
+        'threshold': Decimal('2'),
+        'severity': 'high'
+    }, **extra)
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    with mock_aws():
+        s3 = boto3.client('s3', region_name='us-east-1')
+        s3.create_bucket(Bucket=BUCKET)
+        table = create_table()
+        monkeypatch.setattr(anomaly_archive, 's3', s3)
+        monkeypatch.setattr(anomaly_archive, 'anomalies_table', table)
+        monkeypatch.setattr(anomaly_archive, '_manifest_cache', {})
+        yield s3, table
+
+
+class TestPartitionFormat:
+    """Test the gzip columnar encoding."""
+
+    def test_round_trip(self):
+        """Test that items decode to what was stored, Decimals as numbers."""
+        items = [make_item('MSFT', '2026-01-05'), make_item('AAPL', '2026-01-05', horizon=5)]
+
+        decoded = decode_partition(encode_partition('2026-01-05', items))
+
+        assert [i['ticker'] for i in decoded] == ['AAPL', 'MSFT']
+        assert decoded[0]['horizon'] == 5
+        assert 'horizon' not in decoded[1]
+        assert decoded[1]['value'] == 160.1
+        assert decoded[1]['threshold'] == 2
+
+    def test_ticker_filter(self):
+        """Test that readers can pick tickers out of a partition."""
+        items = [make_item(t, '2026-01-05') for t in ('AAPL', 'MSFT', 'NVDA')]
+
+        decoded = decode_partition(encode_partition('2026-01-05', items), tickers=['MSFT'])
+
+        assert [i['ticker'] for i in decoded] == ['MSFT']
+
+    def test_split_dates(self):
+        """Test that archived dates without anomalies are skipped entirely."""
+        manifest = {'archived_through': '2026-01-03', 'dates': {'2026-01-02': 4}}
+
+        cold, hot = split_dates(['2026-01-01', '2026-01-02', '2026-01-03', '2026-01-04'], manifest)
+
+        assert cold == ['2026-01-02']
+        assert hot == ['2026-01-04']
+
+
+class TestArchiveJob:
+    """Test moving old anomalies to S3."""
+
+    def test_old_dates_archived_and_expired(self, aws):
+        """Test that only dates past the cutoff move, and get a TTL."""
+        s3, table = aws
+        table.put_item(Item=make_item('AAPL', '2026-01-05'))
+        table.put_item(Item=make_item('MSFT', '2026-01-05'))
+        table.put_item(Item=make_item('AAPL', '2026-03-10'))
+
+        summary = run_archive(BUCKET, start='2026-01-01', now=NOW)
+
+        assert summary['items_archived'] == 2
+        assert summary['items_expired'] == 2
+        assert summary['archived_through'] == '2026-02-12'
+        body = s3.get_object(Bucket=BUCKET, Key='anomaly-archive/2026/01/2026-01-05.json.gz')['Body'].read()
+        assert len(decode_partition(body)) == 2
+        old = table.get_item(Key={'ticker': 'AAPL', 'timestamp': '2026-01-05T15:30:00'})['Item']
+        recent = table.get_item(Key={'ticker': 'AAPL', 'timestamp': '2026-03-10T15:30:00'})['Item']
+        assert old['expires_at'] > NOW.timestamp()
+        assert 'expires_at' not in recent
+
+    def test_next_run_resumes_after_watermark(self, aws):
+        """Test that a later run only walks new dates."""
+        s3, table = aws
+        table.put_item(Item=make_item('AAPL', '2026-01-05'))
+        run_archive(BUCKET, start='2026-01-01', now=NOW)
+        table.put_item(Item=make_item('NVDA', '2026-02-13'))
+
+        summary = run_archive(BUCKET, now=datetime(2026, 3, 16, 12, 0))
+
+        assert summary['dates'] == 1
+        assert summary['items_archived'] == 1
+        manifest = json.loads(s3.get_object(Bucket=BUCKET, Key='anomaly-archive/manifest.json')['Body'].read())
+        assert manifest['archived_through'] == '2026-02-13'
+        assert manifest['dates'] == {'2026-01-05': 1, '2026-02-13': 1}
+
+    def test_deadline_stops_with_progress_saved(self, aws, monkeypatch):
+        """Test that a run cut short by the deadline keeps what it archived and resumes."""
+        s3, table = aws
+        table.put_item(Item=make_item('AAPL', '2026-01-05'))
+        table.put_item(Item=make_item('MSFT', '2026-01-06'))
+        clock = {'now': 0.0}
+        archive_date = anomaly_archive.archive_date
+
+        def slow_archive_date(day, *args):
+            # The second date uses up the time left
+            if day == '2026-01-06':
+                clock['now'] = 100.0
+            return archive_date(day, *args)
+
+        monkeypatch.setattr(anomaly_archive, 'archive_date', slow_archive_date)
+        monkeypatch.setattr(anomaly_archive.time, 'monotonic', lambda: clock['now'])
+
+        summary = run_archive(BUCKET, start='2026-01-05', through='2026-01-07', now=NOW, deadline=50.0)
+
+        assert summary['complete'] is False
+        assert summary['dates'] == 2
+        manifest = json.loads(s3.get_object(Bucket=BUCKET, Key='anomaly-archive/manifest.json')['Body'].read())
+        assert manifest['archived_through'] == '2026-01-06'
+        assert manifest['dates'] == {'2026-01-05': 1, '2026-01-06': 1}
+
+        clock['now'] = 0.0
+        summary = run_archive(BUCKET, through='2026-01-07', now=NOW, deadline=50.0)
+
+        assert summary['complete'] is True
+        assert summary['dates'] == 1
+        assert summary['archived_through'] == '2026-01-07'
+
+    def test_rearchive_keeps_expired_items(self, aws):
+        """Test that items already removed from the table stay archived."""
+        s3, table = aws
+        table.put_item(Item=make_item('AAPL', '2026-01-05'))
+        run_archive(BUCKET, start='2026-01-05', through='2026-01-05', now=NOW)
+        table.delete_item(Key={'ticker': 'AAPL', 'timestamp': '2026-01-05T15:30:00'})
+        table.put_item(Item=make_item('MSFT', '2026-01-05', hour=20))
+
+        run_archive(BUCKET, start='2026-01-05', through='2026-01-05', now=NOW)
+
+        body = s3.get_object(Bucket=BUCKET, Key='anomaly-archive/2026/01/2026-01-05.json.gz')['Body'].read()
+        assert [i['ticker'] for i in decode_partition(body)] == ['AAPL', 'MSFT']
@@ -0,0 +1,98 @@
+"""
+Unit tests for the anomaly record and its serializers.
+Tests dict-style access and the DynamoDB, JSON and alert outputs.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../lambda'))
+
+import pytest
+import json
+import pickle
+from decimal import Decimal
+
+from anomaly_record import AnomalyRecord
+
+
+def make_record(**extra):
+    return AnomalyRecord(
+        ticker='AAPL',
+        timestamp='2026-01-21T15:30:00',
+        date='2026-01-21',
+        anomaly_type='price',
+        detector='zscore',
+        value=160.1,
+        baseline_mean=150.25,
+        baseline_std=2.0,
+        z_score=4.93,
+        threshold=2.0,
+        severity='high',
+        **extra
+    )
+
+
+class TestDictAccess:
+    """Test that records read like the dicts they replace."""
+
+    def test_fields_and_extras(self):
+        """Test item access, get and membership for fields and extras."""
+        record = make_record(horizon=5)
+        record['source'] = 'backfill'
+
+        assert record['z_score'] == 4.93
+        assert record['horizon'] == 5
+        assert record.get('members') is None
+        assert 'source' in record
+        assert 'members' not in record
+
+    def test_unset_field_absent(self):
+        """Test that a field left as None behaves like a missing key."""
+        record = AnomalyRecord(ticker='AAPL', anomaly_type='price')
+
+        assert 'detector' not in record
+        with pytest.raises(KeyError):
+            record['detector']
+        assert record.to_dict() == {'ticker': 'AAPL', 'anomaly_type': 'price'}
+
+    def test_no_instance_dict(self):
+        """Test that records are slotted and survive pickling (backfill workers)."""
+        record = make_record(horizon=20)
+
+        assert not hasattr(record, '__dict__')
+        assert pickle.loads(pickle.dumps(record)) == record
+
+
+class TestSerializers:
+    """Test the per-destination serializers."""
+
+    def test_item_uses_decimal(self):
+        """Test that floats become exact Decimals and ints are kept."""
+        item = make_record(member_count=3, members=['A', 'B', 'C']).to_item()
+
+        assert item['value'] == Decimal('160.1')
+        assert item['baseline_std'] == Decimal('2.0')
+        assert item['member_count'] == 3
+        assert not any(isinstance(v, float) for v in item.values())
+
+    def test_item_round_trip(self):
+        """Test that a stored item reads back into an equal record."""
+        record = make_record(horizon=60)
+
+        assert AnomalyRecord.from_dict(record.to_item()) == record
+
+    def test_json_is_compact(self):
+        """Test that JSON output has no padding and parses back to the dict."""
+        record = make_record()
+        line = record.to_json()
+
+        assert ', ' not in line and ': ' not in line
+        assert json.loads(line) == record.to_dict()
+
+    def test_alert_text(self):
+        """Test the alert body for a ticker anomaly."""
+        message = make_record().alert_text()
+
+        assert 'Anomaly Detected for AAPL' in message
+        assert 'Current Value: 160.10' in message
+        assert 'increased' in message
+        assert 'Moved together' not in message
@@ -0,0 +1,437 @@
+"""
+Unit tests for the anomaly API handler.
+Tests the ?since= delta listing, watchlist batch queries and JSON encoding of DynamoDB items.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../lambda'))
+
+import pytest
+import boto3
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal
+from moto import mock_aws
+from unittest.mock import Mock
+
+import anomaly_archive
+import anomaly_export
+import api_handler
+
+
+def create_table():
+    """Create the anomalies table with its DateIndex."""
+    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+    return dynamodb.create_table(
+        TableName='stock-anomalies',
+        KeySchema=[
+            {'AttributeName': 'ticker', 'KeyType': 'HASH'},
+            {'AttributeName': 'timestamp', 'KeyType': 'RANGE'}
+        ],
+        AttributeDefinitions=[
+            {'AttributeName': 'ticker', 'AttributeType': 'S'},
+            {'AttributeName': 'timestamp', 'AttributeType': 'S'},
+            {'AttributeName': 'date', 'AttributeType': 'S'}
+        ],
+        GlobalSecondaryIndexes=[{
+            'IndexName': 'DateIndex',
+            'KeySchema': [
+                {'AttributeName': 'date', 'KeyType': 'HASH'},
+                {'AttributeName': 'timestamp', 'KeyType': 'RANGE'}
+            ],
+            'Projection': {'ProjectionType': 'ALL'}
+        }],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+
+def put_anomaly(table, ticker, minutes_ago, days_before=0):
+    """Store an anomaly scanned `minutes_ago` for a bar `days_before` that."""
+    scanned = datetime.utcnow() - timedelta(minutes=minutes_ago)
+    item = {
+        'ticker': ticker,
+        'timestamp': scanned.isoformat(),
+        'date': (scanned - timedelta(days=days_before)).strftime('%Y-%m-%d'),
+        'anomaly_type': 'price',
+        'z_score': Decimal('3.1'),
+        'volume': Decimal('50000000')
+    }
+    table.put_item(Item=item)
+    return item
+
+
+def get(path, query=None):
+    """Invoke the handler as API Gateway would."""
+    result = api_handler.lambda_handler({
+        'httpMethod': 'GET',
+        'path': path,
+        'queryStringParameters': query
+    }, None)
+    return result['statusCode'], json.loads(result['body'])
+
+
+@pytest.fixture
+def table(monkeypatch):
+    with mock_aws():
+        table = create_table()
+        monkeypatch.setattr(api_handler, 'table', table)
+        yield table
+
+
+class TestListAnomalies:
+    """Test GET /anomalies with and without a watermark."""
+
+    def test_full_list_newest_first(self, table):
+        """Test that the first poll returns recent items and a watermark."""
+        put_anomaly(table, 'AAPL', minutes_ago=60)
+        put_anomaly(table, 'MSFT', minutes_ago=30)
+
+        status, body = get('/anomalies')
+
+        assert status == 200
+        assert [a['ticker'] for a in body['anomalies']] == ['MSFT', 'AAPL']
+        assert body['count'] == 2
+        assert body['watermark'] == body['anomalies'][0]['timestamp']
+
+    def test_since_returns_only_newer_items(self, table):
+        """Test that a poll with the previous watermark gets the delta."""
+        first = put_anomaly(table, 'AAPL', minutes_ago=60)
+        second = put_anomaly(table, 'MSFT', minutes_ago=30)
+
+        status, body = get('/anomalies', {'since': first['timestamp']})
+
+        assert status == 200
+        assert [a['timestamp'] for a in body['anomalies']] == [second['timestamp']]
+
+    def test_weekend_bar_date_found(self, table):
+        """Test items whose bar date trails the scan timestamp."""
+        since = (datetime.utcnow() - timedelta(hours=2)).isoformat()
+        put_anomaly(table, 'AAPL', minutes_ago=30, days_before=3)
+
+        _, body = get('/anomalies', {'since': since})
+
+        assert body['count'] == 1
+
+    def test_watermark_lags_fresh_items(self, table):
+        """Test that items newer than the lag do not advance the watermark past them."""
+        since = (datetime.utcnow() - timedelta(hours=1)).isoformat()
+        fresh = put_anomaly(table, 'AAPL', minutes_ago=0)
+
+        _, body = get('/anomalies', {'since': since})
+
+        assert since <= body['watermark'] < fresh['timestamp']
+
+    def test_empty_delta_keeps_watermark(self, table):
+        """Test that the watermark never moves backwards."""
+        since = datetime.utcnow().isoformat()
+
+        _, body = get('/anomalies', {'since': since})
+
+        assert body['anomalies'] == []
+        assert body['watermark'] == since
+
+    def test_truncated_response_resumes_from_last_item(self, table, monkeypatch):
+        """Test the item cap."""
+        monkeypatch.setattr(api_handler, 'MAX_DELTA_ITEMS', 2)
+        items = [put_anomaly(table, f'T{i}', minutes_ago=50 - i) for i in range(3)]
+
+        _, body = get('/anomalies')
+
+        assert body['truncated'] is True
+        assert body['count'] == 2
+        assert body['watermark'] == items[1]['timestamp']
+
+    def test_truncation_never_splits_a_timestamp(self, table, monkeypatch):
+        """Test that items sharing the cut-off timestamp all arrive, on this poll or the next."""
+        monkeypatch.setattr(api_handler, 'MAX_DELTA_ITEMS', 3)
+        items = [put_anomaly(table, 'A', minutes_ago=50), put_anomaly(table, 'B', minutes_ago=40)]
+        shared = items[1]['timestamp']
+        for ticker in ('C', 'D'):
+            table.put_item(Item=dict(items[1], ticker=ticker))
+        items.append(put_anomaly(table, 'E', minutes_ago=30))
+
+        _, first = get('/anomalies')
+        _, second = get('/anomalies', {'since': first['watermark']})
+        _, third = get('/anomalies', {'since': second['watermark']})
+
+        assert [a['ticker'] for a in first['anomalies']] == ['A']
+        assert first['watermark'] == items[0]['timestamp']
+        assert sorted(a['ticker'] for a in second['anomalies']) == ['B', 'C', 'D']
+        assert second['watermark'] == shared
+        assert [a['ticker'] for a in third['anomalies']] == ['E']
+
+    def test_timestamp_larger_than_page_returned_whole(self, table):
+        """Test that more than a page of backfilled items on one sort key is not skipped."""
+        day = (datetime.utcnow() - timedelta(days=1)).strftime('%Y-%m-%d')
+        shared = f'{day}T00:00:00.000000'
+        with table.batch_writer() as batch:
+            for i in range(api_handler.MAX_DELTA_ITEMS + 20):
+                batch.put_item(Item={'ticker': f'T{i:04d}', 'timestamp': shared, 'date': day,
+                                     'anomaly_type': 'price', 'source': 'backfill'})
+        later = put_anomaly(table, 'AAPL', minutes_ago=30)
+
+        _, first = get('/anomalies')
+        _, second = get('/anomalies', {'since': first['watermark']})
+
+        assert first['truncated'] is True
+        assert first['count'] == api_handler.MAX_DELTA_ITEMS + 20
+        assert first['watermark'] == shared
+        assert [a['ticker'] for a in second['anomalies']] == [later['ticker']]
+
+    def test_backfilled_item_watermark_accepted(self, table):
+        """Test polling from a watermark taken from a backfilled item."""
+        day = (datetime.utcnow() - timedelta(days=1)).strftime('%Y-%m-%d')
+        table.put_item(Item={'ticker': 'AAPL', 'timestamp': f'{day}T00:00:00.000001', 'date': day,
+                             'anomaly_type': 'price', 'source': 'backfill'})
+
+        _, first = get('/anomalies')
+        status, second = get('/anomalies', {'since': first['watermark']})
+
+        assert first['watermark'] == f'{day}T00:00:00.000001'
+        assert status == 200
+        assert second['anomalies'] == []
+        assert second['watermark'] == first['watermark']
+
+    @pytest.mark.parametrize('since', ['yesterday', '2026-10-17T00:00:00#price'])
+    def test_invalid_since_rejected(self, table, since):
+        """Test a malformed watermark."""
+        status, _ = get('/anomalies', {'since': since})
+
+        assert status == 400
+
+
+class TestBatchAnomalies:
+    """Test GET /anomalies?tickers= for a watchlist."""
+
+    def test_grouped_latest_per_ticker(self, table):
+        """Test that each ticker gets its newest items, capped by limit."""
+        aapl = [put_anomaly(table, 'AAPL', minutes_ago=m) for m in (90, 60, 30)]
+        put_anomaly(table, 'MSFT', minutes_ago=45)
+
+        status, body = get('/anomalies', {'tickers': 'aapl, MSFT,NVDA,aapl', 'limit': '2'})
+
+        assert status == 200
+        assert body['tickers'] == ['AAPL', 'MSFT', 'NVDA']
+        assert [a['timestamp'] for a in body['anomalies']['AAPL']] == \
+            [aapl[2]['timestamp'], aapl[1]['timestamp']]
+        assert len(body['anomalies']['MSFT']) == 1
+        assert body['anomalies']['NVDA'] == []
+        assert body['count'] == 3
+
+    def test_merged_newest_first(self, table):
+        """Test the single-list layout."""
+        put_anomaly(table, 'AAPL', minutes_ago=60)
+        put_anomaly(table, 'MSFT', minutes_ago=30)
+
+        _, body = get('/anomalies', {'tickers': 'AAPL,MSFT', 'format': 'merged'})
+
+        assert [a['ticker'] for a in body['anomalies']] == ['MSFT', 'AAPL']
+
+    def test_limit_clamped(self, table):
+        """Test that an oversized limit is capped."""
+        _, body = get('/anomalies', {'tickers': 'AAPL', 'limit': '10000'})
+
+        assert body['limit'] == api_handler.MAX_BATCH_LIMIT
+
+    def test_too_many_tickers_rejected(self, table):
+        """Test the watchlist size cap."""
+        tickers = ','.join(f'T{i}' for i in range(api_handler.MAX_BATCH_TICKERS + 1))
+
+        status, _ = get('/anomalies', {'tickers': tickers})
+
+        assert status == 400
+
+    def test_failed_ticker_reported(self, table, monkeypatch):
+        """Test that one failing Query does not fail the request."""
+        query_latest = api_handler.query_latest
+
+        def flaky(client, table_name, ticker, limit):
+            if ticker == 'BAD':
+                raise RuntimeError('throttled')
+            return query_latest(client, table_name, ticker, limit)
+
+        monkeypatch.setattr(api_handler, 'query_latest', flaky)
+        put_anomaly(table, 'AAPL', minutes_ago=10)
+
+        status, body = get('/anomalies', {'tickers': 'AAPL,BAD'})
+
+        assert status == 200
+        assert body['errors'] == {'BAD': 'Query failed'}
+        assert len(body['anomalies']['AAPL']) == 1
+
+
+@pytest.fixture
+def tiers(table, monkeypatch):
+    """Table plus archive bucket, with anomalies on 2026-01-05 (archived) and 2026-03-10."""
+    s3 = boto3.client('s3', region_name='us-east-1')
+    s3.create_bucket(Bucket='stock-scan-data-test')
+    monkeypatch.setenv('S3_BUCKET', 'stock-scan-data-test')
+    monkeypatch.setattr(anomaly_archive, 's3', s3)
+    monkeypatch.setattr(anomaly_archive, 'anomalies_table', table)
+    monkeypatch.setattr(anomaly_archive, '_manifest_cache', {})
+    for ticker, day in (('AAPL', '2026-01-05'), ('MSFT', '2026-01-05'), ('AAPL', '2026-03-10')):
+        table.put_item(Item={'ticker': ticker, 'timestamp': f'{day}T15:30:00', 'date': day,
+                             'anomaly_type': 'price', 'z_score': Decimal('3.1')})
+    anomaly_archive.run_archive('stock-scan-data-test', start='2026-01-01', through='2026-02-12',
+                                now=datetime(2026, 3, 15))
+    # TTL has removed the archived items from the table
+    table.delete_item(Key={'ticker': 'AAPL', 'timestamp': '2026-01-05T15:30:00'})
+    table.delete_item(Key={'ticker': 'MSFT', 'timestamp': '2026-01-05T15:30:00'})
+    return table
+
+
+class TestRangeAnomalies:
+    """Test ?start=&end= ranges spanning archived and recent dates."""
+
+    def test_range_merges_archive_and_table(self, tiers):
+        """Test that archived and hot anomalies come back together, newest first."""
+        status, body = get('/anomalies', {'start': '2026-01-01', 'end': '2026-03-31'})
+
+        assert status == 200
+        assert [(a['ticker'], a['date']) for a in body['anomalies']] == \
+            [('AAPL', '2026-03-10'), ('MSFT', '2026-01-05'), ('AAPL', '2026-01-05')]
+        assert body['archived'] == 2
+
+    def test_ticker_range(self, tiers):
+        """Test a ticker's history across both tiers."""
+        result = api_handler.lambda_handler({
+            'httpMethod': 'GET',
+            'path': '/anomalies/aapl',
+            'pathParameters': {'ticker': 'aapl'},
+            'queryStringParameters': {'start': '2026-01-01', 'end': '2026-03-31'}
+        }, None)
+        body = json.loads(result['body'])
+
+        assert body['ticker'] == 'AAPL'
+        assert [a['date'] for a in body['anomalies']] == ['2026-03-10', '2026-01-05']
+
+    def test_oversized_range_rejected(self, tiers):
+        """Test the range cap."""
+        status, _ = get('/anomalies', {'start': '2020-01-01', 'end': '2026-01-01'})
+
+        assert status == 400
+
+
+class TestExport:
+    """Test GET /anomalies/export across both tiers."""
+
+    def export(self, query):
+        return api_handler.lambda_handler({
+            'httpMethod': 'GET',
+            'path': '/anomalies/export',
+            'queryStringParameters': query
+        }, None)
+
+    def test_ndjson_oldest_first(self, tiers, monkeypatch):
+        """Test that archived and table anomalies stream as NDJSON lines."""
+        monkeypatch.setattr(api_handler, 'MAX_SYNC_EXPORT_DAYS', 90)
+
+        result = self.export({'start': '2026-01-01', 'end': '2026-03-31'})
+
+        assert result['statusCode'] == 200
+        assert result['headers']['Content-Type'] == 'application/x-ndjson'
+        rows = [json.loads(line) for line in result['body'].splitlines()]
+        assert [(r['ticker'], r['date']) for r in rows] == \
+            [('AAPL', '2026-01-05'), ('MSFT', '2026-01-05'), ('AAPL', '2026-03-10')]
+        assert rows[0]['z_score'] == 3.1
+
+    def test_csv_filtered_by_ticker_and_severity(self, tiers):
+        """Test the CSV layout and the ticker and severity filters."""
+        for day, severity in (('2026-03-11', 'high'), ('2026-03-12', 'medium')):
+            tiers.put_item(Item={'ticker': 'AAPL', 'timestamp': f'{day}T15:30:00', 'date': day,
+                                 'anomaly_type': 'volume', 'severity': severity, 'horizon': 5})
+
+        result = self.export({'format': 'csv', 'ticker': 'aapl', 'severity': 'high',
+                              'start': '2026-03-01', 'end': '2026-03-31'})
+
+        assert result['headers']['Content-Type'] == 'text/csv'
+        lines = result['body'].splitlines()
+        assert lines[0].startswith('ticker,timestamp,date,anomaly_type')
+        assert len(lines) == 2
+        assert lines[1].startswith('AAPL,2026-03-11T15:30:00,2026-03-11,volume')
+        assert lines[1].endswith('"{""horizon"":5}"')
+
+    def test_large_export_uploaded_to_s3(self, tiers, monkeypatch):
+        """Test that an export over the inline limit comes back as a presigned URL."""
+        s3 = boto3.client('s3', region_name='us-east-1')
+        monkeypatch.setattr(anomaly_export, 's3', s3)
+        monkeypatch.setattr(anomaly_export, 'MAX_INLINE_BYTES', 100)
+        monkeypatch.setattr(api_handler, 'MAX_SYNC_EXPORT_DAYS', 90)
+
+        result = self.export({'start': '2026-01-01', 'end': '2026-03-31'})
+        body = json.loads(result['body'])
+
+        assert body['count'] == 3
+        assert body['url'].startswith('https://')
+        key = body['url'].split('.amazonaws.com/')[1].split('?')[0]
+        exported = s3.get_object(Bucket='stock-scan-data-test', Key=key)['Body'].read()
+        assert len(exported.splitlines()) == 3
+
+    def test_long_range_runs_as_job(self, tiers, monkeypatch):
+        """Test that a multi-year export is handed to the export function and polled."""
+        s3 = boto3.client('s3', region_name='us-east-1')
+        monkeypatch.setattr(anomaly_export, 's3', s3)
+        monkeypatch.setattr(anomaly_export, 'anomalies_table', tiers)
+        invocations = []
+
+        def invoke(FunctionName, InvocationType, Payload):
+            invocations.append((FunctionName, InvocationType))
+            anomaly_export.lambda_handler(json.loads(Payload), None)
+            return {'StatusCode': 202}
+
+        monkeypatch.setattr(anomaly_export, 'lambda_client', Mock(invoke=Mock(side_effect=invoke)))
+
+        result = self.export({'start': '2024-01-01', 'end': '2026-03-31'})
+        started = json.loads(result['body'])
+
+        assert result['statusCode'] == 202
+        assert invocations == [('stock-anomaly-export', 'Event')]
+        status = api_handler.lambda_handler({
+            'httpMethod': 'GET',
+            'path': started['poll'],
+            'pathParameters': {'job_id': started['job_id']}
+        }, None)
+        body = json.loads(status['body'])
+        assert status['statusCode'] == 200
+        assert body['status'] == 'complete'
+        assert body['count'] == 3
+        key = body['url'].split('.amazonaws.com/')[1].split('?')[0]
+        exported = s3.get_object(Bucket='stock-scan-data-test', Key=key)['Body'].read()
+        assert len(exported.splitlines()) == 3
+
+    @pytest.mark.parametrize('start,end,max_items', [
+        ('2026-01-01', '2026-03-31', 20000),
+        ('2026-01-01', '2026-01-31', 1),
+    ])
+    def test_request_cutoff_by_estimated_work(self, tiers, monkeypatch, start, end, max_items):
+        """Test that over a month, or a month of many archived anomalies, runs as a job."""
+        monkeypatch.setattr(api_handler, 'MAX_SYNC_EXPORT_ITEMS', max_items)
+        start_job = Mock(return_value={'job_id': 'abc123', 'status': 'running'})
+        monkeypatch.setattr(api_handler, 'start_export_job', start_job)
+
+        result = self.export({'start': start, 'end': end})
+
+        assert result['statusCode'] == 202
+        assert start_job.call_args[0][1:3] == (start, end)
+
+    def test_unknown_job(self, tiers, monkeypatch):
+        """Test polling a job that does not exist."""
+        monkeypatch.setattr(anomaly_export, 's3', boto3.client('s3', region_name='us-east-1'))
+
+        status, _ = get('/anomalies/export/jobs/0123abcd')
+
+        assert status == 404
+
+    def test_invalid_format_rejected(self, tiers):
+        """Test that only NDJSON and CSV are offered."""
+        assert self.export({'format': 'xml'})['statusCode'] == 400
+
+
+class TestResponse:
+    """Test response encoding."""
+
+    def test_decimals_serialized(self):
+        """Test that DynamoDB Decimals become JSON numbers."""
+        result = api_handler.response(200, {'z': Decimal('3.25'), 'volume': Decimal('50000000')})
+
+        assert json.loads(result['body']) == {'z': 3.25, 'volume': 50000000}
@@ -0,0 +1,171 @@
+"""
+Unit tests for the raw-data archive query tool.
+Tests partition pruning, derived columns, predicates and aggregates.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../lambda'))
+
+import pytest
+import io
+import json
+from datetime import date, timedelta
+
+from archive_query import LocalSource, QueryError, RollingColumn, main, run_query, write_rows
+from raw_archive import encode_partition, encode_segment
+
+
+def write_archive(root, ticker='AAPL', spike_date='2025-03-14'):
+    """Jan-Apr 2025 daily bars as monthly partitions plus one pending segment."""
+    bars = []
+    day = date(2025, 1, 1)
+    while day <= date(2025, 4, 30):
+        bars.append({'date': day.isoformat(), 'open': 100.0, 'high': 101.0, 'low': 99.0,
+                     'close': 100.0 + (day.day % 3), 'volume': 1000000 + (day.day % 5) * 1000})
+        day += timedelta(days=1)
+    for bar in bars:
+        if bar['date'] == spike_date:
+            bar['volume'] = 5000000
+
+    ticker_dir = root / ticker
+    (ticker_dir / 'monthly').mkdir(parents=True)
+    (ticker_dir / 'segments').mkdir()
+    months = sorted({b['date'][:7] for b in bars})
+    for month in months[:-1]:
+        part = [b for b in bars if b['date'][:7] == month]
+        (ticker_dir / 'monthly' / f'{month}.ndjson').write_bytes(encode_partition(part))
+    pending = [b for b in bars if b['date'][:7] == months[-1]]
+    segment = f'raw-data/{ticker}/segments/20250430-210000-000000.ndjson'
+    (ticker_dir / 'segments' / '20250430-210000-000000.ndjson').write_bytes(encode_segment(pending))
+    (ticker_dir / 'manifest.json').write_text(json.dumps({
+        'ticker': ticker, 'months': months[:-1], 'last_date': bars[-1]['date'],
+        'segments': [{'key': segment, 'first_date': pending[0]['date'],
+                      'last_date': pending[-1]['date'], 'bars': len(pending)}]
+    }))
+
+
+class ReadCounter(LocalSource):
+    """LocalSource that records which objects were read."""
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.reads = []
+
+    def read(self, key, byte_range=None):
+        self.reads.append((key, byte_range))
+        return super().read(key, byte_range)
+
+
+class TestQuery:
+    """Test filtering and projection."""
+
+    def test_volume_spike_query(self, tmp_path):
+        """Test the "volume > 2x its 20-day mean" question."""
+        write_archive(tmp_path)
+        source = LocalSource(str(tmp_path))
+
+        rows = list(run_query(source, ['AAPL'], start='2025-03-01', end='2025-03-31',
+                              columns=['date', 'volume'], where='volume > 2 * volume_mean20'))
+
+        assert rows == [{'date': '2025-03-14', 'volume': 5000000}]
+
+    def test_derived_columns_on_same_field(self, tmp_path):
+        """Test that mean and z-score windows over one field are independent."""
+        write_archive(tmp_path)
+
+        rows = list(run_query(LocalSource(str(tmp_path)), ['AAPL'], start='2025-03-14',
+                              end='2025-03-14', columns=['volume_mean20', 'volume_z20']))
+
+        assert 1000000 < rows[0]['volume_mean20'] < 1005000
+        assert rows[0]['volume_z20'] > 3
+
+    def test_rolling_window_carried_across_batches(self):
+        """Test that batched prefix sums match a direct window over the previous N values."""
+        values = [100.0 + (i * 7919 % 13) - (i % 4) * 2.5 for i in range(60)]
+        values[10] = None
+        column = RollingColumn('close', 'z', 5)
+        state = {}
+
+        out = column.compute(values[:23], state) + column.compute(values[23:], state)
+
+        seen = []
+        for x, got in zip(values, out):
+            if len(seen) < 5 or x is None:
+                assert got is None
+            else:
+                window = seen[-5:]
+                mean = sum(window) / 5
+                std = (sum((v - mean) ** 2 for v in window) / 4) ** 0.5
+                assert got == pytest.approx((x - mean) / std)
+            if x is not None:
+                seen.append(x)
+
+    def test_partitions_pruned_to_window_and_warmup(self, tmp_path):
+        """Test that only the needed months are read, as byte ranges."""
+        write_archive(tmp_path)
+        source = ReadCounter(str(tmp_path))
+
+        list(run_query(source, ['AAPL'], start='2025-03-10', end='2025-03-12',
+                       where='volume > 2 * volume_mean20'))
+
+        partitions = [r for r in source.reads if '/monthly/' in r[0]]
+        assert [key for key, _ in partitions] == [
+            'AAPL/monthly/2025-01.ndjson', 'AAPL/monthly/2025-02.ndjson', 'AAPL/monthly/2025-03.ndjson'
+        ]
+        assert partitions[-1][1] is not None
+        assert not any('/segments/' in key for key, _ in source.reads)
+
+    def test_pending_segment_included(self, tmp_path):
+        """Test that bars not yet compacted are queried."""
+        write_archive(tmp_path)
+
+        rows = list(run_query(LocalSource(str(tmp_path)), ['AAPL'], start='2025-04-29',
+                              columns=['date']))
+
+        assert rows == [{'date': '2025-04-29'}, {'date': '2025-04-30'}]
+
+    def test_rejects_unknown_names_and_syntax(self, tmp_path):
+        """Test that expressions are restricted."""
+        source = LocalSource(str(tmp_path))
+
+        with pytest.raises(QueryError):
+            list(run_query(source, [], where='price > 1'))
+        with pytest.raises(QueryError):
+            list(run_query(source, [], where='__import__("os")'))
+
+
+class TestAggregates:
+    """Test grouped aggregates."""
+
+    def test_grouped_by_month(self, tmp_path):
+        """Test count, mean and max per month."""
+        write_archive(tmp_path)
+
+        rows = list(run_query(LocalSource(str(tmp_path)), ['AAPL'], start='2025-01-01',
+                              end='2025-02-28', aggregates=['count', 'mean(close)', 'max(volume)'],
+                              group_by=['month']))
+
+        assert [r['month'] for r in rows] == ['2025-01', '2025-02']
+        assert rows[0]['count'] == 31
+        assert rows[1]['count'] == 28
+        assert rows[0]['max(volume)'] == 1004000
+
+    def test_cli_streams_csv(self, tmp_path, capsys):
+        """Test the command line entry point."""
+        write_archive(tmp_path / 'raw')
+        output = tmp_path / 'out.csv'
+
+        main(['--source', str(tmp_path / 'raw'), '--start', '2025-03-01', '--end', '2025-03-31',
+              '--where', 'volume_z20 > 3', '--columns', 'ticker,date,volume_z20',
+              '--output', str(output)])
+
+        lines = output.read_text().splitlines()
+        assert lines[0] == 'ticker,date,volume_z20'
+        assert lines[1].startswith('AAPL,2025-03-14,')
+
+    def test_write_ndjson(self):
+        """Test NDJSON output."""
+        out = io.StringIO()
+
+        assert write_rows(iter([{'a': 1}, {'a': 2}]), out, 'ndjson') == 2
+        assert out.getvalue() == '{"a": 1}\n{"a": 2}\n'
@@ -0,0 +1,176 @@
+"""
+Unit tests for the local backfill runner.
+Tests history loading, multi-process re-scoring and resume.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../lambda'))
+
+import pytest
+import json
+from datetime import datetime
+
+from backfill import (
+    NdjsonWriter,
+    backfill_timestamp,
+    list_tickers,
+    load_local_history,
+    run_backfill
+)
+from detectors import DETECTORS, FIELDS, HORIZONS
+
+
+class TestBackfillTimestamp:
+    """Test the deterministic sort keys of re-scored anomalies."""
+
+    def test_every_detector_type_has_its_own_key(self):
+        """Test that keys are valid, ordered and unique for every field and detector variant."""
+        variants = sorted(DETECTORS) + [f'{h}d' for h in HORIZONS]
+        types = [prefix if variant == 'zscore' else f'{prefix}_{variant}'
+                 for prefix in FIELDS for variant in variants]
+
+        keys = [backfill_timestamp('2026-01-25', t) for t in types]
+
+        assert len(set(keys)) == len(types)
+        assert all(datetime.fromisoformat(k).date().isoformat() == '2026-01-25' for k in keys)
+
+    def test_unknown_type_rejected(self):
+        """Test that a type without a slot fails instead of sharing a key."""
+        with pytest.raises(ValueError, match='BACKFILL_TYPES'):
+            backfill_timestamp('2026-01-25', 'price_new')
+
+
+def write_history(root, ticker, spike_day=25):
+    """Write 30 days of history split across two raw-data objects."""
+    bars = [
+        {'date': f'2026-01-{i:02d}', 'close': 150.0 + (i % 5) * 0.5,
+         'volume': 50000000 + (i % 5) * 100000}
+        for i in range(1, 31)
+    ]
+    bars[spike_day - 1]['close'] = 170.0
+    ticker_dir = root / ticker
+    ticker_dir.mkdir()
+    (ticker_dir / '20260115-000000.json').write_text(json.dumps(bars[:20]))
+    # Overlapping second object, as written by hourly runs
+    (ticker_dir / '20260130-000000.json').write_text(json.dumps(bars[10:]))
+
+
+class TestHistoryLoading:
+    """Test reading a local raw-data mirror."""
+
+    def test_overlapping_objects_are_merged(self, tmp_path):
+        """Test that bars are deduplicated by date and sorted."""
+        write_history(tmp_path, 'AAPL')
+
+        bars = load_local_history(str(tmp_path), 'AAPL')
+
+        assert len(bars) == 30
+        assert bars[0]['date'] == '2026-01-01'
+        assert bars[-1]['date'] == '2026-01-30'
+
+    def test_partitions_and_segments_merged(self, tmp_path):
+        """Test a mirror of the append-only layout; segments win."""
+        from raw_archive import encode_partition, encode_segment
+        bars = [{'date': f'2026-01-{i:02d}', 'close': 150.0, 'volume': 50000000}
+                for i in range(1, 21)]
+        revised = dict(bars[-1], close=155.0)
+        ticker_dir = tmp_path / 'AAPL'
+        (ticker_dir / 'monthly').mkdir(parents=True)
+        (ticker_dir / 'segments').mkdir()
+        (ticker_dir / 'manifest.json').write_text(json.dumps({'ticker': 'AAPL'}))
+        (ticker_dir / 'monthly' / '2026-01.ndjson').write_bytes(encode_partition(bars))
+        (ticker_dir / 'segments' / '20260120-150000-000000.ndjson').write_bytes(encode_segment([revised]))
+
+        loaded = load_local_history(str(tmp_path), 'AAPL')
+
+        assert len(loaded) == 20
+        assert loaded[-1]['close'] == 155.0
+
+    def test_list_tickers(self, tmp_path):
+        """Test ticker discovery from directory names."""
+        write_history(tmp_path, 'AAPL')
+        write_history(tmp_path, 'MSFT')
+
+        assert list_tickers(str(tmp_path)) == ['AAPL', 'MSFT']
+
+
+class TestRunBackfill:
+    """Test the process-pool runner."""
+
+    def test_rescores_and_writes_anomalies(self, tmp_path):
+        """Test that the spike day is found for every ticker."""
+        source = tmp_path / 'raw'
+        source.mkdir()
+        write_history(source, 'AAPL')
+        write_history(source, 'MSFT')
+        output = tmp_path / 'out.ndjson'
+        writer = NdjsonWriter(str(output))
+
+        totals = run_backfill(['AAPL', 'MSFT'], str(source), writer, workers=2,
+                              checkpoint=str(tmp_path / 'ckpt'), progress=None)
+        writer.close()
+
+        records = [json.loads(line) for line in output.read_text().splitlines()]
+        spikes = [r for r in records if r['date'] == '2026-01-25' and r['anomaly_type'] == 'price']
+        assert totals['tickers'] == 2
+        assert totals['bars'] == 20
+        assert len(spikes) == 2
+        assert spikes[0]['timestamp'] == backfill_timestamp('2026-01-25', 'price')
+        assert datetime.fromisoformat(spikes[0]['timestamp']).date().isoformat() == '2026-01-25'
+
+    def test_resume_skips_completed_tickers(self, tmp_path):
+        """Test that tickers in the checkpoint are not re-scored."""
+        source = tmp_path / 'raw'
+        source.mkdir()
+        write_history(source, 'AAPL')
+        write_history(source, 'MSFT')
+        checkpoint = tmp_path / 'ckpt'
+        checkpoint.write_text('AAPL\n')
+        writer = NdjsonWriter(str(tmp_path / 'out.ndjson'))
+
+        totals = run_backfill(['AAPL', 'MSFT'], str(source), writer, workers=1,
+                              checkpoint=str(checkpoint), resume=True, progress=None)
+        writer.close()
+
+        assert totals['skipped'] == 1
+        assert totals['tickers'] == 1
+        assert checkpoint.read_text().split() == ['AAPL', 'MSFT']
+
+    def test_history_store_reused_between_runs(self, tmp_path):
+        """Test that a second run reads the mapped store, not the JSON source."""
+        source = tmp_path / 'raw'
+        source.mkdir()
+        write_history(source, 'AAPL')
+        store = str(tmp_path / 'store')
+        writer = NdjsonWriter(str(tmp_path / 'out.ndjson'))
+
+        first = run_backfill(['AAPL'], str(source), writer, workers=1, progress=None,
+                             checkpoint=str(tmp_path / 'ckpt'), store_root=store)
+        for path in (source / 'AAPL').iterdir():
+            path.unlink()
+        second = run_backfill(['AAPL'], str(source), writer, workers=1, progress=None,
+                              checkpoint=str(tmp_path / 'ckpt'), store_root=store)
+        writer.close()
+
+        assert first['anomalies'] == second['anomalies'] > 0
+        assert second['bars'] == 10
+
+    def test_horizons_scored_over_full_history(self, tmp_path):
+        """Test that horizon anomalies are found for every day in range."""
+        source = tmp_path / 'raw'
+        source.mkdir()
+        write_history(source, 'AAPL')
+        output = tmp_path / 'out.ndjson'
+        writer = NdjsonWriter(str(output))
+
+        run_backfill(['AAPL'], str(source), writer, start='2026-01-25', end='2026-01-25',
+                     detectors=['horizons'], workers=1,
+                     checkpoint=str(tmp_path / 'ckpt'), progress=None)
+        writer.close()
+
+        records = [json.loads(line) for line in output.read_text().splitlines()]
+        assert {r['anomaly_type'] for r in records} >= {'price_5d', 'price_20d'}
+        assert {r['date'] for r in records} == {'2026-01-25'}
+        assert records[0]['timestamp'] == backfill_timestamp('2026-01-25', records[0]['anomaly_type'])
+        # One sort key per type, so types of the same date never overwrite each other
+        assert len({r['timestamp'] for r in records}) == len(records)
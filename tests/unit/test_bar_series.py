@@ -0,0 +1,84 @@
+"""
+Unit tests for the columnar BarSeries type.
+Tests dict round-trips, zero-copy slicing and detector compatibility.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../lambda'))
+
+import pytest
+
+from bar_series import BarSeries, as_records
+from detectors import run_detectors
+
+
+def make_records(days=21):
+    return [
+        {'date': f'2026-01-{i:02d}', 'open': 149.5, 'high': 151.0, 'low': 149.0,
+         'close': 150.0 + (i % 5) * 0.5, 'volume': 50000000 + i}
+        for i in range(1, days + 1)
+    ]
+
+
+class TestConversion:
+    """Test conversion at the dict edges."""
+
+    def test_round_trip(self):
+        """Test that records survive a round trip unchanged."""
+        records = make_records()
+
+        assert BarSeries.from_records(records).to_records() == records
+
+    def test_missing_fields_are_omitted(self):
+        """Test that fields absent from the source are not invented."""
+        records = [{'date': '2026-01-01', 'close': 150.0, 'volume': 100}]
+
+        assert BarSeries.from_records(records).to_records() == records
+
+    def test_as_records_passes_lists_through(self):
+        """Test that list input is returned as-is."""
+        records = make_records(2)
+
+        assert as_records(records) is records
+        assert as_records(BarSeries.from_records(records)) == records
+
+
+class TestColumnarAccess:
+    """Test column views and slicing."""
+
+    def test_slice_shares_buffer(self):
+        """Test that a baseline window does not copy the column."""
+        series = BarSeries.from_records(make_records())
+        window = series[-21:-1]
+
+        assert len(window) == 20
+        assert window.close.obj is series.close.obj
+
+    def test_index_returns_bar_dict(self):
+        """Test that integer indexing yields the dict format."""
+        series = BarSeries.from_records(make_records())
+
+        assert series[-1]['date'] == '2026-01-21'
+        assert series[-1]['volume'] == 50000021
+
+    def test_compact_storage(self):
+        """Test that storage is 44 bytes per bar (int32 date + 5 doubles)."""
+        series = BarSeries.from_records(make_records())
+
+        assert series.nbytes == 21 * 44
+
+
+class TestDetectorCompatibility:
+    """Test that detectors give identical results for both formats."""
+
+    def test_same_anomalies_as_dicts(self):
+        """Test scoring a BarSeries matches scoring the dicts."""
+        records = make_records()
+        records[-1]['close'] = 170.0
+
+        from_dicts, _ = run_detectors('AAPL', records, 2.0, ['zscore', 'ewma', 'mad'])
+        from_series, _ = run_detectors('AAPL', BarSeries.from_records(records), 2.0,
+                                       ['zscore', 'ewma', 'mad'])
+
+        strip = lambda items: [{k: v for k, v in a.items() if k != 'timestamp'} for a in items]
+        assert strip(from_series) == strip(from_dicts)
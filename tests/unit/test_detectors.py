@@ -0,0 +1,196 @@
+"""
+Unit tests for the pluggable anomaly detectors.
+Tests the detector registry, per-ticker selection and timing reports.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../lambda'))
+
+import pytest
+from datetime import date, timedelta
+from statistics import mean, stdev
+
+from detectors import (
+    DETECTORS,
+    HISTORY_DAYS,
+    HORIZON_HISTORY_DAYS,
+    HORIZONS,
+    PrefixSums,
+    SeriesStats,
+    detectors_for_ticker,
+    history_days,
+    horizon_anomalies,
+    horizon_scores,
+    resolve_detectors,
+    run_detectors
+)
+from market_calendar import MarketCalendar
+
+
+def make_data(current_close=150.0, current_volume=50000000):
+    """Build 20 baseline days plus one current day."""
+    baseline = [
+        {'date': f'2026-01-{i:02d}', 'close': 150.0 + (i % 5) * 0.5,
+         'volume': 50000000 + (i % 5) * 100000}
+        for i in range(1, 21)
+    ]
+    current = {'date': '2026-01-21', 'close': current_close, 'volume': current_volume}
+    return baseline + [current]
+
+
+class TestRegistry:
+    """Test detector registration and selection."""
+
+    def test_builtin_detectors_registered(self):
+        """Test that all built-in detectors are available."""
+        assert {'zscore', 'ewma', 'mad'} <= set(DETECTORS)
+
+    def test_unknown_detector_ignored(self):
+        """Test that unknown detector names are dropped."""
+        assert resolve_detectors(['zscore', 'nope']) == ['zscore']
+
+    def test_empty_selection_falls_back_to_default(self):
+        """Test that an empty selection uses the default detectors."""
+        assert resolve_detectors([]) == ['zscore']
+
+    def test_per_ticker_config(self):
+        """Test per-ticker detector selection with default fallback."""
+        config = {'default': ['zscore'], 'TSLA': ['zscore', 'mad']}
+
+        assert detectors_for_ticker(config, 'tsla') == ['zscore', 'mad']
+        assert detectors_for_ticker(config, 'AAPL') == ['zscore']
+        assert detectors_for_ticker(None, 'AAPL') == ['zscore']
+
+
+class TestSeriesStats:
+    """Test the shared single-pass baseline statistics."""
+
+    def test_mean_and_std_match_statistics_module(self):
+        """Test that shifted sums reproduce mean and sample stdev."""
+        values = [50000000 + (i % 5) * 100000 for i in range(20)]
+        stats = SeriesStats(values, 0)
+
+        assert stats.mean == pytest.approx(mean(values))
+        assert stats.std == pytest.approx(stdev(values))
+
+    def test_constant_series_has_zero_std(self):
+        """Test that a flat baseline has no spread."""
+        stats = SeriesStats([100.0] * 20, 100.0)
+
+        assert stats.std == 0.0
+
+
+class TestRunDetectors:
+    """Test running several detectors in one pass."""
+
+    def test_all_detectors_flag_price_spike(self):
+        """Test that every detector flags a large price move."""
+        anomalies, _ = run_detectors('AAPL', make_data(current_close=170.0), 2.0,
+                                     ['zscore', 'ewma', 'mad'])
+
+        types = {a['anomaly_type'] for a in anomalies}
+        assert {'price', 'price_ewma', 'price_mad'} <= types
+
+    def test_zscore_keeps_original_anomaly_types(self):
+        """Test that z-score records keep the 'price'/'volume' types."""
+        anomalies, _ = run_detectors('AAPL', make_data(current_close=170.0), 2.0)
+
+        assert [a['anomaly_type'] for a in anomalies] == ['price']
+        assert anomalies[0]['detector'] == 'zscore'
+
+    def test_timings_reported_per_detector(self):
+        """Test that timings include every selected detector."""
+        _, timings = run_detectors('AAPL', make_data(), 2.0, ['zscore', 'mad'])
+
+        assert set(timings) == {'prepare', 'zscore', 'mad'}
+        assert all(t >= 0 for t in timings.values())
+
+    def test_no_anomalies_for_normal_day(self):
+        """Test that a normal day is not flagged by any detector."""
+        anomalies, _ = run_detectors('AAPL', make_data(current_close=151.0,
+                                                        current_volume=50200000),
+                                     2.0, ['zscore', 'ewma', 'mad'])
+
+        assert anomalies == []
+
+
+def make_history(days=61, close=150.0, volume=50000000):
+    """Build a steady series with a small repeating wobble."""
+    return [
+        {'date': f'day-{i:03d}', 'close': close + (i % 5) * 0.5,
+         'volume': volume + (i % 7) * 100000}
+        for i in range(days)
+    ]
+
+
+class TestHorizons:
+    """Test multi-horizon scoring from prefix sums."""
+
+    def test_prefix_windows_match_statistics_module(self):
+        """Test that O(1) windows agree with a direct computation."""
+        values = [50000000 + (i * 7919) % 300000 for i in range(80)]
+        sums = PrefixSums(values)
+
+        for start, end in [(0, 5), (10, 30), (15, 75)]:
+            window_mean, window_std = sums.window(start, end)
+            assert window_mean == pytest.approx(mean(values[start:end]))
+            assert window_std == pytest.approx(stdev(values[start:end]))
+
+    def test_scores_aligned_and_none_before_horizon(self):
+        """Test that days without a full horizon are not scored."""
+        values = [float(i % 4) for i in range(70)]
+
+        scores = horizon_scores(values, horizons=(5, 60))
+
+        assert scores[5][4] is None
+        assert scores[5][5] is not None
+        assert scores[60][59] is None
+        score, center, _ = scores[60][65]
+        assert center == pytest.approx(mean(values[5:65]))
+
+    def test_short_horizon_sees_level_shift_long_horizon_does_not(self):
+        """Test that each horizon is reported as its own anomaly type."""
+        data = make_history()
+        # A step held for the last 5 days is normal for 5d, unusual for 60d
+        for bar in data[-5:]:
+            bar['close'] += 10.0
+
+        types = {a['anomaly_type'] for a in horizon_anomalies('AAPL', data, 2.0)}
+
+        assert 'price_60d' in types
+        assert 'price_5d' not in types
+
+    def test_run_detectors_with_horizons(self):
+        """Test horizons alongside the fixed-window detectors."""
+        data = make_history()
+        data[-1]['volume'] = 90000000
+
+        anomalies, timings = run_detectors('AAPL', data, 2.0, ['zscore', 'horizons'])
+
+        assert {'volume', 'volume_5d', 'volume_20d', 'volume_60d'} <= {a['anomaly_type'] for a in anomalies}
+        assert {a['horizon'] for a in anomalies if 'horizon' in a} == {5, 20, 60}
+        assert {a['detector'] for a in anomalies if 'horizon' in a} == {'horizons'}
+        assert set(timings) == {'horizons', 'prepare', 'zscore'}
+
+    def test_history_days_extended_for_horizons(self):
+        """Test that scans fetch enough history for the 60-day horizon."""
+        assert history_days(['zscore']) == HISTORY_DAYS
+        assert history_days(['zscore', 'horizons']) == HORIZON_HISTORY_DAYS
+
+    @pytest.mark.parametrize('today', [date(2026, 10, 19), date(2027, 1, 4), date(2026, 4, 6)])
+    def test_history_days_counted_in_sessions(self, today):
+        """Test that the window holds the 60-day horizon plus slack, over holidays."""
+        calendar = MarketCalendar()
+        days = history_days(['horizons'], calendar, today=today)
+
+        sessions = sum(calendar.is_trading_day(today - timedelta(days=d)) for d in range(1, days + 1))
+        assert sessions == max(HORIZONS) + 1 + 5
+        assert calendar.is_trading_day(today - timedelta(days=days))
+
+    def test_short_history_logged(self, caplog):
+        """Test that horizons without enough bars are reported, not skipped silently."""
+        with caplog.at_level('WARNING'):
+            types = {a['anomaly_type'] for a in horizon_anomalies('AAPL', make_history(30), 0.1)}
+
+        assert not any(t.endswith('_60d') for t in types)
+        assert 'Only 30 bars for AAPL, skipping horizons: 60d' in caplog.text
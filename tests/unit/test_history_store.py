@@ -0,0 +1,110 @@
+"""
+Unit tests for the memory-mapped history store.
+Tests appends, zero-copy windows and reader/writer interaction.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../lambda'))
+
+import pytest
+import mmap
+from concurrent.futures import ProcessPoolExecutor
+
+from history_store import RECORD, HistoryReader, HistoryWriter
+from detectors import run_detectors
+
+
+def make_records(first=1, last=30):
+    return [
+        {'date': f'2026-01-{i:02d}', 'open': 149.5, 'high': 151.0, 'low': 149.0,
+         'close': 150.0 + (i % 5) * 0.5, 'volume': 50000000 + i}
+        for i in range(first, last + 1)
+    ]
+
+
+def count_in_other_process(root):
+    """Open a fresh reader in a separate process."""
+    return len(HistoryReader(root).series('AAPL'))
+
+
+class TestAppend:
+    """Test the append-only writer."""
+
+    def test_round_trip(self, tmp_path):
+        """Test that stored bars read back unchanged."""
+        records = make_records()
+        HistoryWriter(str(tmp_path)).append('AAPL', records)
+
+        series = HistoryReader(str(tmp_path)).series('AAPL')
+
+        assert series.to_records() == records
+
+    def test_only_newer_bars_appended(self, tmp_path):
+        """Test that overlapping hourly fetches do not duplicate bars."""
+        writer = HistoryWriter(str(tmp_path))
+
+        assert writer.append('AAPL', make_records(1, 20)) == 20
+        assert writer.append('AAPL', make_records(10, 25)) == 5
+        assert len(HistoryReader(str(tmp_path)).series('AAPL')) == 25
+
+    def test_uncommitted_tail_is_discarded(self, tmp_path):
+        """Test recovery from a writer that died before writing the index."""
+        writer = HistoryWriter(str(tmp_path))
+        writer.append('AAPL', make_records(1, 5))
+        with open(tmp_path / 'AAPL.bars', 'ab') as f:
+            f.write(b'\x00' * (RECORD.size + 3))
+
+        writer.append('AAPL', make_records(6, 6))
+
+        assert os.path.getsize(tmp_path / 'AAPL.bars') == 6 * RECORD.size
+        assert HistoryReader(str(tmp_path)).series('AAPL')[-1]['date'] == '2026-01-06'
+
+    def test_missing_ticker(self, tmp_path):
+        """Test that an unknown ticker reads as None."""
+        assert HistoryReader(str(tmp_path)).series('NOPE') is None
+
+
+class TestReader:
+    """Test zero-copy windows and concurrent access."""
+
+    def test_window_by_date(self, tmp_path):
+        """Test slicing a date range through the index."""
+        HistoryWriter(str(tmp_path)).append('AAPL', make_records())
+
+        window = HistoryReader(str(tmp_path)).window('AAPL', '2026-01-10', '2026-01-14')
+
+        assert [bar['date'] for bar in window] == [f'2026-01-{i}' for i in range(10, 15)]
+
+    def test_columns_are_views_into_the_map(self, tmp_path):
+        """Test that columns are not copied out of the mapped file."""
+        HistoryWriter(str(tmp_path)).append('AAPL', make_records())
+
+        series = HistoryReader(str(tmp_path)).tail('AAPL', 21)
+
+        assert isinstance(series.close.obj, mmap.mmap)
+        assert len(series) == 21
+
+    def test_detectors_run_on_mapped_series(self, tmp_path):
+        """Test scoring straight from the store."""
+        records = make_records(1, 21)
+        records[-1]['close'] = 170.0
+        HistoryWriter(str(tmp_path)).append('AAPL', records)
+
+        anomalies, _ = run_detectors('AAPL', HistoryReader(str(tmp_path)).tail('AAPL', 21), 2.0)
+
+        assert [a['anomaly_type'] for a in anomalies] == ['price']
+
+    def test_reader_sees_only_committed_bars(self, tmp_path):
+        """Test that a reader keeps a stable snapshot while the writer appends."""
+        root = str(tmp_path)
+        writer = HistoryWriter(root)
+        writer.append('AAPL', make_records(1, 10))
+        reader = HistoryReader(root)
+        before = reader.series('AAPL')
+
+        writer.append('AAPL', make_records(11, 20))
+
+        assert len(before) == 10
+        assert len(reader.series('AAPL')) == 20
+        with ProcessPoolExecutor(max_workers=2) as pool:
+            assert list(pool.map(count_in_other_process, [root, root])) == [20, 20]
@@ -0,0 +1,105 @@
+"""
+Unit tests for the trading calendar.
+Tests holiday rules, early closes, DST-correct sessions and schedules.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../lambda'))
+
+import pytest
+from datetime import date, datetime, time, timezone
+
+from market_calendar import MarketCalendar, exchange_early_closes, exchange_holidays
+
+
+class TestHolidays:
+    """Test the exchange holiday rules."""
+
+    def test_2026_holidays(self):
+        """Test a year with a Saturday Independence Day (observed Friday)."""
+        assert sorted(exchange_holidays(2026)) == [
+            date(2026, 1, 1), date(2026, 1, 19), date(2026, 2, 16), date(2026, 4, 3),
+            date(2026, 5, 25), date(2026, 6, 19), date(2026, 7, 3), date(2026, 9, 7),
+            date(2026, 11, 26), date(2026, 12, 25)
+        ]
+
+    def test_saturday_new_year_not_observed(self):
+        """Test that a Saturday New Year's Day is not moved to Dec 31."""
+        assert date(2021, 12, 31) not in exchange_holidays(2021)
+        assert not any(d.month == 1 and d.day < 3 for d in exchange_holidays(2022))
+
+    def test_juneteenth_only_from_2022(self):
+        """Test that Juneteenth is a holiday from 2022, observed on Monday in 2022."""
+        assert date(2021, 6, 18) not in exchange_holidays(2021)
+        assert exchange_holidays(2022)[date(2022, 6, 20)] == 'Juneteenth'
+
+    def test_early_closes(self):
+        """Test half days, skipping candidates that are holidays or weekends."""
+        assert sorted(exchange_early_closes(2024, exchange_holidays(2024))) == [
+            date(2024, 7, 3), date(2024, 11, 29), date(2024, 12, 24)
+        ]
+        assert sorted(exchange_early_closes(2026, exchange_holidays(2026))) == [
+            date(2026, 11, 27), date(2026, 12, 24)
+        ]
+
+
+class TestSessions:
+    """Test sessions and scan windows in exchange time."""
+
+    def test_session_follows_dst(self):
+        """Test that the open is 14:30 UTC in winter and 13:30 UTC in summer."""
+        calendar = MarketCalendar()
+
+        winter = calendar.session(date(2026, 3, 6))[0].astimezone(timezone.utc)
+        summer = calendar.session(date(2026, 3, 9))[0].astimezone(timezone.utc)
+
+        assert (winter.hour, winter.minute) == (14, 30)
+        assert (summer.hour, summer.minute) == (13, 30)
+
+    def test_scan_times(self):
+        """Test hourly scans through the post-close run, shorter on half days."""
+        calendar = MarketCalendar()
+
+        full = calendar.scan_times(date(2026, 3, 2))
+        half = calendar.scan_times(date(2026, 11, 27))
+
+        assert [t.hour for t in full] == list(range(9, 17))
+        assert [t.hour for t in half] == list(range(9, 14))
+        assert calendar.scan_times(date(2026, 11, 26)) == []
+
+    @pytest.mark.parametrize('moment,expected', [
+        (datetime(2026, 3, 2, 14, 30, 5), True),     # 09:30 EST
+        (datetime(2026, 3, 2, 21, 33), True),        # post-close run
+        (datetime(2026, 3, 2, 22, 30), False),       # after hours
+        (datetime(2026, 7, 6, 13, 30, 5), True),     # 09:30 EDT
+        (datetime(2026, 7, 3, 14, 30), False),       # observed holiday
+        (datetime(2026, 3, 7, 15, 30), False),       # Saturday
+        (datetime(2026, 12, 24, 19, 30), False),     # 14:30 on a half day
+    ])
+    def test_scan_window(self, moment, expected):
+        """Test naive-UTC moments against the scan window."""
+        assert MarketCalendar().is_scan_window(moment) is expected
+
+    def test_config_closures_and_hours(self):
+        """Test closures and early closes from the market-hours parameter."""
+        calendar = MarketCalendar.from_config({
+            'open': '09:30', 'close': '16:00', 'timezone': 'America/New_York',
+            'closed': ['2026-03-04'], 'early_close': {'2026-03-05': '13:00'}
+        })
+
+        assert not calendar.is_trading_day(date(2026, 3, 4))
+        assert calendar.session(date(2026, 3, 5))[1].time() == time(13, 0)
+
+
+class TestScheduleExpressions:
+    """Test the generated Scheduler cron expressions."""
+
+    def test_month_split_by_session_shape(self):
+        """Test that holidays are left out and half days get their own hours."""
+        expressions = MarketCalendar().schedule_expressions(date(2026, 11, 1), date(2026, 11, 30))
+
+        assert [e[0] for e in expressions] == [
+            'cron(30 9,10,11,12,13 27 11 ? 2026)',
+            'cron(30 9,10,11,12,13,14,15,16 '
+            '2,3,4,5,6,9,10,11,12,13,16,17,18,19,20,23,24,25,30 11 ? 2026)'
+        ]
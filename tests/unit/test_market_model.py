@@ -0,0 +1,227 @@
+"""
+Unit tests for the cross-sectional market model.
+Tests the incremental factor statistics and collapsing of market moves.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../lambda'))
+
+import pytest
+import boto3
+import json
+import random
+from datetime import date, timedelta
+from moto import mock_aws
+
+import market_model
+from market_model import (
+    apply_market_model,
+    fold_universe,
+    load_universe,
+    new_stats,
+    scan_returns,
+    score_stats,
+    update_stats
+)
+
+BUCKET = 'stock-scan-data-test'
+TICKERS = [f'T{i:02d}' for i in range(12)]
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    with mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket=BUCKET)
+        monkeypatch.setattr(market_model, 's3', client)
+        yield client
+
+
+def universe(days=60, last_market=-0.05, idiosyncratic=None, tickers=TICKERS):
+    """
+    Closes driven by a common factor plus noise; on the last day the market
+    moves by last_market and tickers in `idiosyncratic` move extra.
+    """
+    rng = random.Random(7)
+    market = [rng.gauss(0, 0.01) for _ in range(days - 2)]
+    dates = [(date(2026, 1, 1) + timedelta(days=d)).isoformat() for d in range(days)]
+    scans = []
+    for ticker in tickers:
+        closes = [100.0]
+        for f in market:
+            closes.append(closes[-1] * (1 + f + rng.gauss(0, 0.005)))
+        last = last_market + (idiosyncratic or {}).get(ticker, 0.0)
+        closes.append(closes[-1] * (1 + last))
+        scans.append({'ticker': ticker, 'dates': dates, 'closes': closes, 'anomalies': []})
+    return scans
+
+
+def price_anomaly(scan, anomaly_type='price'):
+    return {'ticker': scan['ticker'], 'date': scan['dates'][-1], 'anomaly_type': anomaly_type,
+            'z_score': -4.0}
+
+
+class TestFactorStatistics:
+    """Test the incremental EWMA statistics."""
+
+    def test_beta_recovered(self):
+        """Test that beta converges on the true factor loading."""
+        rng = random.Random(1)
+        stats = new_stats()
+        for _ in range(500):
+            f = rng.gauss(0, 0.01)
+            update_stats(stats, f, 2.0 * f + rng.gauss(0, 0.001))
+
+        _, residual_z, beta = score_stats(stats, 0.03, 0.06)
+
+        assert beta == pytest.approx(2.0, abs=0.1)
+        assert abs(residual_z) < 2
+
+    def test_warm_up_not_scored(self):
+        """Test that a few observations are not enough to explain anything."""
+        stats = new_stats()
+        for f in (0.01, -0.01, 0.02):
+            update_stats(stats, f, f)
+
+        assert score_stats(stats, 0.05, 0.05) is None
+
+
+class TestApplyMarketModel:
+    """Test collapsing anomalies explained by a market move."""
+
+    def test_market_gap_collapsed_into_one_event(self, s3):
+        """Test that a market-wide gap becomes a single market event."""
+        scans = universe()
+        for scan in scans:
+            scan['anomalies'] = [price_anomaly(scan)]
+        volume = price_anomaly(scans[0], 'volume')
+        scans[0]['anomalies'].append(volume)
+
+        kept, events = apply_market_model(scans, 2.0, bucket=BUCKET)
+
+        assert kept == [volume]
+        assert len(events) == 1
+        assert events[0]['ticker'] == 'MARKET'
+        assert events[0]['anomaly_type'] == 'market_move'
+        assert events[0]['members'] == TICKERS
+        assert events[0]['value'] == pytest.approx(-5.0, abs=0.5)
+
+    def test_ticker_specific_move_kept(self, s3):
+        """Test that a move well beyond the market is still reported."""
+        scans = universe(idiosyncratic={'T03': -0.08})
+        for scan in scans:
+            scan['anomalies'] = [price_anomaly(scan)]
+
+        kept, events = apply_market_model(scans, 2.0, bucket=BUCKET)
+
+        assert [a['ticker'] for a in kept] == ['T03']
+        assert 'T03' not in events[0]['members']
+
+    def test_sector_move_explained(self, s3):
+        """Test that a move shared only by one sector collapses per sector."""
+        tickers = [f'T{i:02d}' for i in range(40)]
+        tech = tickers[:10]
+        scans = universe(last_market=0.0, idiosyncratic={t: -0.06 for t in tech}, tickers=tickers)
+        for scan in scans:
+            if scan['ticker'] in tech:
+                scan['anomalies'] = [price_anomaly(scan)]
+
+        kept, events = apply_market_model(scans, 2.0, sectors={t: 'Tech' for t in tech},
+                                          bucket=BUCKET)
+
+        assert kept == []
+        assert [e['ticker'] for e in events] == ['SECTOR:TECH']
+        assert events[0]['anomaly_type'] == 'sector_move'
+
+    def test_small_batch_passes_through(self, s3):
+        """Test that too few tickers give no factor to compare against."""
+        scans = universe()[:3]
+        for scan in scans:
+            scan['anomalies'] = [price_anomaly(scan)]
+
+        kept, events = apply_market_model(scans, 2.0, bucket=BUCKET)
+
+        assert len(kept) == 3
+        assert events == []
+
+
+class TestUniverse:
+    """Test scoring shards against the universe state the coordinator keeps."""
+
+    def test_shards_share_peers_and_event_key(self, s3):
+        """Test that a gap split across shards gives the statistics and event key of one batch."""
+        scans = universe()
+        for scan in scans:
+            scan['anomalies'] = [price_anomaly(scan)]
+        fold_universe(scan_returns(scans), BUCKET)
+        peers = load_universe(BUCKET)['returns']
+
+        events = []
+        for shard in (scans[:5], scans[5:]):
+            kept, shard_events = apply_market_model(shard, 2.0, bucket=BUCKET, universe=peers,
+                                                    event_time='2026-03-01T15:30:00')
+            assert kept == []
+            events.extend(shard_events)
+        sharded = json.loads(s3.get_object(Bucket=BUCKET, Key='market-model/T00.json')['Body'].read())
+        apply_market_model(scans, 2.0, bucket=BUCKET, prefix='batch')
+        batch = json.loads(s3.get_object(Bucket=BUCKET, Key='batch/T00.json')['Body'].read())
+
+        assert sharded['factors']['market'] == pytest.approx(batch['factors']['market'])
+        assert {(e['ticker'], e['timestamp']) for e in events} == {('MARKET', '2026-03-01T15:30:00')}
+        assert sorted(m for e in events for m in e['members']) == TICKERS
+
+    def test_fresh_returns_replace_stored_ones(self, s3):
+        """Test that a shard scores its own tickers' new day against the stored peers."""
+        scans = universe()
+        # The previous scan saw the peers' gap but not the first shard's
+        stale = universe(last_market=0.0)
+        fold_universe(scan_returns(stale[:5] + scans[5:]), BUCKET)
+        for scan in scans[:5]:
+            scan['anomalies'] = [price_anomaly(scan)]
+
+        kept, events = apply_market_model(scans[:5], 2.0, bucket=BUCKET,
+                                          universe=load_universe(BUCKET)['returns'])
+
+        assert kept == []
+        assert events[0]['members'] == TICKERS[:5]
+        assert events[0]['value'] == pytest.approx(-5.0, abs=0.5)
+
+    def test_fold_keeps_unreported_tickers_and_drops_old_days(self, s3):
+        """Test that tickers a scan did not report keep their returns until they age out."""
+        fold_universe({'A': {'2025-12-31': 0.01, '2026-03-01': 0.02}}, BUCKET)
+
+        state = fold_universe({'B': {'2026-03-02': -0.01}}, BUCKET, as_of='2026-03-02T15:30:00')
+
+        assert state['returns'] == {'A': {'2026-03-01': 0.02}, 'B': {'2026-03-02': -0.01}}
+        assert load_universe(BUCKET) == state
+
+
+class TestStatePersistence:
+    """Test that statistics are updated incrementally between scans."""
+
+    def read_state(self, s3, ticker):
+        return json.loads(s3.get_object(Bucket=BUCKET, Key=f'market-model/{ticker}.json')['Body'].read())
+
+    def test_latest_day_not_folded_in(self, s3):
+        """Test that hourly rescans of the same day leave the state alone."""
+        scans = universe()
+        apply_market_model(scans, 2.0, bucket=BUCKET)
+        first = self.read_state(s3, 'T00')
+
+        apply_market_model(scans, 2.0, bucket=BUCKET)
+
+        assert self.read_state(s3, 'T00') == first
+        assert first['as_of'] == scans[0]['dates'][-2]
+        assert first['factors']['market']['n'] == 58
+
+    def test_next_day_adds_one_observation(self, s3):
+        """Test that a new trading day folds in exactly one return."""
+        scans = universe(days=61)
+        earlier = [dict(s, dates=s['dates'][:-1], closes=s['closes'][:-1]) for s in scans]
+        apply_market_model(earlier, 2.0, bucket=BUCKET)
+
+        apply_market_model(scans, 2.0, bucket=BUCKET)
+
+        state = self.read_state(s3, 'T00')
+        assert state['as_of'] == scans[0]['dates'][-2]
+        assert state['factors']['market']['n'] == 59
@@ -0,0 +1,113 @@
+"""
+Unit tests for the EMF metrics recorder.
+Tests stage timers, counters and the Embedded Metric Format output.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../lambda'))
+
+import pytest
+import json
+from unittest.mock import Mock
+
+from metrics import NAMESPACE, MetricsRecorder
+import stock_scanner
+
+
+class TestMetricsRecorder:
+    """Test stage timing and EMF documents."""
+
+    def test_timer_emits_emf_document(self):
+        """Test that a timed stage becomes one EMF log line."""
+        lines = []
+        recorder = MetricsRecorder('stock-scanner', output=lines.append)
+
+        with recorder.timer('fetch', items=30):
+            pass
+        recorder.flush()
+
+        document = json.loads(lines[0])
+        directive = document['_aws']['CloudWatchMetrics'][0]
+        assert directive['Namespace'] == NAMESPACE
+        assert directive['Dimensions'] == [['Service', 'Stage']]
+        assert {m['Name'] for m in directive['Metrics']} == {'Duration', 'ItemsProcessed'}
+        assert document['Service'] == 'stock-scanner'
+        assert document['Stage'] == 'fetch'
+        assert document['ItemsProcessed'] == 30
+        assert document['Duration'] >= 0
+
+    def test_repeated_stage_reports_value_array(self):
+        """Test that per-ticker timings are kept as separate values."""
+        lines = []
+        recorder = MetricsRecorder('stock-scanner', output=lines.append)
+
+        for _ in range(3):
+            with recorder.timer('detect'):
+                pass
+        recorder.flush()
+
+        assert len(json.loads(lines[0])['Duration']) == 3
+
+    def test_values_split_across_documents(self):
+        """Test the 100-values-per-metric EMF limit."""
+        lines = []
+        recorder = MetricsRecorder('stock-scanner', output=lines.append)
+
+        for _ in range(150):
+            with recorder.timer('detect'):
+                pass
+        recorder.flush()
+
+        assert [len(json.loads(line)['Duration']) for line in lines] == [100, 50]
+
+    def test_flush_resets(self):
+        """Test that metrics are not reported twice."""
+        lines = []
+        recorder = MetricsRecorder('stock-api', output=lines.append)
+        with recorder.timer('query'):
+            pass
+        recorder.flush()
+        recorder.flush()
+
+        assert len(lines) == 1
+
+    def test_flush_inside_running_timer(self):
+        """Test that a nested invocation's flush does not break its caller's timer."""
+        lines = []
+        recorder = MetricsRecorder('stock-scanner', output=lines.append)
+        with recorder.timer('handler'):
+            with recorder.timer('handler'):
+                pass
+            recorder.flush()
+        recorder.flush()
+
+        assert [json.loads(line)['Stage'] for line in lines] == ['handler', 'handler']
+
+
+    def test_record_time_measured_elsewhere(self):
+        """Test that timings taken in worker threads are reported like timers."""
+        lines = []
+        recorder = MetricsRecorder('stock-notifications', output=lines.append)
+        recorder.record('slack_post', 120.5, items=1)
+        recorder.record('slack_post', 80.25, items=1)
+        recorder.flush()
+
+        document = json.loads(lines[0])
+        assert document['Duration'] == [120.5, 80.25]
+        assert document['ItemsProcessed'] == 2
+
+
+class TestScannerInstrumentation:
+    """Test the scanner's use of the recorder."""
+
+    def test_retries_counted_on_running_stage(self):
+        """Test that retry_with_backoff reports retries for the active stage."""
+        recorder = stock_scanner.metrics
+        recorder.stages = {}
+        func = Mock(side_effect=[Exception('fail'), 'ok'])
+
+        with recorder.timer('s3_store'):
+            stock_scanner.retry_with_backoff(func, max_retries=3, initial_delay=0.01)
+
+        assert recorder.stages['s3_store']['Retries'] == 1
+        recorder.stages = {}
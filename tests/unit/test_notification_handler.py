@@ -0,0 +1,151 @@
+"""
+Unit tests for the Slack notification handler.
+Tests SQS batch consumption, partial batch failures and concurrency.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../lambda'))
+
+import pytest
+import json
+import threading
+import time
+from unittest.mock import Mock
+
+import notification_handler
+from tracing import InMemoryExporter, Tracer
+
+
+class FakeWebhook:
+    """Stands in for the urllib3 pool: records posts, fails on request."""
+
+    def __init__(self, fail_subjects=(), latency=0.0):
+        self.fail_subjects = set(fail_subjects)
+        self.latency = latency
+        self.subjects = []
+        self.lock = threading.Lock()
+
+    def request(self, method, url, body=None, headers=None, **kwargs):
+        subject = json.loads(body)['blocks'][0]['text']['text']
+        time.sleep(self.latency)
+        with self.lock:
+            self.subjects.append(subject)
+        return Mock(status=500 if subject in self.fail_subjects else 200)
+
+
+def sqs_record(n, sns_id=None):
+    """SQS record carrying an SNS envelope, as delivered by the subscription."""
+    return {
+        'eventSource': 'aws:sqs',
+        'messageId': f'sqs-{n}',
+        'body': json.dumps({
+            'Type': 'Notification',
+            'MessageId': sns_id or f'sns-{n}',
+            'Subject': f'Stock Anomaly Detected: T{n}',
+            'Message': 'price anomaly',
+            'Timestamp': '2026-03-02T15:30:00Z'
+        })
+    }
+
+
+@pytest.fixture
+def webhook(monkeypatch):
+    monkeypatch.setenv('SLACK_WEBHOOK_URL', 'https://hooks.example.com/test')
+    monkeypatch.setattr(notification_handler, '_delivered', notification_handler.OrderedDict())
+    monkeypatch.setattr(notification_handler.metrics, 'output', lambda line: None)
+
+    def install(**kwargs):
+        fake = FakeWebhook(**kwargs)
+        monkeypatch.setattr(notification_handler, 'http', fake)
+        return fake
+
+    return install
+
+
+class TestBatchDelivery:
+    """Test SQS batches delivered to Slack."""
+
+    def test_only_failed_messages_reported(self, webhook):
+        """Test that a failed post is retried without re-sending the others."""
+        fake = webhook(fail_subjects={'Stock Anomaly Detected: T1'})
+
+        result = notification_handler.lambda_handler(
+            {'Records': [sqs_record(n) for n in range(3)]}, None)
+
+        assert result == {'batchItemFailures': [{'itemIdentifier': 'sqs-1'}]}
+        assert len(fake.subjects) == 3
+
+    def test_deliveries_run_concurrently(self, webhook):
+        """Test that a slow webhook does not serialize the batch."""
+        webhook(latency=0.2)
+
+        started = time.perf_counter()
+        result = notification_handler.lambda_handler(
+            {'Records': [sqs_record(n) for n in range(5)]}, None)
+
+        assert result['batchItemFailures'] == []
+        assert time.perf_counter() - started < 0.6
+
+    def test_duplicate_sns_delivery_dropped(self, webhook):
+        """Test that the same SNS message arriving twice is posted once."""
+        fake = webhook()
+
+        notification_handler.lambda_handler({'Records': [sqs_record(1)]}, None)
+        result = notification_handler.lambda_handler(
+            {'Records': [sqs_record(2, sns_id='sns-1')]}, None)
+
+        assert result['batchItemFailures'] == []
+        assert len(fake.subjects) == 1
+
+    def test_near_timeout_messages_deferred(self, webhook):
+        """Test that posts are not started when the function is about to time out."""
+        fake = webhook()
+        context = Mock(get_remaining_time_in_millis=Mock(return_value=1000))
+
+        result = notification_handler.lambda_handler(
+            {'Records': [sqs_record(n) for n in range(2)]}, context)
+
+        assert [f['itemIdentifier'] for f in result['batchItemFailures']] == ['sqs-0', 'sqs-1']
+        assert fake.subjects == []
+
+    def test_direct_sns_event_still_delivered(self, webhook):
+        """Test the SNS record shape used before the queue was added."""
+        fake = webhook()
+        record = {'EventSource': 'aws:sns', 'Sns': json.loads(sqs_record(7)['body'])}
+
+        result = notification_handler.lambda_handler({'Records': [record]}, None)
+
+        assert result == {'batchItemFailures': []}
+        assert fake.subjects == ['Stock Anomaly Detected: T7']
+
+
+class TestTracing:
+    """Test the end of the scan-to-Slack trace."""
+
+    def test_traced_alert_records_latency(self, webhook, monkeypatch):
+        """Test that a traced message records its spans and the end-to-end latency."""
+        webhook()
+        exporter = InMemoryExporter()
+        monkeypatch.setattr(notification_handler, 'tracer', Tracer('stock-notifications', exporter))
+        recorded = []
+        monkeypatch.setattr(notification_handler.metrics, 'record',
+                            lambda stage, elapsed_ms, items=None: recorded.append((stage, elapsed_ms)))
+        now_ms = int(time.time() * 1000)
+        record = sqs_record(1)
+        body = json.loads(record['body'])
+        body['MessageAttributes'] = {
+            'trace_id': {'Type': 'String', 'Value': '1-abc-def'},
+            'parent_span_id': {'Type': 'String', 'Value': 'a' * 16},
+            'trace_started_ms': {'Type': 'Number', 'Value': str(now_ms - 60000)},
+            'trace_sent_ms': {'Type': 'Number', 'Value': str(now_ms - 1000)},
+        }
+        record['body'] = json.dumps(body)
+
+        notification_handler.lambda_handler({'Records': [record, sqs_record(2)]}, None)
+
+        assert sorted(span.name for _, span in exporter.spans) == ['queue', 'slack_post']
+        assert {span.parent_id for _, span in exporter.spans} == {'a' * 16}
+        assert exporter.named('queue')[0].duration_ms >= 1000
+        latencies = [ms for stage, ms in recorded if stage == 'alert_latency']
+        assert len(latencies) == 1
+        assert 60000 <= latencies[0] < 70000
@@ -0,0 +1,128 @@
+"""
+Unit tests for the on-demand profiling hook.
+Tests sampling, handler wrapping and the local summary.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../lambda'))
+
+import pytest
+import cProfile
+import io
+import json
+from unittest.mock import patch
+
+import profiling
+from profiling import profiled, should_profile, summarize
+
+
+class TestSampling:
+    """Test when invocations are profiled."""
+
+    def test_disabled_by_default(self, monkeypatch):
+        """Test that profiling is off without the env var or event flag."""
+        monkeypatch.delenv('PROFILE_ENABLED', raising=False)
+
+        assert should_profile({}) is False
+
+    def test_event_flag_always_profiles(self, monkeypatch):
+        """Test the per-invocation opt-in."""
+        monkeypatch.delenv('PROFILE_ENABLED', raising=False)
+
+        assert should_profile({'profile': True}) is True
+
+    def test_every_nth_invocation_sampled(self, monkeypatch):
+        """Test that only every Nth invocation pays the overhead."""
+        monkeypatch.setenv('PROFILE_ENABLED', 'true')
+        monkeypatch.setenv('PROFILE_SAMPLE_EVERY', '3')
+        monkeypatch.setattr(profiling, '_invocations', 0)
+
+        assert [should_profile({}) for _ in range(6)] == [False, False, True, False, False, True]
+
+
+class TestProfiledHandler:
+    """Test the handler wrapper."""
+
+    def test_profiled_run_uploads_results(self):
+        """Test that a profiled run stores the profile and allocations."""
+        @profiled('test-service')
+        def handler(event, context):
+            return [0] * 1000
+
+        with patch.object(profiling, 'upload_profile') as upload:
+            result = handler({'profile': True}, None)
+
+        assert len(result) == 1000
+        service, request_id, profiler, allocations, peak = upload.call_args[0]
+        assert service == 'test-service'
+        assert request_id == 'local'
+        assert isinstance(profiler, cProfile.Profile)
+        assert peak > 0
+
+    def test_upload_failure_does_not_fail_handler(self):
+        """Test that profiling problems never break the scan."""
+        @profiled('test-service')
+        def handler(event, context):
+            return 'ok'
+
+        with patch.object(profiling, 'upload_profile', side_effect=Exception('denied')):
+            assert handler({'profile': True}, None) == 'ok'
+
+    def test_nested_handler_runs_inside_outer_profile(self):
+        """Test that a profiled handler called by another keeps the outer trace and profile."""
+        @profiled('worker')
+        def worker(event, context):
+            return [0] * 1000
+
+        @profiled('coordinator')
+        def coordinator(event, context):
+            worker({'profile': True}, None)
+            tracing = profiling.tracemalloc.is_tracing()
+            return tracing, [0] * 1000
+
+        with patch.object(profiling, 'upload_profile') as upload:
+            tracing, _ = coordinator({'profile': True}, None)
+
+        assert tracing is True
+        assert [c[0][0] for c in upload.call_args_list] == ['coordinator']
+        assert upload.call_args[0][4] > 0
+        assert profiling._active is False
+
+    def test_unsampled_run_skips_profiler(self, monkeypatch):
+        """Test that unsampled runs call the handler directly."""
+        monkeypatch.delenv('PROFILE_ENABLED', raising=False)
+
+        @profiled('test-service')
+        def handler(event, context):
+            return 'ok'
+
+        with patch.object(profiling, 'upload_profile') as upload:
+            handler({}, None)
+
+        upload.assert_not_called()
+
+
+class TestSummarize:
+    """Test the local summary command."""
+
+    def test_summarize_merges_profiles_and_allocations(self, tmp_path):
+        """Test the printed report for two local profiles."""
+        paths = []
+        for i in range(2):
+            profiler = cProfile.Profile()
+            profiler.runcall(sorted, range(1000))
+            path = tmp_path / f'run{i}.prof'
+            profiler.dump_stats(str(path))
+            paths.append(str(path))
+        (tmp_path / 'run0.alloc.json').write_text(json.dumps({
+            'peak_kb': 12.5,
+            'top': [{'file': 'stock_scanner.py', 'line': 42, 'size_kb': 10.0, 'count': 3}]
+        }))
+        out = io.StringIO()
+
+        summarize(paths, top=5, out=out)
+
+        report = out.getvalue()
+        assert 'Merged 2 profile(s)' in report
+        assert 'sorted' in report
+        assert 'stock_scanner.py:42' in report
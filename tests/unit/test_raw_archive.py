@@ -0,0 +1,206 @@
+"""
+Unit tests for the append-only raw-data archive.
+Tests segment appends, the manifest and monthly compaction.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../lambda'))
+
+import pytest
+import boto3
+import json
+from datetime import datetime
+from moto import mock_aws
+
+import raw_archive
+from raw_archive import (
+    SLOT_BYTES,
+    ManifestConflict,
+    append_bars,
+    compact_ticker,
+    decode_lines,
+    encode_partition,
+    load_manifest,
+    load_window,
+    save_manifest
+)
+
+BUCKET = 'stock-scan-data-test'
+
+
+def bars(first_day, last_day, month='2026-01', close=150.0):
+    return [
+        {'date': f'{month}-{d:02d}', 'open': close - 0.5, 'high': close + 1.0,
+         'low': close - 1.0, 'close': close, 'volume': 50000000 + d}
+        for d in range(first_day, last_day + 1)
+    ]
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    with mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket=BUCKET)
+        monkeypatch.setattr(raw_archive, 's3', client)
+        yield client
+
+
+def keys(s3, prefix='raw-data/AAPL/'):
+    return sorted(o['Key'] for o in s3.list_objects_v2(Bucket=BUCKET, Prefix=prefix).get('Contents', []))
+
+
+class TestAppend:
+    """Test appending scans to the archive."""
+
+    def test_first_scan_stores_window(self, s3):
+        """Test that the first scan writes a segment and a manifest."""
+        key = append_bars('AAPL', bars(1, 30), bucket=BUCKET)
+
+        manifest, _ = load_manifest('AAPL', BUCKET)
+        body = s3.get_object(Bucket=BUCKET, Key=key)['Body'].read()
+        assert key.startswith('raw-data/AAPL/segments/')
+        assert len(decode_lines(body)) == 30
+        assert manifest['last_date'] == '2026-01-30'
+        assert manifest['segments'] == [
+            {'key': key, 'first_date': '2026-01-01', 'last_date': '2026-01-30', 'bars': 30}
+        ]
+
+    def test_repeat_scan_writes_only_new_bars(self, s3):
+        """Test that an overlapping window stores just the new day."""
+        append_bars('AAPL', bars(1, 30), bucket=BUCKET, now=datetime(2026, 1, 30, 15))
+
+        key = append_bars('AAPL', bars(2, 31), bucket=BUCKET, now=datetime(2026, 1, 31, 15))
+
+        body = s3.get_object(Bucket=BUCKET, Key=key)['Body'].read()
+        assert [b['date'] for b in decode_lines(body)] == ['2026-01-31']
+
+    def test_unchanged_scan_writes_nothing(self, s3):
+        """Test that an hourly run with no new or revised bars is a no-op."""
+        append_bars('AAPL', bars(1, 30), bucket=BUCKET)
+        before = keys(s3)
+
+        assert append_bars('AAPL', bars(1, 30), bucket=BUCKET) is None
+        assert keys(s3) == before
+
+    def test_revised_last_bar_appended(self, s3):
+        """Test that an intraday revision of today's bar is kept."""
+        append_bars('AAPL', bars(1, 30), bucket=BUCKET, now=datetime(2026, 1, 30, 15))
+        revised = bars(1, 30)
+        revised[-1]['close'] = 152.0
+
+        key = append_bars('AAPL', revised, bucket=BUCKET, now=datetime(2026, 1, 30, 16))
+
+        assert decode_lines(s3.get_object(Bucket=BUCKET, Key=key)['Body'].read())[0]['close'] == 152.0
+
+    def test_stale_manifest_write_rejected(self, s3):
+        """Test the conditional manifest write."""
+        append_bars('AAPL', bars(1, 30), bucket=BUCKET)
+        manifest, etag = load_manifest('AAPL', BUCKET)
+        append_bars('AAPL', bars(1, 31), bucket=BUCKET)
+
+        with pytest.raises(ManifestConflict):
+            save_manifest('AAPL', manifest, etag, BUCKET)
+
+
+class TestPartitions:
+    """Test the fixed-width monthly partition format."""
+
+    def test_day_slots_addressable_by_offset(self):
+        """Test that day d is at (d-1) * SLOT_BYTES."""
+        body = encode_partition(bars(5, 6))
+
+        assert len(body) == 31 * SLOT_BYTES
+        slot = body[4 * SLOT_BYTES:5 * SLOT_BYTES]
+        assert json.loads(slot)['date'] == '2026-01-05'
+        assert [b['date'] for b in decode_lines(body)] == ['2026-01-05', '2026-01-06']
+
+
+class TestCompaction:
+    """Test folding segments into monthly partitions."""
+
+    def test_segments_folded_into_months(self, s3):
+        """Test that compaction writes partitions and removes segments."""
+        append_bars('AAPL', bars(20, 31, month='2025-12'), bucket=BUCKET, now=datetime(2026, 1, 1))
+        append_bars('AAPL', bars(1, 10), bucket=BUCKET, now=datetime(2026, 1, 10))
+
+        compacted = compact_ticker('AAPL', BUCKET)
+
+        manifest, _ = load_manifest('AAPL', BUCKET)
+        assert compacted == 22
+        assert manifest['segments'] == []
+        assert manifest['months'] == ['2025-12', '2026-01']
+        assert keys(s3) == [
+            'raw-data/AAPL/manifest.json',
+            'raw-data/AAPL/monthly/2025-12.ndjson',
+            'raw-data/AAPL/monthly/2026-01.ndjson'
+        ]
+
+    def test_later_compaction_merges_existing_partition(self, s3):
+        """Test that a month is extended, and revisions win."""
+        append_bars('AAPL', bars(1, 10), bucket=BUCKET, now=datetime(2026, 1, 10))
+        compact_ticker('AAPL', BUCKET)
+        append_bars('AAPL', bars(10, 12, close=151.0), bucket=BUCKET, now=datetime(2026, 1, 12))
+        compact_ticker('AAPL', BUCKET)
+
+        body = s3.get_object(Bucket=BUCKET, Key='raw-data/AAPL/monthly/2026-01.ndjson')['Body'].read()
+        merged = decode_lines(body)
+        assert len(merged) == 12
+        assert merged[9]['close'] == 151.0
+
+    def test_legacy_objects_migrated(self, s3):
+        """Test folding pre-manifest full-window objects."""
+        s3.put_object(Bucket=BUCKET, Key='raw-data/AAPL/20260110-150000.json',
+                      Body=json.dumps(bars(1, 10)))
+
+        compact_ticker('AAPL', BUCKET, include_legacy=True)
+
+        manifest, _ = load_manifest('AAPL', BUCKET)
+        assert manifest['last_date'] == '2026-01-10'
+        assert 'raw-data/AAPL/20260110-150000.json' not in keys(s3)
+        assert append_bars('AAPL', bars(1, 10), bucket=BUCKET) is None
+
+    def test_handler_reports_totals(self, s3, monkeypatch):
+        """Test the scheduled handler over every archived ticker."""
+        monkeypatch.setenv('S3_BUCKET', BUCKET)
+        append_bars('AAPL', bars(1, 5), bucket=BUCKET)
+        append_bars('MSFT', bars(1, 3), bucket=BUCKET)
+
+        result = raw_archive.lambda_handler({}, None)
+
+        body = json.loads(result['body'])
+        assert body == {'tickers': 2, 'bars_compacted': 8, 'failed_tickers': []}
+
+
+class TestLoadWindow:
+    """Test reading a date window through the manifest."""
+
+    def test_window_spans_partitions_and_segments(self, s3):
+        """Test that compacted months and pending segments are combined."""
+        append_bars('AAPL', bars(1, 31, month='2025-12'), bucket=BUCKET, now=datetime(2026, 1, 1))
+        append_bars('AAPL', bars(1, 10), bucket=BUCKET, now=datetime(2026, 1, 10))
+        compact_ticker('AAPL', BUCKET)
+        append_bars('AAPL', bars(11, 12), bucket=BUCKET, now=datetime(2026, 1, 12))
+
+        window, _ = load_window('AAPL', '2025-12-20', '2026-01-12', BUCKET)
+
+        assert len(window) == 24
+        assert window[0]['date'] == '2025-12-20'
+        assert window[-1]['date'] == '2026-01-12'
+
+    def test_partitions_read_with_ranged_gets(self, s3, monkeypatch):
+        """Test that only the window's day slots are downloaded."""
+        append_bars('AAPL', bars(1, 31), bucket=BUCKET)
+        compact_ticker('AAPL', BUCKET)
+        requests = []
+        get_object = s3.get_object
+        monkeypatch.setattr(s3, 'get_object', lambda **kw: requests.append(kw) or get_object(**kw))
+
+        window, _ = load_window('AAPL', '2026-01-05', '2026-01-07', BUCKET)
+
+        assert [b['date'] for b in window] == ['2026-01-05', '2026-01-06', '2026-01-07']
+        ranged = [r for r in requests if r['Key'].endswith('2026-01.ndjson')]
+        assert ranged[0]['Range'] == f'bytes={4 * SLOT_BYTES}-{7 * SLOT_BYTES - 1}'
+
+    def test_unknown_ticker_empty(self, s3):
+        """Test a ticker with no archive."""
+        assert load_window('NVDA', '2026-01-01', '2026-01-31', BUCKET)[0] == []
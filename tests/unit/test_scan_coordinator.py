@@ -0,0 +1,224 @@
+"""
+Unit tests for sharded universe scans.
+Tests shard planning, executors and result aggregation.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../lambda'))
+
+import pytest
+import io
+import json
+from unittest.mock import Mock, patch
+
+import scan_coordinator
+import stock_scanner
+from scan_coordinator import (
+    LambdaExecutor,
+    LocalExecutor,
+    SqsExecutor,
+    aggregate_shard_results,
+    merge_ticker_costs,
+    plan_shards,
+    run_coordinator
+)
+
+
+def fake_worker(event, context):
+    """Worker that reports one anomaly and 100 ms per ticker."""
+    tickers = event['tickers']
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'status': 'success',
+            'tickers': len(tickers),
+            'anomalies_detected': len(tickers),
+            'failed_tickers': [],
+            'ticker_costs_ms': {t: 100.0 for t in tickers}
+        })
+    }
+
+
+class TestShardPlanning:
+    """Test cost-based shard sizing."""
+
+    def test_shard_count_follows_budget(self):
+        """Test that total cost / budget determines the shard count."""
+        tickers = [f'T{i}' for i in range(100)]
+        shards = plan_shards(tickers, costs={}, budget_ms=10000)
+
+        # 100 tickers x 500 ms default = 50 s -> 5 shards of 10 s
+        assert len(shards) == 5
+        assert sorted(t for shard in shards for t in shard) == sorted(tickers)
+
+    def test_expensive_tickers_spread_across_shards(self):
+        """Test that measured costs balance the shards."""
+        costs = {'BIG1': 9000.0, 'BIG2': 9000.0}
+        tickers = ['BIG1', 'BIG2'] + [f'T{i}' for i in range(18)]
+        shards = plan_shards(tickers, costs=costs, budget_ms=10000)
+
+        big_shards = [s for s in shards if 'BIG1' in s or 'BIG2' in s]
+        assert len(big_shards) == 2
+
+    def test_duplicates_and_case_normalised(self):
+        """Test that duplicate tickers are scanned once."""
+        shards = plan_shards(['aapl', 'AAPL', 'msft'])
+
+        assert len(shards) == 1
+        assert sorted(shards[0]) == ['AAPL', 'MSFT']
+
+    def test_empty_universe(self):
+        """Test that no tickers means no shards."""
+        assert plan_shards([]) == []
+
+
+class TestAggregation:
+    """Test merging worker results."""
+
+    def test_aggregate_counts_failures(self):
+        """Test that shard errors mark the scan as a partial failure."""
+        summary = aggregate_shard_results([
+            {'status': 'success', 'tickers': 2, 'anomalies_detected': 1,
+             'failed_tickers': [], 'ticker_costs_ms': {'A': 1.0, 'B': 2.0}},
+            {'status': 'error', 'tickers': 1, 'failed_tickers': ['C']},
+        ])
+
+        assert summary['status'] == 'partial_failure'
+        assert summary['tickers'] == 3
+        assert summary['anomalies_detected'] == 1
+        assert summary['failed_tickers'] == ['C']
+
+    def test_aggregate_merges_factor_returns(self):
+        """Test that each shard's reported returns reach the coordinator, queued ones excepted."""
+        summary = aggregate_shard_results([
+            {'status': 'success', 'tickers': 1, 'factor_returns': {'A': {'2026-03-02': 0.01}}},
+            {'status': 'success', 'tickers': 1, 'factor_returns': {'B': {'2026-03-02': -0.02}}},
+            {'status': 'queued', 'tickers': 1},
+        ])
+
+        assert summary['factor_returns'] == {'A': {'2026-03-02': 0.01}, 'B': {'2026-03-02': -0.02}}
+
+    def test_merge_ticker_costs_smooths(self):
+        """Test that new measurements are blended into known costs."""
+        merged = merge_ticker_costs({'A': 100.0}, {'A': 200.0, 'B': 50.0})
+
+        assert merged['A'] == pytest.approx(130.0)
+        assert merged['B'] == 50.0
+
+
+class TestLocalExecutor:
+    """Test in-process fan-out."""
+
+    def test_run_coordinator_with_local_executor(self):
+        """Test a full coordinator run without AWS."""
+        executor = LocalExecutor(worker=fake_worker, max_workers=4)
+        tickers = [f'T{i}' for i in range(30)]
+
+        summary = run_coordinator(tickers, executor, budget_ms=2000)
+
+        assert summary['status'] == 'success'
+        assert summary['shards'] == 8
+        assert summary['tickers'] == 30
+        assert summary['anomalies_detected'] == 30
+        assert 'ticker_costs_ms' not in summary
+
+    def test_coordinator_folds_shard_returns_without_fetching(self):
+        """Test that the coordinator reads no bars and keeps the shards' returns for the next scan."""
+        def worker(event, context):
+            response = fake_worker(event, context)
+            body = json.loads(response['body'])
+            body['factor_returns'] = {t: {'2026-03-02': 0.01} for t in event['tickers']}
+            return dict(response, body=json.dumps(body))
+
+        with patch.object(stock_scanner, 'get_parameter_with_retry',
+                          side_effect=lambda name, default: default), \
+             patch.object(stock_scanner, 'make_executor', return_value=LocalExecutor(worker=worker)), \
+             patch.object(stock_scanner, 'fetch_stock_data_simple') as fetch, \
+             patch.object(stock_scanner, 'fold_universe') as fold, \
+             patch.object(stock_scanner, 'publish_dashboard_snapshots'), \
+             patch.object(scan_coordinator, 'load_ticker_costs', return_value={}), \
+             patch.object(scan_coordinator, 'save_ticker_costs'):
+            result = stock_scanner.run_coordinator_mode({'universe': ['AAPL', 'MSFT']})
+
+        fetch.assert_not_called()
+        assert fold.call_args[0][0] == {'AAPL': {'2026-03-02': 0.01}, 'MSFT': {'2026-03-02': 0.01}}
+        assert 'factor_returns' not in json.loads(result['body'])
+
+    def test_scanner_worker_mode(self):
+        """Test the real scanner handler as a shard worker."""
+        result = {'status': 'success', 'anomalies_detected': 2}
+        with patch.object(stock_scanner, 'get_parameter_with_retry',
+                          side_effect=lambda name, default: default), \
+             patch.object(stock_scanner, 'scan_ticker', return_value=result):
+            executor = LocalExecutor(worker=stock_scanner.lambda_handler)
+            summary = run_coordinator(['AAPL', 'MSFT'], executor)
+
+        assert summary['tickers'] == 2
+        assert summary['anomalies_detected'] == 4
+
+
+    def test_shared_fields_sent_to_every_shard(self):
+        """Test that the scan's start time reaches each shard with its tickers."""
+        events = []
+
+        def worker(event, context):
+            events.append(event)
+            return fake_worker(event, context)
+
+        run_coordinator([f'T{i}' for i in range(6)], LocalExecutor(worker=worker), budget_ms=1000,
+                        shared={'scan_time': '2026-03-02T15:30:00'})
+
+        assert len(events) == 3
+        assert all(e['scan_time'] == '2026-03-02T15:30:00' for e in events)
+        assert sorted(t for e in events for t in e['tickers']) == [f'T{i}' for i in range(6)]
+
+
+def lambda_client(clock, shard_seconds):
+    """Mock Lambda client whose synchronous invokes take `shard_seconds`."""
+    def invoke(FunctionName, InvocationType, Payload):
+        if InvocationType == 'Event':
+            return {'StatusCode': 202}
+        clock['now'] += shard_seconds
+        tickers = json.loads(Payload)['tickers']
+        body = json.dumps({'status': 'success', 'tickers': len(tickers), 'anomalies_detected': 0})
+        return {'Payload': io.BytesIO(json.dumps({'body': body}).encode('utf-8'))}
+    return Mock(invoke=Mock(side_effect=invoke))
+
+
+class TestRemoteExecutors:
+    """Test Lambda and SQS dispatch."""
+
+    def test_shards_past_deadline_invoked_async(self, monkeypatch):
+        """Test that shards that cannot finish before the coordinator times out are queued."""
+        clock = {'now': 0.0}
+        monkeypatch.setattr(scan_coordinator.time, 'monotonic', lambda: clock['now'])
+        client = lambda_client(clock, shard_seconds=60)
+        # Room for two 60 s shards one after the other
+        executor = LambdaExecutor('stock-scanner', max_concurrency=1, client=client,
+                                  remaining_ms=130000 + scan_coordinator.COORDINATOR_MARGIN_MS,
+                                  budget_ms=60000)
+
+        results = executor.run([['A'], ['B'], ['C'], ['D']])
+
+        assert [r['status'] for r in results] == ['success', 'success', 'queued', 'queued']
+        async_calls = [c.kwargs for c in client.invoke.call_args_list if c.kwargs['InvocationType'] == 'Event']
+        assert [json.loads(c['Payload']) for c in async_calls] == [
+            {'tickers': ['C'], 'queued': True}, {'tickers': ['D'], 'queued': True}
+        ]
+        assert aggregate_shard_results(results)['shards_queued'] == 2
+
+    def test_failed_queue_entries_reported(self):
+        """Test that shards SQS did not accept are failures, not queued."""
+        sqs = Mock()
+        sqs.send_message_batch.return_value = {
+            'Successful': [{'Id': '0'}],
+            'Failed': [{'Id': '1', 'Code': 'InternalError', 'Message': 'try again'}]
+        }
+
+        results = SqsExecutor('https://queue', client=sqs).run([['A'], ['B', 'C']])
+
+        assert results[0] == {'status': 'queued', 'tickers': 1}
+        assert results[1]['status'] == 'error'
+        summary = aggregate_shard_results(results)
+        assert summary['failed_tickers'] == ['B', 'C']
+        assert summary['status'] == 'partial_failure'
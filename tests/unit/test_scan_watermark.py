@@ -0,0 +1,94 @@
+"""
+Unit tests for per-ticker scan watermarks.
+Tests change detection, the container cache and skipping unchanged tickers.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../lambda'))
+
+import pytest
+import boto3
+from unittest.mock import Mock, patch
+from moto import mock_aws
+
+import scan_watermark
+import stock_scanner
+from scan_watermark import compute_watermark, is_unchanged, save_watermark
+
+BUCKET = 'stock-scan-data-test'
+
+
+def bars(count=25, last_close=150.0):
+    records = [{'date': f'2026-02-{i + 1:02d}', 'close': 150.0, 'volume': 50000000}
+               for i in range(count)]
+    records[-1]['close'] = last_close
+    return records
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    with mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket=BUCKET)
+        monkeypatch.setattr(scan_watermark, 's3', client)
+        monkeypatch.setattr(scan_watermark, '_cache', {})
+        monkeypatch.setenv('S3_BUCKET', BUCKET)
+        yield client
+
+
+class TestWatermark:
+    """Test what counts as a change."""
+
+    def test_revised_bar_changes_hash(self):
+        """Test that a revised last bar is scored again despite the same date."""
+        before = compute_watermark(bars(), 2.0, ['zscore'])
+        after = compute_watermark(bars(last_close=151.0), 2.0, ['zscore'])
+
+        assert before['last_date'] == after['last_date']
+        assert before['hash'] != after['hash']
+
+    def test_config_change_changes_hash(self):
+        """Test that a new threshold or detector list forces a re-scan."""
+        base = compute_watermark(bars(), 2.0, ['zscore'])
+
+        assert compute_watermark(bars(), 2.5, ['zscore'])['hash'] != base['hash']
+        assert compute_watermark(bars(), 2.0, ['zscore', 'mad'])['hash'] != base['hash']
+
+    def test_saved_watermark_read_back(self, s3):
+        """Test a cold container finding the watermark in S3."""
+        watermark = compute_watermark(bars(), 2.0, ['zscore'])
+        save_watermark('AAPL', watermark)
+        scan_watermark._cache.clear()
+
+        assert is_unchanged('AAPL', watermark)
+        assert not is_unchanged('MSFT', watermark)
+
+
+class TestUnchangedTickers:
+    """Test the scanner skipping unchanged tickers."""
+
+    def test_second_scan_skips_after_fetch(self, s3):
+        """Test that an unchanged window is not stored, scored or published."""
+        history = Mock(return_value=(bars(), bars()[-1:]))
+        with patch.object(stock_scanner, 'fetch_history', history), \
+             patch.object(stock_scanner, 'store_raw_data_with_retry') as store, \
+             patch.object(stock_scanner, 'publish_anomalies') as publish, \
+             patch.object(stock_scanner, 'collapse_market_moves', return_value=([], [])):
+            first = stock_scanner.scan_tickers(['AAPL', 'MSFT'], 2.0, {})
+            second = stock_scanner.scan_tickers(['AAPL', 'MSFT'], 2.0, {})
+
+        assert (first['tickers_processed'], first['tickers_skipped']) == (2, 0)
+        assert (second['tickers_processed'], second['tickers_skipped']) == (0, 2)
+        assert second['ticker_costs_ms'] == {}
+        assert store.call_count == 2
+        assert publish.call_count == 1
+
+    def test_failed_publish_not_marked_processed(self, s3):
+        """Test that a shard failing before publishing is scored again."""
+        history = Mock(return_value=(bars(), []))
+        with patch.object(stock_scanner, 'fetch_history', history), \
+             patch.object(stock_scanner, 'collapse_market_moves', side_effect=RuntimeError('boom')):
+            with pytest.raises(RuntimeError):
+                stock_scanner.scan_tickers(['AAPL'], 2.0, {})
+
+        assert not is_unchanged('AAPL', compute_watermark(bars(), 2.0, ['zscore']))
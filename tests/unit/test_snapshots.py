@@ -0,0 +1,160 @@
+"""
+Unit tests for the static dashboard snapshots.
+Tests snapshot contents, versioning and the latest pointer.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../lambda'))
+
+import pytest
+import boto3
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal
+from moto import mock_aws
+
+import snapshots
+from snapshots import LATEST_KEY, build_snapshots, publish_snapshots
+
+BUCKET = 'stock-dashboard-test'
+NOW = datetime(2026, 1, 20, 15, 0, 0)
+
+
+def anomaly(ticker, hours_ago, severity='medium', anomaly_type='price'):
+    scanned = NOW - timedelta(hours=hours_ago)
+    return {
+        'ticker': ticker,
+        'timestamp': scanned.isoformat(),
+        'date': scanned.strftime('%Y-%m-%d'),
+        'anomaly_type': anomaly_type,
+        'severity': severity,
+        'z_score': Decimal('3.1')
+    }
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    with mock_aws():
+        s3 = boto3.client('s3', region_name='us-east-1')
+        s3.create_bucket(Bucket=BUCKET)
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        table = dynamodb.create_table(
+            TableName='stock-anomalies',
+            KeySchema=[
+                {'AttributeName': 'ticker', 'KeyType': 'HASH'},
+                {'AttributeName': 'timestamp', 'KeyType': 'RANGE'}
+            ],
+            AttributeDefinitions=[
+                {'AttributeName': 'ticker', 'AttributeType': 'S'},
+                {'AttributeName': 'timestamp', 'AttributeType': 'S'},
+                {'AttributeName': 'date', 'AttributeType': 'S'}
+            ],
+            GlobalSecondaryIndexes=[{
+                'IndexName': 'DateIndex',
+                'KeySchema': [
+                    {'AttributeName': 'date', 'KeyType': 'HASH'},
+                    {'AttributeName': 'timestamp', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            }],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        monkeypatch.setattr(snapshots, 's3', s3)
+        monkeypatch.setattr(snapshots, 'anomalies_table', table)
+        yield s3, table
+
+
+def read_json(s3, key):
+    return json.loads(s3.get_object(Bucket=BUCKET, Key=key)['Body'].read())
+
+
+class TestBuildSnapshots:
+    """Test the snapshot documents."""
+
+    def test_recent_tickers_and_summary(self):
+        """Test the three documents for a small set of anomalies."""
+        items = [
+            anomaly('AAPL', 30),
+            anomaly('MSFT', 20, severity='high', anomaly_type='volume'),
+            anomaly('AAPL', 10, severity='high')
+        ]
+
+        docs = build_snapshots(items, NOW.isoformat())
+
+        assert [a['timestamp'] for a in docs['recent']['anomalies']] == [
+            items[2]['timestamp'], items[1]['timestamp'], items[0]['timestamp']
+        ]
+        assert docs['tickers']['tickers']['AAPL'] is items[2]
+        assert docs['summary']['total'] == 3
+        assert docs['summary']['by_severity'] == {'medium': 1, 'high': 2}
+        assert docs['summary']['by_ticker'] == {'AAPL': 2, 'MSFT': 1}
+        assert docs['summary']['last_anomaly'] == items[2]['timestamp']
+
+    def test_recent_capped(self, monkeypatch):
+        """Test that recent.json keeps only the newest anomalies."""
+        monkeypatch.setattr(snapshots, 'MAX_RECENT', 2)
+        items = [anomaly('AAPL', h) for h in (3, 2, 1)]
+
+        recent = build_snapshots(items, None)['recent']
+
+        assert recent['truncated'] is True
+        assert [a['timestamp'] for a in recent['anomalies']] == [
+            items[2]['timestamp'], items[1]['timestamp']
+        ]
+
+
+class TestPublishSnapshots:
+    """Test publishing to the dashboard bucket."""
+
+    def test_pointer_references_versioned_documents(self, aws):
+        """Test that latest.json points at immutable, versioned objects."""
+        s3, table = aws
+        table.put_item(Item=anomaly('AAPL', 2))
+        table.put_item(Item=anomaly('MSFT', 200))  # Outside the 7-day window
+
+        pointer = publish_snapshots(bucket=BUCKET, now=NOW)
+
+        assert read_json(s3, LATEST_KEY) == pointer
+        assert pointer['recent'] == f"snapshots/v/{pointer['version']}/recent.json"
+        recent = read_json(s3, pointer['recent'])
+        assert [a['ticker'] for a in recent['anomalies']] == ['AAPL']
+        assert recent['anomalies'][0]['z_score'] == 3.1
+        head = s3.head_object(Bucket=BUCKET, Key=pointer['summary'])
+        assert 'immutable' in head['CacheControl']
+        assert 'immutable' not in s3.head_object(Bucket=BUCKET, Key=LATEST_KEY)['CacheControl']
+
+    def test_unchanged_content_not_republished(self, aws):
+        """Test that a scan without new anomalies keeps the current version."""
+        s3, table = aws
+        table.put_item(Item=anomaly('AAPL', 2))
+
+        first = publish_snapshots(bucket=BUCKET, now=NOW)
+        second = publish_snapshots(bucket=BUCKET, now=NOW + timedelta(minutes=5))
+
+        assert second == first
+
+    def test_new_anomaly_moves_pointer(self, aws):
+        """Test that new anomalies produce a new version."""
+        s3, table = aws
+        table.put_item(Item=anomaly('AAPL', 2))
+        first = publish_snapshots(bucket=BUCKET, now=NOW)
+
+        table.put_item(Item=anomaly('MSFT', 1))
+        second = publish_snapshots(bucket=BUCKET, now=NOW)
+
+        assert second['version'] != first['version']
+        assert read_json(s3, LATEST_KEY)['version'] == second['version']
+
+    def test_live_version_kept_while_unchanged(self, aws):
+        """Test that old versions are pruned but the live and replaced ones stay."""
+        s3, table = aws
+        versions = []
+        for n in range(3):
+            table.put_item(Item=anomaly(f'T{n}', 2))
+            versions.append(publish_snapshots(bucket=BUCKET, now=NOW)['version'])
+        # A quiet weekend: nothing new, nothing deleted
+        publish_snapshots(bucket=BUCKET, now=NOW + timedelta(days=3))
+
+        keys = [o['Key'] for o in s3.list_objects_v2(Bucket=BUCKET, Prefix='snapshots/v/')['Contents']]
+        assert {key.split('/')[2] for key in keys} == {versions[1], versions[2]}
+        assert len(keys) == 6
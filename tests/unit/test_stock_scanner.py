@@ -7,14 +7,18 @@ import os
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../lambda'))
 
 import pytest
-from datetime import datetime, timedelta
+import boto3
+from datetime import datetime, timedelta, timezone
+from moto import mock_aws
 from unittest.mock import Mock, patch, MagicMock
 import json
 
 # Import functions from Lambda
+import stock_scanner
 from stock_scanner import (
     detect_anomalies,
     format_alert_message,
+    fetch_history,
     fetch_stock_data_simple,
     retry_with_backoff
 )
@@ -154,6 +158,27 @@ class TestAlertFormatting:
         assert 'AAPL' in message
         assert 'VOLUME' in message
         assert 'MEDIUM' in message
+    
+    def test_format_market_event_lists_members(self):
+        """Test that a collapsed market event names the tickers that moved."""
+        anomaly = {
+            'ticker': 'MARKET',
+            'anomaly_type': 'market_move',
+            'severity': 'high',
+            'date': '2026-01-21',
+            'value': -4.8,
+            'baseline_mean': 0.05,
+            'baseline_std': 1.1,
+            'z_score': -4.4,
+            'threshold': 2.0,
+            'members': ['AAPL', 'MSFT'],
+            'member_count': 2
+        }
+        
+        message = format_alert_message(anomaly)
+        
+        assert 'MARKET_MOVE' in message
+        assert 'Moved together (2): AAPL, MSFT' in message
 
 
 class TestDataFetching:
@@ -189,6 +214,121 @@ class TestDataFetching:
             assert item['high'] >= item['low']
 
 
+class TestArchivedHistory:
+    """Test loading the baseline window from the raw-data archive."""
+    
+    def bars(self, days_ago):
+        today = datetime.utcnow().date()
+        return [
+            {'date': (today - timedelta(days=d)).isoformat(), 'close': 150.0, 'volume': 50000000}
+            for d in days_ago
+        ]
+    
+    def test_archived_window_only_tops_up_recent_days(self):
+        """Test that the provider is asked only for days after the archive."""
+        archived = self.bars(range(30, 1, -1))
+        provider = Mock(return_value=self.bars([2, 1]))
+        
+        with patch.object(stock_scanner, 'load_window', return_value=(archived, {})), \
+             patch.object(stock_scanner, 'fetch_with_circuit_breaker', provider):
+            records, fetched = fetch_history('AAPL', days=30)
+        
+        provider.assert_called_once_with('AAPL', days=3)
+        assert len(records) == 30
+        assert len(fetched) == 2
+    
+    def test_interior_gap_refetched(self):
+        """Test that a trading day missing from the archive is fetched again."""
+        calendar = stock_scanner.MarketCalendar()
+        today = datetime.utcnow().date()
+        gap = next(today - timedelta(days=d) for d in range(15, 30)
+                   if calendar.is_trading_day(today - timedelta(days=d)))
+        archived = [bar for bar in self.bars(range(30, 1, -1)) if bar['date'] != gap.isoformat()]
+        provider = Mock(return_value=self.bars(range((today - gap).days, 0, -1)))
+        
+        with patch.object(stock_scanner, 'load_window', return_value=(archived, {})), \
+             patch.object(stock_scanner, 'fetch_with_circuit_breaker', provider), \
+             patch.dict(stock_scanner._market_calendar, {'calendar': calendar}):
+            records, _ = fetch_history('AAPL', days=30)
+        
+        provider.assert_called_once_with('AAPL', days=(today - gap).days + 1)
+        assert gap.isoformat() in {r['date'] for r in records}
+    
+    def test_uncovered_window_fetched_in_full(self):
+        """Test that a short archive falls back to the full provider window."""
+        provider = Mock(return_value=self.bars(range(30, 0, -1)))
+        
+        with patch.object(stock_scanner, 'load_window', return_value=(self.bars([3, 2]), {})), \
+             patch.object(stock_scanner, 'fetch_with_circuit_breaker', provider):
+            records, _ = fetch_history('AAPL', days=30)
+        
+        provider.assert_called_once_with('AAPL', days=30)
+        assert len(records) == 30
+    
+    def test_open_circuit_uses_archive(self):
+        """Test that a provider outage still leaves the archived window."""
+        archived = self.bars(range(30, 1, -1))
+        
+        with patch.object(stock_scanner, 'load_window', return_value=(archived, {})), \
+             patch.object(stock_scanner, 'fetch_with_circuit_breaker', return_value=None):
+            records, fetched = fetch_history('AAPL', days=30)
+        
+        assert len(records) == 29
+        assert fetched == []
+    
+    def test_archive_error_falls_back_to_provider(self):
+        """Test that an unreadable archive does not fail the scan."""
+        provider = Mock(return_value=self.bars(range(30, 0, -1)))
+        
+        with patch.object(stock_scanner, 'load_window', side_effect=Exception('AccessDenied')), \
+             patch.object(stock_scanner, 'fetch_with_circuit_breaker', provider):
+            records, _ = fetch_history('AAPL', days=30)
+        
+        assert len(records) == 30
+
+
+class TestScheduledRuns:
+    """Test the market-calendar gate on scheduled invocations."""
+    
+    def fixed_now(self, moment):
+        class FixedDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return moment.astimezone(tz) if tz else moment.replace(tzinfo=None)
+        return FixedDatetime
+    
+    @pytest.fixture(autouse=True)
+    def fresh_calendar(self, monkeypatch):
+        monkeypatch.setattr(stock_scanner, '_market_calendar',
+                            {'calendar': stock_scanner.MarketCalendar(), 'loaded_at': None})
+    
+    def test_closed_market_skips_before_any_io(self, monkeypatch):
+        """Test that a holiday run returns without touching SSM."""
+        ssm = Mock()
+        monkeypatch.setattr(stock_scanner, 'ssm', ssm)
+        monkeypatch.setattr(stock_scanner, 'datetime',
+                            self.fixed_now(datetime(2026, 11, 26, 15, 30, tzinfo=timezone.utc)))
+        
+        result = stock_scanner.lambda_handler({'scheduled': True}, None)
+        
+        assert json.loads(result['body'])['status'] == 'market_closed'
+        ssm.get_parameter.assert_not_called()
+    
+    def test_configured_closure_checked_when_open(self, monkeypatch):
+        """Test that an open session re-checks the market-hours parameter."""
+        config = {'closed': ['2026-03-04']}
+        monkeypatch.setattr(stock_scanner, 'get_parameter_with_retry', Mock(return_value=json.dumps(config)))
+        
+        assert stock_scanner.market_is_open(datetime(2026, 3, 4, 15, 30, tzinfo=timezone.utc)) is False
+        assert stock_scanner.market_is_open(datetime(2026, 3, 5, 15, 30, tzinfo=timezone.utc)) is True
+    
+    def test_manual_runs_not_gated(self):
+        """Test that only scheduled events are checked against the calendar."""
+        assert stock_scanner.is_scheduled({'source': 'aws.events'})
+        assert not stock_scanner.is_scheduled({'tickers': ['AAPL']})
+        assert not stock_scanner.is_scheduled({'mode': 'coordinator'})
+
+
 class TestRetryLogic:
     """Test retry with exponential backoff."""
     
@@ -220,9 +360,54 @@ class TestRetryLogic:
         assert mock_func.call_count == 3
 
 
+class TestMarketEvents:
+    """Test that a scan's shards store and alert each market event once."""
+
+    def test_second_shard_adds_members(self, monkeypatch):
+        """Test that the first shard stores and alerts, later shards extend the members."""
+        with mock_aws():
+            table = boto3.resource('dynamodb', region_name='us-east-1').create_table(
+                TableName='stock-anomalies',
+                KeySchema=[{'AttributeName': 'ticker', 'KeyType': 'HASH'},
+                           {'AttributeName': 'timestamp', 'KeyType': 'RANGE'}],
+                AttributeDefinitions=[{'AttributeName': 'ticker', 'AttributeType': 'S'},
+                                      {'AttributeName': 'timestamp', 'AttributeType': 'S'}],
+                BillingMode='PAY_PER_REQUEST'
+            )
+            monkeypatch.setattr(stock_scanner, 'anomalies_table', table)
+
+            def event(members):
+                return stock_scanner.AnomalyRecord(
+                    ticker='MARKET', timestamp='2026-03-02T15:30:00', date='2026-03-02',
+                    anomaly_type='market_move', detector='market_model', value=-5.0,
+                    baseline_mean=0.0, baseline_std=1.0, z_score=-5.0, threshold=2.0,
+                    severity='high', members=members, member_count=len(members)
+                )
+
+            first = stock_scanner.store_market_events([event(['AAPL', 'MSFT'])])
+            second = stock_scanner.store_market_events([event(['JPM'])])
+            item = table.get_item(Key={'ticker': 'MARKET', 'timestamp': '2026-03-02T15:30:00'})['Item']
+
+        assert len(first) == 1
+        assert second == []
+        assert item['members'] == ['AAPL', 'MSFT', 'JPM']
+        assert item['member_count'] == 3
+
+
 class TestErrorHandling:
     """Test error handling scenarios."""
     
+    def test_market_model_failure_keeps_anomalies(self):
+        """Test that a market model error publishes per-ticker anomalies."""
+        scans = [{'ticker': 'AAPL', 'anomalies': [{'anomaly_type': 'price'}],
+                  'dates': [], 'closes': []}]
+        
+        with patch.object(stock_scanner, 'apply_market_model', side_effect=Exception('AccessDenied')):
+            anomalies, events = stock_scanner.collapse_market_moves(scans, 2.0)
+        
+        assert anomalies == [{'anomaly_type': 'price'}]
+        assert events == []
+    
     def test_detect_anomalies_handles_empty_data(self):
         """Test anomaly detection with empty data."""
         anomalies = detect_anomalies('AAPL', [], threshold=2.0)
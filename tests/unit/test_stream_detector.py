@@ -0,0 +1,255 @@
+"""
+Unit tests for the streaming intraday detector.
+Tests rolling statistics, out-of-order handling and stream sources.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../lambda'))
+
+import pytest
+import base64
+import boto3
+import json
+from statistics import mean, stdev
+from moto import mock_aws
+
+import stream_detector
+from stream_detector import (
+    RollingWindow,
+    StreamDetector,
+    StreamSource,
+    InMemoryStreamSource,
+    FileStreamSource,
+    run_stream
+)
+
+BUCKET = 'stock-scan-data-test'
+
+
+def make_bar(minute, close=150.0, volume=1000000, ticker='AAPL'):
+    """Build a one-minute bar."""
+    return {
+        'ticker': ticker,
+        'timestamp': f'2026-01-21T14:{minute:02d}:00',
+        'open': close, 'high': close, 'low': close,
+        'close': close,
+        'volume': volume
+    }
+
+
+def kinesis_event(bars):
+    """Kinesis event source batch carrying the bars."""
+    return {'Records': [
+        {'kinesis': {'data': base64.b64encode(json.dumps(bar).encode('utf-8')).decode('ascii')}}
+        for bar in bars
+    ]}
+
+
+def baseline_bars(count=20):
+    return [make_bar(i, close=150.0 + (i % 5) * 0.1, volume=1000000 + (i % 5) * 1000)
+            for i in range(count)]
+
+
+class TestRollingWindow:
+    """Test O(1) rolling statistics."""
+
+    def test_matches_statistics_module(self):
+        """Test rolling mean/std against a full recompute."""
+        window = RollingWindow(5)
+        values = [10.0, 12.0, 11.0, 15.0, 9.0, 30.0, 8.0]
+        for value in values:
+            window.push(value)
+
+        assert len(window) == 5
+        assert window.mean == pytest.approx(mean(values[-5:]))
+        assert window.std == pytest.approx(stdev(values[-5:]))
+
+
+class TestStreamDetector:
+    """Test intraday detection and ordering."""
+
+    def test_detects_price_spike(self):
+        """Test that a spike after a full window is flagged."""
+        detector = StreamDetector(threshold=2.0, window=20, allowed_lateness=0)
+        for bar in baseline_bars():
+            assert detector.process(bar) == []
+
+        anomalies = detector.process(make_bar(20, close=160.0))
+
+        assert [a['anomaly_type'] for a in anomalies] == ['price_intraday']
+        assert anomalies[0]['date'] == '2026-01-21'
+        assert anomalies[0]['bar_timestamp'] == '2026-01-21T14:20:00'
+
+    def test_out_of_order_bars_scored_in_order(self):
+        """Test that bars within the lateness window are reordered."""
+        detector = StreamDetector(window=3, allowed_lateness=120)
+        for minute in [0, 2, 1, 3]:
+            detector.process(make_bar(minute))
+        detector.flush()
+
+        assert detector.stats['scored'] == 4
+        assert detector.stats['late_dropped'] == 0
+
+    def test_late_bar_dropped(self):
+        """Test that bars behind the watermark are dropped."""
+        detector = StreamDetector(window=3, allowed_lateness=0)
+        detector.process(make_bar(5))
+        detector.process(make_bar(4))
+
+        assert detector.stats['late_dropped'] == 1
+
+    def test_duplicate_bar_ignored(self):
+        """Test that a pending duplicate bar is counted once."""
+        detector = StreamDetector(window=3, allowed_lateness=300)
+        detector.process(make_bar(1))
+        detector.process(make_bar(1))
+
+        assert detector.stats['duplicates'] == 1
+
+
+class TestStreamSources:
+    """Test local stream sources and the consumer loop."""
+
+    def test_in_memory_source_emits_anomalies(self):
+        """Test the consumer loop with an in-memory source."""
+        source = InMemoryStreamSource(baseline_bars() + [make_bar(20, volume=5000000)])
+        detector = StreamDetector(window=20, allowed_lateness=0)
+        emitted = []
+
+        stats = run_stream(source, detector, max_batches=2, emit=emitted.extend)
+
+        assert stats['scored'] == 21
+        assert [a['anomaly_type'] for a in emitted] == ['volume_intraday']
+
+    def test_source_must_implement_read(self):
+        """Test that a source without read() cannot be created."""
+        class Incomplete(StreamSource):
+            pass
+
+        with pytest.raises(TypeError):
+            Incomplete()
+
+    def test_file_source_follows_appends(self, tmp_path):
+        """Test that the file source only returns complete new lines."""
+        path = tmp_path / 'bars.ndjson'
+        path.write_text(json.dumps(make_bar(0)) + '\n' + json.dumps(make_bar(1))[:10])
+        source = FileStreamSource(str(path))
+
+        assert len(source.read()) == 1
+
+        path.write_text(json.dumps(make_bar(0)) + '\n' + json.dumps(make_bar(1)) + '\n')
+        batch = source.read()
+
+        assert len(batch) == 1
+        assert batch[0]['timestamp'] == '2026-01-21T14:01:00'
+
+
+class TestStatePersistence:
+    """Test that rolling state survives a cold start."""
+
+    @pytest.fixture
+    def handler(self, monkeypatch):
+        with mock_aws():
+            s3 = boto3.client('s3', region_name='us-east-1')
+            s3.create_bucket(Bucket=BUCKET)
+            emitted = []
+            monkeypatch.setenv('S3_BUCKET', BUCKET)
+            monkeypatch.setattr(stream_detector, 's3', s3)
+            monkeypatch.setattr(stream_detector, 'emit_anomalies', emitted.extend)
+            monkeypatch.setattr(stream_detector, 'stream_detector',
+                                StreamDetector(window=20, allowed_lateness=0))
+            yield emitted
+
+    def test_cold_start_restores_window(self, handler, monkeypatch):
+        """Test that a new container scores against the window the old one built."""
+        stream_detector.lambda_handler(kinesis_event(baseline_bars()), None)
+        monkeypatch.setattr(stream_detector, 'stream_detector',
+                            StreamDetector(window=20, allowed_lateness=0))
+
+        stream_detector.lambda_handler(kinesis_event([make_bar(20, volume=5000000)]), None)
+
+        assert [a['anomaly_type'] for a in handler] == ['volume_intraday']
+
+    def test_restored_state_drops_replayed_bars(self, handler, monkeypatch):
+        """Test that bars already scored before the cold start are still dropped as late."""
+        stream_detector.lambda_handler(kinesis_event(baseline_bars()), None)
+        detector = StreamDetector(window=20, allowed_lateness=0)
+        monkeypatch.setattr(stream_detector, 'stream_detector', detector)
+
+        stream_detector.lambda_handler(kinesis_event([make_bar(5)]), None)
+
+        assert detector.stats['late_dropped'] == 1
+
+    def test_unsaved_ticker_counted_as_rewarming(self, handler, monkeypatch):
+        """Test that a ticker with no saved state is reported while it re-warms."""
+        added = []
+        monkeypatch.setattr(stream_detector.metrics, 'add',
+                            lambda stage, metric, value=1: added.append((stage, metric, value)))
+
+        stream_detector.lambda_handler(kinesis_event([make_bar(0, ticker='MSFT')]), None)
+        stream_detector.lambda_handler(kinesis_event([make_bar(1, ticker='MSFT')]), None)
+
+        assert [a for a in added if a[1] == 'Rewarming'] == [('state_load', 'Rewarming', 1)]
+
+    def test_state_saved_before_alerting(self, handler, monkeypatch):
+        """Test that a batch retried after its alerts went out does not alert again."""
+        stream_detector.lambda_handler(kinesis_event(baseline_bars()), None)
+        spike = kinesis_event([make_bar(20, volume=5000000)])
+        saved = []
+        monkeypatch.setattr(stream_detector, 'emit_anomalies', lambda anomalies: (
+            handler.extend(anomalies),
+            saved.append(stream_detector.load_ticker_state('AAPL', BUCKET)[0]['last_emitted'])
+        ))
+
+        stream_detector.lambda_handler(spike, None)
+        monkeypatch.setattr(stream_detector, 'stream_detector',
+                            StreamDetector(window=20, allowed_lateness=0))
+        stream_detector.lambda_handler(spike, None)
+
+        assert [a['anomaly_type'] for a in handler] == ['volume_intraday']
+        assert saved[0] == stream_detector.bar_epoch(make_bar(20))
+
+    def test_failed_save_withholds_alerts_until_retry(self, handler, monkeypatch):
+        """Test that a ticker whose state was not saved is not alerted on, then scored again on retry."""
+        stream_detector.lambda_handler(kinesis_event(baseline_bars()), None)
+        spike = kinesis_event([make_bar(20, volume=5000000)])
+        save = stream_detector.save_ticker_state
+
+        def failing_save(ticker, data, bucket, prefix):
+            raise IOError('S3 unavailable')
+
+        monkeypatch.setattr(stream_detector, 'save_ticker_state', failing_save)
+        with pytest.raises(RuntimeError):
+            stream_detector.lambda_handler(spike, None)
+        assert handler == []
+
+        monkeypatch.setattr(stream_detector, 'save_ticker_state', save)
+        stream_detector.lambda_handler(spike, None)
+
+        assert [a['anomaly_type'] for a in handler] == ['volume_intraday']
+
+    def test_warm_container_reloads_state_advanced_elsewhere(self, handler, monkeypatch):
+        """Test that a warm container picks up bars another container scored meanwhile."""
+        stream_detector.lambda_handler(kinesis_event(baseline_bars()), None)
+        warm = stream_detector.stream_detector
+        monkeypatch.setattr(stream_detector, 'stream_detector',
+                            StreamDetector(window=20, allowed_lateness=0))
+        stream_detector.lambda_handler(kinesis_event([make_bar(20, volume=5000000)]), None)
+
+        monkeypatch.setattr(stream_detector, 'stream_detector', warm)
+        stream_detector.lambda_handler(kinesis_event([make_bar(20, volume=5000000)]), None)
+
+        assert [a['anomaly_type'] for a in handler] == ['volume_intraday']
+        assert warm.stats['late_dropped'] == 1
+
+    def test_unchanged_state_not_reloaded(self, handler, monkeypatch):
+        """Test that a warm container keeps its own state when S3 holds the same version."""
+        stream_detector.lambda_handler(kinesis_event(baseline_bars()), None)
+        restored = []
+        detector = stream_detector.stream_detector
+        monkeypatch.setattr(detector, 'restore_state', lambda ticker, data: restored.append(ticker))
+
+        stream_detector.lambda_handler(kinesis_event([make_bar(20)]), None)
+
+        assert restored == []
+        assert detector.stats['scored'] == 21
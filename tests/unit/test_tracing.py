@@ -0,0 +1,146 @@
+"""
+Unit tests for cross-hop tracing.
+Tests trace ids, span nesting, context propagation and the exporters.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../lambda'))
+
+import json
+import re
+from unittest.mock import Mock
+
+import stock_scanner
+import tracing
+from tracing import (InMemoryExporter, Tracer, XRayExporter, context_from_notification,
+                     message_attributes)
+
+
+def envelope(attributes):
+    """SNS envelope as the queue delivers it: attributes as Type/Value."""
+    return {'MessageAttributes': {
+        name: {'Type': value['DataType'], 'Value': value['StringValue']}
+        for name, value in attributes.items()
+    }}
+
+
+class TestTracer:
+    """Test spans and trace context."""
+
+    def test_trace_id_uses_xray_format(self):
+        """Test that trace ids are accepted by X-Ray unchanged."""
+        assert re.fullmatch(r'1-[0-9a-f]{8}-[0-9a-f]{24}', tracing.new_trace_id())
+
+    def test_nested_spans_link_to_parent(self):
+        """Test that an inner span's parent is the enclosing span."""
+        exporter = InMemoryExporter()
+        tracer = Tracer('svc', exporter)
+        tracer.start_trace()
+
+        with tracer.span('scan') as outer:
+            with tracer.span('sns_publish') as inner:
+                pass
+        tracer.flush()
+
+        assert inner.parent_id == outer.span_id
+        assert outer.parent_id is None
+        assert {span.trace_id for _, span in exporter.spans} == {outer.trace_id}
+        assert outer.duration_ms >= inner.duration_ms
+
+    def test_flush_keeps_trace_while_span_running(self):
+        """Test that a nested handler's flush does not end its caller's trace."""
+        exporter = InMemoryExporter()
+        tracer = Tracer('svc', exporter)
+        trace_id = tracer.start_trace()
+
+        with tracer.span('scan'):
+            with tracer.span('shard'):
+                pass
+            tracer.flush()
+            assert tracer.trace_id == trace_id
+        tracer.flush()
+
+        assert tracer.trace_id is None
+        assert [span.name for _, span in exporter.spans] == ['shard', 'scan']
+
+    def test_context_round_trips_through_sns(self):
+        """Test that the context survives SNS attributes and the queue envelope."""
+        tracer = Tracer('svc')
+        tracer.start_trace(started_ms=1700000000000)
+
+        with tracer.span('sns_publish') as span:
+            attributes = message_attributes(tracer.context())
+
+        context = context_from_notification(envelope(attributes))
+        assert context['trace_id'] == span.trace_id
+        assert context['parent_id'] == span.span_id
+        assert context['started_ms'] == 1700000000000
+        assert context['sent_ms'] >= 1700000000000
+
+    def test_empty_parent_not_sent(self):
+        """Test that a context without a running span omits the parent (SNS rejects empty values)."""
+        attributes = message_attributes({'trace_id': '1-abc', 'parent_id': '', 'started_ms': 1})
+
+        assert tracing.PARENT_ID_ATTRIBUTE not in attributes
+        assert context_from_notification(envelope(attributes))['parent_id'] is None
+
+    def test_untraced_notification(self):
+        """Test that messages from before tracing carry no context."""
+        assert context_from_notification({'Subject': 'x'}) is None
+
+
+class TestXRayExporter:
+    """Test segment export."""
+
+    def test_segments_sent_in_batches(self):
+        """Test that spans are sent as segment documents, 50 per call."""
+        client = Mock()
+        client.put_trace_segments.return_value = {'UnprocessedTraceSegments': []}
+        tracer = Tracer('stock-scanner', XRayExporter(client))
+        tracer.start_trace()
+        for n in range(60):
+            tracer.record('queue', tracer.trace_id, 1.0, 2.0, parent_id='a' * 16, n=n)
+
+        tracer.flush()
+
+        calls = client.put_trace_segments.call_args_list
+        assert [len(c.kwargs['TraceSegmentDocuments']) for c in calls] == [50, 10]
+        segment = json.loads(calls[0].kwargs['TraceSegmentDocuments'][0])
+        assert segment['name'] == 'stock-scanner'
+        assert segment['parent_id'] == 'a' * 16
+        assert segment['annotations'] == {'n': 0, 'span': 'queue'}
+
+    def test_export_failure_not_raised(self):
+        """Test that an X-Ray outage never fails the handler."""
+        client = Mock()
+        client.put_trace_segments.side_effect = Exception('throttled')
+        tracer = Tracer('svc', XRayExporter(client))
+
+        with tracer.span('scan'):
+            pass
+        tracer.flush()
+
+
+class TestScannerPropagation:
+    """Test that published anomalies carry the trace."""
+
+    def test_alert_and_item_carry_trace(self, monkeypatch):
+        """Test that the stored item and the SNS message share the scan's trace id."""
+        sns = Mock()
+        table = Mock()
+        monkeypatch.setattr(stock_scanner, 'sns', sns)
+        monkeypatch.setattr(stock_scanner, 'anomalies_table', table)
+        monkeypatch.setattr(stock_scanner, 'tracer', Tracer('stock-scanner', InMemoryExporter()))
+        anomaly = stock_scanner.AnomalyRecord(
+            ticker='AAPL', timestamp='2026-03-02T15:30:00', date='2026-03-02',
+            anomaly_type='price', detector='zscore', value=180.0, baseline_mean=150.0,
+            baseline_std=5.0, z_score=6.0, threshold=2.0, severity='high'
+        )
+
+        trace_id = stock_scanner.tracer.start_trace()
+        with stock_scanner.tracer.span('scan'):
+            stock_scanner.publish_anomalies([anomaly])
+
+        assert table.put_item.call_args.kwargs['Item']['trace_id'] == trace_id
+        attributes = sns.publish.call_args.kwargs['MessageAttributes']
+        assert attributes[tracing.TRACE_ID_ATTRIBUTE]['StringValue'] == trace_id